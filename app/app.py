@@ -416,7 +416,7 @@ def create_app(script_info=None):
         We resolve automatically when a new concept map version is published, but we also we need an API for manual runs
         """
         concept_map_version_uuid = request.json.get("concept_map_version_uuid")
-        concept_map_version = concept_map_models.ConceptMapVersion(concept_map_version_uuid)
+        concept_map_version = concept_map_models.ConceptMapVersion.load_metadata(concept_map_version_uuid)
         concept_map_version.resolve_error_service_issues()
         return "Resolved"
 
@@ -1,10 +1,14 @@
 import datetime
+import functools
+import gzip
 import hashlib
+import io
 import itertools
 import json
 import re
 import uuid
-from dataclasses import dataclass
+from collections import namedtuple
+from dataclasses import dataclass, field
 from operator import itemgetter
 from typing import Optional, List
 from uuid import UUID
@@ -12,8 +16,9 @@ import logging
 from enum import Enum
 
 from cachetools.func import ttl_cache
-from opensearchpy.helpers import bulk
 from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql.expression import bindparam
 
 import app.models.codes
 import app.models.data_ingestion_registry
@@ -23,18 +28,38 @@ from app.errors import (
     BadRequestWithCode,
     NotFoundException,
 )
+from app.helpers.cache_helper import two_tier_cache
+from app.helpers.canonical_json_helper import canonical_json
 from app.helpers.data_helper import normalized_source_codeable_concept
 from app.helpers.oci_helper import set_up_and_save_to_object_store, folder_path_for_oci
+from app.helpers.opensearch_helper import index_changed_documents
+from app.helpers.publish_helper import PublishDestination, publish_to_destinations
+from app.helpers.stream_helper import StreamedArray
 from app.helpers.simplifier_helper import publish_to_simplifier
 import app.helpers.id_helper
+from app.helpers.interning_helper import InterningPool
 import app.models.data_ingestion_registry
 from app.terminologies.models import (
     Terminology,
     terminology_version_uuid_lookup,
-    load_terminology_version_with_cache,
 )
 import app.tasks
 
+# The attributes of a Mapping that serialize_contributor_extension reads, for serializing without Mapping objects
+MappingContributors = namedtuple(
+    "MappingContributors",
+    [
+        "mapping_id",
+        "mapped_by",
+        "mapped_date_time",
+        "reviewed_by",
+        "reviewed_date_time",
+        "map_program_version",
+        "map_program_prediction_id",
+        "map_program_confidence_score",
+    ],
+)
+
 
 @dataclass
 class ConceptMapSettings:
@@ -64,7 +89,15 @@ class ConceptMapSettings:
         )
 
     @classmethod
-    @ttl_cache()
+    def deserialize(cls, data: dict):
+        return cls(**data)
+
+    @classmethod
+    @two_tier_cache(
+        "concept_map_settings",
+        to_dict=lambda settings: settings.serialize(),
+        from_dict=lambda data: ConceptMapSettings.deserialize(data),
+    )
     def load_from_cache(cls, concept_map_uuid):
         return cls.load(concept_map_uuid)
 
@@ -93,7 +126,12 @@ class ConceptMapSettings:
         )
 
     @classmethod
-    @ttl_cache(ttl=60)  # Caching for 1min to speed up concept map versioning
+    @two_tier_cache(
+        "concept_map_settings_by_version",
+        ttl=60,  # Caching for 1min to speed up concept map versioning
+        to_dict=lambda settings: settings.serialize(),
+        from_dict=lambda data: ConceptMapSettings.deserialize(data),
+    )
     def load_by_concept_map_version_uuid_from_cache(cls, concept_map_version_uuid):
         return cls.load_by_concept_map_version_uuid(concept_map_version_uuid)
 
@@ -135,6 +173,7 @@ class ConceptMap:
     database_schema_version = 5
     next_schema_version = 5
     object_storage_folder_name = "ConceptMaps"
+    target_concept_index = "target_concepts_for_mapping"
 
     def __init__(self, uuid, load_mappings_for_most_recent_active: bool = True):
         self.uuid = uuid
@@ -203,12 +242,14 @@ class ConceptMap:
             ),
             {"concept_map_uuid": self.uuid},
         ).first()
-        if version is not None:
+        if version is not None and load_mappings_for_most_recent_active:
             self.most_recent_active_version = ConceptMapVersion(
                 version.uuid,
                 concept_map=self,
-                load_mappings=load_mappings_for_most_recent_active,
             )
+        elif version is not None:
+            # Metadata only, from the row already read: the mappings are loaded if they are used
+            self.most_recent_active_version = ConceptMapVersion.from_metadata(version, concept_map=self)
         else:
             self.most_recent_active_version = None
 
@@ -392,38 +433,51 @@ class ConceptMap:
     @staticmethod
     def index_targets(
         concept_map_version_uuid: uuid.UUID, target_value_set_version_uuid: uuid.UUID
-    ):
+    ) -> dict:
         """
-        Indexes the target concepts for the given concept map version and target value set version in Elasticsearch.
+        Indexes the target concepts for the given concept map version and target value set version in OpenSearch.
+        Only concepts that are not indexed yet, or whose code, display or terminology_version_uuid differs, are sent.
+
+        A document's _id is the target code_id, so it is shared by every concept map version that indexes the code:
+        its concept_map_version_uuid is the version that indexed it last. A document whose other fields are unchanged
+        only gets a partial update that sets concept_map_version_uuid. Documents are never deleted.
 
         Args:
             concept_map_version_uuid (str): The UUID of the concept map version.
             target_value_set_version_uuid (str): The UUID of the target value set version.
-        """
-        opensearch = get_opensearch()
 
-        def gendata():
-            vs_version = app.value_sets.models.ValueSetVersion.load(
-                target_value_set_version_uuid
-            )
-            vs_version.expand()
-            for concept in vs_version.expansion:
-                terminology_version_uuid = terminology_version_uuid_lookup(
-                    concept.system, concept.version
+        Returns:
+            dict: the number of documents "indexed", "updated" (only to set this version) and "unchanged"
+        """
+        vs_version = app.value_sets.models.ValueSetVersion.load(
+            target_value_set_version_uuid
+        )
+        vs_version.expand()
+
+        terminology_version_uuids = {}
+        documents = {}
+        for concept in vs_version.expansion:
+            if isinstance(concept.code, app.models.codes.FHIRCodeableConcept):
+                raise NotImplementedError("Indexing not implemented for codeable concepts to be used as target terminology in mapping")
+            terminology_key = (concept.system, concept.version)
+            if terminology_key not in terminology_version_uuids:
+                terminology_version_uuid = terminology_version_uuid_lookup(concept.system, concept.version)
+                terminology_version_uuids[terminology_key] = (
+                    str(terminology_version_uuid) if terminology_version_uuid is not None else None
                 )
-                if isinstance(concept.code, app.models.codes.FHIRCodeableConcept):
-                    raise NotImplementedError("Indexing not implemented for codeable concepts to be used as target terminology in mapping")
-                document = {
-                    "_id": concept.code_id,
-                    "_index": "target_concepts_for_mapping",
-                    "code": concept.code,
-                    "display": concept.display,
-                    "concept_map_version_uuid": str(concept_map_version_uuid),
-                    "terminology_version_uuid": terminology_version_uuid,
-                }
-                yield document
+            # As read back from the index, so that unchanged documents compare equal
+            documents[concept.code_id] = {
+                "code": concept.code,
+                "display": concept.display,
+                "terminology_version_uuid": terminology_version_uuids[terminology_key],
+            }
 
-        bulk(opensearch, gendata())
+        return index_changed_documents(
+            get_opensearch(),
+            ConceptMap.target_concept_index,
+            documents,
+            updated_fields={"concept_map_version_uuid": str(concept_map_version_uuid)},
+        )
 
     def serialize(self):
         """
@@ -464,7 +518,8 @@ class ConceptMap:
         if omitted is ConceptMap.next_schema_version.
         @param new_schema_version: As for previous_schema_version but applies to the new_version. If new_schema_version
         is omitted the default is to use previous_schema_version for new_schema_version.
-        @return: dict() identifying added and removed sources and mappings, with compared summaries at top of file.
+        @return: dict() identifying removed, added, modified and unchanged mappings (see diff_mappings), with their
+        counts and compared summaries at top of file.
         """
         # Step 1: setup
         # validate inputs
@@ -482,10 +537,7 @@ class ConceptMap:
                 new_schema_version = previous_schema_version
 
         # initialize outputs
-        new_serialized = dict()
-        new_mappings = dict()
         previous_serialized = dict()
-        previous_mappings = dict()
 
         # Step 2: get the previous and new concept map versions
         if previous_version == 0:
@@ -493,7 +545,7 @@ class ConceptMap:
         else:
             previous_concept_map_version = (
                 ConceptMapVersion.load_by_concept_map_uuid_and_version(
-                    concept_map_uuid, previous_version
+                    concept_map_uuid, previous_version, load_mappings=False
                 )
             )
             if previous_concept_map_version is None:
@@ -503,7 +555,7 @@ class ConceptMap:
                 )
         new_concept_map_version = (
             ConceptMapVersion.load_by_concept_map_uuid_and_version(
-                concept_map_uuid, new_version
+                concept_map_uuid, new_version, load_mappings=False
             )
         )
         if new_concept_map_version is None:
@@ -512,65 +564,14 @@ class ConceptMap:
                 f"Unable to load concept map new version {new_version}",
             )
 
-        # Step 3: get mappings for new - organize results by mapping id, and by groups and elements
-        if new_version != 0:
-            new_serialized = new_concept_map_version.serialize(
-                include_internal_info=False, schema_version=new_schema_version
-            )
-        if len(new_serialized) > 0:
-            new_mappings = cls.collect_and_sort_mappings_for_diff(new_serialized)
-
-        # Step 4: get mappings for previous - organize results by mapping id, and by groups and elements
-        if previous_version != 0:
+        # Step 3: metadata - the versions were loaded without mappings, so they serialize with no groups
+        new_serialized = new_concept_map_version.serialize(
+            include_internal_info=False, schema_version=new_schema_version
+        )
+        if previous_concept_map_version is not None:
             previous_serialized = previous_concept_map_version.serialize(
                 include_internal_info=False, schema_version=previous_schema_version
             )
-        if len(previous_serialized) > 0:
-            previous_mappings = cls.collect_and_sort_mappings_for_diff(
-                previous_serialized
-            )
-
-        # Step 5: collect data for diff output
-        # counts
-        previous_total = len(previous_mappings)
-        new_total = len(new_mappings)
-
-        # removed_codes - order diffs by source and target terminology and target code element
-        modified = dict()
-        unchanged = dict()
-        removed_codes = []
-        for pId in previous_mappings.keys():
-            old = previous_mappings[pId]
-            if pId in new_mappings.keys():
-                new = new_mappings[pId]
-                if new == old:
-                    unchanged.update({pId: old})
-                else:
-                    modified.update({pId: new})
-            else:
-                removed_codes.append({pId: old})
-
-        # added_codes - order diffs by source and target terminology and target code element
-        added_codes = []
-        for nId in new_mappings.keys():
-            new = new_mappings[nId]
-            if nId in previous_mappings.keys():
-                if nId not in modified.keys():
-                    old = previous_mappings[nId]
-                    if new == old:
-                        unchanged.update({nId: old})
-                    else:
-                        modified.update({nId: new})
-            else:
-                added_codes.append({nId: new})
-
-        # sort changes by the unique and immutable mapping id
-        modified_codes = dict()
-        for i in sorted(modified):
-            modified_codes.update({i: modified[i]})
-        unchanged_codes = dict()
-        for i in sorted(unchanged):
-            unchanged_codes.update({i: unchanged[i]})
 
         # summary_diff (new vs. old)
         summary = dict()
@@ -589,28 +590,136 @@ class ConceptMap:
                 value = {"new_value": None, "old_value": previous}
                 summary.update({pKey: value})
 
-        # Step 6: return diff output
+        # Step 4: mappings - matched in the database, each element serialized once from its rows
+        mappings = cls.diff_mappings(previous_concept_map_version, new_concept_map_version)
+
+        # Step 5: return diff output
         return {
             "summary_diff": summary,
-            "removed_count": len(removed_codes),
-            "added_count": len(added_codes),
-            "modified_count": len(modified_codes),
-            "unchanged_count": len(unchanged_codes),
+            "removed_count": len(mappings["removed_codes"]),
+            "added_count": len(mappings["added_codes"]),
+            "modified_count": len(mappings["modified_codes"]),
+            "unchanged_count": len(mappings["unchanged_codes"]),
+            "previous_total": mappings["previous_total"],
+            "new_total": mappings["new_total"],
+            "removed_codes": mappings["removed_codes"],
+            "added_codes": mappings["added_codes"],
+            "modified_codes": mappings["modified_codes"],
+            "unchanged_codes": mappings["unchanged_codes"],
+            "version": new_version,  # supports output to OCI /diff folder
+        }
+
+    @classmethod
+    def diff_mappings(cls, previous_concept_map_version, new_concept_map_version) -> dict:
+        """
+        Compares the reviewed mappings of two concept map versions, by mapping id: each serialized element is
+        identified by the mapping id of its first target, as in sort_concept_map_groups_and_elements. The element ids
+        of the two versions are matched with a full outer join in the database, which streams back the rows of both
+        versions in element order, so each element is serialized once from its rows, and neither version is loaded.
+        @param previous_concept_map_version: ConceptMapVersion, or None to report every element of the new version as
+        added
+        @param new_concept_map_version: ConceptMapVersion
+        @return: dict with the "removed_codes" and "added_codes" lists of {mapping id: element}, ordered by mapping
+        group and then mapping id, the "modified_codes" (new elements) and "unchanged_codes" dicts, sorted by mapping
+        id, and the "previous_total" and "new_total" counts of elements.
+        """
+        previous_rows_select = ConceptMapVersion.reviewed_mapping_rows_select.format(
+            version_parameter="previous_version_uuid", group_filter=""
+        )
+        new_rows_select = ConceptMapVersion.reviewed_mapping_rows_select.format(
+            version_parameter="new_version_uuid", group_filter=""
+        )
+        rows = get_db().execute(
+            text(
+                f"""
+                with previous_rows as ({previous_rows_select}),
+                new_rows as ({new_rows_select}),
+                matched as (
+                    select
+                        coalesce(previous_ids.element_mapping_id, new_ids.element_mapping_id) as element_mapping_id,
+                        previous_ids.element_mapping_id is not null as in_previous,
+                        new_ids.element_mapping_id is not null as in_new
+                    from (select distinct element_mapping_id from previous_rows) previous_ids
+                    full outer join (select distinct element_mapping_id from new_rows) new_ids
+                        on previous_ids.element_mapping_id = new_ids.element_mapping_id
+                )
+                select * from (
+                    select 'previous' as diff_side, matched.in_previous, matched.in_new, previous_rows.*
+                    from previous_rows
+                    join matched on matched.element_mapping_id = previous_rows.element_mapping_id
+                    union all
+                    select 'new' as diff_side, matched.in_previous, matched.in_new, new_rows.*
+                    from new_rows
+                    join matched on matched.element_mapping_id = new_rows.element_mapping_id
+                ) diff_rows
+                order by
+                    element_mapping_id collate "C",
+                    diff_side,
+                    source_concept_uuid,
+                    depends_on_property,
+                    depends_on_system,
+                    depends_on_value_schema,
+                    depends_on_value_simple,
+                    depends_on_value_jsonb,
+                    depends_on_display,
+                    mapping_id collate "C"
+                """
+            ).execution_options(stream_results=True),
+            {
+                "previous_version_uuid": previous_concept_map_version.uuid
+                if previous_concept_map_version is not None
+                else None,
+                "new_version_uuid": new_concept_map_version.uuid,
+            },
+        )
+
+        # The rows of one element id come together, those of the new version first
+        removed = []
+        added = []
+        modified = dict()
+        unchanged = dict()
+        previous_total = 0
+        new_total = 0
+        for mapping_id, element_rows in itertools.groupby(
+            rows, key=lambda row: row.element_mapping_id
+        ):
+            rows_by_side = {"previous": [], "new": []}
+            for row in element_rows:
+                rows_by_side[row.diff_side].append(row)
+            in_previous, in_new = row.in_previous, row.in_new
+            if in_previous:
+                previous_total += 1
+                old = list(previous_concept_map_version.elements_from_rows(rows_by_side["previous"]))[-1]
+            if in_new:
+                new_total += 1
+                new = list(new_concept_map_version.elements_from_rows(rows_by_side["new"]))[-1]
+            if in_previous and in_new:
+                if new == old:
+                    unchanged.update({mapping_id: old})
+                else:
+                    modified.update({mapping_id: new})
+            elif in_previous:
+                removed.append((cls.diff_group_key(rows_by_side["previous"][0]), mapping_id, old))
+            else:
+                added.append((cls.diff_group_key(rows_by_side["new"][0]), mapping_id, new))
+
+        # order removed and added elements by mapping group, as in the sorted groups, then by mapping id
+        return {
+            "removed_codes": [{i: element} for group_key, i, element in sorted(removed, key=itemgetter(0, 1))],
+            "added_codes": [{i: element} for group_key, i, element in sorted(added, key=itemgetter(0, 1))],
+            "modified_codes": {i: modified[i] for i in sorted(modified)},
+            "unchanged_codes": {i: unchanged[i] for i in sorted(unchanged)},
             "previous_total": previous_total,
             "new_total": new_total,
-            "removed_codes": removed_codes,
-            "added_codes": added_codes,
-            "modified_codes": modified_codes,
-            "unchanged_codes": unchanged_codes,
-            "version": new_version,  # supports output to OCI /diff folder
         }
 
     @staticmethod
-    def collect_and_sort_mappings_for_diff(serialized):
-        group_sorted = ConceptMap.sort_concept_map_groups_and_elements(serialized.get("group"))
-        if group_sorted is not None:
-            serialized["group"] = group_sorted
-        return serialized
+    def diff_group_key(row) -> str:
+        """
+        The key by which sort_concept_map_groups_and_elements orders the mapping group of a row of
+        reviewed_mapping_rows_select
+        """
+        return f"{row.source_fhir_uri}{row.source_version}{row.target_fhir_uri}{row.target_version}"
 
     @staticmethod
     def sort_concept_map_groups_and_elements(serialized_group: dict):
@@ -666,8 +775,111 @@ class ConceptMap:
 
 
 class ConceptMapVersion:
+    # Revision of the serialized mappings stored in concept_maps.serialized_version. Increase it whenever the output of
+    # serialize() for the "group" list changes within a schema version: forms stored by another revision are ignored,
+    # and replaced when next read.
+    serialized_artifact_revision = 2
+
+    # All reviewed mappings of a concept map version, with their source concept, target and dependsOn data: one row
+    # per mapping and dependsOn member. Rows come in the order of the elements that serialize builds from them: by the
+    # first mapping id of each element (a source concept and dependsOn value mapped to one target terminology), then
+    # by mapping id within the element, comparing ids as the "C" collation does, as Python compares str.
+    # version_parameter names the bind parameter for the concept map version UUID, usually concept_map_version_uuid;
+    # group_filter may narrow the rows to one mapping group.
+    reviewed_mapping_rows_select = """
+        select
+            crd.mapping_id,
+            crd.deduplication_hash as mapping_deduplication_hash,
+            crd.uuid as mapping_uuid,
+            crd.mapped_by,
+            crd.reviewed_by,
+            crd.review_status,
+            crd.mapping_comments,
+            crd.mapped_date_time,
+            crd.review_comments,
+            crd.reviewed_date_time,
+            crd.map_program_date_time,
+            crd.map_program_version,
+            crd.map_program_prediction_id,
+            crd.map_program_confidence_score,
+            crd.deleted_date_time,
+            crd.deleted_by,
+            scd.uuid as source_concept_uuid,
+            scd.code_schema as source_code_schema,
+            scd.code_simple as source_code_simple,
+            scd.code_jsonb as source_code_jsonb,
+            scd.display as source_display,
+            scd.system_uuid as source_system,
+            tv_source.version as source_version,
+            tv_source.fhir_uri as source_fhir_uri,
+            scd.comments as source_comments,
+            scd.map_status as source_map_status,
+            scd.assigned_mapper as source_assigned_mapper,
+            scd.assigned_reviewer as source_assigned_reviewer,
+            scd.no_map,
+            scd.reason_for_no_map,
+            scd.mapping_group as source_mapping_group,
+            scd.previous_version_context as source_previous_version_context,
+            scd.custom_terminology_code_uuid,
+            relationship_codes.code as relationship_code,
+            scd.map_status,
+            crd.target_concept_code,
+            crd.target_concept_display,
+            crd.target_concept_terminology_version_uuid,
+            tv_target.version as target_version,
+            tv_target.fhir_uri as target_fhir_uri,
+            cdo.depends_on_property,
+            cdo.depends_on_system,
+            cdo.depends_on_value_schema,
+            cdo.depends_on_value_simple,
+            cdo.depends_on_value_jsonb,
+            cdo.depends_on_display,
+            ctcd.code_id as source_code_id,
+            ctcd.deduplication_hash as source_deduplication_hash,
+            min(crd.mapping_id collate "C") over (
+                partition by
+                    scd.uuid,
+                    crd.target_concept_terminology_version_uuid,
+                    cdo.depends_on_property,
+                    cdo.depends_on_system,
+                    cdo.depends_on_value_schema,
+                    cdo.depends_on_value_simple,
+                    cdo.depends_on_value_jsonb,
+                    cdo.depends_on_display
+            ) as element_mapping_id
+        from
+            concept_maps.source_concept_data as scd
+        left join concept_maps.concept_relationship_data as crd
+            on scd.uuid = crd.source_concept_uuid
+        left join custom_terminologies.code_data ctcd
+            on scd.custom_terminology_code_uuid = ctcd.uuid
+        left join custom_terminologies.code_depends_on cdo
+            on scd.custom_terminology_code_uuid = cdo.code_uuid
+        join concept_maps.relationship_codes
+            on relationship_codes.uuid = crd.relationship_code_uuid
+        join terminology_versions as tv_source
+            on cast(tv_source.uuid as uuid) = cast(scd.system_uuid as uuid)
+        join terminology_versions as tv_target
+            on tv_target.uuid = crd.target_concept_terminology_version_uuid
+        where
+            scd.concept_map_version_uuid=:{version_parameter}
+            and crd.review_status = 'reviewed'
+            {group_filter}
+        order by
+            element_mapping_id,
+            scd.uuid,
+            cdo.depends_on_property,
+            cdo.depends_on_system,
+            cdo.depends_on_value_schema,
+            cdo.depends_on_value_simple,
+            cdo.depends_on_value_jsonb,
+            cdo.depends_on_display,
+            crd.mapping_id collate "C"
+        """
+
     def __init__(self, uuid, concept_map=None, load_mappings: bool = True):
         self.uuid = uuid
+        self.concept_map_uuid = None
         self.concept_map = None
         self.description = None
         self.comments = None
@@ -683,6 +895,97 @@ class ConceptMapVersion:
 
         self.load_data(concept_map=concept_map, load_mappings=load_mappings)
 
+    @classmethod
+    def from_metadata(cls, data, concept_map: ConceptMap = None) -> "ConceptMapVersion":
+        """
+        A lightweight handle on a concept map version, built from its concept_maps.concept_map_version row with no
+        further queries. Its concept map, allowed target terminologies and mappings are each loaded when first accessed,
+        so callers that only need the uuid and metadata never load them.
+        @param data: a concept_maps.concept_map_version row
+        @param concept_map: the ConceptMap of the version, if the caller already has it
+        """
+        concept_map_version = cls.__new__(cls)
+        concept_map_version.uuid = data.uuid
+        concept_map_version.url = None
+        concept_map_version.set_metadata(data)
+        concept_map_version._concept_map = concept_map
+        concept_map_version._allowed_target_terminologies = None
+        concept_map_version._mappings = None
+        return concept_map_version
+
+    @classmethod
+    def load_metadata(cls, uuid) -> "ConceptMapVersion":
+        """
+        The from_metadata handle on the concept map version with this uuid, in one query
+        @raise BadRequestWithCode if there is no concept map version with this uuid, as for ConceptMapVersion()
+        """
+        conn = get_db()
+        data = conn.execute(
+            text(
+                """
+                select * from concept_maps.concept_map_version
+                where uuid=:version_uuid
+                """
+            ),
+            {"version_uuid": uuid},
+        ).first()
+        if not data:
+            raise BadRequestWithCode(
+                "ConceptMap.VersionNotFound",
+                f"Unable to load data for concept map version UUID: {uuid}",
+            )
+        return cls.from_metadata(data)
+
+    @property
+    def concept_map(self) -> ConceptMap:
+        if self._concept_map is None and self.concept_map_uuid is not None:
+            self._concept_map = ConceptMap(self.concept_map_uuid, load_mappings_for_most_recent_active=False)
+        return self._concept_map
+
+    @concept_map.setter
+    def concept_map(self, concept_map: ConceptMap):
+        self._concept_map = concept_map
+
+    @property
+    def allowed_target_terminologies(self) -> list:
+        if self._allowed_target_terminologies is None:
+            self._allowed_target_terminologies = []
+            self.load_allowed_target_terminologies()
+        return self._allowed_target_terminologies
+
+    @allowed_target_terminologies.setter
+    def allowed_target_terminologies(self, allowed_target_terminologies: list):
+        self._allowed_target_terminologies = allowed_target_terminologies
+
+    @property
+    def mappings(self) -> dict:
+        """
+        The reviewed mappings, by source concept. For a version from from_metadata, these are loaded by
+        load_reviewed_mappings on first access. For ConceptMapVersion(load_mappings=False), they are empty.
+        """
+        if self._mappings is None:
+            self._mappings = {}
+            self.load_reviewed_mappings()
+        return self._mappings
+
+    @mappings.setter
+    def mappings(self, mappings: dict):
+        self._mappings = mappings
+
+    def set_metadata(self, data):
+        """
+        Set the attributes that come from the concept_maps.concept_map_version row data
+        """
+        self.concept_map_uuid = data.concept_map_uuid
+        self.description = data.description
+        self.comments = data.comments
+        self.status = data.status
+        self.created_date = data.created_date
+        self.version = data.version
+        self.published_date = data.published_date
+        self.source_value_set_version_uuid = data.source_value_set_version_uuid
+        self.target_value_set_version_uuid = data.target_value_set_version_uuid
+
     def load_data(self, concept_map: ConceptMap = None, load_mappings: bool = True):
         """
         runs sql query to return all information related to specified concept map version, data returned is used to
@@ -710,23 +1013,18 @@ class ConceptMapVersion:
         else:
             self.concept_map = concept_map
 
-        self.description = data.description
-        self.comments = data.comments
-        self.status = data.status
-        self.created_date = data.created_date
-        self.version = data.version
-        self.published_date = data.published_date
-        self.source_value_set_version_uuid = data.source_value_set_version_uuid
-        self.target_value_set_version_uuid = data.target_value_set_version_uuid
+        self.set_metadata(data)
         self.load_allowed_target_terminologies()
         if load_mappings:
             self.load_reviewed_mappings()
         # self.generate_self_mappings()
 
     @classmethod
-    def load_by_concept_map_uuid_and_version(cls, concept_map_uuid, version):
+    def load_by_concept_map_uuid_and_version(cls, concept_map_uuid, version, load_mappings: bool = True):
         """
         Receives a concept_map_uuid and version and returns the appropriate ConceptMapVersion, if it exists
+        @param load_mappings: as for ConceptMapVersion(); use False when only the metadata is needed, or with
+        serialize_published
         """
         conn = get_db()
         data = conn.execute(
@@ -740,7 +1038,7 @@ class ConceptMapVersion:
             {"concept_map_uuid": concept_map_uuid, "version": version},
         ).first()
         if data:
-            concept_map_version = ConceptMapVersion(data.uuid)
+            concept_map_version = ConceptMapVersion(data.uuid, load_mappings=load_mappings)
             return concept_map_version
         else:
             return None
@@ -770,125 +1068,80 @@ class ConceptMapVersion:
                     Terminology.load_from_cache(terminology_version_uuid)
                 )
 
-    def load_reviewed_mappings(self):
+    def load_reviewed_mapping_rows(self) -> list:
         """
-        Loads mappings between source and target concepts for a specific version of a concept map.
-        This method queries the database to retrieve all reviewed mappings associated with the
-        concept map version, creates SourceConcept and Mapping objects, and stores them in the
-        self.mappings dictionary.
+        Runs reviewed_mapping_rows_select for all reviewed mappings of this concept map version. Used by
+        load_reviewed_mappings and serialize_mappings_from_rows.
 
         Raises:
             BadRequestWithCode: If a source concept in the concept map version is missing a source system.
         """
-
         conn = get_db()
-        query = """
-            select 
-                crd.mapping_id, 
-                crd.deduplication_hash as mapping_deduplication_hash,
-                crd.uuid as mapping_uuid, 
-                crd.mapped_by, 
-                crd.reviewed_by, 
-                crd.review_status, 
-                crd.mapping_comments,
-                crd.mapped_date_time,
-                crd.review_comments,
-                crd.reviewed_date_time,
-                crd.map_program_date_time,
-                crd.map_program_version,
-                crd.map_program_prediction_id,
-                crd.map_program_confidence_score,
-                crd.deleted_date_time,
-                crd.deleted_by,
-                scd.uuid as source_concept_uuid, 
-                scd.code_schema as source_code_schema, 
-                scd.code_simple as source_code_simple, 
-                scd.code_jsonb as source_code_jsonb,
-                scd.display as source_display, 
-                scd.system_uuid as source_system, 
-                tv_source.version as source_version, 
-                tv_source.fhir_uri as source_fhir_uri,
-                scd.comments as source_comments, 
-                scd.map_status as source_map_status,
-                scd.assigned_mapper as source_assigned_mapper, 
-                scd.assigned_reviewer as source_assigned_reviewer, 
-                scd.no_map,
-                scd.reason_for_no_map, 
-                scd.mapping_group as source_mapping_group, 
-                scd.previous_version_context as source_previous_version_context,
-                scd.custom_terminology_code_uuid,
-                relationship_codes.code as relationship_code, 
-                scd.map_status,
-                crd.target_concept_code, 
-                crd.target_concept_display,
-                crd.target_concept_terminology_version_uuid,
-                tv_target.version as target_version, 
-                tv_target.fhir_uri as target_fhir_uri,
-                cdo.depends_on_property, 
-                cdo.depends_on_system, 
-                cdo.depends_on_value_schema,
-                cdo.depends_on_value_simple,
-                cdo.depends_on_value_jsonb,
-                cdo.depends_on_display,
-                ctcd.code_id as source_code_id,
-                ctcd.deduplication_hash as source_deduplication_hash
-            from 
-                concept_maps.source_concept_data as scd
-            left join concept_maps.concept_relationship_data as crd
-                on scd.uuid = crd.source_concept_uuid
-            left join custom_terminologies.code_data ctcd
-                on scd.custom_terminology_code_uuid = ctcd.uuid
-            left join custom_terminologies.code_depends_on cdo
-                on scd.custom_terminology_code_uuid = cdo.code_uuid
-            join concept_maps.relationship_codes
-                on relationship_codes.uuid = crd.relationship_code_uuid
-            join terminology_versions as tv_source
-                on cast(tv_source.uuid as uuid) = cast(scd.system_uuid as uuid)
-            join terminology_versions as tv_target
-                on tv_target.uuid = crd.target_concept_terminology_version_uuid
-            where 
-                scd.concept_map_version_uuid=:concept_map_version_uuid
-                and crd.review_status = 'reviewed'
-            """
 
         results = conn.execute(
-            text(query),
+            text(
+                ConceptMapVersion.reviewed_mapping_rows_select.format(
+                    version_parameter="concept_map_version_uuid", group_filter=""
+                )
+            ),
             {
                 "concept_map_version_uuid": self.uuid,
             },
         )
 
-        # todo: consider changing from this self-made cache to a regular one
-        terminology_cache = dict()
-
-        for item in results:
-            # Get the system
-            source_system = item.source_system
-            if source_system is None:
+        rows = results.all()
+        for item in rows:
+            if item.source_system is None:
                 raise BadRequestWithCode(
                     "ConceptMap.loadMappings.missingSystem",
                     f"Concept map UUID: {self.concept_map.uuid} version {self.version} has mapping with no source system identified",
                 )
+        return rows
 
-            # Get the Terminology
-            if source_system not in terminology_cache.keys():
-                terminology_cache.update(
-                    {source_system: load_terminology_version_with_cache(source_system)}
-                )
+    def load_reviewed_mappings(self, rows: Optional[list] = None):
+        """
+        Loads mappings between source and target concepts for a specific version of a concept map.
+        This method queries the database to retrieve all reviewed mappings associated with the
+        concept map version, creates SourceConcept and Mapping objects, and stores them in the
+        self.mappings dictionary.
 
-            # Initialize the code for the source code
-            source_code_schema = app.models.codes.RoninCodeSchemas(item.source_code_schema)
-            if source_code_schema == app.models.codes.RoninCodeSchemas.codeable_concept:
-                source_code_fhir_object = app.models.codes.FHIRCodeableConcept.deserialize(item.source_code_jsonb)
-                source_code_code = None
-                source_code_display = None
-            elif source_code_schema == app.models.codes.RoninCodeSchemas.code:
-                source_code_code = item.source_code_simple
-                source_code_display = item.source_display
-                source_code_fhir_object = None
-            else:
-                raise NotImplementedError("Only codeable concept and code schemas available for source concepts")
+        Args:
+            rows: the result of load_reviewed_mapping_rows, if the caller already has it
 
+        Raises:
+            BadRequestWithCode: If a source concept in the concept map version is missing a source system.
+        """
+        if rows is None:
+            rows = self.load_reviewed_mapping_rows()
+
+        # Values such as target displays and review statuses repeat across many rows: share one object for each
+        interning_pool = InterningPool()
+        intern = interning_pool.intern
+
+        # Build the source and target codes in bulk, with one terminology lookup per distinct terminology version
+        source_codes = app.models.codes.Code.from_rows(
+            rows,
+            code_column="source_code_simple",
+            display_column="source_display",
+            code_schema_column="source_code_schema",
+            code_jsonb_column="source_code_jsonb",
+            terminology_version_uuid_column="source_system",
+            custom_terminology_code_uuid_column="custom_terminology_code_uuid",
+            custom_terminology_code_id_column="source_code_id",
+            deduplication_hash_column="source_deduplication_hash",
+            # from_fhir_terminology=None,  # In the future, we can check this if needed
+            interning_pool=interning_pool,
+        )
+        target_codes = app.models.codes.Code.from_rows(  # We only map to standards of code type
+            rows,
+            code_column="target_concept_code",
+            display_column="target_concept_display",
+            terminology_version_uuid_column="target_concept_terminology_version_uuid",
+            from_custom_terminology=False,  # we currently only map to standards
+            interning_pool=interning_pool,
+        )
+
+        for item, source_code_code_object, target_code in zip(rows, source_codes, target_codes):
             # Set up the depends on data
             depends_on = None
             if item.depends_on_property or item.depends_on_value_schema:
@@ -896,26 +1149,12 @@ class ConceptMapVersion:
                     depends_on_value_schema=item.depends_on_value_schema,
                     depends_on_value_simple=item.depends_on_value_simple,
                     depends_on_value_jsonb=item.depends_on_value_jsonb,
-                    depends_on_property=item.depends_on_property,
-                    depends_on_system=item.depends_on_system,
-                    depends_on_display=item.depends_on_display
+                    depends_on_property=intern(item.depends_on_property),
+                    depends_on_system=intern(item.depends_on_system),
+                    depends_on_display=intern(item.depends_on_display)
                 )
-
-            source_code_code_object = app.models.codes.Code(
-                system=None,
-                version=None,
-                code_schema=source_code_schema,
-                code=source_code_code,
-                display=source_code_display,
-                code_object=source_code_fhir_object,
-                terminology_version=terminology_cache[source_system],
-                # from_fhir_terminology=None,  # In the future, we can check this if needed
-                from_custom_terminology=True if item.custom_terminology_code_uuid is not None else False,
-                custom_terminology_code_uuid=item.custom_terminology_code_uuid,
-                depends_on=depends_on,
-                custom_terminology_code_id=item.source_code_id,
-                stored_custom_terminology_deduplication_hash=item.source_deduplication_hash
-            )
+            source_code_code_object.depends_on = depends_on
+            target_code.depends_on = depends_on
 
             # Set up assigned_mapper
             assigned_mapper = ContentCreator.load_by_uuid_from_cache(item.source_assigned_mapper)
@@ -927,24 +1166,16 @@ class ConceptMapVersion:
             source_concept = SourceConcept(
                 uuid=item.source_concept_uuid,
                 code=source_code_code_object,
-                comments=item.source_comments,
-                map_status=item.source_map_status,
+                comments=intern(item.source_comments),
+                map_status=intern(item.source_map_status),
                 assigned_mapper=assigned_mapper,
                 assigned_reviewer=assigned_reviewer,
                 no_map=item.no_map,
-                reason_for_no_map=item.reason_for_no_map,
-                mapping_group=item.source_mapping_group,
+                reason_for_no_map=intern(item.reason_for_no_map),
+                mapping_group=intern(item.source_mapping_group),
                 previous_version_context=item.source_previous_version_context,
                 concept_map_version_uuid=self.uuid,
             )
-            target_code = app.models.codes.Code(  # We only map to standards of code type
-                system=item.target_fhir_uri,
-                version=item.target_version,
-                code=item.target_concept_code,
-                display=item.target_concept_display,
-                depends_on=depends_on,
-                from_custom_terminology=False  # we currently only map to standards
-            )
             relationship = MappingRelationship.load_by_code_from_cache(
                 item.relationship_code
             )  # this needs optimization
@@ -960,16 +1191,16 @@ class ConceptMapVersion:
                 mapping_id=item.mapping_id,
                 _stored_deduplication_hash=item.mapping_deduplication_hash,
                 saved_to_db=True,
-                mapping_comments=item.mapping_comments,
-                review_comments=item.review_comments,
+                mapping_comments=intern(item.mapping_comments),
+                review_comments=intern(item.review_comments),
                 mapped_by=mapped_by,
                 mapped_date_time=item.mapped_date_time,
                 reviewed_by=reviewed_by,
                 reviewed_date_time=item.reviewed_date_time,
                 uuid=item.mapping_uuid,
-                review_status=item.review_status,
+                review_status=intern(item.review_status),
                 map_program_date_time=item.map_program_date_time,
-                map_program_version=item.map_program_version,
+                map_program_version=intern(item.map_program_version),
                 map_program_prediction_id=item.map_program_prediction_id,
                 map_program_confidence_score=item.map_program_confidence_score,
                 deleted_by=deleted_by,
@@ -1043,19 +1274,21 @@ class ConceptMapVersion:
 
     def set_publication_date(self):
         conn = get_db()
-        conn.execute(
+        result = conn.execute(
             text(
                 """
                 UPDATE concept_maps.concept_map_version
                 SET published_date=now()
                 where uuid=:uuid
+                returning published_date
                 """
             ),
             {
                 "uuid": self.uuid,
             },
-        )
-        self.published_date = datetime.datetime.now()
+        ).first()
+        # The stored value, so that what is serialized now matches what is serialized after a reload
+        self.published_date = result.published_date if result is not None else datetime.datetime.now()
 
     def retire_and_obsolete_previous_version(self):
         """
@@ -1116,113 +1349,383 @@ class ConceptMapVersion:
                   their versions, and a list of elements representing individual source codes and
                   their associated target codes.
         """
-        # Identify code_id and all the source terminology / target terminology pairings in the mappings
+        # One pass over the mappings: each target joins the element for its source code in the group for its
+        # (source system, target system) pair. Elements and targets keep the order of self.mappings, and groups keep
+        # the iteration order of the set of pairs, which is built as it always has been.
         source_target_pairs_set = set()
+        elements_by_pair = {}
         for source_code, mappings in self.mappings.items():
             source_uri = source_code.system.fhir_uri
             source_version = source_code.system.version
+            serialized_source_code = None
+            elements_for_source = {}
             for mapping in mappings:
-                target_uri = mapping.target.system
-                target_version = mapping.target.version
+                pair = (source_uri, source_version, mapping.target.system, mapping.target.version)
+                source_target_pairs_set.add(pair)
+
+                element = elements_for_source.get(pair)
+                if element is None:
+                    if serialized_source_code is None:
+                        serialized_source_code = self.serialize_source_code(source_code.code)
+                    element = {
+                        "_code": serialized_source_code,
+                        "target": [],
+                    }
+                    elements_for_source[pair] = element
+                    elements_by_pair.setdefault(pair, []).append(element)
 
-                source_target_pairs_set.add(
-                    (source_uri, source_version, target_uri, target_version)
-                )
+                element["target"].append(self.serialize_mapping_target(source_code, mapping))
 
+        # add high-level attributes that apply to all elements
         groups = []
+        for pair in source_target_pairs_set:
+            source_uri, source_version, target_uri, target_version = pair
+            groups.append(
+                {
+                    "source": source_uri,
+                    "sourceVersion": source_version,
+                    "target": target_uri,
+                    "targetVersion": target_version,
+                    "element": elements_by_pair[pair],
+                }
+            )
 
-        # Serialize the mappings
-        for (
-            source_uri,
-            source_version,
-            target_uri,
-            target_version
-        ) in source_target_pairs_set:
-            elements = []
-            for source_code, mappings in self.mappings.items():
-                if (
-                    source_code.system.fhir_uri == source_uri
-                    and source_code.system.version == source_version
-                ):
-                    filtered_mappings = [
-                        x
-                        for x in mappings
-                        if x.target.system == target_uri
-                        and x.target.version == target_version
-                    ]
+        return groups
 
-                    # Only proceed if there are filtered_mappings for the current target_uri and target_version
-                    if filtered_mappings:
-                        new_element = {
-                            "_code": self.serialize_source_code(source_code.code),
-                            "target": [],
-                        }
-
-                        # Iterate through each mapping for the source and serialize it
-                        for mapping in filtered_mappings:
-                            target_serialized = {
-                                "id": mapping.mapping_id,  # the "mapping_id" introduced in RCDM ConceptMap v5
-                                "code": mapping.target.code,
-                                "display": mapping.target.display,
-                                "equivalence": mapping.relationship.code,
-                                "extension": self.serialize_contributor_extension(mapping)
-                            }
+    def serialize_mappings_from_rows(self, rows) -> list:
+        """
+        Produces the groups that serialize_mappings would produce after load_reviewed_mappings(rows), directly from
+        the rows of load_reviewed_mapping_rows: no Code, SourceConcept or Mapping objects are built, and each distinct
+        source code and dependsOn value is deserialized and serialized once.
 
-                            # add dependsOn
-                            depends_on = mapping.target.depends_on
-                            if depends_on and depends_on.depends_on_value:
-                                target_serialized["dependsOn"] = self.serialize_depends_on(depends_on)
-
-                            # comment and equivalence
-                            if mapping.target.code == "No map" and mapping.target.display == "No matching concept":
-                                target_serialized["comment"] = source_code.reason_for_no_map
-                            if target_serialized["equivalence"] == "source-is-narrower-than-target":
-                                target_serialized["equivalence"] = "wider"
-                                target_serialized["comment"] = (
-                                    f"{target_serialized.get('comment')} source-is-narrower-than-target"
-                                    if target_serialized.get('comment')
-                                    else "source-is-narrower-than-target"
-                                )
-                            elif target_serialized["equivalence"] == "source-is-broader-than-target":
-                                target_serialized["equivalence"] = "narrower"
-                                target_serialized["comment"] = (
-                                    f"{target_serialized.get('comment')} source-is-broader-than-target"
-                                    if target_serialized.get('comment')
-                                    else "source-is-broader-than-target"
-                                )
-
-                            # add target to target list
-                            new_element["target"].append(target_serialized)
-
-                        # add element to element list
-                        elements.append(new_element)
-
-            # add high-level attributes that apply to all elements
+        Rows are collected per source concept as load_reviewed_mappings collects them into self.mappings: by source
+        concept UUID and dependsOn value, in order of first appearance. So groups, elements and targets come out in
+        the same order as from serialize_mappings.
+        """
+        # (source concept UUID, dependsOn identity as in Code.identity) -> rows
+        rows_by_source = {}
+        # dependsOn columns -> (dependsOn identity, serialized dependsOn)
+        depends_on_by_columns = {}
+        for row in rows:
+            depends_on_identity, serialized_depends_on = self.depends_on_from_row(row, depends_on_by_columns)
+            rows_by_source.setdefault((row.source_concept_uuid, depends_on_identity), []).append(
+                (row, serialized_depends_on)
+            )
+
+        source_target_pairs_set = set()
+        elements_by_pair = {}
+        for source_rows in rows_by_source.values():
+            serialized_source_code = None
+            elements_for_source = {}
+            for row, serialized_depends_on in source_rows:
+                pair = (row.source_fhir_uri, row.source_version, row.target_fhir_uri, row.target_version)
+                source_target_pairs_set.add(pair)
+
+                element = elements_for_source.get(pair)
+                if element is None:
+                    if serialized_source_code is None:
+                        serialized_source_code = self.serialize_source_code_row(row)
+                    element = {
+                        "_code": serialized_source_code,
+                        "target": [],
+                    }
+                    elements_for_source[pair] = element
+                    elements_by_pair.setdefault(pair, []).append(element)
+
+                element["target"].append(self.serialize_target_row(row, serialized_depends_on))
+
+        groups = []
+        for pair in source_target_pairs_set:
+            source_uri, source_version, target_uri, target_version = pair
             groups.append(
                 {
                     "source": source_uri,
                     "sourceVersion": source_version,
                     "target": target_uri,
                     "targetVersion": target_version,
-                    "element": elements,
+                    "element": elements_by_pair[pair],
                 }
             )
 
         return groups
 
+    def stream_mapping_groups(self) -> list:
+        """
+        Produces the groups of ConceptMap.sort_concept_map_groups_and_elements(serialize_mappings()), in the same
+        order, without loading the mappings: each group's "element" is a generator that reads the rows of that group
+        from the database as it is consumed, already in element order, and serializes one element at a time. So the
+        elements of a whole concept map version are never held in memory at once.
+
+        The generators read from the database, so consume them in group order, within the request (as
+        app.helpers.stream_helper.stream_json_response does), and each one only once.
+        """
+        conn = get_db()
+        pairs = conn.execute(
+            text(
+                """
+                select distinct
+                    tv_source.fhir_uri as source_fhir_uri,
+                    tv_source.version as source_version,
+                    tv_target.fhir_uri as target_fhir_uri,
+                    tv_target.version as target_version
+                from concept_maps.source_concept_data as scd
+                join concept_maps.concept_relationship_data as crd
+                    on scd.uuid = crd.source_concept_uuid
+                join terminology_versions as tv_source
+                    on cast(tv_source.uuid as uuid) = cast(scd.system_uuid as uuid)
+                join terminology_versions as tv_target
+                    on tv_target.uuid = crd.target_concept_terminology_version_uuid
+                where scd.concept_map_version_uuid=:concept_map_version_uuid
+                and crd.review_status = 'reviewed'
+                """
+            ),
+            {"concept_map_version_uuid": self.uuid},
+        )
+        # Groups in the order of sort_concept_map_groups_and_elements, which sorts them by this key
+        pairs = sorted(
+            (tuple(pair) for pair in pairs),
+            key=lambda pair: "".join(str(value) for value in pair),
+        )
+        groups = []
+        for pair in pairs:
+            source_uri, source_version, target_uri, target_version = pair
+            groups.append(
+                {
+                    "source": source_uri,
+                    "sourceVersion": source_version,
+                    "target": target_uri,
+                    "targetVersion": target_version,
+                    "element": self.iter_mapping_group_elements(pair),
+                }
+            )
+        return groups
+
+    def iter_mapping_group_elements(self, pair: tuple):
+        """
+        Supports stream_mapping_groups by reading the rows of one mapping group, identified by
+        (source fhir_uri, source version, target fhir_uri, target version), and yielding its serialized elements.
+        The rows come in element order, so the rows of each element are consecutive.
+        """
+        query = text(
+            ConceptMapVersion.reviewed_mapping_rows_select.format(
+                version_parameter="concept_map_version_uuid",
+                group_filter="""
+                and tv_source.fhir_uri is not distinct from :source_fhir_uri
+                and tv_source.version is not distinct from :source_version
+                and tv_target.fhir_uri is not distinct from :target_fhir_uri
+                and tv_target.version is not distinct from :target_version
+                """
+            )
+        ).execution_options(stream_results=True)
+        source_uri, source_version, target_uri, target_version = pair
+        rows = get_db().execute(
+            query,
+            {
+                "concept_map_version_uuid": self.uuid,
+                "source_fhir_uri": source_uri,
+                "source_version": source_version,
+                "target_fhir_uri": target_uri,
+                "target_version": target_version,
+            },
+        )
+
+        yield from self.elements_from_rows(rows)
+
+    def elements_from_rows(self, rows):
+        """
+        Serializes the elements of rows of reviewed_mapping_rows_select, which come in element order, so the rows of
+        each element are consecutive. Used by iter_mapping_group_elements and ConceptMap.diff_mappings.
+        """
+
+        def elements():
+            depends_on_by_columns = {}
+            element = None
+            element_key = None
+            serialized_source_code = None
+            source_concept_uuid = None
+            for row in rows:
+                depends_on_identity, serialized_depends_on = self.depends_on_from_row(row, depends_on_by_columns)
+                if (row.source_concept_uuid, depends_on_identity) != element_key:
+                    if element is not None:
+                        yield element
+                    element_key = (row.source_concept_uuid, depends_on_identity)
+                    if row.source_concept_uuid != source_concept_uuid:
+                        source_concept_uuid = row.source_concept_uuid
+                        serialized_source_code = self.serialize_source_code_row(row)
+                    element = {
+                        "_code": serialized_source_code,
+                        "target": [],
+                    }
+                element["target"].append(self.serialize_target_row(row, serialized_depends_on))
+            if element is not None:
+                yield element
+
+        # sort_concept_map_groups_and_elements keeps one element for each first mapping id: the last one
+        previous = None
+        for element in elements():
+            if previous is not None and previous["target"][0]["id"] != element["target"][0]["id"]:
+                yield previous
+            previous = element
+        if previous is not None:
+            yield previous
+
+    def depends_on_from_row(self, row, depends_on_by_columns: dict) -> tuple:
+        """
+        The dependsOn value of a row of load_reviewed_mapping_rows, as (dependsOn identity as in Code.identity,
+        serialized dependsOn), or (None, None) if it has none. depends_on_by_columns caches each distinct value by its
+        columns, so it is deserialized and serialized once.
+        """
+        if not (row.depends_on_property or row.depends_on_value_schema):
+            return None, None
+        depends_on_columns = (
+            row.depends_on_property,
+            row.depends_on_system,
+            row.depends_on_value_schema,
+            row.depends_on_value_simple,
+            canonical_json(row.depends_on_value_jsonb),
+            row.depends_on_display,
+        )
+        if depends_on_columns not in depends_on_by_columns:
+            depends_on = app.models.codes.DependsOnData.setup_from_database_columns(
+                depends_on_value_schema=row.depends_on_value_schema,
+                depends_on_value_simple=row.depends_on_value_simple,
+                depends_on_value_jsonb=row.depends_on_value_jsonb,
+                depends_on_property=row.depends_on_property,
+                depends_on_system=row.depends_on_system,
+                depends_on_display=row.depends_on_display,
+            )
+            depends_on_by_columns[depends_on_columns] = (
+                (
+                    depends_on.depends_on_property,
+                    depends_on.depends_on_system,
+                    app.models.codes.identity_value(depends_on.depends_on_value),
+                    depends_on.depends_on_display,
+                ),
+                self.serialize_depends_on(depends_on) if depends_on.depends_on_value else None,
+            )
+        return depends_on_by_columns[depends_on_columns]
+
+    def serialize_target_row(self, row, serialized_depends_on) -> dict:
+        """
+        serialize_target for the mapping in a row of load_reviewed_mapping_rows
+        """
+        contributors = MappingContributors(
+            mapping_id=row.mapping_id,
+            mapped_by=ContentCreator.load_by_uuid_from_cache(row.mapped_by),
+            mapped_date_time=row.mapped_date_time,
+            reviewed_by=ContentCreator.load_by_uuid_from_cache(row.reviewed_by),
+            reviewed_date_time=row.reviewed_date_time,
+            map_program_version=row.map_program_version,
+            map_program_prediction_id=row.map_program_prediction_id,
+            map_program_confidence_score=row.map_program_confidence_score,
+        )
+        return self.serialize_target(
+            mapping_id=row.mapping_id,
+            code=row.target_concept_code,
+            display=row.target_concept_display,
+            relationship_code=row.relationship_code,
+            extension=self.serialize_contributor_extension(contributors),
+            serialized_depends_on=serialized_depends_on,
+            reason_for_no_map=row.reason_for_no_map,
+        )
+
+    def serialize_source_code_row(self, row):
+        """
+        serialize_source_code for the source code in a row of load_reviewed_mapping_rows
+        """
+        code_schema = app.models.codes.RoninCodeSchemas(row.source_code_schema)
+        if app.models.codes.RoninCodeSchemas.codeable_concept == code_schema:
+            value = normalized_source_codeable_concept(
+                app.models.codes.FHIRCodeableConcept.deserialize(row.source_code_jsonb)
+            )
+        else:
+            value = row.source_code_simple
+        return self.serialize_source_code_value(row.source_code_id, code_schema, value)
+
+    def serialize_mapping_target(self, source_code, mapping) -> dict:
+        """
+        Serializes one mapping as a member of the target list of the element for its source code.
+        """
+        depends_on = mapping.target.depends_on
+        return self.serialize_target(
+            mapping_id=mapping.mapping_id,
+            code=mapping.target.code,
+            display=mapping.target.display,
+            relationship_code=mapping.relationship.code,
+            extension=self.serialize_contributor_extension(mapping),
+            serialized_depends_on=self.serialize_depends_on(depends_on)
+            if depends_on and depends_on.depends_on_value
+            else None,
+            reason_for_no_map=source_code.reason_for_no_map,
+        )
+
+    @staticmethod
+    def serialize_target(
+        mapping_id: str,
+        code: str,
+        display: str,
+        relationship_code: str,
+        extension: list,
+        serialized_depends_on: Optional[dict],
+        reason_for_no_map: Optional[str],
+    ) -> dict:
+        """
+        Serializes the values of one mapping as a member of a target list, for both serialize_mappings and
+        serialize_mappings_from_rows.
+        """
+        target_serialized = {
+            "id": mapping_id,  # the "mapping_id" introduced in RCDM ConceptMap v5
+            "code": code,
+            "display": display,
+            "equivalence": relationship_code,
+            "extension": extension
+        }
+
+        # add dependsOn
+        if serialized_depends_on is not None:
+            target_serialized["dependsOn"] = serialized_depends_on
+
+        # comment and equivalence
+        if code == "No map" and display == "No matching concept":
+            target_serialized["comment"] = reason_for_no_map
+        if target_serialized["equivalence"] == "source-is-narrower-than-target":
+            target_serialized["equivalence"] = "wider"
+            target_serialized["comment"] = (
+                f"{target_serialized.get('comment')} source-is-narrower-than-target"
+                if target_serialized.get('comment')
+                else "source-is-narrower-than-target"
+            )
+        elif target_serialized["equivalence"] == "source-is-broader-than-target":
+            target_serialized["equivalence"] = "narrower"
+            target_serialized["comment"] = (
+                f"{target_serialized.get('comment')} source-is-broader-than-target"
+                if target_serialized.get('comment')
+                else "source-is-broader-than-target"
+            )
+        return target_serialized
+
     def serialize_source_code(self, code: app.models.codes.Code):
         if app.models.codes.RoninCodeSchemas.codeable_concept == code.code_schema:
+            value = normalized_source_codeable_concept(code.code_object)
+        else:
+            value = code.code
+        return self.serialize_source_code_value(code.custom_terminology_code_id, code.code_schema, value)
+
+    @staticmethod
+    def serialize_source_code_value(code_id: str, code_schema: app.models.codes.RoninCodeSchemas, value):
+        """
+        Serializes a source code from its code_id, schema and value: a normalized CodeableConcept or a code string.
+        """
+        if app.models.codes.RoninCodeSchemas.codeable_concept == code_schema:
             valueKey = "valueCodeableConcept"
-            valueValue = normalized_source_codeable_concept(code.code_object)
         else:
             valueKey = "valueCode"
-            valueValue = code.code
         serialized = {
             "extension": [
                 {
-                    "id": code.custom_terminology_code_id,  # the "code_id" introduced in RCDM ConceptMap v5
+                    "id": code_id,  # the "code_id" introduced in RCDM ConceptMap v5
                     "url": "http://projectronin.io/fhir/StructureDefinition/Extension/canonicalSourceData",
-                    valueKey: valueValue
+                    valueKey: value
                 }
             ]
         }
@@ -1254,6 +1757,9 @@ class ConceptMapVersion:
         return serialized
 
     def serialize_contributor_extension(self, mapping):
+        """
+        @param mapping: a Mapping, or the MappingContributors of one
+        """
         contributor = []
         if mapping.mapped_by is not None:
             role = "mapper"
@@ -1447,6 +1953,9 @@ class ConceptMapVersion:
         self,
         include_internal_info=False,
         schema_version: int = ConceptMap.next_schema_version,
+        stream_elements: bool = False,
+        mapping_rows: Optional[list] = None,
+        groups: Optional[list] = None,
     ):
         """
         Serialize the concept map version
@@ -1454,6 +1963,14 @@ class ConceptMapVersion:
         source_value_set_uuid, source_value_set_version_uuid, target_value_set_uuid, target_value_set_version_uuid.
         @param schema_version: Format to use in serialization. Caller may accept the default, or input a choice between
         the current ConceptMap.database_schema_version (such as 3) and ConceptMap.next_schema_version (such as 4).
+        @param stream_elements: Caller may set True to get each group.element as a StreamedArray, for output with
+        app.helpers.stream_helper.stream_json_response. Default is False, for plain lists. If the mappings are not
+        loaded and neither mapping_rows nor groups is passed, the elements are read from the database as they are
+        written out, with stream_mapping_groups.
+        @param mapping_rows: Caller may pass the result of load_reviewed_mapping_rows to serialize the groups directly
+        from the rows, with serialize_mappings_from_rows, instead of from self.mappings. The output is the same.
+        @param groups: Caller may pass the "group" list from an earlier serialize of this version, in any
+        schema_version, to reuse it as is instead of serializing the mappings again. The groups are shared, not copied.
         @return: object structure representing the concept map and conforming to the specified schema_version
         """
         # Prepare according to the version
@@ -1497,7 +2014,7 @@ class ConceptMapVersion:
                 "%Y-%m-%dT%H:%M:%S.%f+00:00"
             ),
             "version": self.version,
-            "group": self.serialize_mappings(),
+            "group": groups,
             "extension": [
                 {
                     "url": "http://projectronin.io/fhir/StructureDefinition/Extension/ronin-conceptMapSchema",
@@ -1539,20 +2056,208 @@ class ConceptMapVersion:
                 "target_value_set_version_uuid": self.target_value_set_version_uuid,
             }
 
-        serialized["group"] = ConceptMap.sort_concept_map_groups_and_elements(serialized.get("group"))
+        if groups is None:
+            if stream_elements and mapping_rows is None and not self._mappings:
+                # Nothing loaded: read each group's elements from the database while they are written out
+                serialized["group"] = self.stream_mapping_groups()
+            else:
+                serialized["group"] = ConceptMap.sort_concept_map_groups_and_elements(
+                    self.serialize_mappings()
+                    if mapping_rows is None
+                    else self.serialize_mappings_from_rows(mapping_rows)
+                )
+        if stream_elements and serialized["group"] is not None:
+            for group in serialized["group"]:
+                group["element"] = StreamedArray(group["element"])
         return serialized
 
-    def prepare_for_oci(self, schema_version: int = ConceptMap.next_schema_version):
+    def is_published(self) -> bool:
+        """
+        True once this version has been published. From then on its mappings do not change, so its serialized
+        mappings are stored in concept_maps.serialized_version and read from there by serialize_published.
+        """
+        return self.published_date is not None and self.status in ("active", "retired")
+
+    def serialize_published(
+        self,
+        schema_version: int = ConceptMap.next_schema_version,
+        stream_elements: bool = False,
+        mapping_rows: Optional[list] = None,
+    ):
+        """
+        The same output as serialize(include_internal_info=False). If this version is published, its "group" list is
+        read from the stored serialized form, and everything else is serialized now, so edits to the concept map
+        metadata after publication are included. A published version with no stored form for the current
+        serialized_artifact_revision, such as one published before forms were stored, is serialized and stored now.
+        @param schema_version: as for serialize()
+        @param stream_elements: as for serialize(). The stored elements are then decompressed as they are written out.
+        @param mapping_rows: as for serialize()
+        """
+        if not self.is_published():
+            return self.serialize(
+                include_internal_info=False,
+                schema_version=schema_version,
+                stream_elements=stream_elements,
+                mapping_rows=mapping_rows,
+            )
+
+        stored = self.load_serialized_artifact(schema_version)
+        if stored is None:
+            if mapping_rows is not None:
+                groups = ConceptMap.sort_concept_map_groups_and_elements(self.serialize_mappings_from_rows(mapping_rows))
+            elif self._mappings:
+                groups = ConceptMap.sort_concept_map_groups_and_elements(self.serialize_mappings())
+            else:
+                groups = self.stream_mapping_groups()
+            stored = ConceptMapVersion.encode_serialized_groups(groups)
+            # Storing is only an optimization: a failure here must not fail the read
+            self.store_serialized_artifacts([schema_version], *stored)
+
+        return self.serialize(
+            include_internal_info=False,
+            schema_version=schema_version,
+            stream_elements=stream_elements,
+            groups=ConceptMapVersion.decode_serialized_groups(*stored, stream_elements=stream_elements),
+        )
+
+    @staticmethod
+    def encode_serialized_groups(groups: list) -> tuple:
+        """
+        The stored form of a "group" list from serialize: (headers, content). headers lists each group without its
+        elements, and with its "element_count". content is the elements of every group, in group order, as gzipped
+        JSON lines. Elements may be any iterable, such as the generators of stream_mapping_groups: they are consumed
+        one at a time, so only the compressed content is held in memory.
+        """
+        headers = []
+        buffer = io.BytesIO()
+        with gzip.GzipFile(fileobj=buffer, mode="wb") as content:
+            for group in groups:
+                header = {key: value for key, value in group.items() if key != "element"}
+                header["element_count"] = 0
+                for element in group["element"]:
+                    content.write(json.dumps(element, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+                    content.write(b"\n")
+                    header["element_count"] += 1
+                headers.append(header)
+        return headers, buffer.getvalue()
+
+    @staticmethod
+    def decode_serialized_groups(headers: list, content: bytes, stream_elements: bool = False) -> list:
+        """
+        The "group" list from the stored form made by encode_serialized_groups. If stream_elements is True, the
+        elements of each group are an iterator that decompresses them as it is consumed: consume them in group order,
+        and each one only once, as stream_json_response does. Otherwise, they are lists.
+        """
+        lines = gzip.GzipFile(fileobj=io.BytesIO(content), mode="rb")
+        groups = []
+        for header in headers:
+            group = {key: value for key, value in header.items() if key != "element_count"}
+            elements = map(json.loads, itertools.islice(lines, header["element_count"]))
+            group["element"] = elements if stream_elements else list(elements)
+            groups.append(group)
+        return groups
+
+    def load_serialized_artifact(self, schema_version: int) -> Optional[tuple]:
+        """
+        The stored form of this version in schema_version, as (headers, content) for decode_serialized_groups, or
+        None if there is none stored by the current serialized_artifact_revision.
+        """
+        conn = get_db()
+        row = conn.execute(
+            text(
+                """
+                select groups, content from concept_maps.serialized_version
+                where concept_map_version_uuid=:version_uuid
+                and schema_version=:schema_version
+                and serializer_revision=:serializer_revision
+                """
+            ),
+            {
+                "version_uuid": self.uuid,
+                "schema_version": schema_version,
+                "serializer_revision": ConceptMapVersion.serialized_artifact_revision,
+            },
+        ).first()
+        if row is None:
+            return None
+        return row.groups, bytes(row.content)
+
+    def store_serialized_artifact(self, schema_version: int, headers: list, content: bytes):
+        """
+        Store the form of this version in schema_version made by encode_serialized_groups, replacing any stored before
+        (as when a version is published again, or by an earlier revision).
+        """
+        conn = get_db()
+        conn.execute(
+            text(
+                """
+                insert into concept_maps.serialized_version
+                (concept_map_version_uuid, schema_version, serializer_revision, groups, content)
+                values
+                (:version_uuid, :schema_version, :serializer_revision, :groups, :content)
+                on conflict (concept_map_version_uuid, schema_version) do update
+                set serializer_revision = excluded.serializer_revision, groups = excluded.groups,
+                content = excluded.content, created_date = now()
+                """
+            ).bindparams(bindparam("groups", type_=JSONB)),
+            {
+                "version_uuid": self.uuid,
+                "schema_version": schema_version,
+                "serializer_revision": ConceptMapVersion.serialized_artifact_revision,
+                "groups": headers,
+                "content": content,
+            },
+        )
+
+    def store_serialized_artifacts(self, schema_versions, headers: list, content: bytes):
+        """
+        Store the form of this version made by encode_serialized_groups in each of schema_versions, in a savepoint.
+        The stored forms are only an optimization: serialize_published stores any that are missing, so a failure
+        here is logged and rolled back, and is not raised to the caller.
+        """
+        conn = get_db()
+        try:
+            with conn.begin_nested():
+                for schema_version in schema_versions:
+                    self.store_serialized_artifact(schema_version, headers, content)
+        except Exception as e:
+            logging.warning(f"Unable to store serialized Concept Map Version {self.uuid}: {e}")
+
+    def store_published_artifacts(self, mapping_rows: Optional[list] = None, groups: Optional[list] = None):
+        """
+        Supports publish() by storing the serialized form of this version in each schema version it is published in.
+        @param mapping_rows: optional result of load_reviewed_mapping_rows, as for serialize()
+        @param groups: optional "group" list already serialized for this version, as for serialize()
+        """
+        if groups is None:
+            groups = ConceptMap.sort_concept_map_groups_and_elements(
+                self.serialize_mappings()
+                if mapping_rows is None
+                else self.serialize_mappings_from_rows(mapping_rows)
+            )
+        self.store_serialized_artifacts(
+            sorted({ConceptMap.database_schema_version, ConceptMap.next_schema_version}),
+            *ConceptMapVersion.encode_serialized_groups(groups),
+        )
+
+    def prepare_for_oci(
+        self,
+        schema_version: int = ConceptMap.next_schema_version,
+        mapping_rows: Optional[list] = None,
+        groups: Optional[list] = None,
+    ):
         """
         Prepare the data required to publish a concept map to OCI.
         @param: schema_version: Format to use in serialization. Caller may accept the default, or input a choice between
         the current ConceptMap.database_schema_version (such as 3) and ConceptMap.next_schema_version (such as 4).
+        @param mapping_rows: optional result of load_reviewed_mapping_rows, as for serialize()
+        @param groups: optional "group" list already serialized for this version, as for serialize()
         @raise BadRequestWithCode if the schema_version is v4 or later and there are no mappings in the concept map.
         @return: (serialized, initial_path) provides the serialized object and the correct starting path in OCI storage.
         """
         # Serialize
         serialized = self.serialize(
-            include_internal_info=False, schema_version=schema_version
+            include_internal_info=False, schema_version=schema_version, mapping_rows=mapping_rows, groups=groups
         )
 
         if len(serialized.get("group")) == 0:
@@ -1611,6 +2316,11 @@ class ConceptMapVersion:
         A method to complete the full publication process including pushing to OCI, Simplifier,
         Normalization Registry and setting status active. If the current ConceptMap.database_schema_version (such as 3)
         and ConceptMap.next_schema_version (such as 4). are different, publishes both formats.
+        The mappings are serialized once, and every format and destination is built from that one "group" list. The
+        content is prepared here, where the database is read, and then sent to the destinations concurrently by
+        app.helpers.publish_helper, each with its own timing and retries: first the OCI formats, which must all
+        succeed before the version is made active, then Simplifier and the Normalization Registry, which lists the
+        newly active version.
         @param resolve_errors After publish, reach out to the Error Service to determine whether any of the new concepts
                 in the map will resolve any errors previously reported. To support tests and repairs without exposing
                 OCI to unauthorized changes, default is False. The only caller who sets it to True is the API endpoint.
@@ -1618,31 +2328,49 @@ class ConceptMapVersion:
         @raise BadRequestWithCode if the schema_version is v4 or later and there are no mappings in the concept map.
         @return: n/a
         """
+        # A version loaded with load_mappings=False, or from_metadata, is serialized straight from the mapping rows,
+        # queried once here
+        mapping_rows = None if self._mappings else self.load_reviewed_mapping_rows()
+        groups = ConceptMap.sort_concept_map_groups_and_elements(
+            self.serialize_mappings() if mapping_rows is None else self.serialize_mappings_from_rows(mapping_rows)
+        )
 
-        # OCI: output as ConceptMap.database_schema_version, which may be the same as ConceptMap.next_schema_version
-        self.send_to_oci(ConceptMap.database_schema_version, is_overwrite_allowed)
-        # write diff to OCI - comment out until we consider storage implications
-        # self.diff_versions_and_store_diff(concept_map_to_json, initial_path, schema_version, is_overwrite_allowed)
-
-        # OCI: also output as ConceptMap.next_schema_version, if different from ConceptMap.database_schema_version
-        if ConceptMap.database_schema_version != ConceptMap.next_schema_version:
-            self.send_to_oci(ConceptMap.next_schema_version, is_overwrite_allowed)
-            # write diff to OCI - comment out until we consider storage implication
+        # OCI: output as ConceptMap.database_schema_version and also as ConceptMap.next_schema_version, if different
+        oci_destinations = []
+        for schema_version in sorted({ConceptMap.database_schema_version, ConceptMap.next_schema_version}):
+            concept_map_to_json, initial_path = self.prepare_for_oci(schema_version, groups=groups)
+            oci_destinations.append(
+                PublishDestination(
+                    name=f"{initial_path}/published/{self.concept_map.uuid}",
+                    send=functools.partial(
+                        self.save_to_oci, concept_map_to_json, initial_path, is_overwrite_allowed
+                    ),
+                )
+            )
+            # write diff to OCI - comment out until we consider storage implications
             # self.diff_versions_and_store_diff(concept_map_to_json, initial_path, schema_version, is_overwrite_allowed)
+        publish_to_destinations(oci_destinations)
 
         # Follow-up publishing activities
         self.version_set_status_active()
         self.set_publication_date()
         self.retire_and_obsolete_previous_version()
-        # todo: INFX-4734 must fix serialization to Simplifier - need a newer serialize function for JSONCode()
-        try:
-            self.to_simplifier()
-        except:
-            logging.warning(f"Unable to publish Concept Map Version {self.uuid}, {self.concept_map.title} version {self.version} to Simplifier")
-            pass  # Simplifier API not reliable, so we make that step optional
+        self.store_published_artifacts(groups=groups)
 
-        # Publish new version of data normalization registry
-        app.models.data_ingestion_registry.DataNormalizationRegistry.publish_data_normalization_registry()
+        # Simplifier gets the ConceptMap.next_schema_version output, now with the publication date. Its API is not
+        # reliable, so that step is optional. Also publish new version of data normalization registry.
+        # todo: INFX-4734 must fix serialization to Simplifier - need a newer serialize function for JSONCode()
+        concept_map_to_json, initial_path = self.prepare_for_oci(ConceptMap.next_schema_version, groups=groups)
+        publish_to_destinations(
+            [
+                PublishDestination(
+                    name="Simplifier",
+                    send=functools.partial(self.to_simplifier, concept_map_to_json=concept_map_to_json),
+                    required=False,
+                )
+            ]
+            + app.models.data_ingestion_registry.DataNormalizationRegistry.publish_destinations()
+        )
 
         # Contact the Error Validation Service to resolve any errors fixed by the new concept map
         if resolve_errors:
@@ -1650,13 +2378,19 @@ class ConceptMapVersion:
                 concept_map_version_uuid=self.uuid
             )
 
-    def send_to_oci(self, schema_version, is_overwrite_allowed: bool = False):
-        concept_map_to_json, initial_path = self.prepare_for_oci(schema_version)
+    def send_to_oci(self, schema_version, is_overwrite_allowed: bool = False, mapping_rows: Optional[list] = None):
+        concept_map_to_json, initial_path = self.prepare_for_oci(schema_version, mapping_rows)
+        self.save_to_oci(concept_map_to_json, initial_path, is_overwrite_allowed)
+
+    def save_to_oci(self, concept_map_to_json: dict, initial_path: str, is_overwrite_allowed: bool = False):
+        """
+        Save the output of prepare_for_oci to OCI. The content is not changed, so it can be saved again on a retry.
+        """
         oci_path = folder_path_for_oci(
             concept_map_to_json, initial_path + f"/published/{self.concept_map.uuid}", content_type="json"
         )
         set_up_and_save_to_object_store(
-            concept_map_to_json,
+            dict(concept_map_to_json),
             oci_path,
             is_overwrite_allowed,
         )
@@ -1683,27 +2417,31 @@ class ConceptMapVersion:
             is_overwrite_allowed
         )  # sends to OCI
 
-    def to_simplifier(self):
+    def to_simplifier(self, mapping_rows: Optional[list] = None, concept_map_to_json: Optional[dict] = None):
         """
         A method to send a concept map version to
         This function uses the highest available output format schema (ConceptMap.next_schema_version).
+        @param mapping_rows: optional result of load_reviewed_mapping_rows, as for serialize()
+        @param concept_map_to_json: optional output of prepare_for_oci(ConceptMap.next_schema_version) to send, which
+        is not changed. If omitted, it is prepared here.
         @raise BadRequestWithCode if the schema_version is v4 or later and there are no mappings in the concept map.
         @return: n/a
         """
-        concept_map_to_json, initial_path = self.prepare_for_oci(
-            ConceptMap.next_schema_version
-        )
+        if concept_map_to_json is None:
+            concept_map_to_json, initial_path = self.prepare_for_oci(
+                ConceptMap.next_schema_version, mapping_rows
+            )
         resource_id = concept_map_to_json["id"]
         resource_type = concept_map_to_json["resourceType"]  # param for Simplifier
-        concept_map_to_json["status"] = "active"  # Simplifier requires status
+        concept_map_to_json = dict(concept_map_to_json, status="active")  # Simplifier requires status
         # Check if the 'group' key is present
         if "group" in concept_map_to_json and len(concept_map_to_json["group"]) > 0:
             group = concept_map_to_json["group"][0]
 
             if "element" in group:
-                group["element"] = group["element"][
-                    :50
-                ]  # Limit the 'element' list to the top 50 entries
+                concept_map_to_json["group"] = [
+                    dict(group, element=group["element"][:50])  # Limit the 'element' list to the top 50 entries
+                ] + concept_map_to_json["group"][1:]
 
         publish_to_simplifier(resource_type, resource_id, concept_map_to_json)
 
@@ -1755,20 +2493,22 @@ class ConceptMapVersion:
     @classmethod
     def get_active_concept_map_versions(cls) -> List["ConceptMapVersion"]:
         """
-        A class method to query the database for active concept map versions.
-        @return: A list on active concept maps version uuids
+        A class method to query the database for active concept map versions, in one statement.
+        @return: A list of from_metadata handles on the active concept map versions, by concept map and version. Their
+        concept maps and mappings are only loaded if the caller uses them.
         """
         conn = get_db()
         data = conn.execute(
             text(
-                """  
-                SELECT uuid FROM concept_maps.concept_map_version  
-                WHERE status = 'active'  
+                """
+                SELECT * FROM concept_maps.concept_map_version
+                WHERE status = 'active'
+                ORDER BY concept_map_uuid, version
                 """
             )
         )
 
-        active_concept_map_versions = [cls(row.uuid) for row in data]
+        active_concept_map_versions = [cls.from_metadata(row) for row in data]
         return active_concept_map_versions
 
     @staticmethod
@@ -2169,6 +2909,8 @@ class Mapping:
     mapping_id: Optional[str] = None
     conn: Optional[None] = None
     _stored_deduplication_hash: Optional[str] = None
+    # The inputs and result of the last deduplication_hash calculation
+    _deduplication_hash_cache: Optional[tuple] = field(default=None, init=False, repr=False, compare=False)
 
     def __post_init__(self):
         self.conn = get_db()
@@ -2185,17 +2927,32 @@ class Mapping:
 
     @property
     def deduplication_hash(self):
+        """
+        The mapping_id calculated from the source code_id, relationship and target code. It is recalculated only
+        when one of those inputs has changed since the last calculation.
+        """
+        hash_inputs = (
+            self.source.code.code_id,
+            self.relationship.code,
+            self.target.code,  # Don't need to handle codeable concepts, since we don't map to them
+            self.target.display,
+            self.target.terminology_version.fhir_uri,
+        )
+        if self._deduplication_hash_cache is not None and self._deduplication_hash_cache[0] == hash_inputs:
+            return self._deduplication_hash_cache[1]
+
         deduplication_hash = app.helpers.id_helper.generate_mapping_id_with_source_code_id(
-            source_code_id=self.source.code.code_id,
-            relationship_code=self.relationship.code,
-            target_concept_code=self.target.code,  # Don't need to handle codeable concepts, since we don't map to them
-            target_concept_display=self.target.display,
-            target_concept_system=self.target.terminology_version.fhir_uri
+            source_code_id=hash_inputs[0],
+            relationship_code=hash_inputs[1],
+            target_concept_code=hash_inputs[2],
+            target_concept_display=hash_inputs[3],
+            target_concept_system=hash_inputs[4]
         )
 
         if self._stored_deduplication_hash:
             if deduplication_hash != self._stored_deduplication_hash:
                 logging.warning(f"Stored deduplication hash does not match calculated one for Mapping. Mapping UUID: {self.uuid}")
+        self._deduplication_hash_cache = (hash_inputs, deduplication_hash)
         return deduplication_hash
 
     @classmethod
@@ -2391,35 +3148,106 @@ def update_comments_source_concept(source_concept_uuid, comments):
     )
 
 
+# Source concepts per page of get_concepts_for_assignment_page, if the caller does not say
+CONCEPTS_FOR_ASSIGNMENT_PAGE_SIZE = 500
+
+# The source concepts of a concept map version with their assignment data, in source concept uuid order. Pages are
+# read by keyset on sc.uuid, an index range scan on cm_source_concept_data_version_uuid.
+concepts_for_assignment_select = """
+    SELECT 
+        *, 
+        sc.code_schema as source_code_schema, 
+        sc.code_simple as source_code_simple, 
+        sc.code_jsonb as source_code_jsonb, 
+        sc.display as source_display, 
+        sc.uuid as source_uuid, 
+        pmu.uuid as mapper_uuid, 
+        pmu.first_last_name as assigned_mapper, 
+        pmu2.uuid as reviewer_uuid, 
+        pmu2.first_last_name as assigned_reviewer, 
+        ctc.additional_data->'count_of_resources_affected' as count_of_resources_affected  
+    FROM concept_maps.source_concept_data sc  
+    LEFT JOIN project_management.user pmu 
+        ON pmu.uuid = sc.assigned_mapper  
+    LEFT JOIN project_management.user pmu2 
+        ON sc.assigned_reviewer = pmu2.uuid  
+    LEFT JOIN custom_terminologies.code_data ctc 
+        ON sc.custom_terminology_code_uuid = ctc.uuid  
+    WHERE sc.concept_map_version_uuid = :version_uuid
+    {keyset}
+    ORDER BY sc.uuid
+    {limit}
+    """
+
+
 def get_concepts_for_assignment(version_uuid):
+    """
+    Every source concept of the concept map version, with its assignment data, in a stable order.
+    For concept map versions with many source concepts, use get_concepts_for_assignment_page.
+    """
     conn = get_db()
     concepts = conn.execute(
-        text(
-            """
-            SELECT 
-                *, 
-                sc.code_schema as source_code_schema, 
-                sc.code_simple as source_code_simple, 
-                sc.code_jsonb as source_code_jsonb, 
-                sc.display as source_display, 
-                sc.uuid as source_uuid, 
-                pmu.uuid as mapper_uuid, 
-                pmu.first_last_name as assigned_mapper, 
-                pmu2.uuid as reviewer_uuid, 
-                pmu2.first_last_name as assigned_reviewer, 
-                ctc.additional_data->'count_of_resources_affected' as count_of_resources_affected  
-            FROM concept_maps.source_concept_data sc  
-            LEFT JOIN project_management.user pmu 
-                ON pmu.uuid = sc.assigned_mapper  
-            LEFT JOIN project_management.user pmu2 
-                ON sc.assigned_reviewer = pmu2.uuid  
-            LEFT JOIN custom_terminologies.code_data ctc 
-                ON sc.custom_terminology_code_uuid = ctc.uuid  
-            WHERE sc.concept_map_version_uuid = :version_uuid
-            """
-        ),
+        text(concepts_for_assignment_select.format(keyset="", limit="")),
         {"version_uuid": version_uuid},
     )
     column_names = concepts.keys()
     concept_list = [dict(zip(column_names, row)) for row in concepts]
     return concept_list
+
+
+def get_concepts_for_assignment_page(
+    version_uuid, count: int = CONCEPTS_FOR_ASSIGNMENT_PAGE_SIZE, cursor: Optional[str] = None
+) -> dict:
+    """
+    One page of the output of get_concepts_for_assignment, read by keyset so that every page costs the same, and
+    stays stable while concepts on earlier pages are assigned.
+    @param count: the most source concepts to return
+    @param cursor: the next_cursor of the previous page, or None for the first page
+    @return: dict with the "concepts" on this page, the "next_cursor" to pass for the next page, or None if this is
+    the last page, and the "estimated_total" source concepts in the concept map version: the query planner's
+    estimate, which is exact when the first page is also the last
+    @raise BadRequestWithCode if the cursor is not one returned by this function
+    """
+    parameters = {"version_uuid": version_uuid, "limit": count + 1}
+    keyset = ""
+    if cursor is not None:
+        try:
+            parameters["after_uuid"] = uuid.UUID(cursor)
+        except ValueError:
+            raise BadRequestWithCode(
+                "ConceptMap.concepts_to_assign.cursor",
+                f"The cursor {cursor} is not a valid page cursor",
+            )
+        keyset = "AND sc.uuid > :after_uuid"
+
+    conn = get_db()
+    rows = conn.execute(
+        text(concepts_for_assignment_select.format(keyset=keyset, limit="LIMIT :limit")),
+        parameters,
+    )
+    column_names = rows.keys()
+    concepts = [dict(zip(column_names, row)) for row in rows]
+
+    next_cursor = None
+    if len(concepts) > count:
+        concepts = concepts[:count]
+        next_cursor = str(concepts[-1]["source_uuid"])
+
+    if cursor is None and next_cursor is None:
+        estimated_total = len(concepts)
+    else:
+        plan = conn.execute(
+            text(
+                """
+                EXPLAIN (FORMAT JSON)
+                SELECT 1 FROM concept_maps.source_concept_data
+                WHERE concept_map_version_uuid = :version_uuid
+                """
+            ),
+            {"version_uuid": version_uuid},
+        ).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimated_total = plan[0]["Plan"]["Plan Rows"]
+
+    return {"concepts": concepts, "next_cursor": next_cursor, "estimated_total": estimated_total}
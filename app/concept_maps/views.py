@@ -13,6 +13,7 @@ import app.tasks as tasks
 from app.concept_maps.models import *
 from app.concept_maps.versioning_models import *
 from app.helpers.oci_helper import get_data_from_oci, OCI_OVERWRITE_PARAM_CONST
+from app.helpers.stream_helper import stream_json_response
 import app.concept_maps.rxnorm_mapping_models
 
 from app.errors import NotFoundException
@@ -49,12 +50,19 @@ def get_concept_map_version(version_uuid):
     @param version_uuid: Concept Map version UUID
     """
     include_internal_info = bool(request.values.get("include_internal_info"))
-    concept_map_version = ConceptMapVersion(version_uuid)
-    concept_map_to_json = concept_map_version.serialize(
-        include_internal_info=include_internal_info,
-        schema_version=ConceptMap.next_schema_version,
-    )
-    return jsonify(concept_map_to_json)
+    concept_map_version = ConceptMapVersion(version_uuid, load_mappings=False)
+    if include_internal_info:
+        concept_map_to_json = concept_map_version.serialize(
+            include_internal_info=include_internal_info,
+            schema_version=ConceptMap.next_schema_version,
+            stream_elements=True,
+        )
+    else:
+        concept_map_to_json = concept_map_version.serialize_published(
+            schema_version=ConceptMap.next_schema_version,
+            stream_elements=True,
+        )
+    return stream_json_response(concept_map_to_json)
 
 
 @concept_maps_blueprint.route(
@@ -134,17 +142,24 @@ def create_initial_concept_map_and_version_one():
             )
 
         concept_map_version = ConceptMapVersion.load_by_concept_map_uuid_and_version(
-            concept_map_uuid=concept_map_uuid, version=version
+            concept_map_uuid=concept_map_uuid, version=version, load_mappings=False
         )
 
         if not concept_map_version:
             return jsonify({"error": "Concept Map Version not found."}, 404)
 
-        serialized_concept_map_version = concept_map_version.serialize(
-            include_internal_info=include_internal_info,
-            schema_version=ConceptMap.next_schema_version,
-        )
-        return jsonify(serialized_concept_map_version)
+        if include_internal_info:
+            serialized_concept_map_version = concept_map_version.serialize(
+                include_internal_info=include_internal_info,
+                schema_version=ConceptMap.next_schema_version,
+                stream_elements=True,
+            )
+        else:
+            serialized_concept_map_version = concept_map_version.serialize_published(
+                schema_version=ConceptMap.next_schema_version,
+                stream_elements=True,
+            )
+        return stream_json_response(serialized_concept_map_version)
 
 
 @concept_maps_blueprint.route(
@@ -196,7 +211,8 @@ def get_concept_map_version_published(version_uuid):
     @param version_uuid: Concept Map version UUID
     @raise BadRequestWithCode if the schema_version is v4 or later and there are no mappings in the concept map.
     """
-    concept_map_version = ConceptMapVersion(version_uuid)
+    # publish() serializes from the mapping rows; the GET needs only the metadata
+    concept_map_version = ConceptMapVersion(version_uuid, load_mappings=False)
 
     if request.method == "POST":
         oci_overwrite_allowed = request.values.get(OCI_OVERWRITE_PARAM_CONST, "false").lower() == "true"
@@ -429,9 +445,32 @@ def full_back_fill_to_simplifier():
     "/ConceptMaps/<string:version_uuid>/concepts_to_assign", methods=["GET"]
 )
 def concepts_for_mapper_assignment(version_uuid):
-    dict_list = get_concepts_for_assignment(version_uuid)
-    response = jsonify(dict_list)
-    return response
+    """
+    The source concepts of the concept map version, with their assignment data, in a stable order.
+    With the parameter count or cursor, returns one page of at most count source concepts (default 500), as
+    {"concepts": [...], "next_cursor": ..., "estimated_total": ...}. Pass next_cursor as cursor for the next page;
+    it is null on the last page. Without either parameter, returns the list of every source concept.
+    """
+    count = request.values.get("count")
+    cursor = request.values.get("cursor") or None
+    if count is None and cursor is None:
+        dict_list = get_concepts_for_assignment(version_uuid)
+        return jsonify(dict_list)
+
+    if count is None or count == "":
+        count = CONCEPTS_FOR_ASSIGNMENT_PAGE_SIZE
+    else:
+        try:
+            count = int(count)
+        except ValueError:
+            count = 0
+        if count < 1:
+            raise BadRequestWithCode(
+                "ConceptMap.concepts_to_assign.count",
+                "The parameter count must be a positive integer",
+            )
+    page = get_concepts_for_assignment_page(version_uuid, count=count, cursor=cursor)
+    return jsonify(page)
 
 
 @concept_maps_blueprint.route("/ConceptMaps/map_no_maps", methods=["POST"])
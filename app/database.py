@@ -5,6 +5,8 @@ from elasticsearch import Elasticsearch
 from opensearchpy import OpenSearch
 from decouple import config
 
+from app.helpers.cache_helper import end_pending_invalidations
+
 # # Create an SQL Alchemy engine instance for connecting to the Postgres database.
 # SQL_ALCHEMY_ENGINE = create_engine(
 #     f"postgresql://{config('DATABASE_USER', default='')}:{config('DATABASE_PASSWORD', default='')}@{config('DATABASE_HOST', default='')}/{config('DATABASE_NAME', default='')}",
@@ -111,6 +113,7 @@ def rollback_and_close_connection_if_open():
     if db is not None:
         db.rollback()
         db.close()
+    end_pending_invalidations(committed=False)
 
 
 def close_db(e=None):
@@ -127,11 +130,16 @@ def close_db(e=None):
                     db.rollback()
                 else:
                     logging.info("Not rolling back because DISABLE_ROLLBACK_AFTER_REQUEST=True")
+                    # Later requests on this connection read the changes
+                    end_pending_invalidations(committed=True)
             else:
                 db.commit()
+                # Only now can other processes read the changes, so only now are their caches invalidated
+                end_pending_invalidations(committed=True)
         if e is not None:
             db.rollback()
         if not current_app.config.get("DISABLE_CLOSE_AFTER_REQUEST"):
             db.close()
         else:
             logging.info("Not closing connection because DISABLE_CLOSE_AFTER_REQUEST=True")
+    end_pending_invalidations(committed=False)
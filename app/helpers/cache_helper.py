@@ -0,0 +1,322 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+import redis
+from cachetools import TTLCache
+from cachetools.keys import hashkey
+from flask import g, has_request_context
+
+from app.helpers.redis_helper import get_redis
+
+LOGGER = logging.getLogger()
+
+CACHE_KEY_PREFIX = "infx:cache"
+# Part of every key in the shared tier, so that values stored in another format, as by an earlier release still
+# running during a deploy, are never read
+SHARED_VALUE_FORMAT = "json"
+INVALIDATION_CHANNEL = "infx:cache:invalidate"
+# After a Redis error, the shared tier is skipped for this long, so requests are not slowed by repeated timeouts
+REDIS_RETRY_INTERVAL_SECONDS = 60
+
+# Every TwoTierCache in this process, by namespace, so that invalidation messages can find them
+_caches = {}
+_listener_lock = threading.Lock()
+_listener_pid = None
+_listener_thread = None
+_redis_unavailable_until = 0.0
+
+
+def _redis_or_none():
+    """
+    Return the Redis client, or None while Redis is considered unavailable after a recent error.
+    """
+    if time.monotonic() < _redis_unavailable_until:
+        return None
+    return get_redis()
+
+
+def _mark_redis_unavailable(error):
+    global _redis_unavailable_until
+    if time.monotonic() >= _redis_unavailable_until:
+        LOGGER.warning(
+            f"Shared cache unavailable, using in-process cache only for {REDIS_RETRY_INTERVAL_SECONDS}s: {error}"
+        )
+    _redis_unavailable_until = time.monotonic() + REDIS_RETRY_INTERVAL_SECONDS
+
+
+def _handle_invalidation_message(message):
+    """
+    Message data is "<namespace>:<generation>". Clear the in-process tier for the namespace and move to the new
+    generation, so that values stored in the shared tier before the invalidation are no longer read.
+    """
+    namespace, _, generation = message["data"].decode("utf-8").rpartition(":")
+    cache = _caches.get(namespace)
+    if cache is not None:
+        cache.clear_local(generation=int(generation))
+
+
+def _listener_running():
+    return _listener_pid == os.getpid() and _listener_thread is not None and _listener_thread.is_alive()
+
+
+def _ensure_invalidation_listener(client):
+    """
+    Subscribe this process to invalidation broadcasts. Called lazily on first use of the shared tier,
+    because a listener thread started before uwsgi or Celery forks its workers does not survive in them.
+    The listener thread ends on a Redis connection error; it is then started again on the next call, and the
+    in-process tiers are cleared, as broadcasts may have been missed while it was down.
+    """
+    global _listener_pid, _listener_thread
+    if _listener_running():
+        return
+    with _listener_lock:
+        if _listener_running():
+            return
+        if _listener_pid == os.getpid():
+            LOGGER.warning("Cache invalidation listener stopped, restarting it")
+            for cache in _caches.values():
+                cache.clear_local()
+                if isinstance(cache, TwoTierCache):
+                    cache.generation = None
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{INVALIDATION_CHANNEL: _handle_invalidation_message})
+        _listener_thread = pubsub.run_in_thread(sleep_time=1, daemon=True)
+        _listener_pid = os.getpid()
+
+
+def _pending_invalidations():
+    """
+    The namespaces invalidated in the current request, which are invalidated once its transaction ends, or None
+    outside a request with a database connection.
+    """
+    if not has_request_context() or "db" not in g:
+        return None
+    if "pending_cache_invalidations" not in g:
+        g.pending_cache_invalidations = set()
+    return g.pending_cache_invalidations
+
+
+class TwoTierCache:
+    """
+    A cache with an in-process TTL tier (L1) in front of a tier shared by all processes on Redis (L2).
+    A miss in L1 is looked up in L2 before the value is loaded, and values loaded by any process are stored in both.
+
+    Keys in L2 include a generation number for the namespace. invalidate_cache increments the generation and
+    broadcasts it, so every process clears its L1 and stops reading the values stored under the previous generation,
+    which then expire from Redis on their own TTL.
+
+    Values are stored in L2 as JSON: to_dict converts a value to JSON types, and from_dict converts them back. A
+    value that cannot be read back is treated as a miss. Values are never unpickled, as Redis is shared with Celery.
+
+    If Redis is unavailable, the cache behaves like cachetools ttl_cache, which it replaces.
+    """
+
+    def __init__(self, namespace: str, maxsize: int, ttl: int, to_dict=None, from_dict=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.to_dict = to_dict or (lambda value: value)
+        self.from_dict = from_dict or (lambda value: value)
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.lock = threading.RLock()
+        self.generation = None
+
+    def generation_key(self):
+        return f"{CACHE_KEY_PREFIX}:{self.namespace}:generation"
+
+    def shared_key(self, args, kwargs):
+        # JSON, rather than repr, so that UUID and str arguments with the same value share an entry
+        arguments = json.dumps([args, sorted(kwargs.items())], default=str)
+        return f"{CACHE_KEY_PREFIX}:{self.namespace}:{self.generation}:{SHARED_VALUE_FORMAT}:{arguments}"
+
+    def clear_local(self, generation=None):
+        with self.lock:
+            self.local.clear()
+            if generation is not None:
+                self.generation = generation
+
+    def get_or_load(self, args, kwargs, load):
+        pending = _pending_invalidations()
+        if pending is not None and self.namespace in pending:
+            # This request changed the cached data and has not committed: it must read its own changes, and
+            # other processes must not read them from the shared tier
+            return load()
+
+        local_key = hashkey(*args, **kwargs)
+        with self.lock:
+            try:
+                return self.local[local_key]
+            except KeyError:
+                pass
+
+        value = self._get_shared(args, kwargs)
+        if value is None:
+            value = load()
+            self._set_shared(args, kwargs, value)
+
+        with self.lock:
+            try:
+                self.local[local_key] = value
+            except ValueError:
+                pass  # value too large for the cache, as in cachetools
+        return value
+
+    def _get_shared(self, args, kwargs):
+        client = _redis_or_none()
+        if client is None:
+            return None
+        try:
+            _ensure_invalidation_listener(client)
+            if self.generation is None:
+                self.generation = int(client.get(self.generation_key()) or 0)
+            stored = client.get(self.shared_key(args, kwargs))
+        except redis.exceptions.RedisError as e:
+            _mark_redis_unavailable(e)
+            return None
+        if stored is None:
+            return None
+        try:
+            return self.from_dict(json.loads(stored))
+        except Exception as e:
+            LOGGER.warning(f"Value in shared cache {self.namespace} not readable, loading it again: {e}")
+            return None
+
+    def _set_shared(self, args, kwargs, value):
+        # None is not stored in the shared tier, so a missing value is looked up again once it may exist
+        client = _redis_or_none()
+        if value is None or client is None or self.generation is None:
+            return
+        try:
+            stored = json.dumps(self.to_dict(value))
+        except Exception as e:
+            LOGGER.warning(f"Value not stored in shared cache {self.namespace}: {e}")
+            return
+        try:
+            client.set(self.shared_key(args, kwargs), stored, ex=self.ttl)
+        except redis.exceptions.RedisError as e:
+            _mark_redis_unavailable(e)
+
+
+def two_tier_cache(namespace: str, ttl: int = 600, maxsize: int = 128, to_dict=None, from_dict=None):
+    """
+    Decorator to cache a function's results in a TwoTierCache, as a cross-process replacement for
+    cachetools.func.ttl_cache with the same defaults. Use below @classmethod: the class argument is not
+    part of the cache key. Results are shared through Redis as JSON: see TwoTierCache.
+    @param namespace: unique name for this cache, also used by invalidate_cache
+    @param ttl: seconds a value is kept in either tier
+    @param maxsize: maximum number of values kept in the in-process tier
+    @param to_dict: converts a result to JSON types; omit if results are JSON types already
+    @param from_dict: converts the output of to_dict back to a result
+    """
+
+    def decorator(func):
+        cache = TwoTierCache(namespace, maxsize=maxsize, ttl=ttl, to_dict=to_dict, from_dict=from_dict)
+        _caches[namespace] = cache
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key_args = args[1:] if args and isinstance(args[0], type) else args
+            return cache.get_or_load(key_args, kwargs, lambda: func(*args, **kwargs))
+
+        wrapper.cache = cache
+        wrapper.cache_clear = cache.clear_local
+        return wrapper
+
+    return decorator
+
+
+def register_local_cache(namespace: str, cache):
+    """
+    Register an in-process cache that is not a TwoTierCache, such as a preloaded index, so that invalidate_cache
+    and invalidation broadcasts for namespace reach it. cache must have a clear_local(generation=None) method.
+    """
+    _caches[namespace] = cache
+
+
+def listen_for_invalidations():
+    """
+    Subscribe this process to invalidation broadcasts, for registered caches that never read the shared tier.
+    Call it on first use, not at import: see _ensure_invalidation_listener.
+    """
+    client = _redis_or_none()
+    if client is None:
+        return
+    try:
+        _ensure_invalidation_listener(client)
+    except redis.exceptions.RedisError as e:
+        _mark_redis_unavailable(e)
+
+
+def invalidate_cache(*namespaces: str):
+    """
+    Invalidate the named caches in every process: the in-process tier here is cleared at once, and other processes
+    clear theirs when they receive the broadcast. If Redis is unavailable, only this process is invalidated.
+
+    In a request, the invalidation is deferred until close_db commits the request transaction, since other processes
+    would otherwise reload the data before the change is visible to them, and cache it again. Until then, the caches
+    are bypassed by this request.
+    """
+    pending = _pending_invalidations()
+    if pending is not None:
+        pending.update(namespaces)
+        return
+    _invalidate_now(namespaces)
+
+
+def invalidation_pending(namespace: str) -> bool:
+    """
+    Whether the current request has invalidated namespace, so its transaction holds changes to the cached data that
+    other processes cannot read yet.
+    """
+    pending = _pending_invalidations()
+    return pending is not None and namespace in pending
+
+
+def run_after_commit(callback):
+    """
+    Call callback once the current request transaction is committed, as invalidate_cache is deferred: use it to store
+    data read in the request in a cache shared by other requests, which must not see uncommitted data. The callback
+    is dropped if the transaction is rolled back. Outside a request with a database connection, it is called at once.
+    """
+    if not has_request_context() or "db" not in g:
+        callback()
+        return
+    if "pending_after_commit" not in g:
+        g.pending_after_commit = []
+    g.pending_after_commit.append(callback)
+
+
+def end_pending_invalidations(committed: bool):
+    """
+    Called by close_db when the request transaction ends: invalidate the caches deferred by invalidate_cache if the
+    transaction was committed, or drop them if it was rolled back, as nothing was changed or cached in the meantime.
+    The callbacks deferred by run_after_commit are called or dropped in the same way, after the invalidations.
+    """
+    namespaces = g.pop("pending_cache_invalidations", None)
+    callbacks = g.pop("pending_after_commit", None)
+    if committed and namespaces:
+        _invalidate_now(sorted(namespaces))
+    if committed and callbacks:
+        for callback in callbacks:
+            callback()
+
+
+def _invalidate_now(namespaces):
+    for namespace in namespaces:
+        cache = _caches.get(namespace)
+        if cache is not None:
+            cache.clear_local()
+        client = _redis_or_none()
+        if client is None:
+            continue
+        try:
+            generation = client.incr(f"{CACHE_KEY_PREFIX}:{namespace}:generation")
+            client.publish(INVALIDATION_CHANNEL, f"{namespace}:{generation}")
+        except redis.exceptions.RedisError as e:
+            _mark_redis_unavailable(e)
+            continue
+        if cache is not None:
+            cache.clear_local(generation=generation)
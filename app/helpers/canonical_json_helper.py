@@ -0,0 +1,64 @@
+import hashlib
+import json
+
+# One encoder with the options of the standard serialization in data_helper. Every value in the system that is hashed
+# into a code_id, mapping_id or deduplication hash is serialized with these options, so they must never change.
+_CANONICAL_ENCODER = json.JSONEncoder(sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+_encode = _CANONICAL_ENCODER.encode
+# What the encoder writes for a str, with ensure_ascii=False, without going through encode()
+_encode_string = json.encoder.encode_basestring
+
+
+def canonical_json(json_object) -> str:
+    """
+    Serialize a JSON value exactly as json.dumps(json_object, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    does, without building a new encoder for each call. Does not reorder list members: see canonical_json_ordered.
+    """
+    return _encode(json_object)
+
+
+def _ordered_members(input_object_list) -> list:
+    """
+    The members of input_object_list, each serialized once, in the order given by order_object_list in data_helper:
+    ascending md5 hex digest of the member serialization, keeping one member for each distinct serialization.
+    A None member is ordered by the digest of "" (an empty string), as serialize_json_object returns "" for None.
+    @return list of (digest, member, serialized member) tuples
+    """
+    members = {}
+    for obj in input_object_list:
+        serialized = _encode(obj)
+        digest = hashlib.md5(("" if obj is None else serialized).encode("utf-8")).hexdigest()
+        members[digest] = (digest, obj, serialized)
+    return sorted(members.values(), key=lambda member: member[0])
+
+
+def ordered_list(input_object_list) -> list:
+    """
+    The members of input_object_list in the consistent order described at data_helper.order_object_list.
+    """
+    return [obj for _, obj, _ in _ordered_members(input_object_list)]
+
+
+def canonical_json_ordered(json_object: dict, ordered_keys) -> str:
+    """
+    Serialize json_object as canonical_json would serialize it after order_object_list had been called on the lists
+    under each of ordered_keys, in a single pass: each list member is serialized once, to find its place in the order
+    and to be written to the output. The result is byte-identical to that two-step sequence.
+    @param json_object: a dict, such as a normalized CodeableConcept
+    @param ordered_keys: keys whose list values are put in consistent order, such as ("coding",)
+    """
+    if not all(isinstance(key, str) for key in json_object):
+        # json.dumps sorts other key types before converting them to strings: let it do so
+        return _encode({
+            key: ordered_list(value) if key in ordered_keys and isinstance(value, list) else value
+            for key, value in json_object.items()
+        })
+    parts = []
+    for key in sorted(json_object):
+        value = json_object[key]
+        if key in ordered_keys and isinstance(value, list):
+            value_string = "[" + ",".join(serialized for _, _, serialized in _ordered_members(value)) + "]"
+        else:
+            value_string = _encode(value)
+        parts.append(_encode_string(key) + ":" + value_string)
+    return "{" + ",".join(parts) + "}"
@@ -2,9 +2,9 @@ import hashlib
 import json
 
 import uuid
-from collections import OrderedDict
 
 from app.errors import BadDataError
+from app.helpers.canonical_json_helper import canonical_json, canonical_json_ordered, ordered_list
 
 OID_URL_CONVERSIONS = {
     "urn:oid:2.16.840.1.113883.6.96": "http://snomed.info/sct",
@@ -85,6 +85,7 @@ def serialize_json_object(json_object) -> str:
     sort_keys=True - sort the keys in the output string alphabetically; respects the current order of list elements
     ensure_ascii=False - ensures that double quotes are used to wrap strings in the output, needed for SQL query format
     separators=(",", ":") - omits space characters from JSON syntax, but retains space characters inside JSON content
+    These options are applied by canonical_json_helper.canonical_json(), which reuses one encoder for every call.
 
     @return (str) - a serialized JSON string, or "" (an empty string) if the input json_object was None
     """
@@ -96,7 +97,7 @@ def serialize_json_object(json_object) -> str:
         input = json_object.serialize()
     else:
         input = json_object
-    return json.dumps(input, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return canonical_json(input)
 
 
 def order_object_list(input_object_list) -> list:
@@ -120,14 +121,13 @@ def order_object_list(input_object_list) -> list:
     Note: for now, ignore the infinite theoretical potential for additional levels of lists within objects within lists:
     will handle when we encounter an RCDM defined model that permits this and is also in a jsonb column in the database.
 
+    When the ordered list is only needed to serialize its parent object, call canonical_json_ordered() in
+    canonical_json_helper instead: it produces the same string without serializing each list member twice.
+
     @param input_object_list is a list of objects, such as CodeableConcept.coding list
     @return a new list in an order that will be consistent any time the same set of list members are input in any order
     """
-    object_list: dict = {}
-    for obj in input_object_list:
-        object_list.update({hash_jsonb(obj): obj})
-    sorted_list = OrderedDict(sorted(object_list.items()))
-    return list(sorted_list.values())
+    return ordered_list(input_object_list)
 
 
 def cleanup_json_string(input_json_string: str) -> str:
@@ -305,6 +305,27 @@ def normalized_source_codeable_concept(input_object):
     shape the CodeableConcept attributes as needed to conform to the RCDM profile - remove the unsupported attributes -
     require required attributes - calls order_object_list() on "coding" list to ensure members are in consistent order
     """
+    output_object = _pruned_source_codeable_concept(input_object)
+    if output_object is not None and "coding" in output_object:
+        output_object["coding"] = order_object_list(output_object["coding"])
+    return output_object
+
+
+def normalized_source_codeable_concept_string(input_object) -> str:
+    """
+    The same as calling normalized_source_codeable_concept() and then serialize_json_object() on the result, in one pass
+    @return a serialized JSON string, or "" (an empty string) if the input object was None
+    """
+    output_object = _pruned_source_codeable_concept(input_object)
+    if output_object is None:
+        return ""
+    return canonical_json_ordered(output_object, ("coding",))
+
+
+def _pruned_source_codeable_concept(input_object):
+    """
+    the RCDM attributes of a CodeableConcept, with the "coding" list members in their input order
+    """
     from app.models.codes import FHIRCodeableConcept
     if input_object is None:
         return None
@@ -333,7 +354,7 @@ def normalized_source_codeable_concept(input_object):
                     coding["system"] = OID_URL_CONVERSIONS[system]
     output_object = {}
     if coding_list is not None:
-        output_object["coding"] = order_object_list(coding_list)
+        output_object["coding"] = coding_list
     if text_value is not None:
         output_object["text"] = text_value
     return output_object
@@ -1,11 +1,13 @@
 import datetime
 import json
 import re
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import Optional
+from typing import Optional, Sequence
 
 import app.models.codes
 import app.helpers.data_helper
+import app.helpers.id_helper
 
 
 class DataExtensionUrl(Enum):
@@ -32,6 +34,14 @@ class IssuePrefix(Enum):
     COLUMN_VALUE_FORMAT = "format issue: "
 
 
+# Patterns for legacy v4 value formats, compiled once for the many rows of a migration
+# todo: delete these patterns with the legacy checks that use them after v5 migration is complete
+LINE_SPARK_PATTERN = re.compile(r"\{Line \d}")
+NULL_LIST_PATTERN = re.compile(r"\[null, ")
+# Regular expression, not a plain substring: the original search pattern also matched any character in place of "."
+UNITS_OF_MEASURE_PATTERN = re.compile("http://unitsofmeasure.org")
+
+
 def convert_string_to_datetime_or_none(input_string):
     """
     This is the standard, top-level function to prepare a datetime value in Informatics desired format, or return None.
@@ -110,6 +120,144 @@ def prepare_code_and_display_for_storage_migration(raw_code: str = None, raw_dis
     return value_schema, value_simple, value_jsonb, value_string, display_string
 
 
+@dataclass
+class SourceConceptColumns:
+    """
+    The result of prepare_source_concept_columns_for_storage_migration(). Each attribute is a column: item i of every
+    column is for input row i, with the value the per-row function named in the comment returns for that row.
+    """
+    # prepare_code_and_display_for_storage_migration()
+    code_schema: list = field(default_factory=list)
+    code_simple: list = field(default_factory=list)
+    code_jsonb: list = field(default_factory=list)
+    code_string: list = field(default_factory=list)
+    display_string: list = field(default_factory=list)
+    # filter_unsafe_depends_on_value()
+    depends_on_value: list = field(default_factory=list)
+    rejected_depends_on_value: list = field(default_factory=list)
+    # prepare_depends_on_value_for_storage()
+    depends_on_value_schema: list = field(default_factory=list)
+    depends_on_value_simple: list = field(default_factory=list)
+    depends_on_value_jsonb: list = field(default_factory=list)
+    depends_on_value_string: list = field(default_factory=list)
+    depends_on_property_string: list = field(default_factory=list)
+    # prepare_depends_on_attributes_for_code_id_migration()
+    depends_on_value_for_code_id: list = field(default_factory=list)
+    # generate_code_id(), or None with the exception it raised in code_id_error
+    code_id: list = field(default_factory=list)
+    code_id_error: list = field(default_factory=list)
+
+
+def prepare_source_concept_columns_for_storage_migration(
+    codes: Sequence[Optional[str]],
+    displays: Sequence[Optional[str]],
+    depends_on_values: Optional[Sequence[Optional[str]]] = None,
+    depends_on_properties: Optional[Sequence[Optional[str]]] = None,
+    depends_on_systems: Optional[Sequence[Optional[str]]] = None,
+    depends_on_displays: Optional[Sequence[Optional[str]]] = None,
+) -> SourceConceptColumns:
+    """
+    # todo: delete this function after v5 migration is complete, with prepare_code_and_display_for_storage_migration()
+    Batch version of the per-row sequence in the v5 migrations: prepare_code_and_display_for_storage_migration(),
+    filter_unsafe_depends_on_value(), prepare_depends_on_value_for_storage(),
+    prepare_depends_on_attributes_for_code_id_migration() and generate_code_id(). Each parameter is a column: item i
+    of every column is one row. The results are identical to running that sequence once per row.
+
+    Each distinct input is normalized once per batch, and each distinct normalized result is hashed once, so repeated
+    source codes and depends_on values (common in concept map data) cost one parse and one hash for the whole batch.
+
+    generate_code_id() raises for rows whose values cannot be hashed, such as rows with format issues. Rather than stop
+    the batch, the exception is returned in code_id_error for that row, so the caller can handle it at that row.
+    @raise ValueError if the columns are not all the same length
+    """
+    count = len(codes)
+    depends_on_columns = []
+    for column in (depends_on_values, depends_on_properties, depends_on_systems, depends_on_displays):
+        depends_on_columns.append([None] * count if column is None else column)
+    for column in [displays] + depends_on_columns:
+        if len(column) != count:
+            raise ValueError(f"Batch column has {len(column)} items, but the codes column has {count}")
+    (depends_on_values, depends_on_properties, depends_on_systems, depends_on_displays) = depends_on_columns
+
+    prepared_codes = {}
+    filtered_depends_on_values = {}
+    prepared_depends_on_values = {}
+    # The position of each distinct code_id input, by value, and the position of the input of each row
+    code_id_keys = {}
+    code_id_positions = []
+    columns = SourceConceptColumns()
+    for code, display, raw_depends_on_value, depends_on_property, depends_on_system, depends_on_display in zip(
+        codes,
+        displays,
+        depends_on_values,
+        depends_on_properties,
+        depends_on_systems,
+        depends_on_displays,
+    ):
+        code_key = (code, display)
+        prepared_code = prepared_codes.get(code_key)
+        if prepared_code is None:
+            prepared_code = prepare_code_and_display_for_storage_migration(code, display)
+            prepared_codes[code_key] = prepared_code
+        (code_schema, code_simple, code_jsonb, code_string, display_string) = prepared_code
+
+        filtered_depends_on_value = filtered_depends_on_values.get(raw_depends_on_value)
+        if filtered_depends_on_value is None:
+            filtered_depends_on_value = filter_unsafe_depends_on_value(raw_depends_on_value)
+            filtered_depends_on_values[raw_depends_on_value] = filtered_depends_on_value
+        (depends_on_value, rejected_depends_on_value) = filtered_depends_on_value
+
+        depends_on_key = (depends_on_value, depends_on_property)
+        prepared_depends_on_value = prepared_depends_on_values.get(depends_on_key)
+        if prepared_depends_on_value is None:
+            prepared_depends_on_value = prepare_depends_on_value_for_storage(depends_on_value, depends_on_property)
+            prepared_depends_on_values[depends_on_key] = prepared_depends_on_value
+        (
+            depends_on_value_schema,
+            depends_on_value_simple,
+            depends_on_value_jsonb,
+            depends_on_value_string,
+            depends_on_property_string
+        ) = prepared_depends_on_value
+
+        depends_on_value_for_code_id = prepare_depends_on_attributes_for_code_id_migration(
+            depends_on_value_string,
+            depends_on_property_string,
+            depends_on_system,
+            depends_on_display
+        )
+
+        code_id_key = (code_string, display_string, depends_on_value_for_code_id)
+        code_id_positions.append(code_id_keys.setdefault(code_id_key, len(code_id_keys)))
+
+        columns.code_schema.append(code_schema)
+        columns.code_simple.append(code_simple)
+        columns.code_jsonb.append(code_jsonb)
+        columns.code_string.append(code_string)
+        columns.display_string.append(display_string)
+        columns.depends_on_value.append(depends_on_value)
+        columns.rejected_depends_on_value.append(rejected_depends_on_value)
+        columns.depends_on_value_schema.append(depends_on_value_schema)
+        columns.depends_on_value_simple.append(depends_on_value_simple)
+        columns.depends_on_value_jsonb.append(depends_on_value_jsonb)
+        columns.depends_on_value_string.append(depends_on_value_string)
+        columns.depends_on_property_string.append(depends_on_property_string)
+        columns.depends_on_value_for_code_id.append(depends_on_value_for_code_id)
+
+    # Each distinct code_id input is hashed once
+    (code_strings, display_strings, depends_on_values_for_code_id) = list(zip(*code_id_keys)) or ([], [], [])
+    code_id_results = app.helpers.id_helper.generate_code_id_results(
+        code_strings=code_strings,
+        display_strings=display_strings,
+        depends_on_value_strings=depends_on_values_for_code_id,
+    )
+    for position in code_id_positions:
+        (code_id, code_id_error) = code_id_results[position]
+        columns.code_id.append(code_id)
+        columns.code_id_error.append(code_id_error)
+    return columns
+
+
 def prepare_depends_on_for_storage(depends_on: list = None) -> (str, list):
     """
     # todo: NOT USED during v5 migration. Fast-follow-on: Top-level function for n-member dependsOn lists
@@ -442,7 +590,7 @@ def prepare_dynamic_value_for_storage_report_issue(old_value: str = None, old_di
 
     # handle Ronin cancer staging pattern as spark (good)
     # todo: delete this legacy check after v5 migration is complete
-    elif old_display is not None and re.search(r"\{Line \d}", old_value):
+    elif old_display is not None and LINE_SPARK_PATTERN.search(old_value):
         # code: convert to json
         json_string = convert_source_concept_text_only_spark_export_string_to_json_string(old_value)
         (
@@ -455,7 +603,7 @@ def prepare_dynamic_value_for_storage_report_issue(old_value: str = None, old_di
 
     # handle '[null]' variants (bad)
     # todo: delete this legacy check after v5 migration is complete
-    elif old_value == "[null]" or re.search(r"\[null, ", old_value):
+    elif old_value == "[null]" or NULL_LIST_PATTERN.search(old_value):
         # depends_on: correct to null
         if old_display is None:
             (value_schema, value_simple, value_jsonb, value_string) = (None, None, None, None)
@@ -684,8 +832,7 @@ def prepare_object_source_code_for_storage(code_object) -> (str, str, str, str):
         value_string (string) - value_jsonb binary JSON value, correctly serialized to a string
             - this returned value_string value is ready for the caller to input to the hash function generate_code_id().
     """
-    rcdm_object = app.helpers.data_helper.normalized_source_codeable_concept(code_object)
-    rcdm_string = app.helpers.data_helper.serialize_json_object(rcdm_object)
+    rcdm_string = app.helpers.data_helper.normalized_source_codeable_concept_string(code_object)
     return (
         DataExtensionUrl.SOURCE_CODEABLE_CONCEPT.value,
         None,
@@ -704,8 +851,7 @@ def normalized_codeable_concept_string(code_object) -> str:
     @raise BadDataError if the value is not a CodeableConcept
     @return (str) serialized RCDM CodeableConcept normalized for: JSON format, JSON key order, coding list member order
     """
-    rcdm_object = app.helpers.data_helper.normalized_source_codeable_concept(code_object)
-    rcdm_string = app.helpers.data_helper.serialize_json_object(rcdm_object)
+    rcdm_string = app.helpers.data_helper.normalized_source_codeable_concept_string(code_object)
     return rcdm_string
 
 
@@ -1048,14 +1194,24 @@ def convert_source_concept_spark_export_string_to_json_string_normalized_ordered
         Possible values are a malformed FHIR Medication.ingredient.strength Ratio for a target dependsOn (do not
         process, return the input string unchanged) or a CodeableConcept (process and return a serialized JSON string).
     @return JSON serialized string for a FHIR CodeableConcept, if successful. Otherwise, returns the input string.
-        This function calls normalized_source_codeable_concept() and serialize_json_object() to return an RCDM model
+        This function calls normalized_source_codeable_concept_string() to return an RCDM model
         compliant sourceCodeableConcept serialized as a string with correctly ordered JSON keys and list members.
         This output is suitable as input to id_helper.py functions as a code_string to create a code_id or mapping_id.
     """
-    code_string = convert_source_concept_spark_export_string_to_json_string_unordered(spark_export_string)
-    code_object = app.helpers.data_helper.load_json_string(code_string)
-    rcdm_object = app.helpers.data_helper.normalized_source_codeable_concept(code_object)
-    rcdm_string = app.helpers.data_helper.serialize_json_object(rcdm_object)
+    code_object = parse_source_concept_spark_export_string(spark_export_string)
+    if code_object is None:
+        # not converted: handle the input string as the unordered conversion result, as before
+        code_object = app.helpers.data_helper.load_json_string(spark_export_string)
+    else:
+        # the same value as serializing the parsed object and reading it back with load_json_string()
+        for coding in code_object.get("coding", []):
+            for key, value in coding.items():
+                if "''" in value:
+                    coding[key] = value.replace("''", "'")
+        text_value = code_object.get("text")
+        if text_value is not None and "''" in text_value:
+            code_object["text"] = text_value.replace("''", "'")
+    rcdm_string = app.helpers.data_helper.normalized_source_codeable_concept_string(code_object)
     return rcdm_string
 
 
@@ -1068,58 +1224,76 @@ def convert_source_concept_spark_export_string_to_json_string_unordered(spark_ex
         process, return the input string unchanged) or a CodeableConcept (process and return a serialized JSON string).
     @return JSON serialized string for a FHIR CodeableConcept, if successful. Otherwise, returns the input string.
     """
-    # reject a malformed Medication.ingredient in spark format
-    if re.search("http://unitsofmeasure.org", spark_export_string):
+    json_object = parse_source_concept_spark_export_string(spark_export_string)
+    if json_object is None:
         return spark_export_string
+    return app.helpers.data_helper.serialize_json_object(json_object)
+
+
+def parse_source_concept_spark_export_string(spark_export_string: str) -> Optional[dict]:
+    """
+    This function is for v5 data migration only. The issue being fixed was a one-time issue from an old ETL script.
+    Parses spark export format, {[{code, display, system}, {code, system}], text}, into a CodeableConcept object in one
+    pass over the string, with no regular expressions. Within the coding list, members are separated by "}, {" and
+    attributes by ", "; a member with more than 3 attributes has commas in its display. The text ends at the next "], ".
+    The literal value null means the attribute is absent. The object is not yet normalized: see callers.
+    @return (dict) CodeableConcept object, or None for a malformed Medication.ingredient.strength Ratio, or for a coding
+        list member that does not have 2 or more attributes
+    """
+    # reject a malformed Medication.ingredient in spark format
+    if "http://unitsofmeasure" in spark_export_string and UNITS_OF_MEASURE_PATTERN.search(spark_export_string):
+        return None
 
-    # init
     json_object: dict = {}
     coding_list = []
-    value_list = re.split(r'], ', spark_export_string)
-
-    # coding
-    if len(value_list) > 0:
-        coding_string = value_list[0][2:]
-        coding_value_list = re.split(r'}, \{', coding_string)
-        if len(coding_value_list) > 0:
-            coding_value_list[0] = coding_value_list[0][1:]
-            coding_value_list[-1] = coding_value_list[-1][:-1]
-            for coding_value in coding_value_list:
-                attribute = re.split(r', ', coding_value)
-                coding_object: dict = {}
-                if len(attribute) >= 3:
-                    first = attribute[0]
-                    middle = ", ".join(attribute[1:-1])
-                    last = attribute[-1]
-                    if first != "null":
-                        coding_object.update({"code": first})
-                    if middle != "null":
-                        coding_object.update({"display": middle})
-                    if last != "null":
-                        coding_object.update({"system": last})
-                elif len(attribute) == 2:
-                    first = attribute[0]
-                    last = attribute[-1]
-                    if first != "null":
-                        coding_object.update({"code": first})
-                    if last != "null":
-                        coding_object.update({"system": last})
-                else:
-                    return spark_export_string
-                if len(coding_object) > 0:
-                    coding_list.append(coding_object)
-            if len(coding_list) > 0:
-                json_object.update({"coding": coding_list})
-        else:
-            return spark_export_string
-    else:
-        return spark_export_string
 
-    # text
-    if len(value_list) > 1:
-        text_value = value_list[1][:-1]
+    # coding: from after the opening "{[{" to before the "}" that precedes the first "], "
+    coding_end = spark_export_string.find("], ")
+    if coding_end == -1:
+        coding_end = len(spark_export_string)
+    coding_string = spark_export_string[2:coding_end]
+    member_start = 0
+    while True:
+        member_end = coding_string.find("}, {", member_start)
+        if member_end == -1:
+            coding_value = coding_string[member_start:]
+        else:
+            coding_value = coding_string[member_start:member_end]
+        # the first member starts after its "{" and the last member ends before its "}"
+        if member_start == 0:
+            coding_value = coding_value[1:]
+        if member_end == -1:
+            coding_value = coding_value[:-1]
+        first_end = coding_value.find(", ")
+        if first_end == -1:
+            return None
+        last_start = coding_value.rfind(", ") + 2
+        first = coding_value[:first_end]
+        last = coding_value[last_start:]
+        coding_object: dict = {}
+        if first != "null":
+            coding_object["code"] = first
+        if last_start - 2 > first_end:
+            middle = coding_value[first_end + 2:last_start - 2]
+            if middle != "null":
+                coding_object["display"] = middle
+        if last != "null":
+            coding_object["system"] = last
+        if len(coding_object) > 0:
+            coding_list.append(coding_object)
+        if member_end == -1:
+            break
+        member_start = member_end + 4
+    if len(coding_list) > 0:
+        json_object["coding"] = coding_list
+
+    # text: from after the first "], " to before the last character, or the next "], "
+    if coding_end < len(spark_export_string):
+        text_end = spark_export_string.find("], ", coding_end + 3)
+        if text_end == -1:
+            text_end = len(spark_export_string)
+        text_value = spark_export_string[coding_end + 3:text_end][:-1]
         if text_value != "null":
-            json_object.update({"text": text_value})
+            json_object["text"] = text_value
 
-    # done
-    return app.helpers.data_helper.serialize_json_object(json_object)
+    return json_object
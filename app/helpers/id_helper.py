@@ -1,9 +1,14 @@
-from typing import Optional
+import concurrent.futures
+from typing import List, Optional, Sequence, Tuple
 
 import app.helpers.data_helper
 import app.helpers.format_helper
 import app.helpers.message_helper
 
+# Batches with fewer items than this are always hashed in the calling process, where a process pool would cost more
+# in start-up and pickling than it saves
+PARALLEL_BATCH_MINIMUM = 10000
+
 
 def generate_code_id(
     code_string: str,
@@ -170,8 +175,7 @@ def prepare_code_string_for_code_id(code_string: str) -> str:
 
         # CodeableConcept
         try:
-            rcdm_object = app.helpers.data_helper.normalized_source_codeable_concept(json_object)
-            rcdm_string = app.helpers.data_helper.serialize_json_object(rcdm_object)
+            rcdm_string = app.helpers.data_helper.normalized_source_codeable_concept_string(json_object)
             return rcdm_string
         except Exception as e:
             raise e
@@ -284,3 +288,239 @@ def hash_for_mapping_id(
 
     hashed = app.helpers.data_helper.hash_string(concatenated)
     return hashed
+
+
+def generate_code_ids(
+    code_strings: Sequence[str],
+    display_strings: Optional[Sequence[Optional[str]]] = None,
+    depends_on_value_strings: Optional[Sequence[Optional[str]]] = None,
+    depends_on_properties: Optional[Sequence[Optional[str]]] = None,
+    depends_on_systems: Optional[Sequence[Optional[str]]] = None,
+    depends_on_displays: Optional[Sequence[Optional[str]]] = None,
+    processes: int = 1,
+) -> List[str]:
+    """
+    Batch version of generate_code_id(). Each parameter is a column: item i of every column is one code.
+    Returns the code_id for each code, in order, identical to calling generate_code_id() once per code.
+
+    Each distinct code_string is normalized once per batch, which saves most of the work when JSON code strings
+    repeat (such as the same CodeableConcept with different depends_on values).
+    @param display_strings and the depends_on columns are optional: a missing column is None for every code.
+    @param processes: if more than 1 and the batch has at least PARALLEL_BATCH_MINIMUM items, the batch is split
+        across this many worker processes.
+    @raise the same errors as generate_code_id(), for the first code that fails; ValueError if columns differ in length
+    """
+    code_ids = []
+    for code_id, error in generate_code_id_results(
+        code_strings,
+        display_strings,
+        depends_on_value_strings,
+        depends_on_properties,
+        depends_on_systems,
+        depends_on_displays,
+        processes=processes,
+    ):
+        if error is not None:
+            raise error
+        code_ids.append(code_id)
+    return code_ids
+
+
+def generate_code_id_results(
+    code_strings: Sequence[str],
+    display_strings: Optional[Sequence[Optional[str]]] = None,
+    depends_on_value_strings: Optional[Sequence[Optional[str]]] = None,
+    depends_on_properties: Optional[Sequence[Optional[str]]] = None,
+    depends_on_systems: Optional[Sequence[Optional[str]]] = None,
+    depends_on_displays: Optional[Sequence[Optional[str]]] = None,
+    processes: int = 1,
+) -> List[Tuple[Optional[str], Optional[Exception]]]:
+    """
+    As generate_code_ids(), but a code that cannot be hashed does not stop the batch: the result for each code is
+    (code_id, None), or (None, the exception generate_code_id() raises for it).
+    @raise ValueError if columns differ in length
+    """
+    columns = _batch_columns(
+        code_strings,
+        display_strings,
+        depends_on_value_strings,
+        depends_on_properties,
+        depends_on_systems,
+        depends_on_displays,
+    )
+    return _run_batch(_code_id_results_for_columns, columns, processes)
+
+
+def generate_mapping_ids_with_source_code_id(
+    source_code_ids: Sequence[str],
+    relationship_codes: Sequence[str],
+    target_concept_codes: Sequence[str],
+    target_concept_displays: Optional[Sequence[Optional[str]]] = None,
+    target_concept_systems: Optional[Sequence[Optional[str]]] = None,
+    processes: int = 1,
+) -> List[str]:
+    """
+    Batch version of generate_mapping_id_with_source_code_id(). Each parameter is a column: item i of every column is
+    one mapping. Returns the mapping_id for each mapping, in order, identical to calling
+    generate_mapping_id_with_source_code_id() once per mapping.
+    @param processes: as for generate_code_ids()
+    @raise the same errors as generate_mapping_id_with_source_code_id(); ValueError if columns differ in length
+    """
+    columns = _batch_columns(
+        source_code_ids,
+        relationship_codes,
+        target_concept_codes,
+        target_concept_displays,
+        target_concept_systems,
+    )
+    return _run_batch(_mapping_ids_for_columns, columns, processes)
+
+
+def generate_mapping_ids_with_source_code_values(
+    source_code_strings: Sequence[str],
+    display_strings: Optional[Sequence[Optional[str]]],
+    relationship_codes: Sequence[str],
+    target_concept_codes: Sequence[str],
+    target_concept_displays: Optional[Sequence[Optional[str]]] = None,
+    target_concept_systems: Optional[Sequence[Optional[str]]] = None,
+    depends_on_value_strings: Optional[Sequence[Optional[str]]] = None,
+    depends_on_properties: Optional[Sequence[Optional[str]]] = None,
+    depends_on_systems: Optional[Sequence[Optional[str]]] = None,
+    depends_on_displays: Optional[Sequence[Optional[str]]] = None,
+    processes: int = 1,
+) -> List[str]:
+    """
+    Batch version of generate_mapping_id_with_source_code_values(): the source code_ids are generated with
+    generate_code_ids(), then the mapping_ids with generate_mapping_ids_with_source_code_id().
+    @param processes: as for generate_code_ids()
+    """
+    source_code_ids = generate_code_ids(
+        source_code_strings,
+        display_strings,
+        depends_on_value_strings,
+        depends_on_properties,
+        depends_on_systems,
+        depends_on_displays,
+        processes=processes,
+    )
+    return generate_mapping_ids_with_source_code_id(
+        source_code_ids,
+        relationship_codes,
+        target_concept_codes,
+        target_concept_displays,
+        target_concept_systems,
+        processes=processes,
+    )
+
+
+def _batch_columns(*columns) -> list:
+    """
+    The first column is required. Optional columns that are None are replaced by a column of None values.
+    @raise ValueError if the columns are not all the same length
+    """
+    count = len(columns[0])
+    prepared_columns = []
+    for position, column in enumerate(columns):
+        if column is None:
+            column = [None] * count
+        elif len(column) != count:
+            raise ValueError(f"Batch column {position} has {len(column)} items, but the first column has {count}")
+        prepared_columns.append(column)
+    return prepared_columns
+
+
+def _run_batch(function, columns: list, processes: int) -> list:
+    """
+    Call function with the columns, either directly or, for large batches with processes > 1, on equal slices of the
+    columns in a process pool. Results are returned in the order of the items.
+    """
+    count = len(columns[0])
+    if processes <= 1 or count < PARALLEL_BATCH_MINIMUM:
+        return function(*columns)
+
+    chunk_size = -(-count // processes)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [
+            executor.submit(function, *[column[start:start + chunk_size] for column in columns])
+            for start in range(0, count, chunk_size)
+        ]
+        results = []
+        for future in futures:
+            results.extend(future.result())
+    return results
+
+
+def _code_id_results_for_columns(
+    code_strings,
+    display_strings,
+    depends_on_value_strings,
+    depends_on_properties,
+    depends_on_systems,
+    depends_on_displays,
+) -> List[Tuple[Optional[str], Optional[Exception]]]:
+    # The normalized code_string, or the exception raised normalizing it, by code_string
+    prepared_code_strings = {}
+    results = []
+    for code_string, display_string, depends_on_value_string, depends_on_property, depends_on_system, \
+            depends_on_display in zip(
+                code_strings,
+                display_strings,
+                depends_on_value_strings,
+                depends_on_properties,
+                depends_on_systems,
+                depends_on_displays,
+            ):
+        prepared_code_string = prepared_code_strings.get(code_string)
+        if prepared_code_string is None:
+            try:
+                prepared_code_string = (prepare_code_string_for_code_id(code_string), None)
+            except Exception as e:
+                prepared_code_string = (None, e)
+            prepared_code_strings[code_string] = prepared_code_string
+        (prepared, error) = prepared_code_string
+        if error is not None:
+            results.append((None, error))
+            continue
+        try:
+            results.append(
+                (
+                    hash_for_code_id(
+                        prepared,
+                        display_string,
+                        depends_on_value_string,
+                        depends_on_property,
+                        depends_on_system,
+                        depends_on_display,
+                    ),
+                    None
+                )
+            )
+        except Exception as e:
+            results.append((None, e))
+    return results
+
+
+def _mapping_ids_for_columns(
+    source_code_ids,
+    relationship_codes,
+    target_concept_codes,
+    target_concept_displays,
+    target_concept_systems,
+) -> List[str]:
+    return [
+        hash_for_mapping_id(
+            source_code_id,
+            relationship_code,
+            target_concept_code,
+            target_concept_display,
+            target_concept_system,
+        )
+        for source_code_id, relationship_code, target_concept_code, target_concept_display, target_concept_system
+        in zip(
+            source_code_ids,
+            relationship_codes,
+            target_concept_codes,
+            target_concept_displays,
+            target_concept_systems,
+        )
+    ]
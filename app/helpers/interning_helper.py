@@ -0,0 +1,25 @@
+class InterningPool:
+    """
+    Shares one object between equal values loaded within one operation, such as loading an expansion or a concept map.
+
+    Strings read from database rows are separate objects even when their values repeat, as displays, statuses and
+    comments do across thousands of rows. Passing each value through intern() returns the first object seen with that
+    value, so the repeats can be freed. Unlike sys.intern, the pool is released with the objects that use it, and it
+    accepts any hashable value.
+    """
+
+    __slots__ = ("values",)
+
+    def __init__(self):
+        self.values = {}
+
+    def intern(self, value):
+        """
+        Return the pooled object equal to value, adding value to the pool if it is new. None is returned unchanged.
+        """
+        if value is None:
+            return None
+        return self.values.setdefault(value, value)
+
+    def __len__(self):
+        return len(self.values)
@@ -0,0 +1,162 @@
+import concurrent.futures
+import logging
+import time
+
+from opensearchpy.exceptions import ConnectionError as OpenSearchConnectionError, NotFoundError
+from opensearchpy.helpers import BulkIndexError
+
+LOGGER = logging.getLogger()
+
+# Actions per bulk or mget request, and requests in flight at once
+BULK_CHUNK_SIZE = 500
+BULK_THREAD_COUNT = 4
+# Retries for items rejected with a retryable status, and for requests that fail to connect, with exponential backoff
+BULK_MAX_RETRIES = 3
+BULK_RETRY_BACKOFF_SECONDS = 1.0
+
+
+def _chunks(items: list, chunk_size: int):
+    for start in range(0, len(items), chunk_size):
+        yield items[start:start + chunk_size]
+
+
+def _is_retryable(status: int) -> bool:
+    # Too many requests, or a server error such as an unavailable shard
+    return status == 429 or status >= 500
+
+
+def fetch_indexed_sources(
+    client,
+    index: str,
+    document_ids,
+    chunk_size: int = BULK_CHUNK_SIZE,
+    thread_count: int = BULK_THREAD_COUNT,
+) -> dict:
+    """
+    The _source of each document in index with one of document_ids, by _id, fetched with mget in parallel chunks.
+    Documents that are not in the index, or an index that does not exist, are left out.
+    """
+
+    def fetch(chunk):
+        try:
+            response = client.mget(index=index, body={"ids": chunk})
+        except NotFoundError:
+            return {}
+        return {document["_id"]: document["_source"] for document in response["docs"] if document.get("found")}
+
+    indexed = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=thread_count) as executor:
+        for found in executor.map(fetch, _chunks(list(document_ids), chunk_size)):
+            indexed.update(found)
+    return indexed
+
+
+def _bulk_body(actions: list) -> list:
+    body = []
+    for action in actions:
+        body.append({action["_op_type"]: {"_index": action["_index"], "_id": action["_id"]}})
+        if action["_op_type"] == "index":
+            body.append(action["_source"])
+        elif action["_op_type"] == "update":
+            body.append({"doc": action["doc"]})
+    return body
+
+
+def bulk_in_parallel(
+    client,
+    actions: list,
+    chunk_size: int = BULK_CHUNK_SIZE,
+    thread_count: int = BULK_THREAD_COUNT,
+    max_retries: int = BULK_MAX_RETRIES,
+    retry_backoff_seconds: float = BULK_RETRY_BACKOFF_SECONDS,
+) -> int:
+    """
+    Send bulk actions in chunks of chunk_size, with up to thread_count chunks in flight at once. Within a chunk,
+    only the items rejected with a retryable status (429 or 5xx) are sent again; a chunk whose request fails to
+    connect is sent again whole. Deleting a document that is not in the index counts as a success.
+    @param actions: dicts with "_op_type" ("index", "update" or "delete"), "_index", "_id" and, to index, "_source",
+    or, to update, the partial "doc"
+    @return: the number of actions that succeeded
+    @raise BulkIndexError: with the response items of the actions that failed, once retries are exhausted
+    @raise opensearchpy.exceptions.ConnectionError: if a chunk still fails to connect once retries are exhausted
+    """
+
+    def send(chunk):
+        failed = []
+        pending = chunk
+        for attempt in range(max_retries + 1):
+            if attempt:
+                time.sleep(retry_backoff_seconds * 2 ** (attempt - 1))
+            try:
+                response = client.bulk(body=_bulk_body(pending))
+            except OpenSearchConnectionError as e:
+                if attempt == max_retries:
+                    raise
+                LOGGER.warning(f"Bulk request of {len(pending)} actions failed, retrying: {e}")
+                continue
+
+            retry = []
+            retry_errors = []
+            for action, item in zip(pending, response["items"]):
+                status = next(iter(item.values())).get("status", 500)
+                if status < 300 or (status == 404 and action["_op_type"] == "delete"):
+                    continue
+                if _is_retryable(status):
+                    retry.append(action)
+                    retry_errors.append(item)
+                else:
+                    failed.append(item)
+            if not retry:
+                return failed
+            if attempt == max_retries:
+                return failed + retry_errors
+            LOGGER.warning(f"{len(retry)} of {len(pending)} bulk actions rejected, retrying")
+            pending = retry
+        return failed
+
+    errors = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=thread_count) as executor:
+        futures = [executor.submit(send, chunk) for chunk in _chunks(actions, chunk_size)]
+        for future in futures:
+            errors.extend(future.result())
+    if errors:
+        raise BulkIndexError(f"{len(errors)} document(s) failed to index.", errors)
+    return len(actions)
+
+
+def index_changed_documents(
+    client, index: str, documents: dict, updated_fields: dict = None, **bulk_options
+) -> dict:
+    """
+    Index documents, sending only those that are not in the index or whose indexed _source differs. Documents in
+    the index but not in documents are left in place.
+
+    updated_fields are set on every document, such as the concept map version that indexed it last. They are not
+    compared: a document that differs only in these fields gets a partial update that sets them, rather than being
+    indexed again.
+    @param documents: the _source of each document, by _id, without updated_fields. Values must be JSON types, as
+    read back from the index.
+    @param updated_fields: optional fields and values to set on every document
+    @param bulk_options: passed to bulk_in_parallel, and chunk_size and thread_count to fetch_indexed_sources
+    @return: dict with the number of documents "indexed", "updated" (only to set updated_fields) and "unchanged"
+    """
+    updated_fields = updated_fields or {}
+    fetch_options = {key: value for key, value in bulk_options.items() if key in ("chunk_size", "thread_count")}
+    indexed = fetch_indexed_sources(client, index, documents.keys(), **fetch_options)
+    actions = []
+    updated = 0
+    for document_id, source in documents.items():
+        indexed_source = indexed.get(document_id)
+        indexed_fields = {}
+        if indexed_source is not None:
+            indexed_source = dict(indexed_source)
+            indexed_fields = {field: indexed_source.pop(field, None) for field in updated_fields}
+        if indexed_source != source:
+            actions.append(
+                {"_op_type": "index", "_index": index, "_id": document_id, "_source": {**source, **updated_fields}}
+            )
+        elif indexed_fields != updated_fields:
+            actions.append({"_op_type": "update", "_index": index, "_id": document_id, "doc": updated_fields})
+            updated += 1
+    bulk_in_parallel(client, actions, **bulk_options)
+    return {"indexed": len(actions) - updated, "updated": updated, "unchanged": len(documents) - len(actions)}
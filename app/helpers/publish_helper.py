@@ -0,0 +1,95 @@
+import concurrent.futures
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable, List
+
+import requests
+
+LOGGER = logging.getLogger()
+
+# Destinations sent at once, and retries for transient failures, with exponential backoff
+PUBLISH_THREAD_COUNT = 4
+PUBLISH_MAX_RETRIES = 2
+PUBLISH_RETRY_BACKOFF_SECONDS = 1.0
+
+
+@dataclass
+class PublishDestination:
+    """
+    One place a published artifact is sent, such as an OCI folder or Simplifier.
+    send is called with no arguments from a worker thread, so it must not read the database: the caller serializes
+    the content first and binds it into send. Each attempt must send the content afresh, as a retry may follow a
+    partial failure. A destination that is not required is published on a best-effort basis: its failure is logged.
+    """
+
+    name: str
+    send: Callable[[], object]
+    required: bool = True
+    max_retries: int = PUBLISH_MAX_RETRIES
+    retry_backoff_seconds: float = PUBLISH_RETRY_BACKOFF_SECONDS
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    True for failures that may succeed if sent again: connection errors and timeouts, and responses with status 429
+    or 5xx (oci.exceptions.ServiceError carries the status as status, requests.HTTPError on its response).
+    """
+    if isinstance(error, (ConnectionError, TimeoutError, requests.ConnectionError, requests.Timeout)):
+        return True
+    status = getattr(error, "status", None)
+    if status is None and isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+def send_to_destination(destination: PublishDestination) -> dict:
+    """
+    Call destination.send, retrying retryable errors up to destination.max_retries times, and time it.
+    @return: dict with the "result" of send, the "seconds" taken over all attempts, the number of "attempts" and the
+    "error" that ended the last attempt, or None if it succeeded
+    """
+    start = time.perf_counter()
+    result = None
+    error = None
+    attempt = 0
+    for attempt in range(1, destination.max_retries + 2):
+        if attempt > 1:
+            time.sleep(destination.retry_backoff_seconds * 2 ** (attempt - 2))
+        try:
+            result = destination.send()
+            error = None
+            break
+        except Exception as e:
+            error = e
+            if attempt > destination.max_retries or not is_retryable_error(e):
+                break
+            LOGGER.warning(f"Publishing to {destination.name} failed, retrying: {e}")
+    seconds = time.perf_counter() - start
+
+    if error is None:
+        LOGGER.info(f"Published to {destination.name} in {seconds:.2f}s ({attempt} attempt(s))")
+    elif destination.required:
+        LOGGER.error(f"Unable to publish to {destination.name} after {attempt} attempt(s) in {seconds:.2f}s: {error}")
+    else:
+        LOGGER.warning(f"Unable to publish to {destination.name} after {attempt} attempt(s) in {seconds:.2f}s: {error}")
+    return {"result": result, "seconds": seconds, "attempts": attempt, "error": error}
+
+
+def publish_to_destinations(destinations: List[PublishDestination], thread_count: int = PUBLISH_THREAD_COUNT) -> dict:
+    """
+    Send to each destination concurrently, with up to thread_count in flight at once. Every destination is tried
+    before any failure is raised, so one slow or failing destination does not hold back the others.
+    @return: the outcome of send_to_destination for each destination, by name
+    @raise: the error of the first required destination, in the order given, that failed
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=thread_count) as executor:
+        outcomes = dict(zip(
+            (destination.name for destination in destinations),
+            executor.map(send_to_destination, destinations),
+        ))
+    for destination in destinations:
+        error = outcomes[destination.name]["error"]
+        if destination.required and error is not None:
+            raise error
+    return outcomes
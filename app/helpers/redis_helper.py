@@ -0,0 +1,39 @@
+import os
+
+import redis
+from decouple import config
+
+# The Redis instance that Celery uses as its broker, also shared by app.helpers.cache_helper
+BROKER_HOST = config("CELERY_BROKER_HOST", "localhost")
+BROKER_PORT = config("CELERY_BROKER_PORT", "5672")
+BROKER_TLS_ENFORCED = bool(config("CELERY_BROKER_TLS_ENFORCED", False))
+broker_protocol = "rediss" if BROKER_TLS_ENFORCED else "redis"
+BROKER_URL = f"{broker_protocol}://{BROKER_HOST}:{BROKER_PORT}//"
+if BROKER_TLS_ENFORCED:
+    BROKER_URL += "?ssl_cert_reqs=required"
+
+REDIS_URL = f"{broker_protocol}://{BROKER_HOST}:{BROKER_PORT}/0"
+if BROKER_TLS_ENFORCED:
+    REDIS_URL += "?ssl_cert_reqs=required"
+
+# Fail fast, so that callers can fall back when Redis is unavailable
+REDIS_SOCKET_TIMEOUT_SECONDS = 0.5
+
+_redis_client = None
+_redis_client_pid = None
+
+
+def get_redis() -> redis.Redis:
+    """
+    Return a Redis client for the broker instance. Clients are not shared across forked processes
+    (uwsgi workers, Celery worker children), so a new client is created in each process.
+    """
+    global _redis_client, _redis_client_pid
+    if _redis_client is None or _redis_client_pid != os.getpid():
+        _redis_client = redis.Redis.from_url(
+            REDIS_URL,
+            socket_timeout=REDIS_SOCKET_TIMEOUT_SECONDS,
+            socket_connect_timeout=REDIS_SOCKET_TIMEOUT_SECONDS,
+        )
+        _redis_client_pid = os.getpid()
+    return _redis_client
@@ -0,0 +1,99 @@
+import re
+import zlib
+from uuid import uuid4
+
+from flask import current_app, Response, stream_with_context
+
+# Encoded JSON is flushed to the client once a buffered chunk reaches this many characters
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class StreamedArray:
+    """
+    Placeholder for a JSON array whose items are encoded one at a time, instead of all at once.
+    Put a StreamedArray anywhere in the envelope passed to iter_json or stream_json_response, in place of a list.
+    The items iterable is consumed only once, while the response is being sent, so it may be a generator.
+    """
+
+    def __init__(self, items):
+        self.items = items
+        self.placeholder = f"__streamed_array_{uuid4().hex}__"
+
+
+def iter_json(envelope, chunk_size: int = STREAM_CHUNK_SIZE):
+    """
+    Encode the envelope as JSON, yielding the output in chunks. Every StreamedArray in the envelope is written
+    item by item, so the full document is never held in memory as a single string.
+
+    The output parses to the same JSON as flask.jsonify(envelope) would produce when each StreamedArray
+    is replaced by a list of its items: keys are sorted and values are encoded by the app's JSON provider.
+    Must be called within an app context.
+    @param envelope: dict or list to encode, containing zero or more StreamedArray values
+    @param chunk_size: approximate number of characters in each chunk yielded
+    @return: generator of str
+    """
+    json_provider = current_app.json
+    streamed_arrays = {}
+
+    def default(value):
+        if isinstance(value, StreamedArray):
+            streamed_arrays[value.placeholder] = value
+            return value.placeholder
+        return json_provider.default(value)
+
+    def dumps(value):
+        return json_provider.dumps(value, default=default, separators=(",", ":"))
+
+    envelope_text = dumps(envelope)
+    # Splitting on a capturing group alternates text between arrays with the placeholders of the arrays
+    parts = re.split(r'"(__streamed_array_[0-9a-f]{32}__)"', envelope_text)
+
+    buffer = []
+    buffered_length = 0
+    for index, part in enumerate(parts):
+        if index % 2 == 0:
+            buffer.append(part)
+            buffered_length += len(part)
+            continue
+
+        buffer.append("[")
+        first = True
+        for item in streamed_arrays[part].items:
+            item_text = dumps(item) if first else "," + dumps(item)
+            first = False
+            buffer.append(item_text)
+            buffered_length += len(item_text)
+            if buffered_length >= chunk_size:
+                yield "".join(buffer)
+                buffer = []
+                buffered_length = 0
+        buffer.append("]")
+
+    if buffer:
+        yield "".join(buffer)
+
+
+def stream_json_response(envelope, status: int = 200) -> Response:
+    """
+    Stream the envelope to the client as JSON. See iter_json. Use in place of flask.jsonify for large payloads.
+    The request context is kept open while streaming, so StreamedArray items may read from the database.
+    """
+    return Response(
+        stream_with_context(iter_json(envelope)),
+        status=status,
+        mimetype="application/json",
+    )
+
+
+def gzip_chunks(chunks, compression_level: int = 6):
+    """
+    Gzip a stream of str chunks as it is produced, for use as a streamed response body with Content-Encoding gzip.
+    @param chunks: iterable of str
+    @return: generator of bytes
+    """
+    compressor = zlib.compressobj(compression_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode("utf-8"))
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -1,4 +1,6 @@
 import datetime
+import itertools
+import operator
 import uuid
 import json
 import logging
@@ -12,10 +14,16 @@ import app.terminologies.models
 from app.database import get_db
 from app.errors import NotFoundException
 import app.helpers.id_helper
+from app.helpers.canonical_json_helper import canonical_json
 from app.helpers.data_helper import serialize_json_object, load_json_string
+from app.helpers.interning_helper import InterningPool
+from app.helpers.message_helper import message_exception_classname
 from app.helpers.format_helper import normalized_codeable_concept_string, normalized_data_dictionary_string, \
     prepare_depends_on_attributes_for_code_id
 
+# Number of codes inserted per statement by Code.save_many
+SAVE_MANY_BATCH_SIZE = 1000
+
 
 class RoninCodeSchemas(Enum):
     code = "code"
@@ -142,13 +150,15 @@ class FHIRCodeableConcept:
             serialized["coding"] = [coding.serialize() for coding in self.coding]
         return serialized
 
+    def identity_key(self) -> str:
+        """
+        A hashable form for the identity of a Code: canonical JSON of serialize(), with the "coding" list in its order.
+        Text-only CodeableConcepts (coding is None) are supported.
+        """
+        return canonical_json(self.serialize())
+
     def __hash__(self):
-        return hash(
-            (
-                self.text,
-                "".join(str(c) for c in [coding.serialize() for coding in self.coding])
-            )
-        )
+        return hash(self.identity_key())
 
 
 class DependsOnSchemas(Enum):
@@ -296,6 +306,27 @@ class AdditionalData:
     additional_data: dict = None
 
 
+def identity_value(value):
+    """
+    A value for the identity tuple of a Code: the identity_key of a FHIRCodeableConcept, which is not hashable by
+    value, or the value itself
+    """
+    if isinstance(value, FHIRCodeableConcept):
+        return value.identity_key()
+    return value
+
+
+@dataclass
+class CodeSaveOutcome:
+    """
+    The result of saving one Code with Code.save_many.
+    status is one of: inserted, duplicate, failed. error is the reason for a failure.
+    """
+    code: 'Code'
+    status: str
+    error: Optional[str] = None
+
+
 class Code:
     """
     This class represents a code object used for encoding and maintaining information about a specific
@@ -317,8 +348,46 @@ class Code:
 
     Methods:
     init: Initializes a new instance of the Code class and sets its attributes.
+
+    Code uses __slots__, because expansions and concept maps hold hundreds of thousands of instances.
+    Hashing and equality use the identity tuple, computed on first use and recomputed only after an identity
+    attribute (code, display, code_object, code_schema, terminology_version, depends_on) is reassigned.
+    The hash of the identity and the deduplication_hash are cached the same way. Changes made inside a depends_on or code_object, rather than by
+    reassigning the attribute, are not detected.
     """
 
+    __slots__ = (
+        "_code",
+        "_display",
+        "code_object",
+        "code_schema",
+        "custom_terminology_code_uuid",
+        "fhir_terminology_code_uuid",
+        "terminology_version",
+        "from_custom_terminology",
+        "from_fhir_terminology",
+        "custom_terminology_code_id",
+        "_stored_custom_terminology_deduplication_hash",
+        "additional_data",
+        "depends_on",
+        "_saved_to_db",
+        "_identity",
+        "_hash",
+        "_deduplication_hash",
+    )
+
+    # Reassigning any of these attributes discards the cached identity tuple and deduplication hash
+    _identity_attributes = frozenset(
+        {
+            "_code",
+            "_display",
+            "code_object",
+            "code_schema",
+            "terminology_version",
+            "depends_on",
+        }
+    )
+
     def __init__(
         self,
         system,
@@ -392,6 +461,10 @@ class Code:
         Raises:
         - Raises ValueError if the conditions for usage (see above) are not met, ensuring proper usage of the constructor.
         """
+        self._identity = None
+        self._hash = None
+        self._deduplication_hash = None
+
         # Validate code_schema against provided parameters
         if code_schema == RoninCodeSchemas.codeable_concept:
             if not code_object or code or display:
@@ -567,6 +640,250 @@ class Code:
                 saved_to_db=False,
         )
 
+    @classmethod
+    def from_rows(
+            cls,
+            rows,
+            code_column: str = "code",
+            display_column: str = "display",
+            code_schema_column: Optional[str] = None,
+            code_jsonb_column: str = "code_jsonb",
+            terminology_version: 'app.terminologies.models.Terminology' = None,
+            system: Optional[str] = None,
+            version: Optional[str] = None,
+            terminology_version_uuid_column: Optional[str] = None,
+            system_column: Optional[str] = None,
+            version_column: Optional[str] = None,
+            custom_terminology_code_uuid_column: Optional[str] = None,
+            custom_terminology_code_id_column: Optional[str] = None,
+            deduplication_hash_column: Optional[str] = None,
+            fhir_terminology_code_uuid_column: Optional[str] = None,
+            from_custom_terminology: Optional[bool] = None,
+            from_fhir_terminology: Optional[bool] = None,
+            interning_pool: Optional[InterningPool] = None,
+    ) -> List['Code']:
+        """
+        Builds saved Codes from the rows of a query result (or from dicts, such as API results), in bulk.
+        Equivalent to calling the constructor once per row, but much faster for large results:
+        - the columns are checked once, against the first row, rather than the arguments of every call
+        - the terminology version is resolved once per distinct version, rather than once per code
+        - codes are built without going through the constructor's argument handling
+
+        The terminology version of every code is, in order of precedence:
+        - terminology_version, if provided
+        - the version loaded for system and version, if provided
+        - the version loaded for the UUID in terminology_version_uuid_column, if provided
+        - the version loaded for the values in system_column and version_column
+
+        If code_schema_column is not provided, every row is a simple code (code and display).
+        If from_custom_terminology or from_fhir_terminology is not provided, it is True for rows with a value in
+        custom_terminology_code_uuid_column or fhir_terminology_code_uuid_column, if provided,
+        and otherwise taken from the terminology version.
+        Codes are built without depends_on data: callers that load it assign it to the returned codes.
+        If an interning_pool is provided, equal code and display values share one string object across its users.
+
+        Returns:
+        A list of Codes, in the order of the rows.
+
+        Raises:
+        - ValueError if a column is missing from the rows, or a row would fail the constructor's validation.
+        """
+        rows = iter(rows)
+        first_row = next(rows, None)
+        if first_row is None:
+            return []
+
+        # Check the shape of the result set once, and prepare a getter per column
+        required_columns = {
+            column_name for column_name in (
+                code_column,
+                display_column,
+                code_schema_column,
+                code_jsonb_column if code_schema_column is not None else None,
+                terminology_version_uuid_column,
+                system_column,
+                version_column,
+                custom_terminology_code_uuid_column,
+                custom_terminology_code_id_column,
+                deduplication_hash_column,
+                fhir_terminology_code_uuid_column,
+            ) if column_name is not None
+        }
+        if isinstance(first_row, dict):
+            # Keys may be absent from dicts, as with dict.get
+            def column_getter(column_name):
+                return lambda row: row.get(column_name)
+        else:
+            missing_columns = required_columns - set(first_row._fields)
+            if missing_columns:
+                raise ValueError(f"Rows are missing columns required to build codes: {sorted(missing_columns)}")
+            column_getter = operator.attrgetter
+
+        def optional_getter(column_name):
+            if column_name is None:
+                return lambda row: None
+            return column_getter(column_name)
+
+        get_code = column_getter(code_column)
+        get_display = column_getter(display_column)
+        get_code_schema = optional_getter(code_schema_column)
+        get_code_jsonb = optional_getter(code_jsonb_column)
+        get_terminology_version_uuid = optional_getter(terminology_version_uuid_column)
+        get_system = optional_getter(system_column)
+        get_version = optional_getter(version_column)
+        get_custom_terminology_code_uuid = optional_getter(custom_terminology_code_uuid_column)
+        get_custom_terminology_code_id = optional_getter(custom_terminology_code_id_column)
+        get_deduplication_hash = optional_getter(deduplication_hash_column)
+        get_fhir_terminology_code_uuid = optional_getter(fhir_terminology_code_uuid_column)
+
+        # Resolve the terminology version once for the result set, or once per distinct version in it
+        if terminology_version is None and system is not None and version is not None:
+            terminology_version = app.terminologies.models.Terminology.load_by_fhir_uri_and_version_from_cache(
+                fhir_uri=system,
+                version=version
+            )
+        if terminology_version is not None:
+            if type(terminology_version) != app.terminologies.models.Terminology:
+                raise ValueError(
+                    "terminology_version parameter must be instance of app.terminologies.models.Terminology or None"
+                )
+        elif terminology_version_uuid_column is None and (system_column is None or version_column is None):
+            raise ValueError(
+                "Either terminology_version, system AND version, terminology_version_uuid_column, "
+                "or system_column AND version_column must be provided to build codes from rows"
+            )
+        terminology_versions = {}
+
+        def resolve_terminology_version(row):
+            if terminology_version_uuid_column is not None:
+                key = get_terminology_version_uuid(row)
+            else:
+                key = (get_system(row), get_version(row))
+            resolved = terminology_versions.get(key)
+            if resolved is None:
+                if terminology_version_uuid_column is not None:
+                    resolved = app.terminologies.models.Terminology.load_from_cache(key)
+                else:
+                    resolved = app.terminologies.models.Terminology.load_by_fhir_uri_and_version_from_cache(
+                        fhir_uri=key[0],
+                        version=key[1]
+                    )
+                terminology_versions[key] = resolved
+            return resolved
+
+        simple_code_schema = RoninCodeSchemas.code
+        codes = []
+        set_attribute = object.__setattr__
+        for row in itertools.chain([first_row], rows):
+            row_terminology_version = terminology_version
+            if row_terminology_version is None:
+                row_terminology_version = resolve_terminology_version(row)
+
+            code_schema = simple_code_schema
+            if code_schema_column is not None:
+                code_schema = RoninCodeSchemas(get_code_schema(row))
+            if code_schema is simple_code_schema:
+                code = get_code(row)
+                display = get_display(row)
+                code_object = None
+                if not code or not display:
+                    raise ValueError(
+                        "For code schema, code and display must be provided, and code_object must be None or not set.")
+                if interning_pool is not None:
+                    code = interning_pool.intern(code)
+                    display = interning_pool.intern(display)
+            else:
+                code = None
+                display = None
+                code_object = FHIRCodeableConcept.deserialize(get_code_jsonb(row))
+
+            custom_terminology_code_uuid = get_custom_terminology_code_uuid(row)
+            fhir_terminology_code_uuid = get_fhir_terminology_code_uuid(row)
+            custom_terminology_code_id = get_custom_terminology_code_id(row)
+
+            row_from_custom_terminology = from_custom_terminology
+            if row_from_custom_terminology is None:
+                if custom_terminology_code_uuid_column is not None:
+                    row_from_custom_terminology = custom_terminology_code_uuid is not None
+                else:
+                    row_from_custom_terminology = row_terminology_version.is_custom_terminology
+            row_from_fhir_terminology = from_fhir_terminology
+            if row_from_fhir_terminology is None:
+                if fhir_terminology_code_uuid_column is not None:
+                    row_from_fhir_terminology = fhir_terminology_code_uuid is not None
+                else:
+                    row_from_fhir_terminology = row_terminology_version.fhir_terminology
+
+            # The constructor's validation for custom terminologies, for codes which are saved to the database
+            if code_schema is not simple_code_schema and not row_from_custom_terminology:
+                raise ValueError("Codeable concepts are only supported in custom terminologies")
+            if row_from_custom_terminology:
+                if custom_terminology_code_uuid is None:
+                    raise ValueError(
+                        "If initializing from a custom terminology, the custom_terminology_uuid must be provided")
+                if custom_terminology_code_id is None:
+                    raise ValueError(
+                        "If loading from a custom terminology, custom_terminology_code_id must be provided; except for when it is first created and this is calculated"
+                    )
+
+            new_code = cls.__new__(cls)
+            set_attribute(new_code, "_identity", None)
+            set_attribute(new_code, "_hash", None)
+            set_attribute(new_code, "_deduplication_hash", None)
+            set_attribute(new_code, "_code", code)
+            set_attribute(new_code, "_display", display)
+            set_attribute(new_code, "code_object", code_object)
+            set_attribute(new_code, "code_schema", code_schema)
+            set_attribute(new_code, "custom_terminology_code_uuid", custom_terminology_code_uuid)
+            set_attribute(new_code, "fhir_terminology_code_uuid", fhir_terminology_code_uuid)
+            set_attribute(new_code, "terminology_version", row_terminology_version)
+            set_attribute(new_code, "from_custom_terminology", row_from_custom_terminology)
+            set_attribute(new_code, "from_fhir_terminology", row_from_fhir_terminology)
+            set_attribute(new_code, "custom_terminology_code_id", custom_terminology_code_id)
+            set_attribute(
+                new_code, "_stored_custom_terminology_deduplication_hash", get_deduplication_hash(row)
+            )
+            set_attribute(new_code, "additional_data", None)
+            set_attribute(new_code, "depends_on", None)
+            set_attribute(new_code, "_saved_to_db", True)
+            codes.append(new_code)
+        return codes
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name in Code._identity_attributes:
+            object.__setattr__(self, "_identity", None)
+            object.__setattr__(self, "_hash", None)
+            object.__setattr__(self, "_deduplication_hash", None)
+
+    @property
+    def identity(self) -> tuple:
+        """
+        The values that identify this Code for hashing and equality: code, display, system, version and
+        the depends_on property, system, value and display (or None if there is no depends_on).
+        A FHIRCodeableConcept code or depends_on value is represented by its identity_key, so the tuple is hashable.
+        additional_data is not part of the identity.
+        """
+        identity = self._identity
+        if identity is None:
+            depends_on = self.depends_on
+            identity = (
+                identity_value(self.code),
+                self.display,
+                self.system,
+                self.version,
+                None
+                if depends_on is None
+                else (
+                    depends_on.depends_on_property,
+                    depends_on.depends_on_system,
+                    identity_value(depends_on.depends_on_value),
+                    depends_on.depends_on_display,
+                ),
+            )
+            object.__setattr__(self, "_identity", identity)
+        return identity
+
     @property
     def uuid(self):
         if self.from_custom_terminology is True:
@@ -637,16 +954,20 @@ class Code:
 
     def __hash__(self) -> int:  # todo: make it very clear why this is different from code_id and if it should be
         """
-        This method computes a hash value for the Code instance based on its string representation. It overrides the default hash method for the Code class.
+        This method computes a hash value for the Code instance based on its identity tuple. It overrides the default hash method for the Code class.
 
         Returns:
-        int: A hash value computed from the string representation of the Code instance.
+        int: A hash value computed from the identity of the Code instance (everything in its repr except additional_data).
 
         Usage:
         To compute the hash value of a Code instance, use the following syntax:
         code_hash = hash(code)
         """
-        return hash(self.__repr__(include_additional_data=False))
+        code_hash = self._hash
+        if code_hash is None:
+            code_hash = hash(self.identity)
+            object.__setattr__(self, "_hash", code_hash)
+        return code_hash
 
     def __eq__(self, other: object) -> bool:
         """
@@ -663,39 +984,18 @@ class Code:
         are_equal = code1 == code2
         """
         if isinstance(other, Code):
-            equal_check = (
-                (self.code == other.code)
-                and (self.display == other.display)
-                and (self.system == other.system)
-                and (self.version == other.version)
-            )
-            if equal_check is True:
-                if self.depends_on is None and other.depends_on is None:
-                    return True
-                elif self.depends_on is not None and other.depends_on is None:
-                    return False
-                elif self.depends_on is None and other.depends_on is not None:
-                    return False
-                else:
-                    return(
-                        (self.depends_on.depends_on_property == other.depends_on.depends_on_property)
-                        and (self.depends_on.depends_on_system == other.depends_on.depends_on_system)
-                        and (self.depends_on.depends_on_value == other.depends_on.depends_on_value)
-                        and (self.depends_on.depends_on_display == other.depends_on.depends_on_display)
-                    )
+            return self is other or self.identity == other.identity
         return False
 
-    # @classmethod
-    # def save_many(
-    #         cls,
-    #         codes: List['app.models.codes.Code'],
-    #         on_conflict_do_nothing: bool = False
-    # ):
-    #     # todo: implement as future optimization
-    #     pass
-
     @property
     def deduplication_hash(self):
+        """
+        The code_id calculated from the code, display and depends_on data. It is calculated on first use and
+        cached until one of those attributes is reassigned.
+        """
+        if self._deduplication_hash is not None:
+            return self._deduplication_hash
+
         if self.code_schema == RoninCodeSchemas.code:
             code_string = self.code
         elif self.code_schema == RoninCodeSchemas.codeable_concept:
@@ -713,6 +1013,7 @@ class Code:
             if deduplication_hash != self._stored_custom_terminology_deduplication_hash:
                 logging.warning(f"Stored deduplication hash does not match calculated one. Custom terminology code uuid: {self.custom_terminology_code_uuid}")
 
+        object.__setattr__(self, "_deduplication_hash", deduplication_hash)
         return deduplication_hash
 
     @property
@@ -767,6 +1068,27 @@ class Code:
                                 """
         query_text += """ returning uuid"""
 
+        try:
+            result = conn.execute(
+                text(query_text),
+                self.code_data_parameters(),
+            ).fetchall()
+        except Exception as e:
+            conn.rollback()
+            raise e
+
+        actually_inserted = True if len(result) > 0 else False
+        if actually_inserted:
+            self._saved_to_db = True
+
+        return actually_inserted
+
+    def code_data_parameters(self) -> dict:
+        """
+        The values to insert as a row of custom_terminologies.code_data for this code, keyed by column name.
+        A new uuid is generated if the code does not have a custom_terminology_code_uuid.
+        @raise NotImplementedError if the code_schema cannot be saved
+        """
         code_schema_to_save = None
         code_simple = None
         code_jsonb = None
@@ -780,31 +1102,139 @@ class Code:
         else:
             raise NotImplementedError("Save only implemented for code and codeable concepts")
 
-        try:
-            custom_terminology_code_uuid = self.custom_terminology_code_uuid if self.custom_terminology_code_uuid is not None else uuid.uuid4()
-            result = conn.execute(
-                text(query_text),
-                {
-                    "uuid": custom_terminology_code_uuid,
-                    "display": self.display,
-                    "code_schema": code_schema_to_save,
-                    "code_simple": code_simple,
-                    "code_jsonb": code_jsonb,
-                    "code_id": self.deduplication_hash,  # When saved for the first time, we generate this
-                    "deduplication_hash": self.deduplication_hash,
-                    "terminology_version_uuid": self.terminology_version_uuid,
-                    "additional_data": normalized_data_dictionary_string(self.additional_data),
-                },
-            ).fetchall()
-        except Exception as e:
-            conn.rollback()
-            raise e
+        custom_terminology_code_uuid = self.custom_terminology_code_uuid if self.custom_terminology_code_uuid is not None else uuid.uuid4()
+        return {
+            "uuid": custom_terminology_code_uuid,
+            "display": self.display,
+            "code_schema": code_schema_to_save,
+            "code_simple": code_simple,
+            "code_jsonb": code_jsonb,
+            "code_id": self.deduplication_hash,  # When saved for the first time, we generate this
+            "deduplication_hash": self.deduplication_hash,
+            "terminology_version_uuid": self.terminology_version_uuid,
+            "additional_data": normalized_data_dictionary_string(self.additional_data),
+        }
 
-        actually_inserted = True if len(result) > 0 else False
-        if actually_inserted:
-            self._saved_to_db = True
+    @classmethod
+    def save_many(
+            cls,
+            codes: List['Code'],
+            batch_size: int = SAVE_MANY_BATCH_SIZE,
+    ) -> List['CodeSaveOutcome']:
+        """
+        Bulk equivalent of calling save(on_conflict_do_nothing=True) on each code: saves new custom terminology codes
+        to custom_terminologies.code_data with one INSERT statement per batch_size codes. The caller commits.
 
-        return actually_inserted
+        Returns one CodeSaveOutcome per code, in the order of the input list. Its status is:
+        - inserted: the code was saved, and its custom_terminology_code_uuid is that of the new row
+        - duplicate: the terminology version already has a code with the same code_id, or an earlier code in the list has it
+        - failed: the code could not be validated or saved, and error gives the reason
+
+        If a batch fails in the database, its codes are inserted again one at a time, so that one bad code does not
+        fail the others in its batch.
+        """
+        outcomes = [None] * len(codes)
+        pending = []
+        seen_code_ids = set()
+        for index, code in enumerate(codes):
+            try:
+                if code._saved_to_db is True:
+                    raise ValueError("Code object is already saved; cannot save again")
+                if not code.from_custom_terminology:
+                    raise ValueError("Code object can only save if custom terminology")
+                parameters = code.code_data_parameters()
+            except Exception as e:
+                outcomes[index] = CodeSaveOutcome(code, "failed", f"{message_exception_classname(e)}: {e}")
+                continue
+
+            code_id_key = (parameters["code_id"], str(parameters["terminology_version_uuid"]))
+            if code_id_key in seen_code_ids:
+                outcomes[index] = CodeSaveOutcome(code, "duplicate")
+                continue
+            seen_code_ids.add(code_id_key)
+            pending.append((index, parameters))
+
+        conn = get_db()
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            savepoint = conn.begin_nested()
+            try:
+                inserted_uuids = cls._insert_code_data_rows(conn, [parameters for _, parameters in batch])
+                savepoint.commit()
+            except Exception as e:
+                savepoint.rollback()
+                logging.warning(f"Batch insert of {len(batch)} codes failed, inserting them one at a time: {e}")
+                inserted_uuids = set()
+                for index, parameters in batch:
+                    savepoint = conn.begin_nested()
+                    try:
+                        inserted_uuids.update(cls._insert_code_data_rows(conn, [parameters]))
+                        savepoint.commit()
+                    except Exception as row_error:
+                        savepoint.rollback()
+                        outcomes[index] = CodeSaveOutcome(
+                            codes[index], "failed", f"{message_exception_classname(row_error)}: {row_error}"
+                        )
+
+            for index, parameters in batch:
+                if outcomes[index] is not None:
+                    continue
+                code = codes[index]
+                if str(parameters["uuid"]) in inserted_uuids:
+                    code.custom_terminology_code_uuid = parameters["uuid"]
+                    code._saved_to_db = True
+                    outcomes[index] = CodeSaveOutcome(code, "inserted")
+                else:
+                    outcomes[index] = CodeSaveOutcome(code, "duplicate")
+
+        return outcomes
+
+    @staticmethod
+    def _insert_code_data_rows(conn, rows: List[dict]) -> set:
+        """
+        Insert rows of code_data_parameters() with a single statement, skipping rows that conflict with existing rows.
+        Returns the uuids (as strings) of the rows actually inserted.
+        """
+        columns = {
+            column_name: [
+                str(row[column_name]) if column_name in ("uuid", "terminology_version_uuid") else row[column_name]
+                for row in rows
+            ]
+            for column_name in rows[0].keys()
+        }
+        result = conn.execute(
+            text(
+                """
+                insert into custom_terminologies.code_data
+                (
+                    uuid, 
+                    display, 
+                    code_schema,
+                    code_simple,
+                    code_jsonb,
+                    code_id,
+                    deduplication_hash,
+                    terminology_version_uuid, 
+                    additional_data
+                )
+                select * from unnest(
+                    cast(:uuid as uuid[]),
+                    cast(:display as varchar[]),
+                    cast(:code_schema as varchar[]),
+                    cast(:code_simple as varchar[]),
+                    cast(:code_jsonb as jsonb[]),
+                    cast(:code_id as varchar[]),
+                    cast(:deduplication_hash as varchar[]),
+                    cast(:terminology_version_uuid as uuid[]),
+                    cast(:additional_data as varchar[])
+                )
+                on conflict do nothing
+                returning uuid
+                """
+            ),
+            columns,
+        )
+        return {str(row.uuid) for row in result}
 
     @classmethod
     def load_from_custom_terminology(cls, code_uuid):
@@ -1,4 +1,6 @@
+import copy
 import datetime
+import functools
 import json
 from dataclasses import dataclass
 from datetime import datetime
@@ -16,6 +18,7 @@ from app.errors import BadRequestWithCode
 from app.helpers import oci_helper
 from app.helpers.oci_helper import oci_authentication
 from app.helpers.oci_helper import is_oci_write_disabled
+from app.helpers.publish_helper import PublishDestination, publish_to_destinations
 
 import logging
 LOGGER = logging.getLogger()
@@ -295,18 +298,15 @@ class DataNormalizationRegistry:
     @classmethod
     def publish_data_normalization_registry_output(
         cls,
-        current_registry,
+        registry_serialized,
         norm_registry_schema_version: int,
-        concept_map_schema_version: int,
-        value_set_schema_version: int,
         is_overwrite_enabled=True,
     ):
         """
-        Helper method for calls to publish_data_normalization_registry using different combinations of schema version.
+        Helper method for publish_data_normalization_registry: publish a registry the caller has serialized, and the
+        diff from the previous one, to the folder for norm_registry_schema_version. This only reads and writes OCI, so
+        it can run in a worker thread.
         """
-        registry_serialized = current_registry.serialize(
-            concept_map_schema_version, value_set_schema_version
-        )
         filepath = f"{DataNormalizationRegistry.object_storage_folder_name}/v{norm_registry_schema_version}"
         full_filepath = (
             f"{filepath}/{DataNormalizationRegistry.object_storage_file_name}"
@@ -321,7 +321,7 @@ class DataNormalizationRegistry:
                 full_filepath
             )
             diff_version = get_incremented_versions_and_update(
-                previous_version, newly_published_version
+                previous_version, copy.deepcopy(newly_published_version)
             )
             DataNormalizationRegistry.publish_to_object_store(
                 diff_version,
@@ -334,44 +334,69 @@ class DataNormalizationRegistry:
         return newly_published_version
 
     @classmethod
-    def publish_data_normalization_registry(cls, is_overwrite_allowed: bool = True):
+    def publish_destinations(cls, is_overwrite_allowed: bool = True) -> List[PublishDestination]:
         """
-        Publish the data normalization registry and the diff from previous version.
-        If DataNormalizationRegistry.database_schema_version and DataNormalizationRegistry.next_schema_version are
-        different (such as 3 and 4) publish registry and diff files to both output folders in OCI, in this case
+        Load and serialize the registry for each output schema version, reading the database here, in the caller's
+        thread and transaction, and return the destinations that publish each one. If
+        DataNormalizationRegistry.database_schema_version and DataNormalizationRegistry.next_schema_version are
+        different (such as 3 and 4) there is one destination for each output folder in OCI, in this case
         /DataNormalizationRegistry/v3 and /DataNormalizationRegistry/v4.
-
-        @param is_overwrite_allowed: Toggle for allowing to overwrite of existing artifacts in object storage. True by
-            default for the data normalization registry.
+        @param is_overwrite_allowed: as for publish_data_normalization_registry
         """
-        # Step 1: Get the data.
         current_registry = DataNormalizationRegistry()
         current_registry.load_entries()
 
-        # Step 2: Output DataNormalizationRegistry.database_schema_version, which may be the same as next_schema_version
-        newly_published_version = cls.publish_data_normalization_registry_output(
-            current_registry,
-            DataNormalizationRegistry.database_schema_version,
-            app.concept_maps.models.ConceptMap.database_schema_version,
-            app.value_sets.models.ValueSet.database_schema_version,
-            is_overwrite_allowed,
-        )
-
-        # Step 3: Also output DataNormalizationRegistry.next_schema_version, if different from database_schema_version
+        output_schema_versions = [
+            (
+                DataNormalizationRegistry.database_schema_version,
+                app.concept_maps.models.ConceptMap.database_schema_version,
+                app.value_sets.models.ValueSet.database_schema_version,
+            )
+        ]
         if (
             DataNormalizationRegistry.database_schema_version
             != DataNormalizationRegistry.next_schema_version
         ):
-            newly_published_version = cls.publish_data_normalization_registry_output(
-                current_registry,
-                DataNormalizationRegistry.next_schema_version,
-                app.concept_maps.models.ConceptMap.next_schema_version,
-                app.value_sets.models.ValueSet.next_schema_version,
-                is_overwrite_allowed,
+            output_schema_versions.append(
+                (
+                    DataNormalizationRegistry.next_schema_version,
+                    app.concept_maps.models.ConceptMap.next_schema_version,
+                    app.value_sets.models.ValueSet.next_schema_version,
+                )
             )
 
-        # Step 4: Done
-        return newly_published_version
+        destinations = []
+        for norm_registry_schema_version, concept_map_schema_version, value_set_schema_version in output_schema_versions:
+            registry_serialized = current_registry.serialize(
+                concept_map_schema_version, value_set_schema_version
+            )
+            destinations.append(
+                PublishDestination(
+                    name=f"{DataNormalizationRegistry.object_storage_folder_name}/v{norm_registry_schema_version}",
+                    send=functools.partial(
+                        cls.publish_data_normalization_registry_output,
+                        registry_serialized,
+                        norm_registry_schema_version,
+                        is_overwrite_allowed,
+                    ),
+                )
+            )
+        return destinations
+
+    @classmethod
+    def publish_data_normalization_registry(cls, is_overwrite_allowed: bool = True):
+        """
+        Publish the data normalization registry and the diff from previous version.
+        If DataNormalizationRegistry.database_schema_version and DataNormalizationRegistry.next_schema_version are
+        different (such as 3 and 4) publish registry and diff files to both output folders in OCI, at the same time.
+
+        @param is_overwrite_allowed: Toggle for allowing to overwrite of existing artifacts in object storage. True by
+            default for the data normalization registry.
+        @return: the registry as published to the next_schema_version folder
+        """
+        destinations = cls.publish_destinations(is_overwrite_allowed)
+        outcomes = publish_to_destinations(destinations)
+        return outcomes[destinations[-1].name]["result"]
 
 
 def get_incremented_versions_and_update(old_data, new_data):
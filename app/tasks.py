@@ -4,6 +4,7 @@ from decouple import config
 
 from app.errors import NotFoundException
 import app.value_sets.models
+import app.value_sets.expansion_job_models
 import app.concept_maps.models
 import app.concept_maps.versioning_models
 import app.util.mapping_request_service
@@ -12,15 +13,7 @@ import app.util.mark_for_migration
 import app.util.concept_map_duplicate_codes
 import app.util.concept_map_v4_code_deduplication_hash
 from app.database import get_db
-
-
-BROKER_HOST = config("CELERY_BROKER_HOST", "localhost")
-BROKER_PORT = config("CELERY_BROKER_PORT", "5672")
-BROKER_TLS_ENFORCED = bool(config("CELERY_BROKER_TLS_ENFORCED", False))
-broker_protocol = "rediss" if BROKER_TLS_ENFORCED else "redis"
-BROKER_URL = f"{broker_protocol}://{BROKER_HOST}:{BROKER_PORT}//"
-if BROKER_TLS_ENFORCED:
-    BROKER_URL += "?ssl_cert_reqs=required"
+from app.helpers.redis_helper import BROKER_URL
 
 
 celery_app = Celery("infx-tasks", broker=BROKER_URL)
@@ -56,8 +49,8 @@ def resolve_errors_after_concept_map_publish(concept_map_version_uuid):
     """ """
     conn = get_db()
 
-    # same code here as for a synchronous api endpoint
-    concept_map_version = app.concept_maps.models.ConceptMapVersion(concept_map_version_uuid)
+    # same code here as for a synchronous api endpoint; only the version metadata is needed
+    concept_map_version = app.concept_maps.models.ConceptMapVersion.load_metadata(concept_map_version_uuid)
     concept_map_version.resolve_error_service_issues()
 
     conn.commit()
@@ -158,14 +151,29 @@ def load_outstanding_codes_to_new_concept_map_version(concept_map_uuid: str):
     return version_creator.new_version_uuid
 
 
+@celery_app.task
+def expand_value_set_version(expansion_job_uuid: str):
+    """
+    Run a queued ExpansionJob. Progress and the outcome are recorded on the job, for clients to poll.
+    """
+    conn = get_db()
+
+    expansion_job = app.value_sets.expansion_job_models.ExpansionJob.load(expansion_job_uuid)
+    expansion_job.run()
+
+    conn.commit()
+    conn.close()
+    return expansion_job.status
+
+
 @celery_app.task
 def back_fill_concept_maps_to_simplifier():
     active_concept_map_versions_to_push = (
         app.concept_maps.models.ConceptMapVersion.get_active_concept_map_versions()
     )
     for concept_map_version in active_concept_map_versions_to_push:
-        concept_map_object = app.concept_maps.models.ConceptMapVersion(concept_map_version)
-        concept_map_object.to_simplifier()
+        # Serialize straight from the mapping rows, so each version's mappings are not loaded as objects
+        concept_map_version.to_simplifier(concept_map_version.load_reviewed_mapping_rows())
 
     return "Active concept map versions back fill to Simplifier complete."
 
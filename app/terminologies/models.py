@@ -1,5 +1,7 @@
 import datetime
 import json
+import threading
+import time
 import uuid
 from typing import List, Dict, Union, Optional
 
@@ -8,12 +10,24 @@ from cachetools.func import ttl_cache
 import app.models.codes
 from app.database import get_db
 from app.errors import BadRequestWithCode, NotFoundException
+from app.helpers.cache_helper import (
+    invalidate_cache,
+    invalidation_pending,
+    listen_for_invalidations,
+    register_local_cache,
+    run_after_commit,
+)
+
+# Caches shared across processes: see app.helpers.cache_helper
+TERMINOLOGY_CACHE_NAMESPACES = [
+    "terminology_registry",
+]
 
 
-@ttl_cache()
 def terminology_version_uuid_lookup(fhir_uri: str, version: str):
     """
-    Given a FHIR URI and version, this function retrieves the UUID of the corresponding terminology version from the database.
+    Given a FHIR URI and version, this function retrieves the UUID of the corresponding terminology version from the
+    TerminologyRegistry.
 
     Args:
         fhir_uri (str): The FHIR URI of the terminology.
@@ -23,19 +37,9 @@ def terminology_version_uuid_lookup(fhir_uri: str, version: str):
         UUID: The UUID of the corresponding terminology version.
         If no result, it returns None. Caller method handles this possibility.
     """
-    conn = get_db()
-    result = conn.execute(
-        text(
-            """
-            select uuid from terminology_versions
-            where fhir_uri=:fhir_uri
-            and version=:version
-            """
-        ),
-        {"fhir_uri": fhir_uri, "version": version},
-    ).first()
-    if result:
-        return result.uuid
+    terminology = TERMINOLOGY_REGISTRY.get_by_fhir_uri_and_version(fhir_uri, version)
+    if terminology:
+        return terminology.uuid
 
 
 def load_terminology_version_with_cache(terminology_version_uuid):
@@ -116,7 +120,13 @@ class Terminology:
                 f"No data found for terminology version UUID: {terminology_version_uuid}"
             )
 
-        # Create and return a Terminology object
+        return cls.from_row(term_data)
+
+    @classmethod
+    def from_row(cls, term_data):
+        """
+        A Terminology with the metadata of a public.terminology_versions row.
+        """
         return cls(
             uuid=term_data.uuid,
             terminology=term_data.terminology,
@@ -129,9 +139,16 @@ class Terminology:
         )
 
     @classmethod
-    @ttl_cache()
     def load_from_cache(cls, terminology_version_uuid):
-        return cls.load(terminology_version_uuid)
+        """
+        The Terminology with this UUID from the TerminologyRegistry. The instance is shared: do not modify it.
+        """
+        terminology = TERMINOLOGY_REGISTRY.get_by_uuid(terminology_version_uuid)
+        if terminology is None:
+            raise NotFoundException(
+                f"No data found for terminology version UUID: {terminology_version_uuid}"
+            )
+        return terminology
 
     @classmethod
     def load_by_fhir_uri_and_version(cls, fhir_uri: str, version: str):
@@ -144,9 +161,17 @@ class Terminology:
             )
 
     @classmethod
-    @ttl_cache()
     def load_by_fhir_uri_and_version_from_cache(cls, fhir_uri: str, version: str):
-        return cls.load_by_fhir_uri_and_version(fhir_uri, version)
+        """
+        The Terminology with this fhir_uri and version from the TerminologyRegistry. The instance is shared: do not
+        modify it.
+        """
+        terminology = TERMINOLOGY_REGISTRY.get_by_fhir_uri_and_version(fhir_uri, version)
+        if terminology is None:
+            raise NotFoundException(
+                f"No terminology is found with the provided fhir_uri: {fhir_uri} and version: {version}"
+            )
+        return terminology
 
     def load_content(self):
         """
@@ -167,18 +192,14 @@ class Terminology:
                 ),
                 {"terminology_version_uuid": self.uuid},
             )
-            for item in content_data:
-                self.codes.append(
-                    app.models.codes.Code(
-                        system=self.fhir_uri,
-                        version=self.version,
-                        code=item.code,
-                        display=item.display,
-                        fhir_terminology_code_uuid=item.uuid,
-                        from_fhir_terminology=True,
-                        terminology_version=self,
-                    )
+            self.codes.extend(
+                app.models.codes.Code.from_rows(
+                    content_data,
+                    terminology_version=self,
+                    fhir_terminology_code_uuid_column="uuid",
+                    from_fhir_terminology=True,
                 )
+            )
         elif self.is_custom_terminology is True:
             conn = get_db()
             content_data = conn.execute(
@@ -190,35 +211,20 @@ class Terminology:
                 ),
                 {"terminology_version_uuid": self.uuid},
             )
-            for code_data in content_data:
-                code_schema_raw = code_data.code_schema
-                code_schema = app.models.codes.RoninCodeSchemas(code_schema_raw)
-                code = None
-                display = None
-
-                code_object = None
-                if code_schema == app.models.codes.RoninCodeSchemas.codeable_concept:
-                    code_object = app.models.codes.FHIRCodeableConcept.deserialize(
-                        code_data.code_jsonb
-                    )
-                elif code_schema == app.models.codes.RoninCodeSchemas.code:
-                    code = code_data.code_simple
-                    display = code_data.display
-
-                new_code = app.models.codes.Code(
-                    system=None,
-                    version=None,
-                    code=code,
-                    display=display,
-                    terminology_version_uuid=code_data.terminology_version_uuid,
-                    custom_terminology_code_uuid=code_data.uuid,
+            self.codes.extend(
+                app.models.codes.Code.from_rows(
+                    content_data,
+                    terminology_version=self,
+                    code_column="code_simple",
+                    display_column="display",
+                    code_schema_column="code_schema",
+                    code_jsonb_column="code_jsonb",
+                    custom_terminology_code_uuid_column="uuid",
+                    custom_terminology_code_id_column="code_id",
+                    deduplication_hash_column="deduplication_hash",
                     from_custom_terminology=True,
-                    code_object=code_object,
-                    code_schema=code_schema,
-                    stored_custom_terminology_deduplication_hash=code_data.deduplication_hash,
-                    custom_terminology_code_id=code_data.code_id
                 )
-                self.codes.append(new_code)
+            )
         else:
             raise NotImplementedError(
                 "Loading content only supported for FHIR Terminologies and Custom Terminologies"
@@ -325,6 +331,8 @@ class Terminology:
             ),
             {"uuid": new_terminology_uuid},
         ).first()
+        # A lookup of this fhir_uri and version may have been cached before the terminology existed
+        invalidate_cache(*TERMINOLOGY_CACHE_NAMESPACES)
         return new_terminology
 
     def serialize(self):
@@ -502,6 +510,8 @@ class Terminology:
             ),
             {"version_uuid": version_uuid},
         ).first()
+        # A lookup of this fhir_uri and version may have been cached before the version existed
+        invalidate_cache(*TERMINOLOGY_CACHE_NAMESPACES)
         return new_term_version
 
     def able_to_load_new_codes(self):
@@ -522,21 +532,116 @@ class Terminology:
         self, codes: List["app.models.codes.Code"], on_conflict_do_nothing=False
     ) -> int:
         """
-        This method loads new codes into the terminology.
+        This method loads new codes into the terminology. See load_new_codes_with_outcomes for how they are loaded.
+        All or nothing: if any code fails, none are loaded, whatever on_conflict_do_nothing is.
 
         Args:
         codes (List[Code]): A list of codes that should be added to the terminology.
+        on_conflict_do_nothing (bool): If True, codes that are already in the terminology are skipped.
+            If False, no codes are loaded when any of them is already in the terminology.
 
         Raises:
         BadRequestWithCode: This exception is raised if the terminology is not a custom terminology,
-        or if the terminology's effective period has ended.
+        or if the terminology's effective period has ended, or if a code could not be saved (400),
+        or if a code is a duplicate and on_conflict_do_nothing is False (409).
 
         Returns:
             count of codes loaded
         """
-        # Get database connection
+        savepoint = get_db().begin_nested()
+        try:
+            outcomes = self.load_new_codes_with_outcomes(codes, on_conflict_do_nothing=on_conflict_do_nothing)
+        except Exception:
+            savepoint.rollback()
+            raise
+        failed = [outcome for outcome in outcomes if outcome.status == "failed"]
+        if failed:
+            # With on_conflict_do_nothing, the codes that did insert were released into the caller's transaction
+            savepoint.rollback()
+            for outcome in outcomes:
+                outcome.code._saved_to_db = False
+            raise BadRequestWithCode(
+                code="Terminology.load_new_codes.failed_codes",
+                description=f"Could not load {len(failed)} codes to Terminology {self.uuid}: {failed[0].error}",
+            )
+        savepoint.commit()
+        return len([outcome for outcome in outcomes if outcome.status == "inserted"])
+
+    def load_new_codes_with_outcomes(
+        self, codes: List["app.models.codes.Code"], on_conflict_do_nothing=False
+    ) -> List["app.models.codes.CodeSaveOutcome"]:
+        """
+        Bulk ingestion of new codes into this terminology, reporting what happened to each code.
+
+        The whole batch is staged first: one set-based query finds the codes whose code_id is already in this
+        terminology version, and only the remaining codes are inserted, by Code.save_many, within one savepoint
+        of the caller's transaction. The caller commits.
+
+        Args:
+        codes (List[Code]): A list of codes that should be added to the terminology.
+        on_conflict_do_nothing (bool): If True, duplicates are skipped, and the codes that insert are kept even if
+            others fail: the failures are only reported in the outcomes. If False, nothing is inserted when any code
+            is a duplicate or fails, and BadRequestWithCode is raised.
+
+        Returns:
+            one CodeSaveOutcome per code, in input order, with status inserted, duplicate (skipped) or failed
+        """
+        self.validate_new_codes(codes)
         conn = get_db()
 
+        code_ids = {}
+        for index, code in enumerate(codes):
+            try:
+                code_ids[index] = code.deduplication_hash
+            except Exception:
+                pass  # Code.save_many reports the failure
+        existing_code_ids = self.existing_code_ids(set(code_ids.values()))
+
+        outcomes = [None] * len(codes)
+        staged = []
+        for index, code in enumerate(codes):
+            if index in code_ids and code_ids[index] in existing_code_ids:
+                outcomes[index] = app.models.codes.CodeSaveOutcome(code, "duplicate")
+            else:
+                staged.append(index)
+        if not on_conflict_do_nothing and len(staged) < len(codes):
+            raise BadRequestWithCode(
+                code="Terminology.load_new_codes.duplicate_codes",
+                description=f"Cannot load {len(codes) - len(staged)} codes that are already in Terminology {self.uuid}",
+                http_status_code=409,
+            )
+
+        savepoint = conn.begin_nested()
+        try:
+            staged_outcomes = app.models.codes.Code.save_many([codes[index] for index in staged])
+        except Exception:
+            savepoint.rollback()
+            raise
+        for index, outcome in zip(staged, staged_outcomes):
+            outcomes[index] = outcome
+
+        rejected = [outcome for outcome in staged_outcomes if outcome.status != "inserted"]
+        if not on_conflict_do_nothing and rejected:
+            savepoint.rollback()
+            for outcome in staged_outcomes:
+                outcome.code._saved_to_db = False
+            if any(outcome.status == "duplicate" for outcome in rejected):
+                raise BadRequestWithCode(
+                    code="Terminology.load_new_codes.duplicate_codes",
+                    description=f"Cannot load the same code more than once to Terminology {self.uuid}",
+                    http_status_code=409,
+                )
+            raise BadRequestWithCode(
+                code="Terminology.load_new_codes.failed_codes",
+                description=f"Could not load {len(rejected)} codes to Terminology {self.uuid}: {rejected[0].error}",
+            )
+        savepoint.commit()
+        return outcomes
+
+    def validate_new_codes(self, codes: List["app.models.codes.Code"]):
+        """
+        Raises BadRequestWithCode unless this terminology is open to new codes and all the codes belong to it.
+        """
         able_to_load, fail_reason = self.able_to_load_new_codes()
         if not able_to_load:
             raise BadRequestWithCode(
@@ -563,13 +668,24 @@ class Terminology:
                 description=f"Cannot load codes to Terminology {terminology_uuids[0]} using the class for Terminology {self.uuid}",
             )
 
-        total_count_inserted = 0
-        for code in codes:
-            actually_saved = code.save()
-            if actually_saved:
-                total_count_inserted += 1
-
-        return total_count_inserted
+    def existing_code_ids(self, code_ids) -> set:
+        """
+        The members of code_ids that are already the code_id of a code in this terminology version, found with one query.
+        """
+        if not code_ids:
+            return set()
+        conn = get_db()
+        result = conn.execute(
+            text(
+                """
+                select code_id from custom_terminologies.code_data
+                where terminology_version_uuid = :terminology_version_uuid
+                and code_id = any(:code_ids)
+                """
+            ),
+            {"terminology_version_uuid": str(self.uuid), "code_ids": list(code_ids)},
+        )
+        return {row.code_id for row in result}
 
     def get_recent_codes(self, comparison_date):
         # todo: adjust for CMv5
@@ -601,3 +717,150 @@ class Terminology:
             for item in recent_codes_data
         ]
         return recent_codes
+
+
+def _version_key(version):
+    # Versions are stored as strings, but callers sometimes pass numbers
+    return None if version is None else str(version)
+
+
+class TerminologyRegistry:
+    """
+    The metadata of every terminology version, loaded with one query and indexed by uuid, by (fhir_uri, version)
+    and by (terminology, version), so that resolving terminologies in a loop over codes costs a dict lookup.
+
+    There are a few thousand terminology versions, so all of them are loaded on first use, and again every ttl
+    seconds to pick up changes made outside this application. A key that is not found is looked up on its own,
+    so a version created since the load is added to the indexes without loading the others again.
+    Keys that were not found are remembered until the namespace "terminology_registry" is invalidated,
+    which happens in every process when a terminology version is created: the indexes are then loaded again.
+
+    The registry is shared by every request in the process, so it only holds committed data. Within a request, a
+    version that is looked up on its own is added once the request transaction commits (see run_after_commit), and
+    a request that has changed terminology versions does not load them all.
+    """
+
+    def __init__(self, ttl: int = 600):
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self.by_uuid = {}
+        self.by_fhir_uri_and_version = {}
+        self.by_terminology_and_version = {}
+        self.not_found = set()
+        self.loaded_at = None
+
+    def clear_local(self, generation=None):
+        """
+        Called on invalidation: forget every version, so that they are all loaded again on next use, and the keys
+        that were not found, as they may exist now.
+        """
+        with self.lock:
+            self.by_uuid = {}
+            self.by_fhir_uri_and_version = {}
+            self.by_terminology_and_version = {}
+            self.not_found = set()
+            self.loaded_at = None
+
+    def load_rows(self, rows):
+        """
+        Replace the indexes with the terminology versions in rows of public.terminology_versions.
+        """
+        by_uuid = {}
+        by_fhir_uri_and_version = {}
+        by_terminology_and_version = {}
+        for row in rows:
+            terminology = Terminology.from_row(row)
+            by_uuid[str(terminology.uuid)] = terminology
+            by_fhir_uri_and_version.setdefault((terminology.fhir_uri, _version_key(terminology.version)), terminology)
+            by_terminology_and_version.setdefault(
+                (terminology.terminology, _version_key(terminology.version)), terminology
+            )
+        with self.lock:
+            self.by_uuid = by_uuid
+            self.by_fhir_uri_and_version = by_fhir_uri_and_version
+            self.by_terminology_and_version = by_terminology_and_version
+            self.not_found = set()
+            self.loaded_at = time.monotonic()
+
+    def add_terminology(self, terminology: Terminology) -> Terminology:
+        """
+        Add or replace one terminology version in the indexes.
+        """
+        with self.lock:
+            previous = self.by_uuid.get(str(terminology.uuid))
+            if previous is not None:
+                for index, key in (
+                    (self.by_fhir_uri_and_version, (previous.fhir_uri, _version_key(previous.version))),
+                    (self.by_terminology_and_version, (previous.terminology, _version_key(previous.version))),
+                ):
+                    if index.get(key) is previous:
+                        del index[key]
+            self.by_uuid[str(terminology.uuid)] = terminology
+            self.by_fhir_uri_and_version.setdefault(
+                (terminology.fhir_uri, _version_key(terminology.version)), terminology
+            )
+            self.by_terminology_and_version.setdefault(
+                (terminology.terminology, _version_key(terminology.version)), terminology
+            )
+        return terminology
+
+    def ensure_loaded(self):
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl:
+            return
+        if invalidation_pending("terminology_registry"):
+            # The request's uncommitted versions must not be shared: each key is looked up on its own until it commits
+            return
+        listen_for_invalidations()
+        conn = get_db()
+        rows = conn.execute(text("select * from public.terminology_versions")).fetchall()
+        self.load_rows(rows)
+
+    def _get(self, index_name: str, key, where: str, parameters: dict) -> Optional[Terminology]:
+        self.ensure_loaded()
+        terminology = getattr(self, index_name).get(key)
+        if terminology is not None or (index_name, key) in self.not_found:
+            return terminology
+        conn = get_db()
+        row = conn.execute(
+            text(f"select * from public.terminology_versions where {where}"),
+            parameters,
+        ).first()
+        if row is None:
+            run_after_commit(lambda: self.add_not_found(index_name, key))
+            return None
+        terminology = Terminology.from_row(row)
+        run_after_commit(lambda: self.add_terminology(terminology))
+        return terminology
+
+    def add_not_found(self, index_name: str, key):
+        """
+        Remember that key is not in the index, until the next invalidation.
+        """
+        with self.lock:
+            self.not_found.add((index_name, key))
+
+    def get_by_uuid(self, terminology_version_uuid) -> Optional[Terminology]:
+        key = str(terminology_version_uuid)
+        return self._get("by_uuid", key, "uuid = :uuid", {"uuid": key})
+
+    def get_by_fhir_uri_and_version(self, fhir_uri: str, version) -> Optional[Terminology]:
+        key = (fhir_uri, _version_key(version))
+        return self._get(
+            "by_fhir_uri_and_version",
+            key,
+            "fhir_uri = :fhir_uri and version = :version",
+            {"fhir_uri": key[0], "version": key[1]},
+        )
+
+    def get_by_terminology_and_version(self, terminology: str, version) -> Optional[Terminology]:
+        key = (terminology, _version_key(version))
+        return self._get(
+            "by_terminology_and_version",
+            key,
+            "terminology = :terminology and version = :version",
+            {"terminology": key[0], "version": key[1]},
+        )
+
+
+TERMINOLOGY_REGISTRY = TerminologyRegistry()
+register_local_cache("terminology_registry", TERMINOLOGY_REGISTRY)
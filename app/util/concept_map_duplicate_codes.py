@@ -10,10 +10,9 @@ import uuid
 from sqlalchemy import text
 
 from app.database import get_db
-from app.helpers.format_helper import prepare_code_and_display_for_storage_migration, filter_unsafe_depends_on_value, \
-    prepare_depends_on_value_for_storage, prepare_depends_on_attributes_for_code_id_migration
+from app.helpers.format_helper import prepare_source_concept_columns_for_storage_migration
 from app.helpers.message_helper import message_exception_summary
-from app.helpers.id_helper import generate_code_id, generate_mapping_id_with_source_code_id
+from app.helpers.id_helper import generate_mapping_ids_with_source_code_id
 from app.util.data_migration import convert_empty_to_null
 
 LOGGER = logging.getLogger()
@@ -244,7 +243,36 @@ def load_duplicate_for_v4_concept_map(
                 if count == 0:
                     done = True
                 else:
-                    for row in result:
+                    # leverage v5 migration functions to get code, display, depends_on, and deduplication values
+                    prepared = prepare_source_concept_columns_for_storage_migration(
+                        codes=[row.code for row in result],
+                        displays=[row.display for row in result],
+                        depends_on_values=[row.depends_on_value for row in result],
+                        depends_on_properties=[row.depends_on_property for row in result],
+                        depends_on_systems=[row.depends_on_system for row in result],
+                        depends_on_displays=[row.depends_on_display for row in result],
+                    )
+                    # Rows with a code_id error are raised as they are reached, below
+                    hashed_positions = [
+                        position for position in range(count) if prepared.code_id_error[position] is None
+                    ]
+                    mapping_deduplication_hashes = dict(zip(
+                        hashed_positions,
+                        generate_mapping_ids_with_source_code_id(
+                            source_code_ids=[prepared.code_id[position] for position in hashed_positions],
+                            relationship_codes=[result[position].relationship_code for position in hashed_positions],
+                            target_concept_codes=[
+                                result[position].target_concept_code for position in hashed_positions
+                            ],
+                            target_concept_displays=[
+                                result[position].target_concept_display for position in hashed_positions
+                            ],
+                            target_concept_systems=[
+                                result[position].target_concept_system for position in hashed_positions
+                            ],
+                        ),
+                    ))
+                    for position, row in enumerate(result):
                         if concept_map_title == "":
                             concept_map_title = row.title
                         last_previous_uuid = row.custom_terminologies_code_uuid
@@ -252,44 +280,12 @@ def load_duplicate_for_v4_concept_map(
                         if total_processed % report_page_size == 0:
                             LOGGER.warning(f"Rows so far this run: {total_processed}")
 
-                        # leverage v5 migration functions to get code, display, depends_on, and deduplication values
-                        (
-                            code_schema,
-                            code_simple,
-                            code_jsonb,
-                            code_string,
-                            display_string
-                        ) = prepare_code_and_display_for_storage_migration(row.code, row.display)
-                        (
-                            depends_on_value,
-                            rejected_depends_on_value
-                        ) = filter_unsafe_depends_on_value(row.depends_on_value)
-                        has_depends_on = (rejected_depends_on_value is None and depends_on_value is not None)
-                        (
-                            depends_on_value_schema,
-                            depends_on_value_simple,
-                            depends_on_value_jsonb,
-                            depends_on_value_string,
-                            depends_on_property_string
-                        ) = prepare_depends_on_value_for_storage(depends_on_value, row.depends_on_property)
-                        depends_on_value_for_code_id = prepare_depends_on_attributes_for_code_id_migration(
-                            depends_on_value_string,
-                            depends_on_property_string,
-                            row.depends_on_system,
-                            row.depends_on_display
-                        )
-                        code_deduplication_hash = generate_code_id(
-                            code_string=code_string,
-                            display_string=display_string,
-                            depends_on_value_string=depends_on_value_for_code_id,
-                        )
-                        mapping_deduplication_hash = generate_mapping_id_with_source_code_id(
-                            source_code_id=code_deduplication_hash,
-                            relationship_code=row.relationship_code,
-                            target_concept_code=row.target_concept_code,
-                            target_concept_display=row.target_concept_display,
-                            target_concept_system=row.target_concept_system,
-                        )
+                        code_string = prepared.code_string[position]
+                        display_string = prepared.display_string[position]
+                        if prepared.code_id_error[position] is not None:
+                            raise prepared.code_id_error[position]
+                        code_deduplication_hash = prepared.code_id[position]
+                        mapping_deduplication_hash = mapping_deduplication_hashes[position]
 
                         try:
                             conn.execute(
@@ -13,10 +13,8 @@ import app.concept_maps.models
 from app.database import get_db
 from app.enum.concept_maps_for_content import ConceptMapsForContent
 from app.enum.concept_maps_for_systems import ConceptMapsForSystems
-from app.helpers.format_helper import prepare_code_and_display_for_storage_migration, filter_unsafe_depends_on_value, \
-    prepare_depends_on_value_for_storage, prepare_depends_on_attributes_for_code_id_migration
+from app.helpers.format_helper import prepare_source_concept_columns_for_storage_migration
 from app.helpers.message_helper import message_exception_summary
-from app.helpers.id_helper import generate_code_id
 from app.util.data_migration import convert_empty_to_null, get_v5_concept_map_uuids_in_n_blocks_for_parallel_process
 
 LOGGER = logging.getLogger()
@@ -148,43 +146,24 @@ def identify_duplicate_code_values_in_v4(
             if count == 0:
                 done = True
             else:
-                for row in result:
+                # leverage v5 migration functions to get deduplication_hash values, for the whole page at once
+                prepared = prepare_source_concept_columns_for_storage_migration(
+                    codes=[row.code for row in result],
+                    displays=[row.display for row in result],
+                    depends_on_values=[row.depends_on_value for row in result],
+                    depends_on_properties=[row.depends_on_property for row in result],
+                    depends_on_systems=[row.depends_on_system for row in result],
+                    depends_on_displays=[row.depends_on_display for row in result],
+                )
+                for position, row in enumerate(result):
                     last_previous_uuid = row.custom_terminologies_code_uuid
                     if total_processed % report_page_size == 0:
                         LOGGER.warning(f"Rows so far this run: {total_processed}")
                     total_processed += 1
 
-                    # leverage v5 migration functions to get deduplication_hash values
-                    (
-                        code_schema,
-                        code_simple,
-                        code_jsonb,
-                        code_string,
-                        display_string
-                    ) = prepare_code_and_display_for_storage_migration(row.code, row.display)
-                    (
-                        depends_on_value,
-                        rejected_depends_on_value
-                    ) = filter_unsafe_depends_on_value(row.depends_on_value)
-                    has_depends_on = (rejected_depends_on_value is None and depends_on_value is not None)
-                    (
-                        depends_on_value_schema,
-                        depends_on_value_simple,
-                        depends_on_value_jsonb,
-                        depends_on_value_string,
-                        depends_on_property_string
-                    ) = prepare_depends_on_value_for_storage(depends_on_value, row.depends_on_property)
-                    depends_on_value_for_code_id = prepare_depends_on_attributes_for_code_id_migration(
-                        depends_on_value_string,
-                        depends_on_property_string,
-                        row.depends_on_system,
-                        row.depends_on_display
-                    )
-                    deduplication_hash = generate_code_id(
-                        code_string=code_string,
-                        display_string=display_string,
-                        depends_on_value_string=depends_on_value_for_code_id,
-                    )
+                    if prepared.code_id_error[position] is not None:
+                        raise prepared.code_id_error[position]
+                    deduplication_hash = prepared.code_id[position]
 
                     try:
                         conn.execute(
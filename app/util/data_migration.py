@@ -16,10 +16,9 @@ from app.database import get_db
 from app.enum.concept_maps_for_content import ConceptMapsForContent
 from app.enum.concept_maps_for_systems import ConceptMapsForSystems
 from app.helpers.format_helper import IssuePrefix, \
-    prepare_additional_data_for_storage, filter_unsafe_depends_on_value, prepare_code_and_display_for_storage_migration, \
-    prepare_depends_on_value_for_storage, prepare_binding_and_value_for_jsonb_insert_migration, \
-    prepare_depends_on_attributes_for_code_id_migration
-from app.helpers.id_helper import generate_code_id, generate_mapping_id_with_source_code_values
+    prepare_additional_data_for_storage, prepare_code_and_display_for_storage_migration, \
+    prepare_binding_and_value_for_jsonb_insert_migration, prepare_source_concept_columns_for_storage_migration
+from app.helpers.id_helper import generate_mapping_ids_with_source_code_values
 from app.helpers.message_helper import message_exception_summary
 
 # from sqlalchemy.dialects.postgresql import UUID as UUID_column_type
@@ -483,7 +482,16 @@ def migrate_custom_terminologies_code(
                 ):
                     done = True
                 else:
-                    for row in result:
+                    # normalize and hash the whole page at once; convert_null_to_empty as for the code_id of each row
+                    prepared = prepare_source_concept_columns_for_storage_migration(
+                        codes=[row.code for row in result],
+                        displays=[row.display for row in result],
+                        depends_on_values=[row.depends_on_value for row in result],
+                        depends_on_properties=[convert_null_to_empty(row.depends_on_property) for row in result],
+                        depends_on_systems=[convert_null_to_empty(row.depends_on_system) for row in result],
+                        depends_on_displays=[convert_null_to_empty(row.depends_on_display) for row in result],
+                    )
+                    for position, row in enumerate(result):
 
                         # init
                         last_previous_uuid = row.uuid
@@ -499,35 +507,19 @@ def migrate_custom_terminologies_code(
                         total_processed += 1
 
                         # prepare_code_and_display_for_storage
-                        (
-                            code_schema,
-                            code_simple,
-                            code_jsonb,
-                            code_string_for_code_id,
-                            display_string_for_code_id
-                        ) = prepare_code_and_display_for_storage_migration(row.code, row.display)
+                        code_schema = prepared.code_schema[position]
+                        code_simple = prepared.code_simple[position]
+                        code_jsonb = prepared.code_jsonb[position]
 
                         # filter_unsafe_depends_on_value
-                        (
-                            depends_on_value,
-                            rejected_depends_on_value
-                        ) = filter_unsafe_depends_on_value(row.depends_on_value)
+                        depends_on_value = prepared.depends_on_value[position]
+                        rejected_depends_on_value = prepared.rejected_depends_on_value[position]
 
                         # has_depends_on
                         has_depends_on = (rejected_depends_on_value is None and depends_on_value is not None)
-                        (
-                            depends_on_value_schema,
-                            depends_on_value_simple,
-                            depends_on_value_jsonb,
-                            depends_on_value_string,
-                            depends_on_property_string
-                        ) = prepare_depends_on_value_for_storage(depends_on_value, row.depends_on_property)
-                        depends_on_value_for_code_id = prepare_depends_on_attributes_for_code_id_migration(
-                            convert_null_to_empty(depends_on_value_string),
-                            convert_null_to_empty(depends_on_property_string),
-                            convert_null_to_empty(row.depends_on_system),
-                            convert_null_to_empty(row.depends_on_display)
-                        )
+                        depends_on_value_schema = prepared.depends_on_value_schema[position]
+                        depends_on_value_simple = prepared.depends_on_value_simple[position]
+                        depends_on_value_jsonb = prepared.depends_on_value_jsonb[position]
 
                         # prepare_additional_data_for_storage
                         additional_data = prepare_additional_data_for_storage(
@@ -536,11 +528,9 @@ def migrate_custom_terminologies_code(
                         )
 
                         # code_id (and deduplication_hash)
-                        code_id = generate_code_id(
-                            code_string=code_string_for_code_id,
-                            display_string=display_string_for_code_id,
-                            depends_on_value_string=depends_on_value_for_code_id,
-                        )
+                        if prepared.code_id_error[position] is not None:
+                            raise prepared.code_id_error[position]
+                        code_id = prepared.code_id[position]
                         deduplication_hash = code_id
 
                         # uuid
@@ -972,16 +962,17 @@ def migrate_concept_maps_concept_relationship(
         ).fetchall()
 
         if concept_relationship_results:
-            data_to_migrate = []
+            source_code_strings = []
+            depends_on_values = []
             for row in concept_relationship_results:
-
-                # Calculate new mapping_id
+                # Source code and depends_on values for the new mapping_id
                 if row.sc_code_schema == CODEABLE_CONCEPT_SCHEMA:
                     source_code_string = row.sc_code_jsonb
                 elif row.sc_code_schema == CODE_SCHEMA:
                     source_code_string = row.sc_code_simple
                 else:
                     raise Exception("Unable to calculate source_code_string")
+                source_code_strings.append(source_code_string)
 
                 depends_on_value = None
                 if row.depends_on_value_schema is not None:
@@ -991,19 +982,29 @@ def migrate_concept_maps_concept_relationship(
                         depends_on_value = json.dumps(row.depends_on_value_jsonb)
                     if not depends_on_value:
                         raise Exception("Unable to calculate depends on value")
+                depends_on_values.append(depends_on_value)
+
+            # Calculate new mapping_ids for the batch: each distinct source code is normalized once
+            new_mapping_ids = generate_mapping_ids_with_source_code_values(
+                source_code_strings=source_code_strings,
+                display_strings=[row.sc_display for row in concept_relationship_results],
+                relationship_codes=[
+                    str(row.relationship_code_uuid) if row.relationship_code_uuid else ""
+                    for row in concept_relationship_results
+                ],
+                target_concept_codes=[str(row.target_concept_display) for row in concept_relationship_results],
+                target_concept_displays=[str(row.target_concept_display) for row in concept_relationship_results],
+                target_concept_systems=[
+                    str(row.target_concept_system_version_uuid) for row in concept_relationship_results
+                ],
+                depends_on_value_strings=depends_on_values,
+                depends_on_properties=[row.depends_on_property for row in concept_relationship_results],
+                depends_on_systems=[row.depends_on_system for row in concept_relationship_results],
+                depends_on_displays=[row.depends_on_display for row in concept_relationship_results],
+            )
 
-                new_mapping_id = generate_mapping_id_with_source_code_values(
-                    source_code_string=source_code_string,
-                    display_string=row.sc_display,
-                    relationship_code=str(row.relationship_code_uuid) if row.relationship_code_uuid else "",
-                    target_concept_code=str(row.target_concept_display),
-                    target_concept_display=str(row.target_concept_display),
-                    target_concept_system=str(row.target_concept_system_version_uuid),
-                    depends_on_value_string=depends_on_value,
-                    depends_on_property=row.depends_on_property,
-                    depends_on_system=row.depends_on_system,
-                    depends_on_display=row.depends_on_display,
-                )
+            data_to_migrate = []
+            for row, new_mapping_id in zip(concept_relationship_results, new_mapping_ids):
                 new_deduplication_hash = new_mapping_id
 
                 new_mapped_by = user_to_uuid(row.author)
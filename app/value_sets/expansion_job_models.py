@@ -0,0 +1,328 @@
+import logging
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import text
+
+import app.tasks
+import app.value_sets.models
+from app.database import get_db
+from app.errors import NotFoundException
+from app.helpers.message_helper import message_exception_classname
+
+LOGGER = logging.getLogger(__name__)
+
+# A queued or running job not updated for this many minutes is assumed lost (for example, its worker restarted)
+# and no longer blocks new submissions for the same value set version
+EXPANSION_JOB_STALE_MINUTES = 120
+
+
+@dataclass
+class ExpansionJob:
+    """
+    An expansion of a value set version, run as a Celery task rather than inside a web request.
+    The job is stored in value_sets.expansion_job so that clients can poll its status and progress.
+
+    status is one of: waiting, queued, running, complete, failed, skipped. A waiting job is a forced expansion
+    submitted while an expansion that is not forced was queued or running: it is queued once that job, its
+    after_job_uuid, ends. A skipped job has nothing to expand, and its error gives the reason.
+    While running, phase is one of app.value_sets.models.EXPANSION_PHASES, and phase_completed of phase_total
+    units of work (rule groups, or members saved) are done.
+    """
+
+    uuid: uuid.UUID
+    vs_version_uuid: uuid.UUID
+    force_new: bool
+    status: str
+    phase: Optional[str] = None
+    phase_completed: Optional[int] = None
+    phase_total: Optional[int] = None
+    expansion_uuid: Optional[uuid.UUID] = None
+    error: Optional[str] = None
+    created_date: Optional[datetime] = None
+    updated_date: Optional[datetime] = None
+    after_job_uuid: Optional[uuid.UUID] = None
+    coalesced: bool = False
+
+    @classmethod
+    def load(cls, job_uuid) -> "ExpansionJob":
+        """
+        @raise NotFoundException if there is no job with this UUID
+        """
+        conn = get_db()
+        row = conn.execute(
+            text(
+                """
+                select * from value_sets.expansion_job
+                where uuid = :job_uuid
+                """
+            ),
+            {"job_uuid": str(job_uuid)},
+        ).first()
+        if row is None:
+            raise NotFoundException(f"No Expansion Job found with UUID: {job_uuid}")
+        return cls.from_row(row)
+
+    @classmethod
+    def from_row(cls, row, coalesced=False) -> "ExpansionJob":
+        return cls(
+            uuid=row.uuid,
+            vs_version_uuid=row.vs_version_uuid,
+            force_new=row.force_new,
+            status=row.status,
+            phase=row.phase,
+            phase_completed=row.phase_completed,
+            phase_total=row.phase_total,
+            expansion_uuid=row.expansion_uuid,
+            error=row.error,
+            created_date=row.created_date,
+            updated_date=row.updated_date,
+            after_job_uuid=row.after_job_uuid,
+            coalesced=coalesced,
+        )
+
+    @classmethod
+    def submit(cls, vs_version_uuid, force_new=False) -> "ExpansionJob":
+        """
+        Queue an expansion of the value set version. If a job for the same version is already queued or running,
+        and it is forced or this one is not, no new job is created: that job is returned instead, with coalesced set
+        to True. A forced job submitted while a job that is not forced is active waits for it to end, as a forced
+        expansion must not reuse the stored one: only one job waits per version, and later forced jobs coalesce
+        onto it.
+        The job is committed before the task is queued, so that the worker can always load it.
+        @raise NotFoundException if the value set version does not exist
+        """
+        # Fail fast on an unknown version, rather than in the worker
+        app.value_sets.models.ValueSetVersion.load(vs_version_uuid)
+
+        conn = get_db()
+        parameters = {"vs_version_uuid": str(vs_version_uuid), "force_new": force_new}
+        abandoned_job_uuids = [
+            row.uuid
+            for row in conn.execute(
+                text(
+                    """
+                    update value_sets.expansion_job
+                    set status = 'failed', error = 'abandoned', updated_date = now()
+                    where vs_version_uuid = :vs_version_uuid
+                    and status in ('queued', 'running')
+                    and updated_date < now() - make_interval(mins => :stale_minutes)
+                    returning uuid
+                    """
+                ),
+                dict(parameters, stale_minutes=EXPANSION_JOB_STALE_MINUTES),
+            )
+        ]
+        promoted_jobs = cls._queue_waiting_jobs(abandoned_job_uuids)
+
+        # A conflicting job may finish between the insert and the select: the insert is then tried again
+        while True:
+            job_row = conn.execute(
+                text(
+                    """
+                    insert into value_sets.expansion_job
+                    (uuid, vs_version_uuid, force_new, status)
+                    values
+                    (:job_uuid, :vs_version_uuid, :force_new, 'queued')
+                    on conflict (vs_version_uuid) where status in ('queued', 'running')
+                    do nothing
+                    returning *
+                    """
+                ),
+                dict(parameters, job_uuid=str(uuid.uuid4())),
+            ).first()
+            if job_row is not None:
+                job = cls.from_row(job_row)
+                break
+
+            active_job = conn.execute(
+                text(
+                    """
+                    select * from value_sets.expansion_job
+                    where vs_version_uuid = :vs_version_uuid
+                    and status in ('queued', 'running')
+                    """
+                ),
+                parameters,
+            ).first()
+            if active_job is None:
+                continue
+            if active_job.force_new or not force_new:
+                job = cls.from_row(active_job, coalesced=True)
+                break
+
+            waiting_job = conn.execute(
+                text(
+                    """
+                    insert into value_sets.expansion_job
+                    (uuid, vs_version_uuid, force_new, status, after_job_uuid)
+                    values
+                    (:job_uuid, :vs_version_uuid, true, 'waiting', :after_job_uuid)
+                    on conflict (vs_version_uuid) where status = 'waiting'
+                    do nothing
+                    returning *
+                    """
+                ),
+                dict(parameters, job_uuid=str(uuid.uuid4()), after_job_uuid=str(active_job.uuid)),
+            ).first()
+            if waiting_job is not None:
+                job = cls.from_row(waiting_job)
+                break
+            waiting_job = conn.execute(
+                text(
+                    """
+                    select * from value_sets.expansion_job
+                    where vs_version_uuid = :vs_version_uuid
+                    and status = 'waiting'
+                    """
+                ),
+                parameters,
+            ).first()
+            if waiting_job is not None:
+                job = cls.from_row(waiting_job, coalesced=True)
+                break
+
+        conn.commit()
+        for promoted_job in promoted_jobs:
+            promoted_job._enqueue()
+        if job.status == "queued" and not job.coalesced:
+            job._enqueue()
+        return job
+
+    @classmethod
+    def _queue_waiting_jobs(cls, after_job_uuids) -> list:
+        """
+        Queue the jobs waiting for any of the jobs after_job_uuids, which have ended, without committing.
+        @return: the queued jobs, to be enqueued once committed
+        """
+        if not after_job_uuids:
+            return []
+        rows = get_db().execute(
+            text(
+                """
+                update value_sets.expansion_job
+                set status = 'queued', updated_date = now()
+                where status = 'waiting'
+                and after_job_uuid = any(cast(:after_job_uuids as uuid[]))
+                returning *
+                """
+            ),
+            {"after_job_uuids": [str(job_uuid) for job_uuid in after_job_uuids]},
+        )
+        return [cls.from_row(row) for row in rows]
+
+    def _enqueue(self):
+        """
+        Send the committed job to a worker. If it cannot be sent, the job is marked failed, so that it does not
+        block later submissions for its version until it is abandoned.
+        """
+        try:
+            app.tasks.expand_value_set_version.delay(str(self.uuid))
+        except Exception as e:
+            LOGGER.warning(f"Expansion job {self.uuid} for value set version {self.vs_version_uuid} not queued: {e}")
+            self.status = "failed"
+            self.error = message_exception_classname(e)
+            self._finish()
+
+    def update_progress(self, phase, completed, total):
+        """
+        Record the progress of the current phase and commit it, so that it is visible to clients while the job runs.
+        Suitable as the progress_callback for ValueSetVersion.create_expansion.
+        """
+        self.phase = phase
+        self.phase_completed = completed
+        self.phase_total = total
+        self._save_state()
+
+    def run(self):
+        """
+        Perform the expansion. The job is marked complete with the expansion_uuid, or failed with the error.
+        When force_new is False and the version already has a stored expansion, that expansion is used.
+        Extensional value sets are not expanded: the job is marked skipped.
+        """
+        self.status = "running"
+        self._save_state()
+        try:
+            vs_version = app.value_sets.models.ValueSetVersion.load(
+                self.vs_version_uuid
+            )
+            if vs_version.value_set.type == "extensional":
+                self.status = "skipped"
+                self.error = "Extensional value sets have no expansion: their members are listed in the value set"
+                self._finish()
+                return
+            if self.force_new is True or not vs_version.expansion_already_exists():
+                vs_version.create_expansion(progress_callback=self.update_progress)
+            else:
+                vs_version.load_current_expansion_metadata()
+            self.expansion_uuid = vs_version.expansion_uuid
+            self.status = "complete"
+            self._finish()
+        except Exception as e:
+            LOGGER.warning(
+                f"Expansion job {self.uuid} for value set version {self.vs_version_uuid} failed: {e}"
+            )
+            get_db().rollback()
+            self.status = "failed"
+            self.error = message_exception_classname(e)
+            self._finish()
+
+    def _finish(self):
+        """
+        Save the final status, and queue the job waiting for this one in the same transaction: a job submitted
+        meanwhile then coalesces onto the queued job, rather than conflicting with it.
+        """
+        self._update_state()
+        waiting_jobs = self._queue_waiting_jobs([self.uuid])
+        get_db().commit()
+        for waiting_job in waiting_jobs:
+            waiting_job._enqueue()
+
+    def _save_state(self):
+        self._update_state()
+        get_db().commit()
+
+    def _update_state(self):
+        conn = get_db()
+        conn.execute(
+            text(
+                """
+                update value_sets.expansion_job
+                set status = :status, phase = :phase, phase_completed = :phase_completed,
+                phase_total = :phase_total, expansion_uuid = :expansion_uuid, error = :error, updated_date = now()
+                where uuid = :job_uuid
+                """
+            ),
+            {
+                "job_uuid": str(self.uuid),
+                "status": self.status,
+                "phase": self.phase,
+                "phase_completed": self.phase_completed,
+                "phase_total": self.phase_total,
+                "expansion_uuid": str(self.expansion_uuid)
+                if self.expansion_uuid
+                else None,
+                "error": self.error,
+            },
+        )
+
+    def serialize(self):
+        return {
+            "uuid": self.uuid,
+            "vs_version_uuid": self.vs_version_uuid,
+            "force_new": self.force_new,
+            "status": self.status,
+            "progress": {
+                "phase": self.phase,
+                "completed": self.phase_completed,
+                "total": self.phase_total,
+            },
+            "expansion_uuid": self.expansion_uuid,
+            "error": self.error,
+            "created_date": self.created_date,
+            "updated_date": self.updated_date,
+            "after_job_uuid": self.after_job_uuid,
+            "coalesced": self.coalesced,
+        }
@@ -1,8 +1,9 @@
 import csv
+from io import StringIO
 import datetime
+import functools
 import json
 from dataclasses import dataclass, field
-from cachetools.func import ttl_cache
 from typing import List, Dict, Tuple, Optional, Any
 import re
 import requests
@@ -29,7 +30,10 @@ from app.errors import (
 )
 from app.helpers.message_helper import message_exception_classname
 
+from app.helpers.cache_helper import two_tier_cache, invalidate_cache
 from app.helpers.oci_helper import set_up_and_save_to_object_store, folder_path_for_oci
+from app.helpers.publish_helper import PublishDestination, publish_to_destinations
+from app.helpers.stream_helper import StreamedArray
 
 import app.models.codes
 
@@ -52,6 +56,12 @@ RXNORM_BASE_URL = "https://rxnav.prod.projectronin.io/REST/"
 
 MAX_ES_SIZE = 1000
 
+# Phases reported, in order, by ValueSetVersion.create_expansion to its progress_callback
+EXPANSION_PHASES = ["rules", "mapping_inclusions", "save"]
+
+# Formats supported by ValueSetVersion.export_current_expansion
+EXPANSION_EXPORT_FORMATS = ["ndjson", "csv"]
+
 metadata = MetaData()
 expansion_member_data = Table(
     "expansion_member_data",
@@ -287,17 +297,15 @@ class UcumRule(VSRule):
         converted_query = text(query).bindparams(bindparam("codes", expanding=True))
 
         results_data = conn.execute(converted_query, {"codes": codes})
-        results = [
-            app.models.codes.Code(
-                system=self.fhir_system,
-                version=self.terminology_version.version,
-                code=x.code,
-                display=x.code,
-                from_custom_terminology=False,
-                from_fhir_terminology=False,
-            )
-            for x in results_data
-        ]
+        results = app.models.codes.Code.from_rows(
+            results_data,
+            system=self.fhir_system,
+            version=self.terminology_version.version,
+            code_column="code",
+            display_column="code",
+            from_custom_terminology=False,
+            from_fhir_terminology=False,
+        )
         self.results = set(results)
 
     def include_entire_code_system(self):
@@ -311,17 +319,15 @@ class UcumRule(VSRule):
         results_data = conn.execute(
             text(query), {"terminology_version_uuid": self.terminology_version.uuid}
         )
-        results = [
-            app.models.codes.Code(
-                system=self.fhir_system,
-                version=self.terminology_version.version,
-                code=x.code,
-                display=x.code,
-                from_fhir_terminology=False,
-                from_custom_terminology=False,
-            )
-            for x in results_data
-        ]
+        results = app.models.codes.Code.from_rows(
+            results_data,
+            system=self.fhir_system,
+            version=self.terminology_version.version,
+            code_column="code",
+            display_column="code",
+            from_custom_terminology=False,
+            from_fhir_terminology=False,
+        )
         self.results = set(results)
 
 
@@ -362,17 +368,15 @@ class ICD10CMRule(VSRule):
             converted_query,
             {"codes": codes, "version_uuid": self.terminology_version.uuid},
         )
-        results = [
-            app.models.codes.Code(
-                system=self.fhir_system,
-                version=self.terminology_version.version,
-                code=x.code,
-                display=x.display,
-                from_custom_terminology=False,
-                from_fhir_terminology=False,
-            )
-            for x in results_data
-        ]
+        results = app.models.codes.Code.from_rows(
+            results_data,
+            system=self.fhir_system,
+            version=self.terminology_version.version,
+            code_column="code",
+            display_column="display",
+            from_custom_terminology=False,
+            from_fhir_terminology=False,
+        )
         self.results = set(results)
 
     def self_and_descendents(self):
@@ -419,17 +423,15 @@ class ICD10CMRule(VSRule):
             converted_query,
             {"codes": codes, "version_uuid": self.terminology_version.uuid},
         )
-        results = [
-            app.models.codes.Code(
-                system=self.fhir_system,
-                version=self.terminology_version.version,
-                code=x.code,
-                display=x.display,
-                from_fhir_terminology=False,
-                from_custom_terminology=False,
-            )
-            for x in results_data
-        ]
+        results = app.models.codes.Code.from_rows(
+            results_data,
+            system=self.fhir_system,
+            version=self.terminology_version.version,
+            code_column="code",
+            display_column="display",
+            from_custom_terminology=False,
+            from_fhir_terminology=False,
+        )
         self.results = set(results)
 
     def descendent_of(self):
@@ -471,17 +473,15 @@ class ICD10CMRule(VSRule):
             converted_query,
             {"codes": codes, "version_uuid": self.terminology_version.uuid},
         )
-        results = [
-            app.models.codes.Code(
-                system=self.fhir_system,
-                version=self.terminology_version.version,
-                code=x.code,
-                display=x.display,
-                from_custom_terminology=False,
-                from_fhir_terminology=False,
-            )
-            for x in results_data
-        ]
+        results = app.models.codes.Code.from_rows(
+            results_data,
+            system=self.fhir_system,
+            version=self.terminology_version.version,
+            code_column="code",
+            display_column="display",
+            from_custom_terminology=False,
+            from_fhir_terminology=False,
+        )
         self.results = set(results)
 
     def in_section(self):
@@ -497,17 +497,15 @@ class ICD10CMRule(VSRule):
             text(query),
             {"section_uuid": self.value, "version_uuid": self.terminology_version.uuid},
         )
-        results = [
-            app.models.codes.Code(
-                system=self.fhir_system,
-                version=self.terminology_version.version,
-                code=x.code,
-                display=x.display,
-                from_fhir_terminology=False,
-                from_custom_terminology=False,
-            )
-            for x in results_data
-        ]
+        results = app.models.codes.Code.from_rows(
+            results_data,
+            system=self.fhir_system,
+            version=self.terminology_version.version,
+            code_column="code",
+            display_column="display",
+            from_custom_terminology=False,
+            from_fhir_terminology=False,
+        )
         self.results = set(results)
 
     def in_chapter(self):
@@ -525,17 +523,15 @@ class ICD10CMRule(VSRule):
             text(query),
             {"chapter_uuid": self.value, "version_uuid": self.terminology_version.uuid},
         )
-        results = [
-            app.models.codes.Code(
-                system=self.fhir_system,
-                version=self.terminology_version.version,
-                code=x.code,
-                display=x.display,
-                from_custom_terminology=False,
-                from_fhir_terminology=False,
-            )
-            for x in results_data
-        ]
+        results = app.models.codes.Code.from_rows(
+            results_data,
+            system=self.fhir_system,
+            version=self.terminology_version.version,
+            code_column="code",
+            display_column="display",
+            from_custom_terminology=False,
+            from_fhir_terminology=False,
+        )
         self.results = set(results)
 
     def include_entire_code_system(self):
@@ -551,17 +547,15 @@ class ICD10CMRule(VSRule):
         results_data = conn.execute(
             text(query), {"terminology_version_uuid": self.terminology_version.uuid}
         )
-        results = [
-            app.models.codes.Code(
-                system=self.fhir_system,
-                version=self.terminology_version.version,
-                code=x.code,
-                display=x.display,
-                from_fhir_terminology=False,
-                from_custom_terminology=False,
-            )
-            for x in results_data
-        ]
+        results = app.models.codes.Code.from_rows(
+            results_data,
+            system=self.fhir_system,
+            version=self.terminology_version.version,
+            code_column="code",
+            display_column="display",
+            from_custom_terminology=False,
+            from_fhir_terminology=False,
+        )
         self.results = set(results)
 
 
@@ -750,17 +744,15 @@ class RxNormRule(VSRule):
 
             # Combine the data from both responses
             combined_data = concepts_data + status_data
-            results = [
-                app.models.codes.Code(
-                    system=self.fhir_system,
-                    version=self.terminology_version.version,
-                    code=x.get("rxcui"),
-                    display=x.get("name"),
-                    from_fhir_terminology=False,
-                    from_custom_terminology=False,
-                )
-                for x in combined_data
-            ]
+            results = app.models.codes.Code.from_rows(
+                combined_data,
+                system=self.fhir_system,
+                version=self.terminology_version.version,
+                code_column="rxcui",
+                display_column="name",
+                from_custom_terminology=False,
+                from_fhir_terminology=False,
+            )
             self.results = set(results)
 
     def all_active_rxnorm(self):
@@ -775,17 +767,15 @@ class RxNormRule(VSRule):
         )
         # Add data to results
         data = r.json().get("minConceptGroup").get("minConcept")
-        results = [
-            app.models.codes.Code(
-                system=self.fhir_system,
-                version=self.terminology_version.version,
-                code=x.get("rxcui"),
-                display=x.get("name"),
-                from_custom_terminology=False,
-                from_fhir_terminology=False,
-            )
-            for x in data
-        ]
+        results = app.models.codes.Code.from_rows(
+            data,
+            system=self.fhir_system,
+            version=self.terminology_version.version,
+            code_column="rxcui",
+            display_column="name",
+            from_custom_terminology=False,
+            from_fhir_terminology=False,
+        )
         self.results.update(set(results))
 
 
@@ -795,17 +785,15 @@ class LOINCRule(VSRule):
     """
 
     def codes_from_results(self, db_result):
-        results = [
-            app.models.codes.Code(
-                system=self.fhir_system,
-                version=self.terminology_version.version,
-                code=x.loinc_num,
-                display=x.long_common_name,
-                from_fhir_terminology=False,
-                from_custom_terminology=False,
-            )
-            for x in db_result
-        ]
+        results = app.models.codes.Code.from_rows(
+            db_result,
+            system=self.fhir_system,
+            version=self.terminology_version.version,
+            code_column="loinc_num",
+            display_column="long_common_name",
+            from_custom_terminology=False,
+            from_fhir_terminology=False,
+        )
 
         return set(results)
 
@@ -967,17 +955,15 @@ class ICD10PCSRule(VSRule):
             converted_query,
             {"value": value_param, "version_uuid": self.terminology_version.uuid},
         )
-        results = [
-            app.models.codes.Code(
-                system=self.fhir_system,
-                version=self.terminology_version.version,
-                code=x.code,
-                display=x.display,
-                from_custom_terminology=False,
-                from_fhir_terminology=False,
-            )
-            for x in results_data
-        ]
+        results = app.models.codes.Code.from_rows(
+            results_data,
+            system=self.fhir_system,
+            version=self.terminology_version.version,
+            code_column="code",
+            display_column="display",
+            from_custom_terminology=False,
+            from_fhir_terminology=False,
+        )
         self.results = set(results)
 
     def code_rule(self):
@@ -1118,17 +1104,15 @@ class CPTRule(VSRule):
 
         conn = get_db()
         results_data = conn.execute(text(query))
-        results = [
-            app.models.codes.Code(
-                system=self.fhir_system,
-                version=self.terminology_version.version,
-                code=x.code,
-                display=x.long_description,
-                from_fhir_terminology=False,
-                from_custom_terminology=False,
-            )
-            for x in results_data
-        ]
+        results = app.models.codes.Code.from_rows(
+            results_data,
+            system=self.fhir_system,
+            version=self.terminology_version.version,
+            code_column="code",
+            display_column="long_description",
+            from_custom_terminology=False,
+            from_fhir_terminology=False,
+        )
         self.results = set(results)
 
     # def display_regex(self):
@@ -1171,17 +1155,15 @@ class CPTRule(VSRule):
         results_data = conn.execute(
             text(query), {"terminology_version_uuid": self.terminology_version.uuid}
         )
-        results = [
-            app.models.codes.Code(
-                system=self.fhir_system,
-                version=self.terminology_version.version,
-                code=x.code,
-                display=x.long_description,
-                from_custom_terminology=False,
-                from_fhir_terminology=False,
-            )
-            for x in results_data
-        ]
+        results = app.models.codes.Code.from_rows(
+            results_data,
+            system=self.fhir_system,
+            version=self.terminology_version.version,
+            code_column="code",
+            display_column="long_description",
+            from_custom_terminology=False,
+            from_fhir_terminology=False,
+        )
         self.results = set(results)
 
 
@@ -1199,17 +1181,15 @@ class FHIRRule(VSRule):
         results_data = conn.execute(
             text(query), {"terminology_version_uuid": self.terminology_version.uuid}
         )
-        results = [
-            app.models.codes.Code(
-                system=self.fhir_system,
-                version=self.terminology_version.version,
-                code=x.code,
-                display=x.display,
-                from_fhir_terminology=True,
-                from_custom_terminology=False,
-            )
-            for x in results_data
-        ]
+        results = app.models.codes.Code.from_rows(
+            results_data,
+            system=self.fhir_system,
+            version=self.terminology_version.version,
+            code_column="code",
+            display_column="display",
+            from_custom_terminology=False,
+            from_fhir_terminology=True,
+        )
         self.results = set(results)
 
     def code_rule(self):
@@ -1237,67 +1217,34 @@ class FHIRRule(VSRule):
             converted_query,
             {"codes": codes, "terminology_version_uuid": self.terminology_version.uuid},
         )
-        results = [
-            app.models.codes.Code(
-                system=self.fhir_system,
-                version=self.terminology_version.version,
-                code=x.code,
-                display=x.display,
-                from_custom_terminology=False,
-                from_fhir_terminology=True,
-            )
-            for x in results_data
-        ]
+        results = app.models.codes.Code.from_rows(
+            results_data,
+            system=self.fhir_system,
+            version=self.terminology_version.version,
+            code_column="code",
+            display_column="display",
+            from_custom_terminology=False,
+            from_fhir_terminology=True,
+        )
         self.results = set(results)
 
 
 class CustomTerminologyRule(VSRule):
     def codes_from_results(self, db_result):
-        codes = []
-        for row in db_result:
-            # TODO: come back and add depends on support
-            code_schema = app.models.codes.RoninCodeSchemas(row.code_schema)
-
-            if code_schema == app.models.codes.RoninCodeSchemas.code:
-                new_code = app.models.codes.Code(
-                    code_schema=code_schema,
-                    code=row.code_simple,
-                    system=None,
-                    version=None,
-                    display=row.display,
-                    terminology_version=self.terminology_version,
-                    from_custom_terminology=True,
-                    custom_terminology_code_uuid=row.uuid,
-                    custom_terminology_code_id=row.code_id,
-                    stored_custom_terminology_deduplication_hash=row.deduplication_hash,
-                    from_fhir_terminology=False,
-                    saved_to_db=True,
-                )
-            elif code_schema == app.models.codes.RoninCodeSchemas.codeable_concept:
-                code_object = app.models.codes.FHIRCodeableConcept.deserialize(
-                    row.code_jsonb
-                )
-                new_code = app.models.codes.Code(
-                    code_schema=code_schema,
-                    code=None,
-                    display=None,
-                    system=None,
-                    version=None,
-                    terminology_version=self.terminology_version,
-                    code_object=code_object,
-                    from_custom_terminology=True,
-                    custom_terminology_code_uuid=row.uuid,
-                    custom_terminology_code_id=row.code_id,
-                    stored_custom_terminology_deduplication_hash=row.deduplication_hash,
-                    from_fhir_terminology=False,
-                    saved_to_db=True,
-                )
-            else:
-                raise NotImplementedError(
-                    f"ValueSetVersion.load_current_expansion cannot load code with schema {code_schema}"
-                )
-            codes.append(new_code)
-        return codes
+        # TODO: come back and add depends on support
+        return app.models.codes.Code.from_rows(
+            db_result,
+            terminology_version=self.terminology_version,
+            code_column="code_simple",
+            display_column="display",
+            code_schema_column="code_schema",
+            code_jsonb_column="code_jsonb",
+            custom_terminology_code_uuid_column="uuid",
+            custom_terminology_code_id_column="code_id",
+            deduplication_hash_column="deduplication_hash",
+            from_custom_terminology=True,
+            from_fhir_terminology=False,
+        )
 
     def include_entire_code_system(self):
         self.terminology_version.load_content()
@@ -1809,7 +1756,12 @@ class ValueSet:
         ]
 
     @classmethod
-    @ttl_cache()
+    @two_tier_cache(
+        "value_set_most_recent_active_version",
+        # Processes share which version is the most recent active one, and each loads that version itself
+        to_dict=lambda version: {"uuid": str(version.uuid)},
+        from_dict=lambda data: ValueSetVersion.load(data["uuid"]),
+    )
     def load_most_recent_active_version_with_cache(cls, uuid):
         return cls.load_most_recent_active_version(uuid)
 
@@ -2162,9 +2114,9 @@ class ValueSet:
         except Exception as e:
             return f"failed_to_update_rules: {message_exception_classname(e)}"
 
-        # Expand the previous and new value set versions
+        # Expand the new value set version; the previous version only needs a stored expansion to diff against
         try:
-            most_recent_version.expand()
+            most_recent_version.stored_expansion_uuid()
             new_value_set_version.expand(force_new=True)
         except Exception as e:
             return f"failed_to_expand: {message_exception_classname(e)}"
@@ -2179,7 +2131,11 @@ class ValueSet:
             return f"failed_to_diff_versions: {message_exception_classname(e)}"
 
         # Update the status of the new value set version
-        if not diff["removed_codes"] and not diff["added_codes"]:
+        if (
+            not diff["removed_codes"]
+            and not diff["added_codes"]
+            and not diff.get("display_changed_codes")
+        ):
             new_value_set_version.update(status="reviewed")
             return "reviewed"
         else:
@@ -2642,6 +2598,11 @@ class ValueSetVersion:
         self.extensional_codes = {}
         self.explicitly_included_codes = []
 
+        # Populated by load_current_expansion_page when only part of the expansion is requested
+        self.expansion_page = None
+        self.expansion_total = None
+        self.expansion_offset = None
+
         self._expanded = False
 
     def __repr__(self):
@@ -2812,8 +2773,9 @@ class ValueSetVersion:
             return True
         return False
 
-    def load_current_expansion(self):
+    def load_current_expansion_metadata(self):
         """
+        Sets expansion_uuid and expansion_timestamp from the most recent expansion of this ValueSetVersion.
         Raises NotFoundException if the ValueSetVersion is not found
         """
         conn = get_db()
@@ -2841,6 +2803,34 @@ class ValueSetVersion:
         if isinstance(self.expansion_timestamp, str):
             self.expansion_timestamp = parser.parse(self.expansion_timestamp)
 
+    @staticmethod
+    def codes_from_expansion_member_rows(rows):
+        """
+        Build Codes from rows of value_sets.expansion_member_data joined to custom_terminologies.code_data
+        (code_id and deduplication_hash columns), with one terminology lookup per distinct system and version.
+        """
+        # TODO: come back and add depends on support
+        return app.models.codes.Code.from_rows(
+            rows,
+            code_column="code_simple",
+            display_column="display",
+            code_schema_column="code_schema",
+            code_jsonb_column="code_jsonb",
+            system_column="system",
+            version_column="version",
+            custom_terminology_code_uuid_column="custom_terminology_uuid",
+            custom_terminology_code_id_column="code_id",
+            deduplication_hash_column="deduplication_hash",
+            fhir_terminology_code_uuid_column="fhir_terminology_uuid",
+        )
+
+    def load_current_expansion(self):
+        """
+        Raises NotFoundException if the ValueSetVersion is not found
+        """
+        conn = get_db()
+        self.load_current_expansion_metadata()
+
         query_result = conn.execute(
             text(
                 """
@@ -2857,56 +2847,243 @@ class ValueSetVersion:
             {"expansion_uuid": self.expansion_uuid},
         )
 
-        for row in query_result:
-            # TODO: come back and add depends on support
-            code_schema = app.models.codes.RoninCodeSchemas(row.code_schema)
-            from_custom_terminology = (
-                True if row.custom_terminology_uuid is not None else False
+        self.expansion.update(self.codes_from_expansion_member_rows(query_result))
+
+    def load_current_expansion_page(self, offset=0, count=None, filter_text=None):
+        """
+        Load one page of the most recent stored expansion, as supported by the FHIR $expand operation parameters.
+        Filtering, ordering and paging are all evaluated in the database, so only the requested members are loaded.
+
+        Members are ordered by display, then code, then system and version, so that pages are stable between calls.
+
+        Parameters
+        ----------
+        offset : int
+            Number of (filtered) members to skip. Default is 0.
+        count : int, optional
+            Maximum number of members to return. If None, all remaining members are returned.
+        filter_text : str, optional
+            Case-insensitive text that must appear in the display or code of a member. For a CodeableConcept
+            member, that is the code or display of one of its codings, or its text.
+
+        Returns
+        -------
+        int
+            The total number of members matching filter_text, regardless of offset and count.
+            The page itself is stored in self.expansion_page, in order.
+
+        Raises
+        ------
+        NotFoundException
+            If the ValueSetVersion has no stored expansion.
+        """
+        conn = get_db()
+        self.load_current_expansion_metadata()
+
+        parameters = {"expansion_uuid": self.expansion_uuid}
+        filter_clause = ""
+        if filter_text:
+            # Escape LIKE wildcards so the filter is matched as literal text
+            escaped_filter = (
+                filter_text.replace("\\", "\\\\")
+                .replace("%", "\\%")
+                .replace("_", "\\_")
             )
-            from_fhir_terminology = (
-                True if row.fhir_terminology_uuid is not None else False
+            parameters["filter_pattern"] = f"%{escaped_filter}%"
+            filter_clause = """
+                and (
+                    emd.display ilike :filter_pattern
+                    or emd.code_simple ilike :filter_pattern
+                    or exists (
+                        -- The codes and displays in a CodeableConcept, and its text: not its keys or systems
+                        select 1
+                        from unnest(
+                            array['lax $.coding[*].code', 'lax $.coding[*].display', 'lax $.text']::jsonpath[]
+                        ) as path,
+                        jsonb_path_query(emd.code_jsonb, path) as value
+                        where value #>> '{}' ilike :filter_pattern
+                    )
+                )
+                """
+
+        self.expansion_total = conn.execute(
+            text(
+                f"""
+                select count(*) from value_sets.expansion_member_data emd
+                where emd.expansion_uuid = :expansion_uuid
+                {filter_clause}
+                """
+            ),
+            parameters,
+        ).scalar()
+
+        limit_clause = ""
+        if count is not None:
+            parameters["count"] = count
+            limit_clause = "limit :count"
+        parameters["offset"] = offset
+
+        query_result = conn.execute(
+            text(
+                f"""
+                select 
+                    emd.*, 
+                    cd.code_id, 
+                    cd.deduplication_hash 
+                from value_sets.expansion_member_data emd
+                left join custom_terminologies.code_data cd
+                    on emd.custom_terminology_uuid=cd.uuid
+                where emd.expansion_uuid = :expansion_uuid
+                {filter_clause}
+                order by 
+                    emd.display, 
+                    emd.code_simple, 
+                    emd.code_jsonb::text, 
+                    emd.system, 
+                    emd.version, 
+                    emd.custom_terminology_uuid, 
+                    emd.fhir_terminology_uuid
+                {limit_clause}
+                offset :offset
+                """
+            ),
+            parameters,
+        )
+
+        self.expansion_page = self.codes_from_expansion_member_rows(query_result)
+        self.expansion_offset = offset
+        return self.expansion_total
+
+    def expand_page(self, offset=0, count=None, filter_text=None, force_new=False):
+        """
+        Page-aware counterpart of expand(). Creates and saves a new expansion if required,
+        then loads only the requested page of members from the database.
+        See load_current_expansion_page for the parameters.
+        """
+        if force_new is True or not self.expansion_already_exists():
+            self.create_expansion()
+        self._expanded = True
+        return self.load_current_expansion_page(
+            offset=offset, count=count, filter_text=filter_text
+        )
+
+    def export_current_expansion(self, export_format="ndjson", batch_size=1000):
+        """
+        Export the members of the most recent stored expansion, reading them from a server-side database cursor.
+        Each member is formatted straight from its row: no Code objects are created.
+
+        Parameters
+        ----------
+        export_format : str
+            "ndjson" for one JSON object per line, with keys code_schema, code (a string, or a codeable concept
+            object), display, system and version; or "csv" with a header row and the same columns,
+            where a codeable concept code is its JSON text.
+        batch_size : int
+            Number of rows fetched from the cursor at a time.
+
+        Returns
+        -------
+        generator of str
+            One chunk of output per batch of rows.
+
+        Raises
+        ------
+        BadRequestWithCode
+            If the export_format is not supported.
+        """
+        if export_format not in EXPANSION_EXPORT_FORMATS:
+            raise BadRequestWithCode(
+                "ValueSetVersion.export.format",
+                f"Expansion export format {export_format} is not supported. Use one of: {', '.join(EXPANSION_EXPORT_FORMATS)}",
             )
+        expansion_uuid = self.stored_expansion_uuid()
+
+        if export_format == "ndjson":
+            # Postgres builds each JSON line, so Python only passes the text through
+            select_clause = """
+                select jsonb_build_object(
+                    'code_schema', code_schema,
+                    'code', coalesce(to_jsonb(code_simple), code_jsonb),
+                    'display', display,
+                    'system', system,
+                    'version', version
+                )::text as line
+                """
+        else:
+            select_clause = """
+                select code_schema, coalesce(code_simple, code_jsonb::text) as code, display, system, version
+                """
+        query = text(
+            select_clause
+            + """
+                from value_sets.expansion_member_data
+                where expansion_uuid = :expansion_uuid
+                order by display, code_simple, code_jsonb::text, system, version
+                """
+        ).execution_options(stream_results=True, max_row_buffer=batch_size)
 
-            if code_schema == app.models.codes.RoninCodeSchemas.code:
-                new_code = app.models.codes.Code(
-                    code_schema=code_schema,
-                    system=row.system,
-                    version=row.version,
-                    code=row.code_simple,
-                    display=row.display,
-                    from_custom_terminology=from_custom_terminology,
-                    custom_terminology_code_uuid=row.custom_terminology_uuid,
-                    custom_terminology_code_id=row.code_id,
-                    stored_custom_terminology_deduplication_hash=row.deduplication_hash,
-                    from_fhir_terminology=from_fhir_terminology,
-                    fhir_terminology_code_uuid=row.fhir_terminology_uuid,
-                    saved_to_db=True,
-                )
-            elif code_schema == app.models.codes.RoninCodeSchemas.codeable_concept:
-                code_object = app.models.codes.FHIRCodeableConcept.deserialize(
-                    row.code_jsonb
-                )
-                new_code = app.models.codes.Code(
-                    code_schema=code_schema,
-                    system=row.system,
-                    version=row.version,
-                    code=None,
-                    display=None,
-                    code_object=code_object,
-                    from_custom_terminology=from_custom_terminology,
-                    custom_terminology_code_uuid=row.custom_terminology_uuid,
-                    custom_terminology_code_id=row.code_id,
-                    stored_custom_terminology_deduplication_hash=row.deduplication_hash,
-                    from_fhir_terminology=from_fhir_terminology,
-                    fhir_terminology_code_uuid=row.fhir_terminology_uuid,
-                    saved_to_db=True,
-                )
+        def generate():
+            conn = get_db()
+            result = conn.execute(query, {"expansion_uuid": expansion_uuid})
+            if export_format == "csv":
+                buffer = StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(["code_schema", "code", "display", "system", "version"])
+                for rows in result.partitions(batch_size):
+                    writer.writerows(rows)
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                if buffer.tell():
+                    yield buffer.getvalue()
             else:
-                raise NotImplementedError(
-                    f"ValueSetVersion.load_current_expansion cannot load code with schema {code_schema}"
-                )
+                for rows in result.partitions(batch_size):
+                    yield "".join(row.line + "\n" for row in rows)
+
+        return generate()
 
-            self.expansion.add(new_code)
+    def iter_stored_expansion_contains(self, batch_size=1000):
+        """
+        Serialize the members of the stored expansion self.expansion_uuid as Code.serialize would, reading them from
+        a server-side database cursor. Each member is serialized straight from its row: no Code objects are created.
+        Members are in the order of export_current_expansion.
+
+        Parameters
+        ----------
+        batch_size : int
+            Number of rows fetched from the cursor at a time.
+
+        Returns
+        -------
+        generator of dict
+            The expansion.contains members, with system, version, code and display.
+        """
+        if self.expansion_uuid is None:
+            return
+        result = get_db().execute(
+            text(
+                """
+                select code_schema, code_simple, code_jsonb, display, system, version
+                from value_sets.expansion_member_data
+                where expansion_uuid = :expansion_uuid
+                order by display, code_simple, code_jsonb::text, system, version
+                """
+            ).execution_options(stream_results=True, max_row_buffer=batch_size),
+            {"expansion_uuid": self.expansion_uuid},
+        )
+        codeable_concept_schema = app.models.codes.RoninCodeSchemas.codeable_concept.value
+        for rows in result.partitions(batch_size):
+            for row in rows:
+                if row.code_schema == codeable_concept_schema:
+                    code = app.models.codes.FHIRCodeableConcept.deserialize(row.code_jsonb).serialize()
+                else:
+                    code = row.code_simple
+                yield {
+                    "system": row.system,
+                    "version": row.version,
+                    "code": code,
+                    "display": row.display,
+                }
 
     def save_expansion(self, report=None):
         """
@@ -2973,29 +3150,43 @@ class ValueSetVersion:
                 conn.rollback()
                 raise e
 
-    def create_expansion(self):
+    def create_expansion(self, progress_callback=None):
         """
         1. Rules are processed
         2. Mapping inclusions are processed
         3. Explicitly included codes are added directly to the final expansion
+
+        If a progress_callback is provided, it is called as progress_callback(phase, completed, total)
+        as each phase starts and after each rule group: phase is one of EXPANSION_PHASES.
         """
+
+        def report_progress(phase, completed, total):
+            if progress_callback is not None:
+                progress_callback(phase, completed, total)
+
         if self.value_set.type == "extensional":
             return None
 
         self.expansion = set()
         expansion_report_combined = ""
 
-        for rule_group in self.rule_groups:
+        rule_group_count = len(self.rule_groups)
+        report_progress("rules", 0, rule_group_count)
+        for index, rule_group in enumerate(self.rule_groups):
             expansion, expansion_report = rule_group.generate_expansion()
             self.expansion = self.expansion.union(expansion)
             expansion_report_combined += expansion_report
+            report_progress("rules", index + 1, rule_group_count)
 
+        report_progress("mapping_inclusions", 0, 1)
         self.process_mapping_inclusions()
 
         codes_for_explicit_inclusion = [x.code for x in self.explicitly_included_codes]
         self.expansion = self.expansion.union(set(codes_for_explicit_inclusion))
 
+        report_progress("save", 0, len(self.expansion))
         self.save_expansion(report=expansion_report_combined)
+        report_progress("save", len(self.expansion), len(self.expansion))
 
     def parse_mapping_inclusion_retool_array(self, retool_array):
         array_string_copy = retool_array
@@ -3105,6 +3296,8 @@ class ValueSetVersion:
     def serialize(
         self,
         schema_version: int = ValueSet.next_schema_version,
+        stream_expansion: bool = False,
+        expansion_contains: Optional[list] = None,
     ):
         """
         Transform the ValueSet instance into a dictionary in a format suitable for serialization.
@@ -3119,6 +3312,14 @@ class ValueSetVersion:
         ----------
         schema_version : int, optional
         The schema version to use when serializing the ValueSet instance. Default is ValueSet.next_schema_version.
+        stream_expansion : bool, optional
+        If True, expansion.contains is a StreamedArray that serializes each member only as it is written out
+        by app.helpers.stream_helper.stream_json_response. Default is False, for a plain list. Unless a page
+        is loaded, the members are read from the stored expansion (see iter_stored_expansion_contains), so the
+        expansion need not be loaded: call stored_expansion_uuid rather than expand.
+        expansion_contains : list, optional
+        The expansion.contains list from an earlier serialize of this version, in any schema version, reused as is
+        instead of serializing the expansion again. The list is shared, not copied.
 
         Returns
         -------
@@ -3238,12 +3439,27 @@ class ValueSetVersion:
         serialized["purpose"] = self.value_set.purpose
         serialized["version"] = str(self.version)  # Version must be a string
         serialized["status"] = self.status
+        # A paged $expand: contains holds only the requested page, in stable order
+        expansion_members = (
+            self.expansion if self.expansion_page is None else self.expansion_page
+        )
+        if expansion_contains is not None:
+            contains = expansion_contains
+        elif stream_expansion and self.expansion_page is None:
+            contains = StreamedArray(self.iter_stored_expansion_contains())
+        elif stream_expansion:
+            contains = StreamedArray(x.serialize() for x in expansion_members)
+        else:
+            contains = [x.serialize() for x in expansion_members]
         serialized["expansion"] = {
-            "contains": [x.serialize() for x in self.expansion],
+            "contains": contains,
             "timestamp": self.expansion_timestamp.strftime("%Y-%m-%d")
             if self.expansion_timestamp is not None
             else None,
         }
+        if self.expansion_page is not None:
+            serialized["expansion"]["total"] = self.expansion_total
+            serialized["expansion"]["offset"] = self.expansion_offset
         # serialized["compose"] = {"include": self.serialize_include()},
         serialized[
             "additionalData"
@@ -3265,7 +3481,9 @@ class ValueSetVersion:
 
         return serialized
 
-    def prepare_for_oci(self, schema_version: int = ValueSet.next_schema_version):
+    def prepare_for_oci(
+        self, schema_version: int = ValueSet.next_schema_version, expansion_contains: Optional[list] = None
+    ):
         """
         This method prepares the serialized representation of a value set for OCI publishing.
 
@@ -3277,13 +3495,17 @@ class ValueSetVersion:
         ----------
         schema_version : int, optional
         The schema version to use when preparing the ValueSet instance for OCI publishing. Default is ValueSet.next_schema_version.
+        expansion_contains : list, optional
+        The serialized expansion, as for serialize(). If omitted, the expansion is serialized here, once.
 
         Returns:
         tuple: A tuple containing two elements:
         1. dict: The RCDM-compliant serialized representation of the value set.
         2. str: The initial storage path for the value set, based on its UUID.
         """
-        serialized = self.serialize(schema_version=schema_version)
+        if expansion_contains is None:
+            expansion_contains = [x.serialize() for x in self.expansion]
+        serialized = self.serialize(schema_version=schema_version, expansion_contains=expansion_contains)
         rcdm_id = serialized.get("id")
         rcdm_url = "http://projectronin.io/ValueSet/"
         # id will depend on publisher
@@ -3354,7 +3576,7 @@ class ValueSetVersion:
             "expansion": {
                 "identifier": f"urn:uuid:{self.expansion_uuid}",  # rcdm format specific
                 "total": len(self.expansion),  # total number of codes in the expansion
-                "contains": [x.serialize() for x in self.expansion],
+                "contains": expansion_contains,
                 "timestamp": self.expansion_timestamp.strftime("%Y-%m-%d")
                 if self.expansion_timestamp is not None
                 else None,
@@ -3374,72 +3596,93 @@ class ValueSetVersion:
         """
         Publish the ValueSet instance to OCI storage and Simplifier.
 
-        This method first expands the ValueSet instance and then prepares it for OCI publishing using the `prepare_for_oci` method.
-        It sends the serialized value set to OCI storage using the `set_up_and_save_to_object_store` method for both the database_schema_version
-        and next_schema_version, if they are different.
+        This method first expands the ValueSet instance and serializes the expansion once. From that, it prepares the
+        value set for OCI publishing using the `prepare_for_oci` method, for both the database_schema_version and
+        next_schema_version, if they are different. The prepared outputs are sent to OCI storage concurrently by
+        app.helpers.publish_helper, each with its own timing and retries, and must all succeed before the status is
+        set to active.
 
-        The method then creates a copy of the serialized value set for Simplifier and sets the status to active.
+        The method then sends the next_schema_version output to Simplifier, which is optional, while it publishes
+        the data normalization registry.
 
         """
 
         self.expand(force_new=force_new_expansion)
-
-        # OCI: output as ValueSet.database_schema_version, which may be the same as ValueSet.next_schema_version
-        value_set_to_json = self.send_to_oci(ValueSet.database_schema_version, is_overwrite_allowed)
-
-        # OCI: also output as ValueSet.next_schema_version, if different from ValueSet.database_schema_version
-        if ValueSet.database_schema_version != ValueSet.next_schema_version:
-            value_set_to_json = self.send_to_oci(ValueSet.next_schema_version, is_overwrite_allowed)
+        expansion_contains = [x.serialize() for x in self.expansion]
+
+        # OCI: output as ValueSet.database_schema_version and also as ValueSet.next_schema_version, if different
+        oci_outputs = {}
+        for schema_version in sorted({ValueSet.database_schema_version, ValueSet.next_schema_version}):
+            oci_outputs[schema_version] = self.prepare_for_oci(schema_version, expansion_contains)
+        publish_to_destinations(
+            [
+                PublishDestination(
+                    name=f"{initial_path}/published/{self.value_set.uuid}",
+                    send=functools.partial(self.save_to_oci, value_set_to_json, initial_path, is_overwrite_allowed),
+                )
+                for value_set_to_json, initial_path in oci_outputs.values()
+            ]
+        )
 
         # Additional publishing activities
         self.version_set_status_active()
         self.retire_and_obsolete_previous_version()
-        self.to_simplifier(value_set_to_json)
-
-        # Publish new version of data normalization registry
-        app.models.data_ingestion_registry.DataNormalizationRegistry.publish_data_normalization_registry()
+        # The most recent active version has changed, in every process
+        invalidate_cache("value_set_most_recent_active_version")
+
+        # Publish to Simplifier, and publish new version of data normalization registry
+        value_set_to_json, initial_path = oci_outputs[ValueSet.next_schema_version]
+        publish_to_destinations(
+            [
+                PublishDestination(
+                    name="Simplifier",
+                    send=functools.partial(self.to_simplifier, value_set_to_json),
+                    required=False,  # Publishing to Simplifier will be treated as optional, not required
+                )
+            ]
+            + app.models.data_ingestion_registry.DataNormalizationRegistry.publish_destinations()
+        )
 
     def send_to_oci(self, schema_version, is_overwrite_enabled=False):
         value_set_to_json, initial_path = self.prepare_for_oci(schema_version)
+        return self.save_to_oci(value_set_to_json, initial_path, is_overwrite_enabled)
+
+    def save_to_oci(self, value_set_to_json, initial_path, is_overwrite_enabled=False):
+        """
+        Save the output of prepare_for_oci to OCI. The content is not changed, so it can be saved again on a retry.
+        """
         oci_path = folder_path_for_oci(
             value_set_to_json,
             initial_path + f"/published/{self.value_set.uuid}",
             content_type="json"
         )
         set_up_and_save_to_object_store(
-            value_set_to_json,
+            dict(value_set_to_json),
             oci_path,
             is_overwrite_enabled,
         )
         return value_set_to_json
 
     def to_simplifier(self, value_set_to_json):
+        """
+        Send the output of prepare_for_oci to Simplifier, as active and with at most 50 expansion members. The content
+        is not changed. Errors from Simplifier are raised: publish() treats this step as optional.
+        """
         value_set_uuid = self.value_set.uuid
         resource_type = "ValueSet"  # param for Simplifier
-        value_set_to_json["status"] = "active"  # Simplifier requires a status
+        value_set_to_json = dict(value_set_to_json, status="active")  # Simplifier requires a status
 
         # Check if the 'expansion' and 'contains' keys are present
         if (
             "expansion" in value_set_to_json
             and "contains" in value_set_to_json["expansion"]
         ):
-            # Store the original total value
-            original_total = value_set_to_json["expansion"]["total"]
-
-            # Limit the contains list to the top 50 entries
-            value_set_to_json["expansion"]["contains"] = value_set_to_json["expansion"][
-                "contains"
-            ][:50]
-
-            # Set the 'total' field to the original total
-            value_set_to_json["expansion"]["total"] = original_total
-        try:
-            publish_to_simplifier(resource_type, value_set_uuid, value_set_to_json)
-        except Exception as e:  # Publishing to Simplifier will be treated as optional, not required
-            logging.warning(
-                f"Unable to publish Value Set Version {self.uuid}, {self.value_set.title} version {self.version} to Simplifier"
+            # Limit the contains list to the top 50 entries, keeping the original total value
+            value_set_to_json["expansion"] = dict(
+                value_set_to_json["expansion"],
+                contains=value_set_to_json["expansion"]["contains"][:50],
             )
-            pass
+        publish_to_simplifier(resource_type, value_set_uuid, value_set_to_json)
 
     @classmethod
     def load_expansion_report(cls, expansion_uuid):
@@ -3470,72 +3713,140 @@ class ValueSetVersion:
         cls,
         previous_version_uuid,
         new_version_uuid,
+        counts_only=False,
     ):
         """
-        Raises NotFoundException if ValueSetVersion.load fails on either version
-        """
-        previous_value_set_version = ValueSetVersion.load(previous_version_uuid)
-        new_value_set_version = ValueSetVersion.load(new_version_uuid)
+        Compare the stored expansions of two value set versions in a single pass in the database.
+
+        Members are matched on a hash of their identity (code schema, code, system); the display is
+        compared separately, so a member whose display changed is reported once as display-changed,
+        rather than as one removed code and one added code. A stored expansion is used when one exists;
+        a version is only expanded if it has never been expanded.
+
+        Parameters
+        ----------
+        previous_version_uuid : str
+        new_version_uuid : str
+        counts_only : bool, optional
+            If True, only the counts are computed and returned, without the lists of codes. Default is False.
+
+        Returns
+        -------
+        dict
+            "counts" with the number of "removed", "added" and "display_changed" codes; unless counts_only is True,
+            also the "removed_codes", "added_codes" and "display_changed_codes" lists, each in display order.
 
-        previous_value_set_version.expand()
-        new_value_set_version.expand()
+        Raises
+        ------
+        NotFoundException
+            If ValueSetVersion.load fails on either version
+        """
+        previous_expansion_uuid = cls.load(previous_version_uuid).stored_expansion_uuid()
+        new_expansion_uuid = cls.load(new_version_uuid).stored_expansion_uuid()
 
         conn = get_db()
-        removed_codes_query = conn.execute(
-            text(
-                """
-                select distinct code_schema, code_simple, code_jsonb, display, system from value_sets.expansion_member_data
-                where expansion_uuid = :previous_expansion
-                EXCEPT
-                select distinct code_schema, code_simple, code_jsonb, display, system from value_sets.expansion_member_data
-                where expansion_uuid = :new_expansion
-                order by display asc
-                """
+        parameters = {
+            "previous_expansion": previous_expansion_uuid,
+            "new_expansion": new_expansion_uuid,
+        }
+        # Compare distinct members keyed by the hash of their identity, with a full outer join on that hash
+        diff_query = """
+            with previous_members as (
+                select distinct on (member_hash) * from (
+                    select
+                        md5(concat_ws('|', code_schema, code_simple, code_jsonb::text, system)) as member_hash,
+                        code_schema, code_simple, code_jsonb, display, system
+                    from value_sets.expansion_member_data
+                    where expansion_uuid = :previous_expansion
+                ) previous_hashed
+                order by member_hash, display
             ),
-            {
-                "previous_expansion": previous_value_set_version.expansion_uuid,
-                "new_expansion": new_value_set_version.expansion_uuid,
-            },
-        )
-        removed_codes = [
-            {
-                "code_schema": x.code_schema,
-                "code_simple": x.code_simple,
-                "code_jsonb": x.code_jsonb,
-                "display": x.display,
-                "system": x.system,
-            }
-            for x in removed_codes_query
-        ]
+            new_members as (
+                select distinct on (member_hash) * from (
+                    select
+                        md5(concat_ws('|', code_schema, code_simple, code_jsonb::text, system)) as member_hash,
+                        code_schema, code_simple, code_jsonb, display, system
+                    from value_sets.expansion_member_data
+                    where expansion_uuid = :new_expansion
+                ) new_hashed
+                order by member_hash, display
+            ),
+            changes as (
+                select
+                    case
+                        when previous_members.member_hash is null then 'added'
+                        when new_members.member_hash is null then 'removed'
+                        else 'display_changed'
+                    end as change_type,
+                    coalesce(new_members.code_schema, previous_members.code_schema) as code_schema,
+                    coalesce(new_members.code_simple, previous_members.code_simple) as code_simple,
+                    coalesce(new_members.code_jsonb, previous_members.code_jsonb) as code_jsonb,
+                    coalesce(new_members.system, previous_members.system) as system,
+                    previous_members.display as previous_display,
+                    new_members.display as new_display
+                from previous_members
+                full outer join new_members
+                    on previous_members.member_hash = new_members.member_hash
+                where previous_members.member_hash is null
+                    or new_members.member_hash is null
+                    or previous_members.display is distinct from new_members.display
+            )
+            """
+
+        counts = {"removed": 0, "added": 0, "display_changed": 0}
+        if counts_only:
+            counts_query = conn.execute(
+                text(
+                    diff_query
+                    + """
+            select change_type, count(*) as total from changes group by change_type
+            """
+                ),
+                parameters,
+            )
+            for row in counts_query:
+                counts[row.change_type] = row.total
+            return {"counts": counts}
 
-        added_codes_query = conn.execute(
+        changes_query = conn.execute(
             text(
-                """
-                select distinct code_schema, code_simple, code_jsonb, display, system from value_sets.expansion_member_data
-                where expansion_uuid = :new_expansion
-                EXCEPT
-                select distinct code_schema, code_simple, code_jsonb, display, system from value_sets.expansion_member_data
-                where expansion_uuid = :previous_expansion
-                order by display asc
-                """
+                diff_query
+                + """
+            select * from changes
+            order by coalesce(new_display, previous_display) asc
+            """
             ),
-            {
-                "previous_expansion": previous_value_set_version.expansion_uuid,
-                "new_expansion": new_value_set_version.expansion_uuid,
-            },
+            parameters,
         )
-        added_codes = [
-            {
-                "code_schema": x.code_schema,
-                "code_simple": x.code_simple,
-                "code_jsonb": x.code_jsonb,
-                "display": x.display,
-                "system": x.system,
+        diff = {"removed_codes": [], "added_codes": [], "display_changed_codes": []}
+        for row in changes_query:
+            counts[row.change_type] += 1
+            change = {
+                "code_schema": row.code_schema,
+                "code_simple": row.code_simple,
+                "code_jsonb": row.code_jsonb,
+                "display": row.previous_display
+                if row.change_type == "removed"
+                else row.new_display,
+                "system": row.system,
             }
-            for x in added_codes_query
-        ]
+            if row.change_type == "display_changed":
+                change["previous_display"] = row.previous_display
+            diff[f"{row.change_type}_codes"].append(change)
+
+        diff["counts"] = counts
+        return diff
 
-        return {"removed_codes": removed_codes, "added_codes": added_codes}
+    def stored_expansion_uuid(self, force_new=False):
+        """
+        Return the UUID of the most recent stored expansion for this version, without loading its members.
+        Creates a new expansion only if this version has never been expanded, or if force_new is True.
+        """
+        if force_new is False and self.expansion_already_exists():
+            self.load_current_expansion_metadata()
+        else:
+            self.create_expansion()
+        return self.expansion_uuid
 
     def update(self, status=None):
         if status is None:
@@ -1,11 +1,13 @@
 from io import StringIO
 
 from deprecated.classic import deprecated
-from flask import Blueprint, request, jsonify, Response
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 
 from app.errors import BadRequestWithCode
 from app.helpers.oci_helper import get_data_from_oci, OCI_OVERWRITE_PARAM_CONST
+from app.helpers.stream_helper import stream_json_response, gzip_chunks
 from app.value_sets.models import *
+from app.value_sets.expansion_job_models import ExpansionJob
 from app.models.use_case import (
     load_use_case_by_value_set_uuid,
     delete_all_use_cases_for_value_set,
@@ -18,11 +20,86 @@ value_sets_blueprint = Blueprint("value_sets", import_name=__name__)
 # FHIR endpoint
 @value_sets_blueprint.route("/ValueSet/<string:uuid>/$expand")
 def expand_value_set(uuid):
-    """Expands the specified ValueSet and returns it as a JSON object."""
+    """
+    Expands the specified ValueSet and returns it as a JSON object.
+
+    Supports the FHIR $expand parameters offset, count and filter. When any of these is supplied,
+    filtering and paging are done in the database against the stored expansion, members are returned
+    in a stable order, and the response reports the expansion total and offset.
+
+    With the header "Prefer: respond-async", the expansion is queued as an expansion job instead:
+    see /ValueSets/<version_uuid>/expansion_jobs.
+    """
     force_new = request.values.get("force_new") == "true"
+    if request.headers.get("Prefer") == "respond-async":
+        return _submit_expansion_job(uuid, force_new)
+    offset = _non_negative_int_parameter("offset")
+    count = _non_negative_int_parameter("count")
+    filter_text = request.values.get("filter")
+
     vs_version = ValueSetVersion.load(uuid)
-    vs_version.expand(force_new=force_new)
-    return jsonify(vs_version.serialize())
+    if offset is None and count is None and not filter_text:
+        # The members are streamed from the stored expansion, without loading it
+        vs_version.stored_expansion_uuid(force_new=force_new)
+    else:
+        vs_version.expand_page(
+            offset=offset or 0,
+            count=count,
+            filter_text=filter_text,
+            force_new=force_new,
+        )
+    return stream_json_response(vs_version.serialize(stream_expansion=True))
+
+
+@value_sets_blueprint.route(
+    "/ValueSets/<string:version_uuid>/expansion_jobs", methods=["POST"]
+)
+def create_expansion_job(version_uuid):
+    """
+    Queue an expansion of the value set version to run as a background task, so that large expansions
+    do not hold a web thread. If a job for this version is already queued or running, that job is returned.
+    Responds 202 with the job, and a Location header for polling it.
+    """
+    force_new = request.values.get("force_new") == "true"
+    return _submit_expansion_job(version_uuid, force_new)
+
+
+@value_sets_blueprint.route("/ValueSets/expansion_jobs/<string:job_uuid>")
+def get_expansion_job(job_uuid):
+    """
+    Poll an expansion job for its status (waiting, queued, running, complete, failed, skipped) and the progress of its current phase.
+    Once complete, the expansion is available from $expand.
+    """
+    expansion_job = ExpansionJob.load(job_uuid)
+    return jsonify(expansion_job.serialize())
+
+
+def _submit_expansion_job(version_uuid, force_new):
+    expansion_job = ExpansionJob.submit(version_uuid, force_new=force_new)
+    response = jsonify(expansion_job.serialize())
+    response.status_code = 202
+    response.headers["Location"] = f"/ValueSets/expansion_jobs/{expansion_job.uuid}"
+    return response
+
+
+def _non_negative_int_parameter(name):
+    """
+    Read an optional non-negative integer request parameter.
+    @raise BadRequestWithCode if the parameter is present but not a non-negative integer
+    """
+    value = request.values.get(name)
+    if value is None or value == "":
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        value = -1
+    if value < 0:
+        raise BadRequestWithCode(
+            "ValueSet.expand.parameter",
+            f"The $expand parameter {name} must be a non-negative integer",
+        )
+    return value
 
 
 @value_sets_blueprint.route("/ValueSets/", methods=["GET", "POST"])
@@ -348,8 +425,8 @@ def get_most_recent_version(identifier):
     """
     uuid = ValueSet.name_to_uuid(identifier)
     version = ValueSet.load_most_recent_active_version(uuid)
-    version.expand()
-    return jsonify(version.serialize())
+    version.stored_expansion_uuid()
+    return stream_json_response(version.serialize(stream_expansion=True))
 
 
 @value_sets_blueprint.route("/ValueSets/expansions/<string:expansion_uuid>/report")
@@ -372,6 +449,36 @@ def load_expansion_report(expansion_uuid):
     return response
 
 
+EXPANSION_EXPORT_MIMETYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+@value_sets_blueprint.route("/ValueSets/<string:version_uuid>/expansion/export")
+def export_expansion(version_uuid):
+    """
+    Bulk export of the full membership of a value set version's current expansion, streamed from the database.
+    format: "ndjson" (default) or "csv". gzip: "true" to gzip the response body (Content-Encoding gzip).
+    """
+    export_format = request.values.get("format", "ndjson")
+    use_gzip = request.values.get("gzip") == "true"
+    vs_version = ValueSetVersion.load(version_uuid)
+    chunks = vs_version.export_current_expansion(export_format=export_format)
+
+    headers = {
+        "Content-Disposition": f"attachment; filename={version_uuid}-expansion.{export_format}"
+    }
+    if use_gzip:
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+    return Response(
+        stream_with_context(chunks),
+        mimetype=EXPANSION_EXPORT_MIMETYPES[export_format],
+        headers=headers,
+    )
+
+
 @value_sets_blueprint.route("/ValueSets/rule_set/execute", methods=["POST"])
 def process_rule_set():
     """Allows for the real-time execution of rules, used on the front-end to preview output of a rule set"""
@@ -387,12 +494,14 @@ def process_rule_set():
 def diff_new_version_against_previous():
     """
     Compare a new ValueSet version against a previous version using their UUIDs.
-    Returns the differences between the versions as JSON data.
+    Returns the removed, added and display-changed codes, with counts, as JSON data.
+    If counts_only is true, returns only the counts.
     """
     previous_version_uuid = request.json.get("previous_version_uuid")
     new_version_uuid = request.json.get("new_version_uuid")
+    counts_only = request.json.get("counts_only") is True
     diff = ValueSetVersion.diff_for_removed_and_added_codes(
-        previous_version_uuid, new_version_uuid
+        previous_version_uuid, new_version_uuid, counts_only=counts_only
     )
     return jsonify(diff)
 
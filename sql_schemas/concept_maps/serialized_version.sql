@@ -0,0 +1,32 @@
+-- Table: concept_maps.serialized_version
+
+-- DROP TABLE IF EXISTS concept_maps.serialized_version;
+
+CREATE TABLE IF NOT EXISTS concept_maps.serialized_version
+(
+    concept_map_version_uuid uuid NOT NULL,
+    schema_version integer NOT NULL,
+    serializer_revision integer NOT NULL,
+    groups jsonb NOT NULL,
+    content bytea NOT NULL,
+    created_date timestamp with time zone DEFAULT now(),
+    CONSTRAINT serialized_version_pkey PRIMARY KEY (concept_map_version_uuid, schema_version)
+)
+
+TABLESPACE pg_default;
+
+ALTER TABLE IF EXISTS concept_maps.serialized_version
+    OWNER to roninadmin;
+
+COMMENT ON TABLE concept_maps.serialized_version
+    IS 'The "group" list of ConceptMapVersion.serialize for published concept map versions, by schema version';
+
+COMMENT ON COLUMN concept_maps.serialized_version.serializer_revision
+    IS 'ConceptMapVersion.serialized_artifact_revision that stored the content: content of any other revision is ignored';
+
+COMMENT ON COLUMN concept_maps.serialized_version.groups
+    IS 'Each group without its elements, and with its element_count, in order';
+
+COMMENT ON COLUMN concept_maps.serialized_version.content
+    IS 'The elements of every group, in group order, as gzipped JSON lines';
+
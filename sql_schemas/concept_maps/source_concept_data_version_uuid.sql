@@ -0,0 +1,12 @@
+-- Index: cm_source_concept_data_version_uuid
+
+-- Serves get_concepts_for_assignment_page: the source concepts of one concept map version, read in pages by keyset
+-- on uuid, as an index range scan
+
+-- DROP INDEX IF EXISTS concept_maps.cm_source_concept_data_version_uuid;
+
+CREATE INDEX IF NOT EXISTS cm_source_concept_data_version_uuid
+    ON concept_maps.source_concept_data USING btree
+    (concept_map_version_uuid ASC NULLS LAST, uuid ASC NULLS LAST)
+    WITH (deduplicate_items=True)
+    TABLESPACE pg_default;
@@ -0,0 +1,48 @@
+-- Table: value_sets.expansion_job
+
+-- DROP TABLE IF EXISTS value_sets.expansion_job;
+
+CREATE TABLE IF NOT EXISTS value_sets.expansion_job
+(
+    uuid uuid NOT NULL,
+    vs_version_uuid uuid NOT NULL,
+    force_new boolean NOT NULL DEFAULT false,
+    status character varying COLLATE pg_catalog."default" NOT NULL,
+    phase character varying COLLATE pg_catalog."default",
+    phase_completed integer,
+    phase_total integer,
+    expansion_uuid uuid,
+    error character varying COLLATE pg_catalog."default",
+    created_date timestamp with time zone DEFAULT now(),
+    updated_date timestamp with time zone DEFAULT now(),
+    after_job_uuid uuid,
+    CONSTRAINT expansion_job_pkey PRIMARY KEY (uuid)
+)
+
+TABLESPACE pg_default;
+
+ALTER TABLE IF EXISTS value_sets.expansion_job
+    OWNER to roninadmin;
+
+COMMENT ON TABLE value_sets.expansion_job
+    IS 'asynchronous value set expansion jobs, with the progress of the current phase: rules, mapping_inclusions, save. A waiting job is queued when the job after_job_uuid ends';
+-- Index: expansion_job_active_version
+
+-- DROP INDEX IF EXISTS value_sets.expansion_job_active_version;
+
+-- At most one queued or running job per value set version: duplicate submissions coalesce onto it
+CREATE UNIQUE INDEX IF NOT EXISTS expansion_job_active_version
+    ON value_sets.expansion_job USING btree
+    (vs_version_uuid ASC NULLS LAST)
+    TABLESPACE pg_default
+    WHERE status IN ('queued', 'running');
+-- Index: expansion_job_waiting_version
+
+-- DROP INDEX IF EXISTS value_sets.expansion_job_waiting_version;
+
+-- At most one forced job waits per value set version: later forced submissions coalesce onto it
+CREATE UNIQUE INDEX IF NOT EXISTS expansion_job_waiting_version
+    ON value_sets.expansion_job USING btree
+    (vs_version_uuid ASC NULLS LAST)
+    TABLESPACE pg_default
+    WHERE status = 'waiting';
@@ -0,0 +1,230 @@
+import json
+import random
+import unittest
+import uuid
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import app.terminologies.models
+from app.concept_maps.models import ConceptMap, ContentCreator
+from test_serialize_mappings import (
+    APPOINTMENT_SOURCE,
+    APPOINTMENT_TARGET,
+    AUTOMAP,
+    CONDITION_SOURCE,
+    CONDITION_SOURCE_PREVIOUS,
+    HUMAN,
+    LOINC,
+    NLP,
+    NO_MAP,
+    OBSERVATION_SOURCE,
+    RELATIONSHIPS,
+    REVIEWER,
+    SNOMED,
+    MappingRowsConnection,
+    make_golden_concept_map_versions,
+    make_mapping_rows,
+)
+
+
+def collect_and_sort_mappings_for_diff(groups: list) -> dict:
+    """
+    The mappings of serialized groups by mapping id, as the diff collected them before it was done in the database:
+    from the sorted groups, in group order and then mapping id order
+    """
+    mappings = dict()
+    for group in ConceptMap.sort_concept_map_groups_and_elements(groups):
+        for element in group["element"]:
+            mappings.update({element["target"][0]["id"]: element})
+    return mappings
+
+
+def diff_collected_mappings(previous_mappings: dict, new_mappings: dict) -> dict:
+    """
+    The comparison that diff_mappings_and_metadata made of the collected mappings before it was done in the database
+    """
+    modified = dict()
+    unchanged = dict()
+    removed_codes = []
+    for pId in previous_mappings.keys():
+        old = previous_mappings[pId]
+        if pId in new_mappings.keys():
+            new = new_mappings[pId]
+            if new == old:
+                unchanged.update({pId: old})
+            else:
+                modified.update({pId: new})
+        else:
+            removed_codes.append({pId: old})
+    added_codes = []
+    for nId in new_mappings.keys():
+        if nId not in previous_mappings.keys():
+            added_codes.append({nId: new_mappings[nId]})
+    return {
+        "removed_codes": removed_codes,
+        "added_codes": added_codes,
+        "modified_codes": {i: modified[i] for i in sorted(modified)},
+        "unchanged_codes": {i: unchanged[i] for i in sorted(unchanged)},
+        "previous_total": len(previous_mappings),
+        "new_total": len(new_mappings),
+    }
+
+
+class DiffRowsConnection:
+    """
+    Answers the query of ConceptMap.diff_mappings from the rows of the previous and the new version, as the database
+    would: the rows of both versions with their element mapping ids and whether each element id is in either version,
+    ordered by element mapping id, version, and then in the order of reviewed_mapping_rows_select
+    """
+
+    def __init__(self, previous_rows, new_rows):
+        self.previous_rows = previous_rows
+        self.new_rows = new_rows
+        self.parameters = None
+
+    @staticmethod
+    def with_element_mapping_ids(diff_side: str, rows) -> list:
+        def partition(row):
+            return (
+                row.source_concept_uuid,
+                row.target_concept_terminology_version_uuid,
+                json.dumps(
+                    [row.depends_on_property, row.depends_on_system, row.depends_on_value_schema,
+                     row.depends_on_value_simple, row.depends_on_value_jsonb, row.depends_on_display],
+                    sort_keys=True,
+                ),
+            )
+
+        element_mapping_ids = {}
+        for row in rows:
+            key = partition(row)
+            element_mapping_ids[key] = min(element_mapping_ids.get(key, row.mapping_id), row.mapping_id)
+        return [
+            (element_mapping_ids[partition(row)], diff_side, position, row)
+            for position, row in enumerate(MappingRowsConnection.in_element_order(rows))
+        ]
+
+    def execute(self, query, parameters):
+        self.parameters = parameters
+        previous = self.with_element_mapping_ids("previous", self.previous_rows)
+        new = self.with_element_mapping_ids("new", self.new_rows)
+        previous_ids = {element_mapping_id for element_mapping_id, _, _, _ in previous}
+        new_ids = {element_mapping_id for element_mapping_id, _, _, _ in new}
+        return iter(
+            SimpleNamespace(
+                diff_side=diff_side,
+                in_previous=element_mapping_id in previous_ids,
+                in_new=element_mapping_id in new_ids,
+                element_mapping_id=element_mapping_id,
+                **row._asdict(),
+            )
+            for element_mapping_id, diff_side, _, row in sorted(previous + new, key=lambda item: item[:3])
+        )
+
+
+class ConceptMapDiffTests(unittest.TestCase):
+    """
+    diff_mappings matches the elements of two versions in the database and serializes them from the rows it reads
+    back: its output must be the same as comparing the collected mappings of the two serialized versions. Mapping
+    construction also looks up a database connection, which is not used.
+    """
+
+    def setUp(self) -> None:
+        terminologies = {
+            str(terminology.uuid): terminology
+            for terminology in [LOINC, SNOMED, NO_MAP, OBSERVATION_SOURCE, CONDITION_SOURCE, CONDITION_SOURCE_PREVIOUS,
+                                APPOINTMENT_SOURCE, APPOINTMENT_TARGET]
+        }
+        content_creators = {creator.uuid: creator for creator in [HUMAN, REVIEWER, AUTOMAP, NLP]}
+        self.patches = [
+            patch("app.concept_maps.models.get_db"),
+            patch.object(
+                app.terminologies.models.Terminology,
+                "load_from_cache",
+                side_effect=lambda key: terminologies[str(key)],
+            ),
+            patch.object(ContentCreator, "load_by_uuid_from_cache", side_effect=content_creators.get),
+        ]
+        self.get_db, _, _ = [started.start() for started in self.patches]
+
+    def tearDown(self) -> None:
+        for started in self.patches:
+            started.stop()
+
+    @staticmethod
+    def new_version_rows(previous_rows: list, added_rows: list, rng: random.Random) -> list:
+        """
+        The rows of a new version of a concept map: some source concepts removed, some mappings changed, and the rows
+        of other source concepts added
+        """
+        source_concept_uuids = sorted({row.source_concept_uuid for row in previous_rows})
+        removed_source_concepts = set(rng.sample(source_concept_uuids, len(source_concept_uuids) // 4))
+        new_rows = []
+        for row in previous_rows:
+            if row.source_concept_uuid in removed_source_concepts:
+                continue
+            change = rng.random()
+            if change < 0.1:
+                row = row._replace(target_concept_display=f"{row.target_concept_display} (revised)")
+            elif change < 0.2:
+                row = row._replace(relationship_code=rng.choice(RELATIONSHIPS).code)
+            elif change < 0.25:
+                continue
+            new_rows.append(row)
+        return new_rows + added_rows[: len(added_rows) // 2]
+
+    def test_diff_mappings_matches_collected_mappings(self):
+        rng = random.Random(46)
+        names = list(make_golden_concept_map_versions())
+        for name, added_name in zip(names, names[1:] + names[:1]):
+            # the new version serializes as the previous version does: the same concept map, another version UUID
+            previous_version = make_golden_concept_map_versions()[name]
+            new_version = make_golden_concept_map_versions()[name]
+            new_version.uuid = uuid.UUID(int=rng.getrandbits(128))
+            previous_rows = make_mapping_rows(previous_version, rng)
+            added_rows = make_mapping_rows(make_golden_concept_map_versions()[added_name], rng)
+            new_rows = self.new_version_rows(previous_rows, added_rows, rng)
+
+            expected = diff_collected_mappings(
+                collect_and_sort_mappings_for_diff(
+                    previous_version.serialize_mappings_from_rows(MappingRowsConnection.in_element_order(previous_rows))
+                ),
+                collect_and_sort_mappings_for_diff(
+                    new_version.serialize_mappings_from_rows(MappingRowsConnection.in_element_order(new_rows))
+                ),
+            )
+            connection = DiffRowsConnection(previous_rows, new_rows)
+            self.get_db.return_value = connection
+            diff = ConceptMap.diff_mappings(previous_version, new_version)
+
+            self.assertEqual(
+                {"previous_version_uuid": previous_version.uuid, "new_version_uuid": new_version.uuid},
+                connection.parameters,
+            )
+            self.assertTrue(expected["removed_codes"])
+            self.assertTrue(expected["added_codes"])
+            self.assertTrue(expected["modified_codes"])
+            self.assertTrue(expected["unchanged_codes"])
+            self.assertEqual(json.dumps(expected), json.dumps(diff), name)
+
+    def test_diff_mappings_with_no_previous_version(self):
+        rng = random.Random(47)
+        for name, new_version in make_golden_concept_map_versions().items():
+            new_rows = make_mapping_rows(new_version, rng)
+            expected = diff_collected_mappings(
+                {},
+                collect_and_sort_mappings_for_diff(
+                    new_version.serialize_mappings_from_rows(MappingRowsConnection.in_element_order(new_rows))
+                ),
+            )
+            connection = DiffRowsConnection([], new_rows)
+            self.get_db.return_value = connection
+            diff = ConceptMap.diff_mappings(None, new_version)
+
+            self.assertEqual({"previous_version_uuid": None, "new_version_uuid": new_version.uuid}, connection.parameters)
+            self.assertEqual(0, diff["previous_total"])
+            self.assertEqual(json.dumps(expected), json.dumps(diff), name)
+
+
+if __name__ == "__main__":
+    unittest.main()
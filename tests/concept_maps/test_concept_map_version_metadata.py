@@ -0,0 +1,104 @@
+import datetime
+import unittest
+import uuid
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from app.concept_maps.models import ConceptMapVersion
+from app.errors import BadRequestWithCode
+
+
+def make_version_row(version: int = 1, status: str = "active", concept_map_uuid=None):
+    """
+    A concept_maps.concept_map_version row
+    """
+    return SimpleNamespace(
+        uuid=uuid.uuid4(),
+        concept_map_uuid=concept_map_uuid or uuid.uuid4(),
+        description="Version description",
+        comments=None,
+        status=status,
+        created_date=datetime.datetime(2024, 1, 1),
+        version=version,
+        published_date=datetime.datetime(2024, 1, 2),
+        source_value_set_version_uuid=uuid.uuid4(),
+        target_value_set_version_uuid=uuid.uuid4(),
+    )
+
+
+class ConceptMapVersionMetadataTests(unittest.TestCase):
+    """
+    Metadata-only handles on concept map versions load nothing beyond their row until it is used. The database
+    connection is replaced by a mock, so any query a test does not expect shows up in its execute calls.
+    """
+    def setUp(self) -> None:
+        self.patch = patch("app.concept_maps.models.get_db")
+        self.conn = self.patch.start().return_value
+
+    def tearDown(self) -> None:
+        self.patch.stop()
+
+    def test_get_active_concept_map_versions_in_one_statement(self):
+        rows = [make_version_row(version) for version in (1, 2, 3)]
+        self.conn.execute.return_value = rows
+        with patch("app.concept_maps.models.ConceptMap") as concept_map_class:
+            versions = ConceptMapVersion.get_active_concept_map_versions()
+
+        self.assertEqual(1, self.conn.execute.call_count)
+        self.assertIn("WHERE status = 'active'", str(self.conn.execute.call_args.args[0]))
+        self.assertEqual([row.uuid for row in rows], [version.uuid for version in versions])
+        self.assertEqual([1, 2, 3], [version.version for version in versions])
+        self.assertEqual(rows[1].concept_map_uuid, versions[1].concept_map_uuid)
+        self.assertEqual(rows[2].published_date, versions[2].published_date)
+        concept_map_class.assert_not_called()
+
+    def test_mappings_load_on_first_access(self):
+        concept_map_version = ConceptMapVersion.from_metadata(make_version_row())
+        loaded = {"source concept": ["mapping"]}
+
+        def load_reviewed_mappings():
+            concept_map_version.mappings.update(loaded)
+
+        with patch.object(
+            ConceptMapVersion, "load_reviewed_mappings", side_effect=load_reviewed_mappings
+        ) as load_reviewed_mappings_mock:
+            self.assertEqual(loaded, concept_map_version.mappings)
+            self.assertEqual(loaded, concept_map_version.mappings)
+        load_reviewed_mappings_mock.assert_called_once()
+        self.conn.execute.assert_not_called()
+
+    def test_concept_map_loads_on_first_access(self):
+        row = make_version_row()
+        concept_map_version = ConceptMapVersion.from_metadata(row)
+        with patch("app.concept_maps.models.ConceptMap") as concept_map_class:
+            self.assertIs(concept_map_class.return_value, concept_map_version.concept_map)
+            self.assertIs(concept_map_class.return_value, concept_map_version.concept_map)
+        concept_map_class.assert_called_once_with(row.concept_map_uuid, load_mappings_for_most_recent_active=False)
+
+    def test_concept_map_given_is_not_loaded(self):
+        concept_map = SimpleNamespace(uuid=uuid.uuid4())
+        concept_map_version = ConceptMapVersion.from_metadata(make_version_row(), concept_map=concept_map)
+        with patch("app.concept_maps.models.ConceptMap") as concept_map_class:
+            self.assertIs(concept_map, concept_map_version.concept_map)
+        concept_map_class.assert_not_called()
+
+    def test_serialize_published_handle_streams_mappings(self):
+        concept_map_version = ConceptMapVersion.from_metadata(make_version_row(status="pending"))
+        with patch.object(ConceptMapVersion, "load_reviewed_mapping_rows") as load_rows, \
+                patch.object(ConceptMapVersion, "load_reviewed_mappings") as load_reviewed_mappings, \
+                patch.object(ConceptMapVersion, "serialize", return_value={"group": []}) as serialize:
+            concept_map_version.serialize_published(stream_elements=True)
+        load_rows.assert_not_called()
+        load_reviewed_mappings.assert_not_called()
+        self.assertTrue(serialize.call_args.kwargs["stream_elements"])
+        self.assertIsNone(serialize.call_args.kwargs["mapping_rows"])
+
+    def test_load_metadata_not_found(self):
+        self.conn.execute.return_value.first.return_value = None
+        with self.assertRaises(BadRequestWithCode) as raised:
+            ConceptMapVersion.load_metadata(uuid.uuid4())
+        self.assertEqual("ConceptMap.VersionNotFound", raised.exception.code)
+
+
+if __name__ == "__main__":
+    unittest.main()
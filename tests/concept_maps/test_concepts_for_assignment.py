@@ -0,0 +1,105 @@
+import random
+import unittest
+import uuid
+from unittest.mock import patch
+
+from app.concept_maps.models import get_concepts_for_assignment_page
+from app.errors import BadRequestWithCode
+
+
+class FakeResult:
+    """
+    The result of conn.execute for the concepts for assignment query: rows with keys(), or a scalar
+    """
+
+    def __init__(self, rows=None, scalar=None):
+        self.rows = rows or []
+        self.scalar_value = scalar
+
+    def keys(self):
+        return ["source_uuid", "source_display"]
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def scalar(self):
+        return self.scalar_value
+
+
+class FakeConnection:
+    """
+    Answers the keyset query from source_uuids, applying after_uuid and limit as the database would, and the
+    EXPLAIN query with a planner estimate of estimated_rows
+    """
+
+    def __init__(self, source_uuids, estimated_rows=1000):
+        self.source_uuids = sorted(source_uuids)
+        self.estimated_rows = estimated_rows
+        self.queries = []
+
+    def execute(self, query, parameters):
+        self.queries.append(str(query))
+        if "EXPLAIN" in str(query):
+            return FakeResult(scalar=[{"Plan": {"Plan Rows": self.estimated_rows}}])
+        self.assert_keyset_query(str(query), parameters)
+        after_uuid = parameters.get("after_uuid")
+        rows = [
+            (source_uuid, f"Display {source_uuid}")
+            for source_uuid in self.source_uuids
+            if after_uuid is None or source_uuid > after_uuid
+        ]
+        return FakeResult(rows=rows[:parameters["limit"]])
+
+    @staticmethod
+    def assert_keyset_query(query: str, parameters: dict):
+        assert "ORDER BY sc.uuid" in query
+        assert "LIMIT :limit" in query
+        assert ("AND sc.uuid > :after_uuid" in query) == ("after_uuid" in parameters)
+
+
+class ConceptsForAssignmentPageTests(unittest.TestCase):
+    def get_page(self, connection, **kwargs):
+        with patch("app.concept_maps.models.get_db", return_value=connection):
+            return get_concepts_for_assignment_page(uuid.uuid4(), **kwargs)
+
+    def test_pages_cover_every_concept_once_in_order(self):
+        randomizer = random.Random(50)
+        source_uuids = [uuid.UUID(int=randomizer.getrandbits(128)) for _ in range(23)]
+        connection = FakeConnection(source_uuids, estimated_rows=25)
+
+        seen = []
+        cursor = None
+        while True:
+            page = self.get_page(connection, count=5, cursor=cursor)
+            self.assertLessEqual(len(page["concepts"]), 5)
+            self.assertEqual(25, page["estimated_total"])
+            seen.extend(concept["source_uuid"] for concept in page["concepts"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+            self.assertEqual(str(page["concepts"][-1]["source_uuid"]), cursor)
+        self.assertEqual(sorted(source_uuids), seen)
+
+    def test_single_page_total_is_exact(self):
+        connection = FakeConnection([uuid.uuid4() for _ in range(3)], estimated_rows=40)
+        page = self.get_page(connection, count=5)
+        self.assertEqual(3, len(page["concepts"]))
+        self.assertIsNone(page["next_cursor"])
+        self.assertEqual(3, page["estimated_total"])
+        self.assertFalse(any("EXPLAIN" in query for query in connection.queries))
+
+    def test_full_last_page_has_no_next_cursor(self):
+        connection = FakeConnection([uuid.uuid4() for _ in range(10)])
+        first = self.get_page(connection, count=5)
+        last = self.get_page(connection, count=5, cursor=first["next_cursor"])
+        self.assertEqual(5, len(last["concepts"]))
+        self.assertIsNone(last["next_cursor"])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(BadRequestWithCode) as raised:
+            self.get_page(FakeConnection([]), cursor="not-a-cursor")
+        self.assertEqual("ConceptMap.concepts_to_assign.cursor", raised.exception.code)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,530 @@
+import datetime
+import json
+import random
+import unittest
+import uuid
+from collections import namedtuple
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import app.models.codes
+import app.terminologies.models
+from app.concept_maps.models import ConceptMap, ConceptMapVersion, ContentCreator, Mapping, MappingRelationship, SourceConcept
+from app.helpers.file_helper import resources_folder
+
+GOLDEN_FILE = "serialize_mappings_golden.json"
+
+RELATIONSHIPS = [
+    MappingRelationship(uuid.UUID("f2a20235-bd9d-4f6a-8e78-b3f41f97d07f"), "equivalent", "Equivalent"),
+    MappingRelationship(uuid.UUID("dca7c556-82d9-4433-8971-0b7edb9c9661"), "source-is-narrower-than-target", "Narrower"),
+    MappingRelationship(uuid.UUID("a6e9e0a4-5d1b-4c72-94e9-e4cbb7be5a55"), "source-is-broader-than-target", "Broader"),
+]
+HUMAN = ContentCreator(uuid.UUID("5ab0f1a1-1aaa-41a4-9d6b-3a3d0b4a2f5d"), "Jane Mapper")
+REVIEWER = ContentCreator(uuid.UUID("c2f7a2c4-4c0b-4b9a-8a3e-7d3f1e2b9a10"), "Joe Reviewer")
+AUTOMAP = ContentCreator(uuid.UUID("8990714d-8eeb-4acf-a5b7-abf92007a53a"), "Automap")
+NLP = ContentCreator(uuid.UUID("8abf5747-121b-48e0-9edf-dbd820d397fb"), "NLP")
+
+
+def legacy_serialize_mappings(concept_map_version) -> list:
+    """
+    ConceptMapVersion.serialize_mappings as it was before it was made single-pass, which scanned the whole mapping
+    list for every (source system, target system) pair
+    """
+    self = concept_map_version
+    source_target_pairs_set = set()
+    for source_code, mappings in self.mappings.items():
+        source_uri = source_code.system.fhir_uri
+        source_version = source_code.system.version
+        for mapping in mappings:
+            source_target_pairs_set.add(
+                (source_uri, source_version, mapping.target.system, mapping.target.version)
+            )
+
+    groups = []
+    for (source_uri, source_version, target_uri, target_version) in source_target_pairs_set:
+        elements = []
+        for source_code, mappings in self.mappings.items():
+            if source_code.system.fhir_uri == source_uri and source_code.system.version == source_version:
+                filtered_mappings = [
+                    x for x in mappings if x.target.system == target_uri and x.target.version == target_version
+                ]
+                if filtered_mappings:
+                    new_element = {"_code": self.serialize_source_code(source_code.code), "target": []}
+                    for mapping in filtered_mappings:
+                        target_serialized = {
+                            "id": mapping.mapping_id,
+                            "code": mapping.target.code,
+                            "display": mapping.target.display,
+                            "equivalence": mapping.relationship.code,
+                            "extension": self.serialize_contributor_extension(mapping)
+                        }
+                        depends_on = mapping.target.depends_on
+                        if depends_on and depends_on.depends_on_value:
+                            target_serialized["dependsOn"] = self.serialize_depends_on(depends_on)
+                        if mapping.target.code == "No map" and mapping.target.display == "No matching concept":
+                            target_serialized["comment"] = source_code.reason_for_no_map
+                        if target_serialized["equivalence"] == "source-is-narrower-than-target":
+                            target_serialized["equivalence"] = "wider"
+                            target_serialized["comment"] = (
+                                f"{target_serialized.get('comment')} source-is-narrower-than-target"
+                                if target_serialized.get('comment')
+                                else "source-is-narrower-than-target"
+                            )
+                        elif target_serialized["equivalence"] == "source-is-broader-than-target":
+                            target_serialized["equivalence"] = "narrower"
+                            target_serialized["comment"] = (
+                                f"{target_serialized.get('comment')} source-is-broader-than-target"
+                                if target_serialized.get('comment')
+                                else "source-is-broader-than-target"
+                            )
+                        new_element["target"].append(target_serialized)
+                    elements.append(new_element)
+        groups.append(
+            {
+                "source": source_uri,
+                "sourceVersion": source_version,
+                "target": target_uri,
+                "targetVersion": target_version,
+                "element": elements,
+            }
+        )
+    return groups
+
+
+def make_terminology(terminology_uuid: str, name: str, version: str, fhir_uri: str, custom: bool = True):
+    return app.terminologies.models.Terminology(
+        uuid=uuid.UUID(terminology_uuid),
+        terminology=name,
+        version=version,
+        effective_start=datetime.date(2023, 1, 1),
+        effective_end=datetime.date(2030, 12, 31),
+        fhir_uri=fhir_uri,
+        fhir_terminology=not custom,
+        is_standard=not custom,
+    )
+
+
+LOINC = make_terminology("ceac3e3c-c7ae-4a1b-85ca-1c5a5a7d0c11", "LOINC", "2.76", "http://loinc.org", False)
+SNOMED = make_terminology("e4b8d7e4-4a3a-4bde-9c3c-9a43dbf6b2d1", "SNOMED CT", "2023-09-01", "http://snomed.info/sct", False)
+NO_MAP = make_terminology(
+    "f6a0c9f0-3b3c-4d3c-8d5e-1b7a2c9e4f21", "No map", "1.0", "http://projectronin.io/fhir/CodeSystem/agnostic/nomap", False
+)
+OBSERVATION_SOURCE = make_terminology(
+    "b3a3a2f4-2d6d-4d46-9c38-6b8a5c1d3e11", "mdaoc_observation", "14",
+    "http://projectronin.io/fhir/CodeSystem/mdaoc/ObservationCodeAndComponentCode",
+)
+CONDITION_SOURCE = make_terminology(
+    "a1d2c3b4-6e5f-4a3b-9c8d-7e6f5a4b3c21", "v7r1eczk_condition", "1.0",
+    "http://projectronin.io/fhir/CodeSytem/v7r1eczk/ConditionCode",
+)
+CONDITION_SOURCE_PREVIOUS = make_terminology(
+    "d4c3b2a1-5f6e-4b3a-8d9c-6f5e4d3c2b11", "v7r1eczk_condition", "0.9",
+    "http://projectronin.io/fhir/CodeSytem/v7r1eczk/ConditionCode",
+)
+APPOINTMENT_SOURCE = make_terminology(
+    "9e8d7c6b-1a2b-4c3d-8e9f-0a1b2c3d4e51", "apposnd_appointment_status", "4",
+    "http://projectronin.io/fhir/CodeSystem/apposnd/AppointmentStatus",
+)
+APPOINTMENT_TARGET = make_terminology(
+    "7a6b5c4d-3e2f-4a1b-9c8d-7e6f5a4b3c61", "ronin_appointment_status", "1",
+    "http://projectronin.io/fhir/CodeSystem/ronin/AppointmentStatus", False,
+)
+
+
+def make_codeable_concept(rng: random.Random, i: int) -> app.models.codes.FHIRCodeableConcept:
+    codings = [
+        app.models.codes.FHIRCoding(
+            code=rng.choice([f"{9000 + i}", f"H49.{i % 20}", f"{20610004 + i}"]),
+            display=rng.choice([None, f"Display {i}"]),
+            system=rng.choice(["urn:oid:1.2.840.114350.1.13.412.2.7.5.737384.134", "http://hl7.org/fhir/sid/icd-10-cm",
+                               "http://snomed.info/sct"]),
+            version=None,
+        )
+        for _ in range(rng.randint(1, 3))
+    ]
+    return app.models.codes.FHIRCodeableConcept(coding=codings, text=f"Source concept {i}")
+
+
+def make_concept_map_version(
+    seed: int,
+    source_terminologies: list,
+    target_terminologies: list,
+    source_count: int,
+    codeable_concepts: bool,
+    mappers: list,
+) -> ConceptMapVersion:
+    """
+    An in-memory ConceptMapVersion shaped like published concept maps: sources mapped to one or more targets in one
+    or more target terminologies, including No map targets, narrower and broader relationships, and dependsOn data.
+    """
+    rng = random.Random(seed)
+    concept_map_version = ConceptMapVersion.__new__(ConceptMapVersion)
+    concept_map_version.uuid = uuid.UUID(int=rng.getrandbits(128))
+    concept_map_version.concept_map = SimpleNamespace(uuid=uuid.UUID(int=rng.getrandbits(128)))
+    concept_map_version.version = rng.randint(1, 30)
+    concept_map_version.mappings = {}
+    mapped_date_time = datetime.datetime(2023, 12, 15, 21, 50, 45, 336600)
+
+    for i in range(source_count):
+        source_terminology = rng.choice(source_terminologies)
+        if codeable_concepts:
+            source_code = app.models.codes.Code(
+                system=None, version=None, code=None, display=None,
+                terminology_version=source_terminology,
+                code_object=make_codeable_concept(rng, i),
+                code_schema=app.models.codes.RoninCodeSchemas.codeable_concept,
+                custom_terminology_code_uuid=uuid.UUID(int=rng.getrandbits(128)),
+                custom_terminology_code_id=f"{rng.getrandbits(128):032x}",
+                from_custom_terminology=True, from_fhir_terminology=False,
+            )
+        else:
+            source_code = app.models.codes.Code(
+                system=None, version=None, code=f"status-{i}", display=f"Status {i}",
+                terminology_version=source_terminology,
+                custom_terminology_code_uuid=uuid.UUID(int=rng.getrandbits(128)),
+                custom_terminology_code_id=f"{rng.getrandbits(128):032x}",
+                from_custom_terminology=True, from_fhir_terminology=False,
+            )
+        source_concept = SourceConcept(
+            uuid=uuid.UUID(int=rng.getrandbits(128)),
+            code=source_code,
+            concept_map_version_uuid=concept_map_version.uuid,
+            reason_for_no_map=rng.choice([None, "Not enough information", "Non-specific source concept"]),
+        )
+
+        mappings = []
+        for _ in range(rng.choice([1, 1, 1, 2, 3])):
+            target_terminology = rng.choice(target_terminologies)
+            depends_on = None
+            if rng.random() < 0.2:
+                depends_on = app.models.codes.DependsOnData(
+                    depends_on_property="Observation.category",
+                    depends_on_value_schema=app.models.codes.DependsOnSchemas.CODEABLE_CONCEPT,
+                    depends_on_value=app.models.codes.FHIRCodeableConcept(
+                        coding=[app.models.codes.FHIRCoding(
+                            code="laboratory", display="Laboratory", version=None,
+                            system="http://terminology.hl7.org/CodeSystem/observation-category",
+                        )],
+                        text="Laboratory",
+                    ),
+                    depends_on_system=rng.choice([None, "http://terminology.hl7.org/CodeSystem/observation-category"]),
+                    depends_on_display=rng.choice([None, "Laboratory"]),
+                )
+            if target_terminology is NO_MAP:
+                code, display = "No map", "No matching concept"
+            else:
+                code, display = f"{rng.randint(10000, 99999)}-{rng.randint(0, 9)}", f"Target concept {rng.randint(0, 999)}"
+            target = app.models.codes.Code(
+                system=None, version=None, code=code, display=display,
+                terminology_version=target_terminology, depends_on=depends_on,
+                from_custom_terminology=False, from_fhir_terminology=True,
+            )
+            mapped_by = rng.choice(mappers)
+            mapping_id = f"{rng.getrandbits(128):032x}"
+            mappings.append(
+                Mapping(
+                    source=source_concept,
+                    relationship=rng.choice(RELATIONSHIPS),
+                    target=target,
+                    saved_to_db=True,
+                    mapping_id=mapping_id,
+                    _stored_deduplication_hash=mapping_id,
+                    mapped_by=mapped_by,
+                    mapped_date_time=mapped_date_time,
+                    reviewed_by=rng.choice([None, REVIEWER]),
+                    reviewed_date_time=rng.choice([None, mapped_date_time + datetime.timedelta(days=1)]),
+                    map_program_version="4" if mapped_by is NLP else None,
+                    map_program_confidence_score="0.9999999" if mapped_by in (NLP, AUTOMAP) else None,
+                )
+            )
+        concept_map_version.mappings[source_concept] = mappings
+    return concept_map_version
+
+
+def make_golden_concept_map_versions() -> dict:
+    """
+    The concept maps whose serialized groups are stored in the golden file
+    """
+    return {
+        "observation_codeable_concepts": make_concept_map_version(
+            4301, [OBSERVATION_SOURCE], [LOINC, NO_MAP, SNOMED], 12, True, [HUMAN]
+        ),
+        "condition_nlp_and_automap": make_concept_map_version(
+            4302, [CONDITION_SOURCE, CONDITION_SOURCE_PREVIOUS], [SNOMED, NO_MAP], 12, True, [HUMAN, NLP, AUTOMAP]
+        ),
+        "appointment_status_codes": make_concept_map_version(
+            4303, [APPOINTMENT_SOURCE], [APPOINTMENT_TARGET, NO_MAP], 8, False, [HUMAN, AUTOMAP]
+        ),
+    }
+
+
+# The columns of ConceptMapVersion.load_reviewed_mapping_rows
+MappingRow = namedtuple(
+    "MappingRow",
+    [
+        "mapping_id", "mapping_deduplication_hash", "mapping_uuid", "mapped_by", "reviewed_by", "review_status",
+        "mapping_comments", "mapped_date_time", "review_comments", "reviewed_date_time", "map_program_date_time",
+        "map_program_version", "map_program_prediction_id", "map_program_confidence_score", "deleted_date_time",
+        "deleted_by", "source_concept_uuid", "source_code_schema", "source_code_simple", "source_code_jsonb",
+        "source_display", "source_system", "source_version", "source_fhir_uri", "source_comments", "source_map_status",
+        "source_assigned_mapper", "source_assigned_reviewer", "no_map", "reason_for_no_map", "source_mapping_group",
+        "source_previous_version_context", "custom_terminology_code_uuid", "relationship_code", "map_status",
+        "target_concept_code", "target_concept_display", "target_concept_terminology_version_uuid", "target_version",
+        "target_fhir_uri", "depends_on_property", "depends_on_system", "depends_on_value_schema",
+        "depends_on_value_simple", "depends_on_value_jsonb", "depends_on_display", "source_code_id",
+        "source_deduplication_hash",
+    ],
+)
+
+
+def make_mapping_rows(concept_map_version: ConceptMapVersion, rng: random.Random) -> list:
+    """
+    The rows that load_reviewed_mapping_rows would return for an in-memory ConceptMapVersion, in shuffled order, as
+    the query gives no order. Some dependsOn values are stored as (deprecated) strings.
+    """
+    rows = []
+    for source_concept, mappings in concept_map_version.mappings.items():
+        source_code = source_concept.code
+        for mapping in mappings:
+            depends_on = mapping.target.depends_on
+            depends_on_columns = dict.fromkeys(
+                ["property", "system", "value_schema", "value_simple", "value_jsonb", "display"]
+            )
+            if depends_on is not None:
+                depends_on_columns.update(
+                    property=depends_on.depends_on_property,
+                    system=depends_on.depends_on_system,
+                    display=depends_on.depends_on_display,
+                )
+                if rng.random() < 0.3:
+                    depends_on_columns.update(value_schema="string", value_simple=depends_on.depends_on_value.text)
+                else:
+                    depends_on_columns.update(
+                        value_schema=app.models.codes.DependsOnSchemas.CODEABLE_CONCEPT.value,
+                        value_jsonb=depends_on.depends_on_value.serialize(),
+                    )
+            codeable_concept = source_code.code_schema == app.models.codes.RoninCodeSchemas.codeable_concept
+            rows.append(
+                MappingRow(
+                    mapping_id=mapping.mapping_id,
+                    mapping_deduplication_hash=mapping.mapping_id,
+                    mapping_uuid=uuid.UUID(int=rng.getrandbits(128)),
+                    mapped_by=mapping.mapped_by.uuid,
+                    reviewed_by=mapping.reviewed_by.uuid if mapping.reviewed_by is not None else None,
+                    review_status="reviewed",
+                    mapping_comments=None,
+                    mapped_date_time=mapping.mapped_date_time,
+                    review_comments=None,
+                    reviewed_date_time=mapping.reviewed_date_time,
+                    map_program_date_time=None,
+                    map_program_version=mapping.map_program_version,
+                    map_program_prediction_id=mapping.map_program_prediction_id,
+                    map_program_confidence_score=mapping.map_program_confidence_score,
+                    deleted_date_time=None,
+                    deleted_by=None,
+                    source_concept_uuid=source_concept.uuid,
+                    source_code_schema=source_code.code_schema.value,
+                    source_code_simple=None if codeable_concept else source_code.code,
+                    source_code_jsonb=source_code.code_object.serialize() if codeable_concept else None,
+                    source_display=None if codeable_concept else source_code.display,
+                    source_system=str(source_code.terminology_version.uuid),
+                    source_version=source_code.terminology_version.version,
+                    source_fhir_uri=source_code.terminology_version.fhir_uri,
+                    source_comments=None,
+                    source_map_status="completed",
+                    source_assigned_mapper=None,
+                    source_assigned_reviewer=None,
+                    no_map=None,
+                    reason_for_no_map=source_concept.reason_for_no_map,
+                    source_mapping_group=None,
+                    source_previous_version_context=None,
+                    custom_terminology_code_uuid=source_code.custom_terminology_code_uuid,
+                    relationship_code=mapping.relationship.code,
+                    map_status="completed",
+                    target_concept_code=mapping.target.code,
+                    target_concept_display=mapping.target.display,
+                    target_concept_terminology_version_uuid=mapping.target.terminology_version.uuid,
+                    target_version=mapping.target.terminology_version.version,
+                    target_fhir_uri=mapping.target.terminology_version.fhir_uri,
+                    depends_on_property=depends_on_columns["property"],
+                    depends_on_system=depends_on_columns["system"],
+                    depends_on_value_schema=depends_on_columns["value_schema"],
+                    depends_on_value_simple=depends_on_columns["value_simple"],
+                    depends_on_value_jsonb=depends_on_columns["value_jsonb"],
+                    depends_on_display=depends_on_columns["display"],
+                    source_code_id=source_code.custom_terminology_code_id,
+                    source_deduplication_hash=None,
+                )
+            )
+    rng.shuffle(rows)
+    return rows
+
+
+def groups_in_pair_order(groups: list) -> list:
+    """
+    Groups follow the iteration order of a set, which varies between processes with the string hash seed
+    """
+    return sorted(groups, key=lambda group: (group["source"], group["sourceVersion"], group["target"], group["targetVersion"]))
+
+
+class MappingRowsConnection:
+    """
+    Answers the queries of ConceptMapVersion.stream_mapping_groups from rows, as the database would: the distinct
+    mapping groups, and the rows of one group in the order of reviewed_mapping_rows_select
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.group_queries = 0
+
+    @staticmethod
+    def pair(row) -> tuple:
+        return row.source_fhir_uri, row.source_version, row.target_fhir_uri, row.target_version
+
+    @staticmethod
+    def in_element_order(rows) -> list:
+        def depends_on_columns(row):
+            return tuple(
+                json.dumps(value, sort_keys=True)
+                for value in (row.depends_on_property, row.depends_on_system, row.depends_on_value_schema,
+                              row.depends_on_value_simple, row.depends_on_value_jsonb, row.depends_on_display)
+            )
+
+        def partition(row):
+            return row.source_concept_uuid, row.target_concept_terminology_version_uuid, depends_on_columns(row)
+
+        element_mapping_ids = {}
+        for row in rows:
+            key = partition(row)
+            element_mapping_ids[key] = min(element_mapping_ids.get(key, row.mapping_id), row.mapping_id)
+        return sorted(
+            rows,
+            key=lambda row: (
+                element_mapping_ids[partition(row)], str(row.source_concept_uuid), depends_on_columns(row),
+                row.mapping_id,
+            ),
+        )
+
+    def execute(self, query, parameters):
+        if "select distinct" in str(query):
+            return sorted({self.pair(row) for row in self.rows}, key=str)
+        self.group_queries += 1
+        pair = (parameters["source_fhir_uri"], parameters["source_version"], parameters["target_fhir_uri"],
+                parameters["target_version"])
+        return iter(self.in_element_order([row for row in self.rows if self.pair(row) == pair]))
+
+
+class SerializeMappingsTests(unittest.TestCase):
+    """
+    serialize_mappings must give the same output as before it was made single-pass. Mapping construction looks up a
+    database connection, which these tests do not use, so none is needed.
+    """
+    def setUp(self) -> None:
+        self.patch = patch("app.concept_maps.models.get_db")
+        self.patch.start()
+
+    def tearDown(self) -> None:
+        self.patch.stop()
+
+    def test_serialize_mappings_matches_golden_file(self):
+        with open(resources_folder(__file__, GOLDEN_FILE)) as golden_file:
+            golden = json.load(golden_file)
+        concept_map_versions = make_golden_concept_map_versions()
+        self.assertEqual(sorted(golden.keys()), sorted(concept_map_versions.keys()))
+        for name, concept_map_version in concept_map_versions.items():
+            self.assertEqual(
+                json.dumps(golden[name]),
+                json.dumps(groups_in_pair_order(concept_map_version.serialize_mappings())),
+                name,
+            )
+
+    def test_serialize_mappings_matches_legacy(self):
+        """
+        Within one process, the output is byte-identical to the legacy output, including the order of the groups
+        """
+        rng = random.Random(43)
+        terminologies = [LOINC, SNOMED, NO_MAP, APPOINTMENT_TARGET]
+        for seed in range(20):
+            concept_map_version = make_concept_map_version(
+                seed,
+                rng.sample([OBSERVATION_SOURCE, CONDITION_SOURCE, CONDITION_SOURCE_PREVIOUS], rng.randint(1, 3)),
+                rng.sample(terminologies, rng.randint(1, len(terminologies))),
+                rng.randint(0, 30),
+                rng.random() < 0.5,
+                [HUMAN, NLP, AUTOMAP],
+            )
+            self.assertEqual(
+                json.dumps(legacy_serialize_mappings(concept_map_version)),
+                json.dumps(concept_map_version.serialize_mappings()),
+            )
+
+    def test_serialize_mappings_from_rows_matches_serialize_mappings(self):
+        """
+        For the same rows, serialize_mappings_from_rows is byte-identical to load_reviewed_mappings followed by
+        serialize_mappings, including the order of the groups
+        """
+        terminologies = {
+            str(terminology.uuid): terminology
+            for terminology in [LOINC, SNOMED, NO_MAP, OBSERVATION_SOURCE, CONDITION_SOURCE, CONDITION_SOURCE_PREVIOUS,
+                                APPOINTMENT_SOURCE, APPOINTMENT_TARGET]
+        }
+        content_creators = {creator.uuid: creator for creator in [HUMAN, REVIEWER, AUTOMAP, NLP]}
+        relationships = {relationship.code: relationship for relationship in RELATIONSHIPS}
+        rng = random.Random(44)
+        with patch.object(
+            app.terminologies.models.Terminology, "load_from_cache", side_effect=lambda key: terminologies[str(key)]
+        ), patch.object(
+            ContentCreator, "load_by_uuid_from_cache", side_effect=content_creators.get
+        ), patch.object(
+            MappingRelationship, "load_by_code_from_cache", side_effect=relationships.get
+        ):
+            for name, concept_map_version in make_golden_concept_map_versions().items():
+                rows = make_mapping_rows(concept_map_version, rng)
+                concept_map_version.mappings = {}
+                concept_map_version.load_reviewed_mappings(rows)
+                self.assertEqual(
+                    json.dumps(concept_map_version.serialize_mappings()),
+                    json.dumps(concept_map_version.serialize_mappings_from_rows(rows)),
+                    name,
+                )
+
+    def test_stream_mapping_groups_matches_sorted_serialize_mappings_from_rows(self):
+        """
+        The groups streamed from the database, one group query at a time, are byte-identical to the sorted groups
+        serialized from all of the rows at once
+        """
+        terminologies = {
+            str(terminology.uuid): terminology
+            for terminology in [LOINC, SNOMED, NO_MAP, OBSERVATION_SOURCE, CONDITION_SOURCE, CONDITION_SOURCE_PREVIOUS,
+                                APPOINTMENT_SOURCE, APPOINTMENT_TARGET]
+        }
+        content_creators = {creator.uuid: creator for creator in [HUMAN, REVIEWER, AUTOMAP, NLP]}
+        rng = random.Random(45)
+        with patch.object(
+            app.terminologies.models.Terminology, "load_from_cache", side_effect=lambda key: terminologies[str(key)]
+        ), patch.object(
+            ContentCreator, "load_by_uuid_from_cache", side_effect=content_creators.get
+        ):
+            for name, concept_map_version in make_golden_concept_map_versions().items():
+                rows = make_mapping_rows(concept_map_version, rng)
+                connection = MappingRowsConnection(rows)
+                with patch("app.concept_maps.models.get_db", return_value=connection):
+                    groups = concept_map_version.stream_mapping_groups()
+                    self.assertEqual(0, connection.group_queries)
+                    streamed = [dict(group, element=list(group["element"])) for group in groups]
+                self.assertEqual(len(groups), connection.group_queries)
+                self.assertEqual(
+                    json.dumps(
+                        ConceptMap.sort_concept_map_groups_and_elements(
+                            concept_map_version.serialize_mappings_from_rows(
+                                MappingRowsConnection.in_element_order(rows)
+                            )
+                        )
+                    ),
+                    json.dumps(streamed),
+                    name,
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
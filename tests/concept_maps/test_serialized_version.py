@@ -0,0 +1,126 @@
+import copy
+import datetime
+import unittest
+import uuid
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from app.concept_maps.models import ConceptMap, ConceptMapVersion
+
+
+def make_concept_map_version(status: str, published_date=None) -> ConceptMapVersion:
+    concept_map_version = ConceptMapVersion.__new__(ConceptMapVersion)
+    concept_map_version.uuid = uuid.uuid4()
+    concept_map_version.status = status
+    concept_map_version.published_date = published_date
+    concept_map_version.mappings = {}
+    return concept_map_version
+
+
+GROUPS = [
+    {
+        "source": "http://projectronin.io/fhir/CodeSystem/mdaoc/ObservationCodeAndComponentCode",
+        "element": [{"_code": {"extension": []}, "target": [{"id": "1", "display": "Élément “quoted”"}]}],
+    }
+]
+
+
+def serialize(include_internal_info=False, schema_version=ConceptMap.next_schema_version, stream_elements=False,
+              mapping_rows=None, groups=None):
+    """
+    Stands in for ConceptMapVersion.serialize, with the metadata reduced to a marker of when it was serialized
+    """
+    return {"resourceType": "ConceptMap", "serialized_now": True, "group": copy.deepcopy(GROUPS) if groups is None else groups}
+
+
+class SerializedVersionTests(unittest.TestCase):
+    """
+    The mappings of published concept map versions are serialized once and then read back from
+    concept_maps.serialized_version, while their metadata is serialized on each read. The database connection is
+    replaced by a mock that keeps the stored content, so no database is needed.
+    """
+    def setUp(self) -> None:
+        self.patch = patch("app.concept_maps.models.get_db")
+        self.conn = self.patch.start().return_value
+        self.conn.execute.return_value.first.return_value = None
+
+    def tearDown(self) -> None:
+        self.patch.stop()
+
+    def test_encode_and_decode_round_trip(self):
+        groups = copy.deepcopy(GROUPS) + [dict(GROUPS[0], source="empty", element=[])]
+        headers, content = ConceptMapVersion.encode_serialized_groups(
+            [dict(group, element=iter(group["element"])) for group in groups]
+        )
+        self.assertEqual([1, 0], [header["element_count"] for header in headers])
+        self.assertEqual(groups, ConceptMapVersion.decode_serialized_groups(headers, content))
+
+        streamed = ConceptMapVersion.decode_serialized_groups(headers, content, stream_elements=True)
+        self.assertNotIsInstance(streamed[0]["element"], list)
+        self.assertEqual(groups, [dict(group, element=list(group["element"])) for group in streamed])
+
+    def test_store_and_load_round_trip(self):
+        concept_map_version = make_concept_map_version("retired", datetime.datetime(2024, 1, 1))
+        headers, content = ConceptMapVersion.encode_serialized_groups(GROUPS)
+        concept_map_version.store_serialized_artifact(ConceptMap.next_schema_version, headers, content)
+        parameters = self.conn.execute.call_args.args[1]
+        self.assertEqual(ConceptMapVersion.serialized_artifact_revision, parameters["serializer_revision"])
+        self.conn.execute.return_value.first.return_value = SimpleNamespace(
+            groups=parameters["groups"], content=memoryview(parameters["content"])
+        )
+
+        loaded = concept_map_version.load_serialized_artifact(ConceptMap.next_schema_version)
+        self.assertEqual(GROUPS, ConceptMapVersion.decode_serialized_groups(*loaded))
+        self.assertIn("serializer_revision=:serializer_revision", str(self.conn.execute.call_args.args[0]))
+        self.assertEqual(
+            ConceptMapVersion.serialized_artifact_revision,
+            self.conn.execute.call_args.args[1]["serializer_revision"],
+        )
+
+    def test_published_version_metadata_is_serialized_on_read(self):
+        concept_map_version = make_concept_map_version("active", datetime.datetime(2024, 1, 1))
+        stored = ConceptMapVersion.encode_serialized_groups(GROUPS)
+        with patch.object(ConceptMapVersion, "load_serialized_artifact", return_value=stored), \
+                patch.object(ConceptMapVersion, "stream_mapping_groups") as stream_mapping_groups, \
+                patch.object(ConceptMapVersion, "serialize", side_effect=serialize) as serialize_mock, \
+                patch.object(ConceptMapVersion, "store_serialized_artifact") as store:
+            serialized = concept_map_version.serialize_published()
+        self.assertTrue(serialized["serialized_now"])
+        self.assertEqual(GROUPS, serialize_mock.call_args.kwargs["groups"])
+        stream_mapping_groups.assert_not_called()
+        store.assert_not_called()
+
+    def test_published_version_without_stored_form_is_stored(self):
+        concept_map_version = make_concept_map_version("active", datetime.datetime(2024, 1, 1))
+        with patch.object(ConceptMapVersion, "stream_mapping_groups", return_value=copy.deepcopy(GROUPS)) as stream, \
+                patch.object(ConceptMapVersion, "serialize", side_effect=serialize) as serialize_mock, \
+                patch.object(ConceptMapVersion, "store_serialized_artifact") as store:
+            concept_map_version.serialize_published(schema_version=ConceptMap.next_schema_version)
+        stream.assert_called_once()
+        schema_version, headers, content = store.call_args.args
+        self.assertEqual(ConceptMap.next_schema_version, schema_version)
+        self.assertEqual(GROUPS, ConceptMapVersion.decode_serialized_groups(headers, content))
+        self.assertEqual(GROUPS, serialize_mock.call_args.kwargs["groups"])
+        self.conn.begin_nested.assert_called_once()
+
+    def test_store_failure_does_not_fail_read(self):
+        concept_map_version = make_concept_map_version("active", datetime.datetime(2024, 1, 1))
+        with patch.object(ConceptMapVersion, "stream_mapping_groups", return_value=copy.deepcopy(GROUPS)), \
+                patch.object(ConceptMapVersion, "serialize", side_effect=serialize), \
+                patch.object(ConceptMapVersion, "store_serialized_artifact", side_effect=RuntimeError("read only")), \
+                self.assertLogs(level="WARNING"):
+            serialized = concept_map_version.serialize_published(stream_elements=True)
+        self.assertEqual(GROUPS[0]["element"], list(serialized["group"][0]["element"]))
+
+    def test_unpublished_version_is_not_stored(self):
+        concept_map_version = make_concept_map_version("pending")
+        with patch.object(ConceptMapVersion, "serialize", side_effect=serialize), \
+                patch.object(ConceptMapVersion, "load_serialized_artifact") as load, \
+                patch.object(ConceptMapVersion, "store_serialized_artifact") as store:
+            concept_map_version.serialize_published()
+        load.assert_not_called()
+        store.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,255 @@
+import json
+import pickle
+import unittest
+from unittest.mock import MagicMock, patch
+
+import redis
+from flask import Flask, g
+
+import app.helpers.cache_helper
+from app.concept_maps.models import ConceptMapSettings
+from app.database import close_db
+from app.helpers.cache_helper import TwoTierCache, two_tier_cache, invalidate_cache, register_local_cache
+
+
+class FakeRedis:
+    """
+    Just enough of a Redis client for the shared cache tier, kept in memory. These tests need no Redis server.
+    """
+
+    def __init__(self, fail=False):
+        self.values = {}
+        self.published = []
+        self.fail = fail
+
+    def _check(self):
+        if self.fail:
+            raise redis.exceptions.ConnectionError("Fake Redis is down")
+
+    def get(self, key):
+        self._check()
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self._check()
+        self.values[key] = value
+
+    def incr(self, key):
+        self._check()
+        self.values[key] = int(self.values.get(key, 0)) + 1
+        return self.values[key]
+
+    def publish(self, channel, message):
+        self._check()
+        self.published.append((channel, message))
+
+
+class CacheHelperTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.fake_redis = FakeRedis()
+        self.patches = [
+            patch("app.helpers.cache_helper.get_redis", return_value=self.fake_redis),
+            patch("app.helpers.cache_helper._ensure_invalidation_listener"),
+        ]
+        for p in self.patches:
+            p.start()
+        app.helpers.cache_helper._redis_unavailable_until = 0.0
+
+    def tearDown(self) -> None:
+        for p in self.patches:
+            p.stop()
+
+    def test_second_process_reads_shared_tier(self):
+        """
+        Two caches with the same namespace stand in for the same cache in two processes
+        """
+        loads = []
+
+        def load():
+            loads.append(1)
+            return {"uuid": "d2ae0de5-0168-4f54-924a-1f79cf658939"}
+
+        first_process = TwoTierCache("test_namespace", maxsize=10, ttl=60)
+        second_process = TwoTierCache("test_namespace", maxsize=10, ttl=60)
+        first_value = first_process.get_or_load(("a",), {}, load)
+        second_value = second_process.get_or_load(("a",), {}, load)
+
+        self.assertEqual(1, len(loads))
+        self.assertEqual(first_value, second_value)
+
+    def test_shared_tier_stores_json(self):
+        class Settings:
+            def __init__(self, uuid):
+                self.uuid = uuid
+
+        cache = TwoTierCache(
+            "test_json_namespace",
+            maxsize=10,
+            ttl=60,
+            to_dict=lambda settings: {"uuid": settings.uuid},
+            from_dict=lambda data: Settings(**data),
+        )
+        cache.get_or_load(("a",), {}, lambda: Settings("d2ae0de5-0168-4f54-924a-1f79cf658939"))
+        [stored] = [value for key, value in self.fake_redis.values.items() if "test_json_namespace" in key]
+        self.assertEqual({"uuid": "d2ae0de5-0168-4f54-924a-1f79cf658939"}, json.loads(stored))
+
+        cache.clear_local()
+        value = cache.get_or_load(("a",), {}, lambda: self.fail("read from the shared tier"))
+        self.assertIsInstance(value, Settings)
+        self.assertEqual("d2ae0de5-0168-4f54-924a-1f79cf658939", value.uuid)
+
+    def test_unreadable_shared_value_is_a_miss(self):
+        cache = TwoTierCache("test_unreadable_namespace", maxsize=10, ttl=60)
+        cache.get_or_load(("a",), {}, lambda: "value")
+        [key] = [key for key in self.fake_redis.values if "test_unreadable_namespace" in key]
+        # As stored by a release that pickled values
+        self.fake_redis.values[key] = pickle.dumps("value")
+
+        cache.clear_local()
+        self.assertEqual("reloaded", cache.get_or_load(("a",), {}, lambda: "reloaded"))
+        self.assertEqual("reloaded", json.loads(self.fake_redis.values[key]))
+
+    def test_concept_map_settings_shared_as_json(self):
+        settings = ConceptMapSettings(
+            auto_advance_after_mapping=True, auto_fill_search_bar=False, show_target_codes_in_mapping_interface=True
+        )
+        with patch.object(ConceptMapSettings, "load", return_value=settings) as load:
+            ConceptMapSettings.load_from_cache("ca75b03c-1763-44fd-9bfa-4fe015ff809c")
+            ConceptMapSettings.load_from_cache.cache_clear()
+            self.assertEqual(settings, ConceptMapSettings.load_from_cache("ca75b03c-1763-44fd-9bfa-4fe015ff809c"))
+        load.assert_called_once()
+
+    def test_invalidate_broadcasts_new_generation(self):
+        calls = []
+
+        @two_tier_cache("test_invalidate_namespace")
+        def cached(value):
+            calls.append(value)
+            return value * 2
+
+        self.assertEqual(4, cached(2))
+        self.assertEqual(4, cached(2))
+        self.assertEqual(1, len(calls))
+
+        invalidate_cache("test_invalidate_namespace")
+        self.assertEqual(
+            [(app.helpers.cache_helper.INVALIDATION_CHANNEL, "test_invalidate_namespace:1")],
+            self.fake_redis.published,
+        )
+        self.assertEqual(4, cached(2))
+        self.assertEqual(2, len(calls))
+
+    def test_invalidation_message_clears_local_tier(self):
+        cache = TwoTierCache("test_message_namespace", maxsize=10, ttl=60)
+        app.helpers.cache_helper._caches["test_message_namespace"] = cache
+        cache.get_or_load(("a",), {}, lambda: "value")
+
+        app.helpers.cache_helper._handle_invalidation_message(
+            {"data": b"test_message_namespace:7"}
+        )
+        self.assertEqual(0, len(cache.local))
+        self.assertEqual(7, cache.generation)
+
+    def test_registered_local_cache_invalidated(self):
+        class Index:
+            cleared = 0
+
+            def clear_local(self, generation=None):
+                self.cleared += 1
+
+        index = Index()
+        register_local_cache("test_local_namespace", index)
+        invalidate_cache("test_local_namespace")
+        app.helpers.cache_helper._handle_invalidation_message({"data": b"test_local_namespace:2"})
+        self.assertEqual(3, index.cleared)
+
+    def test_class_argument_not_in_key(self):
+        class Loader:
+            @classmethod
+            @two_tier_cache("test_classmethod_namespace")
+            def load(cls, uuid):
+                return {"uuid": uuid}
+
+        Loader.load("ca75b03c-1763-44fd-9bfa-4fe015ff809c")
+        keys = [key for key in self.fake_redis.values if "test_classmethod_namespace:0:" in key]
+        self.assertEqual(1, len(keys))
+        self.assertNotIn("Loader", keys[0])
+
+    def test_redis_unavailable_falls_back_to_local_tier(self):
+        self.fake_redis.fail = True
+        calls = []
+
+        @two_tier_cache("test_unavailable_namespace")
+        def cached(value):
+            calls.append(value)
+            return value
+
+        self.assertEqual("x", cached("x"))
+        self.assertEqual("x", cached("x"))
+        self.assertEqual(1, len(calls))
+        invalidate_cache("test_unavailable_namespace")
+        self.assertEqual("x", cached("x"))
+        self.assertEqual(2, len(calls))
+
+    def test_invalidation_in_request_waits_for_commit(self):
+        calls = []
+
+        @two_tier_cache("test_deferred_namespace")
+        def cached(value):
+            calls.append(value)
+            return value
+
+        flask_app = Flask(__name__)
+        with flask_app.app_context():
+            cached("x")
+            with flask_app.test_request_context():
+                g.db = db = MagicMock()
+                db.commit.side_effect = lambda: self.assertEqual([], self.fake_redis.published)
+                invalidate_cache("test_deferred_namespace")
+                self.assertEqual([], self.fake_redis.published)
+                # The request reads its own uncommitted changes, and does not cache them
+                cached("x")
+                cached("x")
+                self.assertEqual(3, len(calls))
+                close_db()
+            db.commit.assert_called_once()
+        self.assertEqual(
+            [(app.helpers.cache_helper.INVALIDATION_CHANNEL, "test_deferred_namespace:1")],
+            self.fake_redis.published,
+        )
+
+    def test_invalidation_in_request_dropped_on_rollback(self):
+        flask_app = Flask(__name__)
+        with flask_app.app_context(), flask_app.test_request_context():
+            g.db = MagicMock()
+            invalidate_cache("test_rolled_back_namespace")
+            close_db(Exception("request failed"))
+        self.assertEqual([], self.fake_redis.published)
+
+    def test_stopped_listener_is_restarted(self):
+        self.patches[1].stop()
+        self.patches.pop()
+        threads = [MagicMock(), MagicMock()]
+        pubsub = MagicMock()
+        pubsub.run_in_thread.side_effect = threads
+        self.fake_redis.pubsub = MagicMock(return_value=pubsub)
+        cache = TwoTierCache("test_listener_namespace", maxsize=10, ttl=60)
+        app.helpers.cache_helper._caches["test_listener_namespace"] = cache
+        app.helpers.cache_helper._listener_pid = None
+
+        cache.get_or_load(("a",), {}, lambda: "value")
+        app.helpers.cache_helper._ensure_invalidation_listener(self.fake_redis)
+        self.assertEqual(1, pubsub.run_in_thread.call_count)
+        self.assertEqual(1, len(cache.local))
+
+        # Broadcasts may have been missed while the listener was down
+        threads[0].is_alive.return_value = False
+        app.helpers.cache_helper._ensure_invalidation_listener(self.fake_redis)
+        self.assertEqual(2, pubsub.run_in_thread.call_count)
+        self.assertEqual(0, len(cache.local))
+        self.assertIsNone(cache.generation)
+        app.helpers.cache_helper._listener_pid = None
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import random
+import unittest
+from collections import OrderedDict
+
+from app.helpers.canonical_json_helper import canonical_json, canonical_json_ordered, ordered_list
+from app.helpers.data_helper import hash_string, normalized_source_codeable_concept, \
+    normalized_source_codeable_concept_string, order_object_list, serialize_json_object
+
+
+def legacy_serialize_json_object(json_object) -> str:
+    """
+    serialize_json_object as it was when the stored code_id, mapping_id and deduplication hash values were created
+    """
+    if json_object is None:
+        return ""
+    return json.dumps(json_object, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+
+def legacy_order_object_list(input_object_list) -> list:
+    """
+    order_object_list as it was when the stored code_id, mapping_id and deduplication hash values were created
+    """
+    object_list: dict = {}
+    for obj in input_object_list:
+        object_list.update({hashlib.md5(legacy_serialize_json_object(obj).encode("utf-8")).hexdigest(): obj})
+    sorted_list = OrderedDict(sorted(object_list.items()))
+    return list(sorted_list.values())
+
+
+# Normalized CodeableConcepts with the serialization and hash that the legacy functions produced for them.
+# The coding members of each input are reversed before normalizing, so the expected order is not the input order.
+CANONICAL_CORPUS = [
+    (
+        {"coding": [{"code": 292241000119108, "system": "http://snomed.info/sct"},
+                    {"code": "G57.61", "system": "http://hl7.org/fhir/sid/icd-10-cm"}],
+         "text": "Morton's neuroma of right foot"},
+        '{"coding":[{"code":292241000119108,"system":"http://snomed.info/sct"},{"code":"G57.61","system":"http://hl7.org/fhir/sid/icd-10-cm"}],"text":"Morton\'s neuroma of right foot"}',
+        "1f1d59b2559e305ca874a0a66726796a",
+    ),
+    (
+        {"coding": [{"code": "R31.9", "system": "urn:oid:2.16.840.1.113883.6.90"},
+                    {"code": "95567008", "system": "urn:oid:2.16.840.1.113883.6.96"}],
+         "text": "Traumatic hematuria"},
+        '{"coding":[{"code":"R31.9","system":"http://hl7.org/fhir/sid/icd-10-cm"},{"code":"95567008","system":"http://snomed.info/sct"}],"text":"Traumatic hematuria"}',
+        "b2bb6c2f10e16185b550bd1c37c857f3",
+    ),
+    (
+        {"id": "ronin-12345",
+         "coding": [{"display": "Potassium Level", "code": "21704910", "userSelected": True,
+                     "system": "https://fhir.cerner.com/ec2458f2-1e24-41c8-b71b-0e701af7583d/codeSet/72"},
+                    {"code": "2823-3", "system": "http://loinc.org", "userSelected": False,
+                     "display": "Potassium [Moles/volume] in Serum or Plasma"}],
+         "text": "Potassium Level"},
+        '{"coding":[{"code":"2823-3","display":"Potassium [Moles/volume] in Serum or Plasma","system":"http://loinc.org"},{"code":"21704910","display":"Potassium Level","system":"https://fhir.cerner.com/ec2458f2-1e24-41c8-b71b-0e701af7583d/codeSet/72"}],"text":"Potassium Level"}',
+        "072888e36f829f8ca90f428fde31ccda",
+    ),
+    (
+        {"coding": [{"code": "791.7", "display": "Urine micr.:leukocytes present",
+                     "system": "http://hl7.org/fhir/sid/icd-9-cm/diagnosis"},
+                    {"system": "http://hl7.org/fhir/sid/icd-9-cm/diagnosis", "code": "791.7",
+                     "display": "Urine micr.:leukocytes present"}],
+         "text": "Urine micr.:leukocytes present"},
+        '{"coding":[{"code":"791.7","display":"Urine micr.:leukocytes present","system":"http://hl7.org/fhir/sid/icd-9-cm/diagnosis"}],"text":"Urine micr.:leukocytes present"}',
+        "dcc97decb3f4388c9b81ee667e3f47c1",
+    ),
+    (
+        {"coding": [{"code": "C50.911", "display": "Néoplasme malin du sein droit — “femme”",
+                     "system": "urn:oid:2.16.840.1.113883.6.90"}],
+         "text": "乳癌 \\ \"quoted\"\n"},
+        '{"coding":[{"code":"C50.911","display":"Néoplasme malin du sein droit — “femme”","system":"http://hl7.org/fhir/sid/icd-10-cm"}],"text":"乳癌 \\\\ \\"quoted\\"\\n"}',
+        "28b7ddeaca70948c2dd6ef5f0f708083",
+    ),
+    (
+        {"coding": [], "text": "No codings"},
+        '{"coding":[],"text":"No codings"}',
+        "61d8a3b6c4bcf981c6dc71f2baaed35b",
+    ),
+    (
+        {"text": "Text only"},
+        '{"text":"Text only"}',
+        "92f73ed2c71395a19c1f52dd45ca9501",
+    ),
+]
+
+
+def random_json_value(rng: random.Random, depth: int = 0):
+    choice = rng.randrange(9 if depth < 3 else 6)
+    if choice == 0:
+        return None
+    if choice == 1:
+        return rng.choice([True, False])
+    if choice == 2:
+        return rng.randint(-10 ** 18, 10 ** 18)
+    if choice == 3:
+        return rng.choice([0.1, 7.5, -2.0, 1e-7, 1e21, float("inf")])
+    if choice in (4, 5):
+        return random_text(rng)
+    if choice in (6, 7):
+        return {random_text(rng): random_json_value(rng, depth + 1) for _ in range(rng.randrange(4))}
+    return [random_json_value(rng, depth + 1) for _ in range(rng.randrange(4))]
+
+
+def random_text(rng: random.Random) -> str:
+    alphabet = "abcXYZ019 .:,'\"\\/\n\té—“乳\U0001F600\x00\x1f"
+    return "".join(rng.choice(alphabet) for _ in range(rng.randrange(8)))
+
+
+def random_coding_list(rng: random.Random) -> list:
+    codings = [
+        {key: random_json_value(rng) for key in rng.sample(["code", "display", "system", "version"], rng.randint(1, 4))}
+        for _ in range(rng.randrange(6))
+    ]
+    # repeat some members, as source data sometimes does
+    return codings + [dict(rng.choice(codings)) for _ in range(rng.randrange(3)) if codings]
+
+
+class CanonicalJsonHelperTests(unittest.TestCase):
+    """
+    Differential tests: the canonical serialization must stay byte-identical to the legacy serialization, because the
+    code_id, mapping_id and deduplication hash values stored in the database were made from it. These need no database.
+    """
+    def test_corpus_matches_stored_serialization_and_hash(self):
+        for input_object, expected_string, expected_hash in CANONICAL_CORPUS:
+            reversed_input = json.loads(json.dumps(input_object))
+            if "coding" in reversed_input:
+                reversed_input["coding"].reverse()
+            for codeable_concept in (input_object, reversed_input):
+                one_pass_string = normalized_source_codeable_concept_string(json.loads(json.dumps(codeable_concept)))
+                two_step_string = serialize_json_object(
+                    normalized_source_codeable_concept(json.loads(json.dumps(codeable_concept)))
+                )
+                self.assertEqual(expected_string, one_pass_string)
+                self.assertEqual(expected_string, two_step_string)
+                self.assertEqual(expected_hash, hash_string(one_pass_string))
+
+    def test_canonical_json_matches_legacy(self):
+        rng = random.Random(38)
+        for _ in range(2000):
+            value = random_json_value(rng)
+            if value is None:
+                continue
+            self.assertEqual(legacy_serialize_json_object(value), canonical_json(value))
+
+    def test_ordered_list_matches_legacy(self):
+        rng = random.Random(3801)
+        for _ in range(2000):
+            members = random_coding_list(rng) + [None] * rng.randrange(2)
+            rng.shuffle(members)
+            self.assertEqual(
+                legacy_serialize_json_object(legacy_order_object_list(members)),
+                legacy_serialize_json_object(ordered_list(members)),
+            )
+            self.assertEqual(
+                legacy_serialize_json_object(legacy_order_object_list(members)),
+                legacy_serialize_json_object(order_object_list(members)),
+            )
+
+    def test_canonical_json_ordered_matches_legacy(self):
+        rng = random.Random(3802)
+        for _ in range(2000):
+            json_object = {random_text(rng): random_json_value(rng) for _ in range(rng.randrange(3))}
+            json_object["coding"] = random_coding_list(rng)
+            if rng.random() < 0.5:
+                json_object["text"] = random_text(rng)
+            legacy_object = dict(json_object)
+            legacy_object["coding"] = legacy_order_object_list(json_object["coding"])
+            self.assertEqual(
+                legacy_serialize_json_object(legacy_object),
+                canonical_json_ordered(json_object, ("coding",)),
+            )
+
+    def test_canonical_json_ordered_non_string_keys(self):
+        json_object = {2: "b", 10: "a", 1: [{"code": "b"}, {"code": "a"}]}
+        legacy_object = dict(json_object)
+        legacy_object[1] = legacy_order_object_list(json_object[1])
+        self.assertEqual(legacy_serialize_json_object(legacy_object), canonical_json_ordered(json_object, (1,)))
+
+
+if __name__ == "__main__":
+    unittest.main()
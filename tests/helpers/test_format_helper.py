@@ -1,14 +1,20 @@
+import random
+import re
 import unittest
 
 from unittest import skip
 
 from app.database import get_db
 from app.app import create_app
-from app.helpers.data_helper import normalized_source_codeable_concept
+from app.helpers.data_helper import normalized_source_codeable_concept, load_json_string, serialize_json_object
 from app.helpers.format_helper import DataExtensionUrl, \
     prepare_code_and_display_for_storage_migration, \
     prepare_depends_on_value_for_storage, normalized_data_dictionary_string, normalized_codeable_concept_string, \
-    prepare_depends_on_attributes_for_code_id_migration, prepare_depends_on_attributes_for_code_id
+    prepare_depends_on_attributes_for_code_id_migration, prepare_depends_on_attributes_for_code_id, \
+    convert_source_concept_spark_export_string_to_json_string_unordered, \
+    convert_source_concept_spark_export_string_to_json_string_normalized_ordered, filter_unsafe_depends_on_value, \
+    prepare_source_concept_columns_for_storage_migration
+from app.helpers.id_helper import generate_code_id
 from app.models.codes import DependsOnData, DependsOnSchemas
 
 
@@ -336,5 +342,230 @@ class FormatHelperTests(unittest.TestCase):
         self.assertEquals(result_2, result_1)
 
 
+def legacy_spark_export_string_to_json_string_unordered(spark_export_string: str) -> str:
+    """
+    convert_source_concept_spark_export_string_to_json_string_unordered as it was when the v5 migrations began
+    """
+    if re.search("http://unitsofmeasure.org", spark_export_string):
+        return spark_export_string
+    json_object: dict = {}
+    coding_list = []
+    value_list = re.split(r'], ', spark_export_string)
+    coding_string = value_list[0][2:]
+    coding_value_list = re.split(r'}, \{', coding_string)
+    coding_value_list[0] = coding_value_list[0][1:]
+    coding_value_list[-1] = coding_value_list[-1][:-1]
+    for coding_value in coding_value_list:
+        attribute = re.split(r', ', coding_value)
+        coding_object: dict = {}
+        if len(attribute) >= 3:
+            first = attribute[0]
+            middle = ", ".join(attribute[1:-1])
+            last = attribute[-1]
+            if first != "null":
+                coding_object.update({"code": first})
+            if middle != "null":
+                coding_object.update({"display": middle})
+            if last != "null":
+                coding_object.update({"system": last})
+        elif len(attribute) == 2:
+            first = attribute[0]
+            last = attribute[-1]
+            if first != "null":
+                coding_object.update({"code": first})
+            if last != "null":
+                coding_object.update({"system": last})
+        else:
+            return spark_export_string
+        if len(coding_object) > 0:
+            coding_list.append(coding_object)
+    if len(coding_list) > 0:
+        json_object.update({"coding": coding_list})
+    if len(value_list) > 1:
+        text_value = value_list[1][:-1]
+        if text_value != "null":
+            json_object.update({"text": text_value})
+    return serialize_json_object(json_object)
+
+
+def legacy_spark_export_string_to_json_string_normalized_ordered(spark_export_string: str) -> str:
+    """
+    convert_source_concept_spark_export_string_to_json_string_normalized_ordered as it was when the v5 migrations began
+    """
+    code_string = legacy_spark_export_string_to_json_string_unordered(spark_export_string)
+    code_object = load_json_string(code_string)
+    rcdm_object = normalized_source_codeable_concept(code_object)
+    return serialize_json_object(rcdm_object)
+
+
+SPARK_EXPORT_VALUE_TOKENS = [
+    " ", "null", "''", "'", "\"", "\\", "\n", "\x00", "urn:oid:2.16.840.1.113883.6.90", "http://snomed.info/sct",
+    "R31.9", "95567008", "Murphy's sign", "Néoplasme — “femme”", "乳癌", "Line 1",
+]
+SPARK_EXPORT_SYNTAX_TOKENS = [
+    "{", "}", "[", "]", "{[{", "}], ", "], ", "}, {", ", ", ",", "http://unitsofmeasure.org", "http://unitsofmeasure-org",
+]
+
+
+def random_spark_value(rng: random.Random) -> str:
+    tokens = SPARK_EXPORT_VALUE_TOKENS if rng.random() < 0.9 else SPARK_EXPORT_VALUE_TOKENS + SPARK_EXPORT_SYNTAX_TOKENS
+    return "".join(rng.choice(tokens) for _ in range(rng.randrange(4)))
+
+
+def random_spark_export_string(rng: random.Random) -> str:
+    """
+    A spark export string built from random attribute values, then randomly mutated, so that the corpus holds both
+    well-formed strings and the malformed strings that old ETL output also contains
+    """
+    members = []
+    for _ in range(rng.randrange(1, 6)):
+        attribute_count = 1 if rng.random() < 0.03 else rng.choice([2, 3, 3, 4, 5])
+        attributes = [random_spark_value(rng) if rng.random() < 0.8 else "null" for _ in range(attribute_count)]
+        members.append("{" + ", ".join(attributes) + "}")
+    text = random_spark_value(rng) if rng.random() < 0.8 else "null"
+    spark_export_string = "{[" + ", ".join(members) + "], " + text + "}"
+    for _ in range(rng.choice([0, 0, 1, 2])):
+        position = rng.randrange(len(spark_export_string) + 1)
+        if rng.random() < 0.5:
+            spark_export_string = spark_export_string[:position] + rng.choice(SPARK_EXPORT_SYNTAX_TOKENS) + \
+                spark_export_string[position:]
+        else:
+            spark_export_string = spark_export_string[:position] + spark_export_string[position + rng.randrange(4):]
+    return spark_export_string
+
+
+def conversion_outcome(convert, spark_export_string):
+    try:
+        return convert(spark_export_string)
+    except Exception as e:
+        return type(e), str(e)
+
+
+class SparkExportConversionTests(unittest.TestCase):
+    """
+    Differential tests of the spark export parser against the legacy regular expression conversion, on a fuzzed corpus.
+    These need no database.
+    """
+    def test_unordered_matches_legacy(self):
+        rng = random.Random(39)
+        for _ in range(20000):
+            spark_export_string = random_spark_export_string(rng)
+            self.assertEqual(
+                legacy_spark_export_string_to_json_string_unordered(spark_export_string),
+                convert_source_concept_spark_export_string_to_json_string_unordered(spark_export_string),
+                spark_export_string
+            )
+
+    def test_normalized_ordered_matches_legacy(self):
+        rng = random.Random(3901)
+        for _ in range(20000):
+            spark_export_string = random_spark_export_string(rng)
+            self.assertEqual(
+                conversion_outcome(legacy_spark_export_string_to_json_string_normalized_ordered, spark_export_string),
+                conversion_outcome(
+                    convert_source_concept_spark_export_string_to_json_string_normalized_ordered, spark_export_string
+                ),
+                spark_export_string
+            )
+
+
+SOURCE_CONCEPT_CODES = [
+    None,
+    "",
+    "[null]",
+    "[null, null]",
+    "{Line 1}",
+    "12345",
+    "R31.9",
+    '{"coding":[{"display":"Potassium Level","code":"21704910","system":"https://fhir.cerner.com/ec2458f2-1e24-41c8-b71b-0e701af7583d/codeSet/72","userSelected":true},{"code":"2823-3","system":"http://loinc.org","display":"Potassium [Moles/volume] in Serum or Plasma","userSelected":false}],"text":"Potassium Level"}',
+    '{"coding": [{"code": "95567008", "system": "urn:oid:2.16.840.1.113883.6.96"}, {"code": "R31.9", "system": "urn:oid:2.16.840.1.113883.6.90"}], "text": "Traumatic hematuria"}',
+    '{"valueCodeableConcept": {"coding": [{"code": "R31.9", "system": "urn:oid:2.16.840.1.113883.6.90"}], "text": "Hematuria"}}',
+    '{"numerator": {"value": 7.5, "unit": "mL"}, "denominator": {"value": 10, "unit": "mL"}}',
+    "{[{300352008, Murphy's sign positive (situation), http://snomed.info/sct}, {R19.8, Positive Murphy's Sign, http://hl7.org/fhir/sid/icd-10-cm}], Positive Murphy's Sign}",
+    "{[{300352008, Murphy's sign positive (situation), http://snomed.info/sct, 1.0}, {R19.8}], Positive Murphy's Sign}",
+]
+SOURCE_CONCEPT_DEPENDS_ON_VALUES = [
+    None,
+    "",
+    "[null]",
+    "Oral",
+    '{"coding":[{"code":"26643006","system":"http://snomed.info/sct"}],"text":"Oral route"}',
+    "{[{7.5, mL, http://unitsofmeasure.org}, {10, mL, http://unitsofmeasure.org}]}",
+]
+SOURCE_CONCEPT_DEPENDS_ON_PROPERTIES = [None, "", "null", "Observation.code.text", "Medication.ingredient.strength"]
+
+
+class SourceConceptColumnsTests(unittest.TestCase):
+    """
+    The batch preparation must return, for every row, what the per-row v5 migration sequence returns. No database.
+    """
+    @staticmethod
+    def prepare_row(code, display, depends_on_value, depends_on_property, depends_on_system, depends_on_display):
+        code_result = prepare_code_and_display_for_storage_migration(code, display)
+        (filtered_value, rejected_value) = filter_unsafe_depends_on_value(depends_on_value)
+        depends_on_result = prepare_depends_on_value_for_storage(filtered_value, depends_on_property)
+        depends_on_value_for_code_id = prepare_depends_on_attributes_for_code_id_migration(
+            depends_on_result[3],
+            depends_on_result[4],
+            depends_on_system,
+            depends_on_display
+        )
+        try:
+            code_id = generate_code_id(
+                code_string=code_result[3],
+                display_string=code_result[4],
+                depends_on_value_string=depends_on_value_for_code_id,
+            )
+            code_id_error = None
+        except Exception as e:
+            code_id = None
+            code_id_error = (type(e), str(e))
+        return code_result + (filtered_value, rejected_value) + depends_on_result + (
+            depends_on_value_for_code_id, code_id, code_id_error
+        )
+
+    def test_columns_match_per_row_preparation(self):
+        rng = random.Random(40)
+        rows = []
+        for _ in range(3000):
+            code = rng.choice(SOURCE_CONCEPT_CODES) if rng.random() < 0.8 else random_spark_export_string(rng)
+            rows.append((
+                code,
+                rng.choice([None, "Display", "Potassium Level"]),
+                rng.choice(SOURCE_CONCEPT_DEPENDS_ON_VALUES),
+                rng.choice(SOURCE_CONCEPT_DEPENDS_ON_PROPERTIES),
+                rng.choice([None, "", "http://snomed.info/sct"]),
+                rng.choice([None, "Route"]),
+            ))
+        columns = prepare_source_concept_columns_for_storage_migration(*[list(column) for column in zip(*rows)])
+        for position, row in enumerate(rows):
+            code_id_error = columns.code_id_error[position]
+            self.assertEqual(
+                self.prepare_row(*row),
+                (
+                    columns.code_schema[position],
+                    columns.code_simple[position],
+                    columns.code_jsonb[position],
+                    columns.code_string[position],
+                    columns.display_string[position],
+                    columns.depends_on_value[position],
+                    columns.rejected_depends_on_value[position],
+                    columns.depends_on_value_schema[position],
+                    columns.depends_on_value_simple[position],
+                    columns.depends_on_value_jsonb[position],
+                    columns.depends_on_value_string[position],
+                    columns.depends_on_property_string[position],
+                    columns.depends_on_value_for_code_id[position],
+                    columns.code_id[position],
+                    None if code_id_error is None else (type(code_id_error), str(code_id_error)),
+                ),
+                row
+            )
+
+    def test_columns_must_have_equal_length(self):
+        with self.assertRaises(ValueError):
+            prepare_source_concept_columns_for_storage_migration(["R31.9", "R31.8"], ["Display"])
+
+
 if __name__ == '__main__':
     unittest.main()
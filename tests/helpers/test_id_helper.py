@@ -1,11 +1,15 @@
+import random
 import unittest
 import json
+from unittest.mock import patch
 
 from _pytest.python_api import raises
 
 from app.database import get_db
 from app.app import create_app
-from app.helpers.id_helper import generate_code_id, hash_for_code_id, generate_mapping_id_with_source_code_id
+from app.helpers.id_helper import generate_code_id, hash_for_code_id, generate_mapping_id_with_source_code_id, \
+    generate_mapping_id_with_source_code_values, generate_code_ids, generate_mapping_ids_with_source_code_id, \
+    generate_mapping_ids_with_source_code_values, generate_code_id_results
 
 
 class IdHelperTests(unittest.TestCase):
@@ -468,3 +472,146 @@ class IdHelperTests(unittest.TestCase):
             target_concept_system="a",
         )
         self.mapping_changes_unique(index=3, mapping_id=mapping_id)
+
+
+class IdHelperBatchTests(unittest.TestCase):
+    """
+    Property tests: the batch functions must return exactly what the single-item functions return, for random inputs.
+    These tests need no database connection.
+    """
+    item_count = 500
+
+    def setUp(self) -> None:
+        # A fixed seed, so that a failure can be reproduced
+        self.random = random.Random(20240501)
+
+    def random_text(self, allow_none=False):
+        if allow_none and self.random.random() < 0.3:
+            return None
+        alphabet = "abcXYZ019 |^-_.:/'\"é中"
+        return "".join(self.random.choice(alphabet) for _ in range(self.random.randint(1, 12)))
+
+    def random_code_string(self):
+        choice = self.random.random()
+        if choice < 0.2:
+            return str(self.random.randint(0, 10 ** 9))
+        if choice < 0.6:
+            return self.random_text()
+        codings = [
+            {"code": self.random_text(), "system": self.random.choice(
+                ["http://snomed.info/sct", "urn:oid:2.16.840.1.113883.6.90", "http://loinc.org"]
+            )}
+            for _ in range(self.random.randint(1, 3))
+        ]
+        self.random.shuffle(codings)
+        return json.dumps({"coding": codings, "text": self.random_text()})
+
+    def random_code_columns(self):
+        # Repeat some code strings, as real batches do
+        code_strings = [self.random_code_string() for _ in range(self.item_count // 5)]
+        columns = {
+            "code_strings": [self.random.choice(code_strings) for _ in range(self.item_count)],
+            "display_strings": [self.random_text(allow_none=True) for _ in range(self.item_count)],
+            "depends_on_value_strings": [],
+            "depends_on_properties": [],
+            "depends_on_systems": [],
+            "depends_on_displays": [],
+        }
+        for _ in range(self.item_count):
+            depends_on_value = self.random_text(allow_none=True)
+            columns["depends_on_value_strings"].append(depends_on_value)
+            # depends_on property, system and display require a depends_on value
+            for column_name in ("depends_on_properties", "depends_on_systems", "depends_on_displays"):
+                columns[column_name].append(
+                    self.random_text(allow_none=True) if depends_on_value is not None else None
+                )
+        return columns
+
+    def test_generate_code_ids_matches_generate_code_id(self):
+        columns = self.random_code_columns()
+        expected = [
+            generate_code_id(*item)
+            for item in zip(
+                columns["code_strings"],
+                columns["display_strings"],
+                columns["depends_on_value_strings"],
+                columns["depends_on_properties"],
+                columns["depends_on_systems"],
+                columns["depends_on_displays"],
+            )
+        ]
+        self.assertEqual(expected, generate_code_ids(**columns))
+
+        # Optional columns default to None
+        self.assertEqual(
+            [generate_code_id(code_string) for code_string in columns["code_strings"]],
+            generate_code_ids(columns["code_strings"]),
+        )
+
+    def test_generate_mapping_ids_match_single_item_functions(self):
+        columns = self.random_code_columns()
+        relationship_codes = [self.random_text() for _ in range(self.item_count)]
+        target_concept_codes = [self.random_text() for _ in range(self.item_count)]
+        target_concept_displays = [self.random_text(allow_none=True) for _ in range(self.item_count)]
+        target_concept_systems = [self.random_text(allow_none=True) for _ in range(self.item_count)]
+
+        expected = [
+            generate_mapping_id_with_source_code_values(*item)
+            for item in zip(
+                columns["code_strings"],
+                columns["display_strings"],
+                relationship_codes,
+                target_concept_codes,
+                target_concept_displays,
+                target_concept_systems,
+                columns["depends_on_value_strings"],
+                columns["depends_on_properties"],
+                columns["depends_on_systems"],
+                columns["depends_on_displays"],
+            )
+        ]
+        self.assertEqual(
+            expected,
+            generate_mapping_ids_with_source_code_values(
+                columns["code_strings"],
+                columns["display_strings"],
+                relationship_codes,
+                target_concept_codes,
+                target_concept_displays,
+                target_concept_systems,
+                columns["depends_on_value_strings"],
+                columns["depends_on_properties"],
+                columns["depends_on_systems"],
+                columns["depends_on_displays"],
+            ),
+        )
+
+        source_code_ids = generate_code_ids(columns["code_strings"])
+        self.assertEqual(
+            [
+                generate_mapping_id_with_source_code_id(*item)
+                for item in zip(source_code_ids, relationship_codes, target_concept_codes)
+            ],
+            generate_mapping_ids_with_source_code_id(source_code_ids, relationship_codes, target_concept_codes),
+        )
+
+    def test_generate_code_ids_in_process_pool(self):
+        columns = self.random_code_columns()
+        with patch("app.helpers.id_helper.PARALLEL_BATCH_MINIMUM", 100):
+            self.assertEqual(generate_code_ids(**columns), generate_code_ids(**columns, processes=3))
+
+    def test_batch_errors(self):
+        with raises(ValueError):
+            generate_code_ids(["a", ""])
+        with raises(ValueError):
+            generate_code_ids(["a", "b"], display_strings=["a"])
+        with raises(ValueError):
+            generate_mapping_ids_with_source_code_id(["a"], [None], ["c"])
+
+    def test_generate_code_id_results_continue_past_errors(self):
+        results = generate_code_id_results(["a", "", "b", None], depends_on_properties=[None, None, "p", None])
+        self.assertEqual((generate_code_id("a"), None), results[0])
+        for position in (1, 2, 3):
+            code_id, error = results[position]
+            self.assertIsNone(code_id)
+            self.assertIsInstance(error, ValueError)
@@ -0,0 +1,31 @@
+import unittest
+
+from app.helpers.interning_helper import InterningPool
+
+
+class InterningHelperTests(unittest.TestCase):
+    """
+    These tests need no database connection
+    """
+    def test_intern_shares_equal_values(self):
+        pool = InterningPool()
+        first_display = "".join(["Display ", "1"])
+        second_display = "".join(["Display ", "1"])
+        self.assertIsNot(first_display, second_display)
+
+        self.assertIs(first_display, pool.intern(first_display))
+        self.assertIs(first_display, pool.intern(second_display))
+        self.assertIsNone(pool.intern(None))
+        self.assertEqual(1, len(pool))
+
+    def test_pools_are_separate(self):
+        first_pool = InterningPool()
+        second_pool = InterningPool()
+        first_value = "".join(["review", "ed"])
+        second_value = "".join(["review", "ed"])
+        first_pool.intern(first_value)
+        self.assertIs(second_value, second_pool.intern(second_value))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,233 @@
+import copy
+import threading
+import unittest
+import uuid
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from opensearchpy.exceptions import ConnectionError as OpenSearchConnectionError
+from opensearchpy.helpers import BulkIndexError
+
+from app.concept_maps.models import ConceptMap
+from app.helpers.opensearch_helper import bulk_in_parallel, fetch_indexed_sources, index_changed_documents
+
+
+class FakeOpenSearch:
+    """
+    An in-process stand-in for the OpenSearch client methods used by app.helpers.opensearch_helper: mget and bulk.
+    rejections maps a document _id to the statuses its next actions get, one per attempt, and connection_failures is
+    the number of bulk requests that fail to connect before any succeeds. Updates merge their partial doc.
+    """
+
+    def __init__(self, documents: dict = None, rejections: dict = None, connection_failures: int = 0):
+        self.documents = copy.deepcopy(documents or {})  # index -> _id -> _source
+        self.rejections = {document_id: list(statuses) for document_id, statuses in (rejections or {}).items()}
+        self.connection_failures = connection_failures
+        self.bulk_requests = []
+        self.lock = threading.Lock()
+
+    def mget(self, index, body):
+        indexed = self.documents.get(index, {})
+        return {
+            "docs": [
+                {"_id": document_id, "found": True, "_source": copy.deepcopy(indexed[document_id])}
+                if document_id in indexed
+                else {"_id": document_id, "found": False}
+                for document_id in body["ids"]
+            ]
+        }
+
+    def bulk(self, body):
+        with self.lock:
+            self.bulk_requests.append(body)
+            if self.connection_failures:
+                self.connection_failures -= 1
+                raise OpenSearchConnectionError("N/A", "connection refused", None)
+            items = []
+            lines = iter(body)
+            for line in lines:
+                operation, metadata = next(iter(line.items()))
+                document_id = metadata["_id"]
+                indexed = self.documents.setdefault(metadata["_index"], {})
+                status = self.rejections[document_id].pop(0) if self.rejections.get(document_id) else None
+                if operation == "index":
+                    source = next(lines)
+                    if status is None:
+                        status = 200 if document_id in indexed else 201
+                        indexed[document_id] = copy.deepcopy(source)
+                elif operation == "update":
+                    doc = next(lines)["doc"]
+                    if status is None:
+                        status = 200 if document_id in indexed else 404
+                    if status == 200:
+                        indexed[document_id].update(copy.deepcopy(doc))
+                else:
+                    if status is None:
+                        status = 200 if indexed.pop(document_id, None) is not None else 404
+                item = {"_id": document_id, "status": status}
+                if status >= 300 and not (operation == "delete" and status == 404):
+                    item["error"] = {"type": "rejected"}
+                items.append({operation: item})
+            return {"errors": any("error" in next(iter(item.values())) for item in items), "items": items}
+
+
+def make_documents(count: int, display: str = "Display") -> dict:
+    return {f"code-{i}": {"code": f"{i}", "display": f"{display} {i}"} for i in range(count)}
+
+
+def make_actions(documents: dict) -> list:
+    return [
+        {"_op_type": "index", "_index": "test_index", "_id": document_id, "_source": source}
+        for document_id, source in documents.items()
+    ]
+
+
+class OpenSearchHelperTests(unittest.TestCase):
+    def test_bulk_in_parallel_chunks(self):
+        client = FakeOpenSearch()
+        documents = make_documents(25)
+        self.assertEqual(25, bulk_in_parallel(client, make_actions(documents), chunk_size=10, thread_count=3))
+        self.assertEqual(documents, client.documents["test_index"])
+        self.assertEqual([20, 20, 10], sorted((len(body) for body in client.bulk_requests), reverse=True))
+
+    def test_bulk_in_parallel_retries_rejected_items_only(self):
+        client = FakeOpenSearch(rejections={"code-3": [429, 503]})
+        documents = make_documents(5)
+        bulk_in_parallel(client, make_actions(documents), retry_backoff_seconds=0)
+        self.assertEqual(documents, client.documents["test_index"])
+        # the whole chunk, then code-3 alone twice
+        self.assertEqual([10, 2, 2], [len(body) for body in client.bulk_requests])
+
+    def test_bulk_in_parallel_retries_connection_errors(self):
+        client = FakeOpenSearch(connection_failures=2)
+        documents = make_documents(3)
+        bulk_in_parallel(client, make_actions(documents), retry_backoff_seconds=0)
+        self.assertEqual(documents, client.documents["test_index"])
+
+    def test_bulk_in_parallel_raises_after_retries(self):
+        client = FakeOpenSearch(rejections={"code-1": [400], "code-2": [503, 503, 503]})
+        with self.assertRaises(BulkIndexError) as raised:
+            bulk_in_parallel(client, make_actions(make_documents(4)), max_retries=2, retry_backoff_seconds=0)
+        self.assertEqual(["code-1", "code-2"], sorted(item["index"]["_id"] for item in raised.exception.errors))
+        self.assertEqual({"code-0", "code-3"}, set(client.documents["test_index"]))
+
+    def test_bulk_in_parallel_delete_missing_document(self):
+        client = FakeOpenSearch()
+        actions = [{"_op_type": "delete", "_index": "test_index", "_id": "code-0"}]
+        self.assertEqual(1, bulk_in_parallel(client, actions))
+
+    def test_fetch_indexed_sources(self):
+        client = FakeOpenSearch(documents={"test_index": make_documents(5)})
+        indexed = fetch_indexed_sources(client, "test_index", ["code-1", "code-4", "code-9"], chunk_size=2)
+        self.assertEqual(["code-1", "code-4"], sorted(indexed))
+
+    def test_index_changed_documents(self):
+        indexed = make_documents(10)
+        client = FakeOpenSearch(documents={"test_index": indexed})
+        documents = make_documents(12)
+        documents["code-4"] = {"code": "4", "display": "New display 4"}
+
+        counts = index_changed_documents(client, "test_index", documents)
+        self.assertEqual({"indexed": 3, "updated": 0, "unchanged": 9}, counts)
+        self.assertEqual(documents, client.documents["test_index"])
+        sent = sorted(line["index"]["_id"] for body in client.bulk_requests for line in body if "index" in line)
+        self.assertEqual(["code-10", "code-11", "code-4"], sent)
+
+        # Indexing the same documents again sends nothing
+        client.bulk_requests.clear()
+        self.assertEqual(
+            {"indexed": 0, "updated": 0, "unchanged": 12}, index_changed_documents(client, "test_index", documents)
+        )
+        self.assertEqual([], client.bulk_requests)
+
+
+class IndexTargetsTests(unittest.TestCase):
+    """
+    ConceptMap.index_targets against the in-process fake, with the target value set expansion in memory
+    """
+    def index_targets(self, client, concept_map_version_uuid, expansion):
+        vs_version = SimpleNamespace(expand=lambda: None, expansion=expansion)
+        terminology_version_uuid = uuid.UUID("ceac3e3c-c7ae-4a1b-85ca-1c5a5a7d0c11")
+        with patch("app.concept_maps.models.get_opensearch", return_value=client), \
+                patch("app.value_sets.models.ValueSetVersion.load", return_value=vs_version), \
+                patch("app.concept_maps.models.terminology_version_uuid_lookup", return_value=terminology_version_uuid):
+            return ConceptMap.index_targets(concept_map_version_uuid, uuid.uuid4())
+
+    def test_index_targets_sends_only_changes(self):
+        expansion = [
+            SimpleNamespace(code_id=f"{i:032x}", code=f"{i}", display=f"Target {i}", system="http://loinc.org",
+                            version="2.76")
+            for i in range(20)
+        ]
+        concept_map_version_uuid = uuid.uuid4()
+        client = FakeOpenSearch()
+        self.assertEqual(
+            {"indexed": 20, "updated": 0, "unchanged": 0},
+            self.index_targets(client, concept_map_version_uuid, expansion),
+        )
+        self.assertEqual(
+            {
+                "code": "7",
+                "display": "Target 7",
+                "concept_map_version_uuid": str(concept_map_version_uuid),
+                "terminology_version_uuid": "ceac3e3c-c7ae-4a1b-85ca-1c5a5a7d0c11",
+            },
+            client.documents[ConceptMap.target_concept_index][f"{7:032x}"],
+        )
+
+        expansion[7].display = "Target 7, revised"
+        expansion.append(
+            SimpleNamespace(code_id=f"{20:032x}", code="20", display="Target 20", system="http://loinc.org",
+                            version="2.76")
+        )
+        self.assertEqual(
+            {"indexed": 2, "updated": 0, "unchanged": 19},
+            self.index_targets(client, concept_map_version_uuid, expansion),
+        )
+
+    def test_new_version_only_sets_its_uuid(self):
+        expansion = [
+            SimpleNamespace(code_id=f"{i:032x}", code=f"{i}", display=f"Target {i}", system="http://loinc.org",
+                            version="2.76")
+            for i in range(10)
+        ]
+        previous_version_uuid = str(uuid.uuid4())
+        new_version_uuid = uuid.uuid4()
+        indexed = {
+            expansion[i].code_id: {
+                "code": f"{i}",
+                "display": f"Target {i}",
+                "concept_map_version_uuid": previous_version_uuid,
+                "terminology_version_uuid": "ceac3e3c-c7ae-4a1b-85ca-1c5a5a7d0c11",
+            }
+            for i in range(10)
+        }
+        client = FakeOpenSearch(documents={ConceptMap.target_concept_index: indexed})
+        self.assertEqual(
+            {"indexed": 0, "updated": 10, "unchanged": 0},
+            self.index_targets(client, new_version_uuid, expansion),
+        )
+        updates = [line for body in client.bulk_requests for line in body if "doc" in line]
+        self.assertEqual([{"doc": {"concept_map_version_uuid": str(new_version_uuid)}}] * 10, updates)
+        for i, document in enumerate(client.documents[ConceptMap.target_concept_index].values()):
+            self.assertEqual(
+                {
+                    "code": f"{i}",
+                    "display": f"Target {i}",
+                    "concept_map_version_uuid": str(new_version_uuid),
+                    "terminology_version_uuid": "ceac3e3c-c7ae-4a1b-85ca-1c5a5a7d0c11",
+                },
+                document,
+            )
+
+        # Every document has the version now, so indexing it again sends nothing
+        client.bulk_requests.clear()
+        self.assertEqual(
+            {"indexed": 0, "updated": 0, "unchanged": 10},
+            self.index_targets(client, new_version_uuid, expansion),
+        )
+        self.assertEqual([], client.bulk_requests)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+import threading
+import unittest
+import uuid
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import requests
+
+from app.concept_maps.models import ConceptMap, ConceptMapVersion
+from app.errors import BadRequestWithCode
+from app.helpers.publish_helper import PublishDestination, is_retryable_error, publish_to_destinations
+
+
+class StatusError(Exception):
+    """
+    An error with a status, like oci.exceptions.ServiceError
+    """
+
+    def __init__(self, status: int):
+        super().__init__(f"status {status}")
+        self.status = status
+
+
+class FlakySend:
+    """
+    A destination send that raises each of errors in turn, one per call, and then returns result
+    """
+
+    def __init__(self, errors=(), result="sent"):
+        self.errors = list(errors)
+        self.result = result
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.result
+
+
+class PublishHelperTests(unittest.TestCase):
+    def test_is_retryable_error(self):
+        self.assertTrue(is_retryable_error(requests.ConnectionError("connection reset")))
+        self.assertTrue(is_retryable_error(TimeoutError()))
+        self.assertTrue(is_retryable_error(StatusError(status=503)))
+        self.assertTrue(is_retryable_error(StatusError(status=429)))
+        self.assertFalse(is_retryable_error(StatusError(status=409)))
+        self.assertFalse(is_retryable_error(ValueError("This object already exists in the object store")))
+
+    def test_destinations_are_sent_concurrently(self):
+        # Each send waits for the other, so this only finishes if both are in flight at once
+        barrier = threading.Barrier(2, timeout=5)
+        destinations = [
+            PublishDestination(name=name, send=lambda name=name: (barrier.wait(), name)[1])
+            for name in ("ConceptMaps/v4", "ConceptMaps/v5")
+        ]
+        outcomes = publish_to_destinations(destinations)
+        self.assertEqual(["ConceptMaps/v4", "ConceptMaps/v5"], [outcomes[name]["result"] for name in outcomes])
+
+    def test_retryable_errors_are_retried(self):
+        send = FlakySend(errors=[requests.ConnectionError(), StatusError(status=503)])
+        outcomes = publish_to_destinations([PublishDestination(name="OCI", send=send, retry_backoff_seconds=0)])
+        self.assertEqual(3, send.calls)
+        self.assertEqual(3, outcomes["OCI"]["attempts"])
+        self.assertEqual("sent", outcomes["OCI"]["result"])
+        self.assertIsNone(outcomes["OCI"]["error"])
+        self.assertGreaterEqual(outcomes["OCI"]["seconds"], 0)
+
+    def test_other_errors_are_not_retried(self):
+        send = FlakySend(errors=[ValueError("This object already exists in the object store")])
+        with self.assertRaises(ValueError):
+            publish_to_destinations([PublishDestination(name="OCI", send=send, retry_backoff_seconds=0)])
+        self.assertEqual(1, send.calls)
+
+    def test_required_failure_is_raised_after_every_destination_is_tried(self):
+        failing = FlakySend(errors=[StatusError(status=500)] * 2)
+        other = FlakySend()
+        with self.assertRaises(StatusError):
+            publish_to_destinations(
+                [
+                    PublishDestination(name="OCI", send=failing, max_retries=1, retry_backoff_seconds=0),
+                    PublishDestination(name="DataNormalizationRegistry/v5", send=other),
+                ]
+            )
+        self.assertEqual(2, failing.calls)
+        self.assertEqual(1, other.calls)
+
+    def test_optional_failure_is_not_raised(self):
+        send = FlakySend(errors=[requests.HTTPError("Unauthorized")])
+        outcomes = publish_to_destinations([PublishDestination(name="Simplifier", send=send, required=False)])
+        self.assertIsInstance(outcomes["Simplifier"]["error"], requests.HTTPError)
+
+
+def make_groups(element_count: int) -> list:
+    return [
+        {
+            "source": "http://projectronin.io/fhir/CodeSystem/mdaoc/ObservationStatus",
+            "sourceVersion": "1",
+            "target": "http://hl7.org/fhir/observation-status",
+            "targetVersion": "4.0.1",
+            "element": [{"code": f"{i}", "target": [{"id": f"{i:03}"}]} for i in range(element_count)],
+        }
+    ]
+
+
+class ConceptMapPublishTests(unittest.TestCase):
+    """
+    ConceptMapVersion.publish serializes the mappings once and sends every output from them. The database, OCI,
+    Simplifier and the registry are replaced by mocks.
+    """
+
+    def make_concept_map_version(self) -> ConceptMapVersion:
+        concept_map_version = ConceptMapVersion.__new__(ConceptMapVersion)
+        concept_map_version.uuid = uuid.uuid4()
+        concept_map_version.concept_map = SimpleNamespace(uuid=uuid.uuid4(), publisher="Project Ronin")
+        concept_map_version.mappings = {"a source concept": []}
+        concept_map_version.status = "pending"
+        concept_map_version.published_date = None
+        concept_map_version.version = 3
+        return concept_map_version
+
+    def publish(self, concept_map_version, groups, simplifier_error=None):
+        """
+        Publish with the mocks in place, and return the OCI and Simplifier mocks and the groups that were published
+        """
+        def serialize(include_internal_info=False, schema_version=ConceptMap.next_schema_version,
+                      stream_elements=False, mapping_rows=None, groups=None):
+            return {
+                "resourceType": "ConceptMap",
+                "id": str(concept_map_version.concept_map.uuid),
+                "version": concept_map_version.version,
+                "status": concept_map_version.status,
+                "extension": [{"valueString": f"{schema_version}.0.0"}],
+                "group": groups,
+            }
+
+        registry_send = FlakySend()
+        with patch.object(ConceptMapVersion, "serialize_mappings", return_value=groups) as serialize_mappings, \
+                patch.object(ConceptMapVersion, "serialize", side_effect=serialize), \
+                patch.object(ConceptMapVersion, "version_set_status_active"), \
+                patch.object(ConceptMapVersion, "set_publication_date"), \
+                patch.object(ConceptMapVersion, "retire_and_obsolete_previous_version"), \
+                patch.object(ConceptMapVersion, "store_published_artifacts") as store, \
+                patch("app.concept_maps.models.set_up_and_save_to_object_store") as save, \
+                patch("app.concept_maps.models.publish_to_simplifier", side_effect=simplifier_error) as simplifier, \
+                patch(
+                    "app.models.data_ingestion_registry.DataNormalizationRegistry.publish_destinations",
+                    return_value=[PublishDestination(name="DataNormalizationRegistry/v5", send=registry_send)],
+                ):
+            concept_map_version.publish()
+        serialize_mappings.assert_called_once()
+        self.assertEqual(1, registry_send.calls)
+        return save, simplifier, store.call_args.kwargs["groups"]
+
+    def test_publish_sends_each_output_from_one_serialization(self):
+        groups = make_groups(60)
+        concept_map_version = self.make_concept_map_version()
+        save, simplifier, published_groups = self.publish(concept_map_version, groups)
+        self.assertEqual(60, len(published_groups[0]["element"]))
+
+        schema_versions = sorted({ConceptMap.database_schema_version, ConceptMap.next_schema_version})
+        self.assertEqual(len(schema_versions), save.call_count)
+        for call, schema_version in zip(sorted(save.call_args_list, key=lambda call: call.args[1]), schema_versions):
+            content, oci_path, is_overwrite_allowed = call.args
+            self.assertEqual(f"ConceptMaps/v{schema_version}/published/{concept_map_version.concept_map.uuid}/3.json",
+                             oci_path)
+            self.assertIs(published_groups, content["group"])
+
+        resource_type, resource_id, resource = simplifier.call_args.args
+        self.assertEqual("active", resource["status"])
+        self.assertEqual(50, len(resource["group"][0]["element"]))
+        # The shared groups are not truncated for Simplifier
+        self.assertEqual(60, len(published_groups[0]["element"]))
+
+    def test_simplifier_failure_does_not_fail_publish(self):
+        save, simplifier, published_groups = self.publish(
+            self.make_concept_map_version(), make_groups(1), simplifier_error=requests.HTTPError("Unauthorized")
+        )
+        simplifier.assert_called_once()
+
+    def test_publish_without_mappings_sends_nothing(self):
+        concept_map_version = self.make_concept_map_version()
+        with patch.object(ConceptMapVersion, "serialize_mappings", return_value=[]), \
+                patch.object(ConceptMapVersion, "serialize", return_value={"group": []}), \
+                patch("app.concept_maps.models.set_up_and_save_to_object_store") as save:
+            with self.assertRaises(BadRequestWithCode):
+                concept_map_version.publish()
+        save.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
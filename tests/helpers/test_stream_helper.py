@@ -0,0 +1,77 @@
+import datetime
+import gzip
+import json
+import unittest
+import uuid
+
+from flask import jsonify
+
+from app.app import create_app
+from app.helpers.stream_helper import StreamedArray, iter_json, gzip_chunks
+
+
+class StreamHelperTests(unittest.TestCase):
+    """
+    These tests need no database connection
+    """
+    def setUp(self) -> None:
+        self.app = create_app()
+        self.app.config.update({
+            "TESTING": True,
+        })
+
+    def envelope(self, contains):
+        return {
+            "resourceType": "ValueSet",
+            "id": uuid.UUID("ca75b03c-1763-44fd-9bfa-4fe015ff809c"),
+            "date": datetime.datetime(2023, 11, 2, 10, 30),
+            "title": "Testing ONLY: Ünicode \"quoted\" title",
+            "expansion": {
+                "contains": contains,
+                "timestamp": "2023-11-02",
+            },
+            "additionalData": {"synonyms": {}},
+        }
+
+    def test_iter_json_matches_jsonify(self):
+        members = [{"code": str(i), "display": f"Display {i}", "system": "http://loinc.org"} for i in range(1000)]
+        with self.app.app_context():
+            expected = json.loads(jsonify(self.envelope(members)).get_data(as_text=True))
+            streamed = "".join(
+                iter_json(self.envelope(StreamedArray(iter(members))), chunk_size=512)
+            )
+        self.assertEqual(expected, json.loads(streamed))
+
+    def test_iter_json_yields_chunks(self):
+        members = ({"code": str(i)} for i in range(1000))
+        with self.app.app_context():
+            chunks = list(iter_json(self.envelope(StreamedArray(members)), chunk_size=512))
+        self.assertGreater(len(chunks), 1)
+
+    def test_iter_json_empty_and_multiple_arrays(self):
+        envelope = {
+            "group": [
+                {"source": "a", "element": StreamedArray([])},
+                {"source": "b", "element": StreamedArray([{"code": "1"}, {"code": "2"}])},
+            ]
+        }
+        with self.app.app_context():
+            streamed = "".join(iter_json(envelope))
+        self.assertEqual(
+            {
+                "group": [
+                    {"source": "a", "element": []},
+                    {"source": "b", "element": [{"code": "1"}, {"code": "2"}]},
+                ]
+            },
+            json.loads(streamed),
+        )
+
+    def test_gzip_chunks(self):
+        chunks = [f'{{"code":"{i}"}}\n' for i in range(1000)]
+        compressed = b"".join(gzip_chunks(iter(chunks)))
+        self.assertEqual("".join(chunks), gzip.decompress(compressed).decode("utf-8"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,6 +3,7 @@ import json
 import unittest
 import uuid
 from unittest import skip
+from unittest.mock import patch
 
 from pytest import raises
 from sqlalchemy import text
@@ -10,11 +11,13 @@ from werkzeug.exceptions import NotFound
 
 import app.terminologies.models
 import app.models.codes
+import app.helpers.id_helper
 from app.app import create_app
 from app.database import get_db
 from app.errors import BadRequestWithCode
 from app.helpers.format_helper import prepare_depends_on_attributes_for_code_id, normalized_codeable_concept_string
 from app.helpers.id_helper import generate_code_id
+from app.helpers.interning_helper import InterningPool
 from app.terminologies.views import create_code_payload_to_code_list
 
 
@@ -274,6 +277,165 @@ class CodeClassTests(unittest.TestCase):
         assert codeable_concept.deduplication_hash == deduplication_hash
         assert deduplication_hash == code_id
 
+    def test_identity_hash_and_equality(self):
+        """
+        Tests Code.identity, Code.__hash__, Code.__eq__ and Code.__slots__
+        """
+        first_code = app.models.codes.Code.new_code(
+            code="Test Code",
+            display="Test Display",
+            system=None,
+            version=None,
+            terminology_version=self.example_terminology
+        )
+        second_code = app.models.codes.Code.new_code(
+            code="Test Code",
+            display="Test Display",
+            system=None,
+            version=None,
+            terminology_version=self.example_terminology,
+            additional_data={"source": "not part of the identity"}
+        )
+        self.assertFalse(hasattr(first_code, "__dict__"))
+        self.assertEqual(first_code, second_code)
+        self.assertEqual(hash(first_code), hash(second_code))
+        self.assertEqual(1, len({first_code, second_code}))
+
+        # Reassigning an identity attribute recomputes the identity
+        second_code.depends_on = app.models.codes.DependsOnData(
+            depends_on_property="Observation.code",
+            depends_on_value_schema=app.models.codes.DependsOnSchemas.STRING,
+            depends_on_value="Test Value",
+        )
+        self.assertNotEqual(first_code, second_code)
+        self.assertEqual(2, len({first_code, second_code}))
+        second_code.depends_on = None
+        self.assertEqual(first_code, second_code)
+
+    def test_identity_hash_of_text_only_codeable_concept(self):
+        """
+        A CodeableConcept with text and no coding has a hashable identity, and its hash is computed once
+        """
+        def make_code(depends_on=None):
+            return app.models.codes.Code(
+                code_schema=app.models.codes.RoninCodeSchemas.codeable_concept,
+                system=None,
+                version=None,
+                code=None,
+                display=None,
+                code_object=app.models.codes.FHIRCodeableConcept.deserialize({"text": "Hemolytic anemia"}),
+                terminology_version=self.example_terminology,
+                depends_on=depends_on,
+                from_custom_terminology=True,
+                custom_terminology_code_uuid=uuid.uuid4(),
+                custom_terminology_code_id="text only",
+            )
+
+        first_code = make_code()
+        second_code = make_code(
+            depends_on=app.models.codes.DependsOnData(
+                depends_on_property="Observation.code",
+                depends_on_value_schema=app.models.codes.DependsOnSchemas.CODEABLE_CONCEPT,
+                depends_on_value=app.models.codes.FHIRCodeableConcept.deserialize({"text": "Age at diagnosis"}),
+            )
+        )
+        self.assertIsNone(first_code.code_object.coding)
+        self.assertEqual("Hemolytic anemia", first_code.display)
+        self.assertEqual(hash(first_code), hash(make_code()))
+        self.assertEqual(first_code, make_code())
+        self.assertEqual(2, len({first_code, make_code(), second_code}))
+        self.assertEqual(hash(first_code.code_object), hash(make_code().code_object))
+
+        with patch.object(app.models.codes.FHIRCodeableConcept, "identity_key") as identity_key:
+            self.assertEqual(hash(first_code), hash(first_code))
+        identity_key.assert_not_called()
+
+    def test_deduplication_hash_cached_until_identity_changes(self):
+        """
+        Tests Code.deduplication_hash is calculated once, and again only after an identity attribute is reassigned
+        """
+        simple_code = app.models.codes.Code.new_code(
+            code="Test Code",
+            display="Test Display",
+            system=None,
+            version=None,
+            terminology_version=self.example_terminology
+        )
+        with patch(
+            "app.helpers.id_helper.generate_code_id", wraps=app.helpers.id_helper.generate_code_id
+        ) as mock_generate_code_id:
+            first_hash = simple_code.deduplication_hash
+            self.assertEqual(first_hash, simple_code.deduplication_hash)
+            self.assertEqual(1, mock_generate_code_id.call_count)
+
+            simple_code.additional_data = {"source": "not part of the identity"}
+            self.assertEqual(first_hash, simple_code.deduplication_hash)
+            self.assertEqual(1, mock_generate_code_id.call_count)
+
+            simple_code._display = "Other Display"
+            self.assertNotEqual(first_hash, simple_code.deduplication_hash)
+            self.assertEqual(2, mock_generate_code_id.call_count)
+
+    def test_from_rows_matches_constructor(self):
+        """
+        Tests Code.from_rows builds the same codes as the constructor, and checks the columns
+        """
+        rows = [
+            {"code_value": "Test Code 1", "display_value": "Test Display 1"},
+            {"code_value": "Test Code 2", "display_value": "Test Display 2"},
+        ]
+        codes = app.models.codes.Code.from_rows(
+            rows,
+            code_column="code_value",
+            display_column="display_value",
+            terminology_version=self.example_terminology,
+            from_custom_terminology=False,
+            from_fhir_terminology=False,
+        )
+        expected_codes = [
+            app.models.codes.Code(
+                system=None,
+                version=None,
+                code=row["code_value"],
+                display=row["display_value"],
+                terminology_version=self.example_terminology,
+                from_custom_terminology=False,
+                from_fhir_terminology=False,
+            )
+            for row in rows
+        ]
+        self.assertEqual(expected_codes, codes)
+        self.assertIs(self.example_terminology, codes[1].terminology_version)
+        self.assertEqual([], app.models.codes.Code.from_rows([], terminology_version=self.example_terminology))
+
+        with self.assertRaises(ValueError):
+            app.models.codes.Code.from_rows(
+                [{"code_value": "Test Code", "display_value": None}],
+                code_column="code_value",
+                display_column="display_value",
+                terminology_version=self.example_terminology,
+            )
+
+    def test_from_rows_interning(self):
+        """
+        Tests an InterningPool shares repeated code and display values
+        """
+        rows = [
+            {"code": "".join(["Test Code ", str(1)]), "display": "".join(["Test Display ", str(1)])}
+            for _ in range(2)
+        ]
+        interning_pool = InterningPool()
+        codes = app.models.codes.Code.from_rows(
+            rows,
+            terminology_version=self.example_terminology,
+            from_custom_terminology=False,
+            from_fhir_terminology=False,
+            interning_pool=interning_pool,
+        )
+        self.assertIs(codes[0].code, codes[1].code)
+        self.assertIs(codes[0].display, codes[1].display)
+        self.assertEqual(2, len(interning_pool))
+
 
 class CodeAPITests(unittest.TestCase):
     """
@@ -327,6 +489,49 @@ class CodeAPITests(unittest.TestCase):
     safe_term_uuid_fhir = "34eb844c-ffff-4462-ad6d-48af68f1e8a1"
     safe_term_uuid_std = "c96200d7-9e30-4a0c-b98e-22d0ff146a99"
 
+    def test_save_many_outcomes(self):
+        """
+        Code.save_many reports inserted, duplicate and failed codes, in input order. The test rolls back its inserts.
+        """
+        terminology = app.terminologies.models.Terminology.load(self.safe_term_uuid_dupl)
+        new_codes = [
+            app.models.codes.Code.new_code(
+                code=f"test code at {datetime.datetime.utcnow()} {i}",
+                display="test display",
+                terminology_version=terminology,
+            )
+            for i in range(3)
+        ]
+        repeated_code = app.models.codes.Code.new_code(
+            code=new_codes[0].code,
+            display="test display",
+            terminology_version=terminology,
+        )
+        saved_code = app.models.codes.Code.new_code(
+            code=new_codes[1].code,
+            display="test display",
+            terminology_version=terminology,
+        )
+        saved_code._saved_to_db = True
+
+        outcomes = app.models.codes.Code.save_many(new_codes + [repeated_code, saved_code], batch_size=2)
+
+        self.assertEqual(
+            ["inserted", "inserted", "inserted", "duplicate", "failed"],
+            [outcome.status for outcome in outcomes],
+        )
+        self.assertIs(repeated_code, outcomes[3].code)
+        self.assertIsNotNone(outcomes[4].error)
+
+        # Saving the same codes again finds them already in the terminology
+        outcomes = app.models.codes.Code.save_many(
+            [
+                app.models.codes.Code.new_code(code=code.code, display="test display", terminology_version=terminology)
+                for code in new_codes
+            ]
+        )
+        self.assertEqual(["duplicate"] * 3, [outcome.status for outcome in outcomes])
+
     def test_create_codeable_concept_happy(self):
         # Allow us to make multiple requests without database rolling back after each one
         self.app.config.update({
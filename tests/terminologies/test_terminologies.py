@@ -3,13 +3,18 @@ import unittest
 import uuid
 import time
 from datetime import datetime, date
+from types import SimpleNamespace
 from unittest import skip
+from unittest.mock import MagicMock, patch
 
 import app.terminologies.models
 import app.models.codes
+import app.errors
 from app.app import create_app
 from app.database import get_db
 from app.errors import NotFoundException
+from app.helpers.cache_helper import end_pending_invalidations
+from flask import Flask, g
 from pytest import raises
 
 
@@ -83,11 +88,48 @@ class TerminologyTests(unittest.TestCase):
             custom_terminology_code_uuid=uuid.uuid4(),
             saved_to_db=False
         )
-        with raises(Exception) as e:
-            duplicate_insert_test_terminology.load_new_codes_to_terminology([code1], on_conflict_do_nothing=True)
-        message = str(e.value)
-        assert '(psycopg2.errors.UniqueViolation) duplicate key value violates unique constraint "code_data_code_id"' in message
-        assert 'DETAIL:  Key (code_id, terminology_version_uuid)=(53effae39bebd4932ce94cae302cd044, 7e7d40aa-8987-4ad2-8f8b-fabdc7ba3800) already exists.' in message
+        code2 = app.models.codes.Code(
+            code=f"test code at {datetime.utcnow()}",
+            display="test display",
+            system=None,
+            version=None,
+            terminology_version=duplicate_insert_test_terminology,
+            custom_terminology_code_uuid=uuid.uuid4(),
+            saved_to_db=False
+        )
+        inserted_count = duplicate_insert_test_terminology.load_new_codes_to_terminology(
+            [code1, code2], on_conflict_do_nothing=True
+        )
+        assert inserted_count == 1
+
+    def test_load_new_codes_with_outcomes(self) -> None:
+        """
+        Bulk ingestion reports each code as inserted or skipped as a duplicate, in input order. Without
+        on_conflict_do_nothing, a batch containing a code already in the terminology loads nothing.
+        """
+        terminology = app.terminologies.models.Terminology.load(self.safe_term_uuid_dupl)
+
+        def new_codes():
+            return [
+                app.models.codes.Code.new_code(code="booked", display="booked", terminology_version=terminology),
+                app.models.codes.Code.new_code(
+                    code=f"test code at {datetime.utcnow()}", display="test display", terminology_version=terminology
+                ),
+            ]
+
+        with raises(app.errors.BadRequestWithCode) as e:
+            terminology.load_new_codes_with_outcomes(new_codes(), on_conflict_do_nothing=False)
+        assert e.value.code == "Terminology.load_new_codes.duplicate_codes"
+        assert e.value.http_status_code == 409
+
+        codes = new_codes()
+        repeated_code = app.models.codes.Code.new_code(
+            code=codes[1].code, display="test display", terminology_version=terminology
+        )
+        outcomes = terminology.load_new_codes_with_outcomes(codes + [repeated_code], on_conflict_do_nothing=True)
+        assert [outcome.status for outcome in outcomes] == ["duplicate", "inserted", "duplicate"]
+        assert [outcome.code for outcome in outcomes] == codes + [repeated_code]
+        assert terminology.existing_code_ids({codes[1].deduplication_hash}) == {codes[1].deduplication_hash}
 
     def test_get_terminology_happy(self):
         """
@@ -468,5 +510,156 @@ class TerminologyTests(unittest.TestCase):
         assert error_text in result.get("message")
 
 
+def terminology_version_row(terminology_version_uuid, terminology, version, fhir_uri):
+    return SimpleNamespace(
+        uuid=terminology_version_uuid,
+        terminology=terminology,
+        version=version,
+        effective_start=date(2024, 1, 1),
+        effective_end=date(2030, 12, 31),
+        fhir_uri=fhir_uri,
+        fhir_terminology=False,
+        is_standard=False,
+    )
+
+
+class TerminologyRegistryTests(unittest.TestCase):
+    """
+    The registry is filled from rows, and the database is a mock, so these tests need no database.
+    """
+    def setUp(self) -> None:
+        self.registry = app.terminologies.models.TerminologyRegistry()
+        self.registry.load_rows([
+            terminology_version_row(uuid.UUID("d2ae0de5-0168-4f54-924a-1f79cf658939"), "Test ONLY", "1", "http://test1"),
+            terminology_version_row(uuid.UUID("7e7d40aa-8987-4ad2-8f8b-fabdc7ba3800"), "Test ONLY", "2", "http://test1"),
+        ])
+        self.conn = MagicMock()
+        self.conn.execute.return_value.first.return_value = None
+        self.patch = patch("app.terminologies.models.get_db", return_value=self.conn)
+        self.patch.start()
+
+    def tearDown(self) -> None:
+        self.patch.stop()
+
+    def test_lookups_use_indexes(self):
+        by_uuid = self.registry.get_by_uuid("7e7d40aa-8987-4ad2-8f8b-fabdc7ba3800")
+        self.assertIs(by_uuid, self.registry.get_by_uuid(uuid.UUID("7e7d40aa-8987-4ad2-8f8b-fabdc7ba3800")))
+        self.assertIs(by_uuid, self.registry.get_by_fhir_uri_and_version("http://test1", "2"))
+        self.assertIs(by_uuid, self.registry.get_by_terminology_and_version("Test ONLY", 2))
+        self.conn.execute.assert_not_called()
+
+    def test_missing_key_loaded_on_its_own(self):
+        self.assertIsNone(self.registry.get_by_fhir_uri_and_version("http://test1", "3"))
+        self.assertIsNone(self.registry.get_by_fhir_uri_and_version("http://test1", "3"))
+        self.assertEqual(1, self.conn.execute.call_count)
+
+        # A version created since the load is added
+        new_row = terminology_version_row(uuid.uuid4(), "Test ONLY", "4", "http://test1")
+        self.conn.execute.return_value.first.return_value = new_row
+        terminology = self.registry.get_by_fhir_uri_and_version("http://test1", "4")
+        self.assertEqual(new_row.uuid, terminology.uuid)
+        self.assertIs(terminology, self.registry.get_by_uuid(new_row.uuid))
+        self.assertEqual(2, self.conn.execute.call_count)
+        self.assertIsNotNone(self.registry.get_by_uuid("d2ae0de5-0168-4f54-924a-1f79cf658939"))
+
+    def test_invalidation_loads_every_version_again(self):
+        self.assertIsNone(self.registry.get_by_fhir_uri_and_version("http://test1", "3"))
+        self.registry.clear_local()
+        self.assertIsNone(self.registry.loaded_at)
+        self.assertEqual({}, self.registry.by_uuid)
+
+        rows = [
+            terminology_version_row(uuid.UUID("7e7d40aa-8987-4ad2-8f8b-fabdc7ba3800"), "Test ONLY", "2", "http://test1"),
+            terminology_version_row(uuid.uuid4(), "Test ONLY", "3", "http://test1"),
+        ]
+        self.conn.execute.return_value.fetchall.return_value = rows
+        with patch("app.terminologies.models.listen_for_invalidations"):
+            terminology = self.registry.get_by_fhir_uri_and_version("http://test1", "3")
+        self.assertEqual(rows[1].uuid, terminology.uuid)
+        # The version deleted since the first load is gone
+        self.assertNotIn("d2ae0de5-0168-4f54-924a-1f79cf658939", self.registry.by_uuid)
+
+    def test_version_read_in_request_added_after_commit(self):
+        flask_app = Flask(__name__)
+        new_row = terminology_version_row(uuid.uuid4(), "Test ONLY", "3", "http://test1")
+        self.conn.execute.return_value.first.return_value = new_row
+        with flask_app.app_context():
+            with flask_app.test_request_context():
+                g.db = MagicMock()
+                self.assertEqual(new_row.uuid, self.registry.get_by_fhir_uri_and_version("http://test1", "3").uuid)
+                # Until the request commits, other requests must not see the version
+                self.assertNotIn(str(new_row.uuid), self.registry.by_uuid)
+                end_pending_invalidations(committed=True)
+            self.assertIn(str(new_row.uuid), self.registry.by_uuid)
+
+            with flask_app.test_request_context():
+                g.db = MagicMock()
+                self.conn.execute.return_value.first.return_value = None
+                self.assertIsNone(self.registry.get_by_fhir_uri_and_version("http://test1", "5"))
+                end_pending_invalidations(committed=False)
+            self.assertEqual(set(), self.registry.not_found)
+
+
+class LoadNewCodesTests(unittest.TestCase):
+    """
+    The savepoints of load_new_codes_to_terminology, with the database and Code.save_many replaced by mocks, so these
+    tests need no database.
+    """
+    def setUp(self) -> None:
+        self.terminology = app.terminologies.models.Terminology(
+            uuid=uuid.uuid4(),
+            terminology="Test ONLY",
+            version="1",
+            effective_start=date(2024, 1, 1),
+            effective_end=date(2030, 12, 31),
+            fhir_uri="http://test1",
+            fhir_terminology=False,
+            is_standard=False,
+        )
+        self.codes = [SimpleNamespace(deduplication_hash=f"code-{i}", _saved_to_db=False) for i in range(3)]
+        self.savepoints = []
+        self.conn = MagicMock()
+        self.conn.begin_nested.side_effect = lambda: self.savepoints.append(MagicMock()) or self.savepoints[-1]
+        self.patches = [
+            patch("app.terminologies.models.get_db", return_value=self.conn),
+            patch.object(app.terminologies.models.Terminology, "validate_new_codes"),
+            patch.object(app.terminologies.models.Terminology, "existing_code_ids", return_value=set()),
+        ]
+        for started in self.patches:
+            started.start()
+
+    def tearDown(self) -> None:
+        for started in self.patches:
+            started.stop()
+
+    def save_many(self, statuses):
+        def save_many(codes):
+            outcomes = []
+            for code, status in zip(codes, statuses):
+                code._saved_to_db = status == "inserted"
+                outcomes.append(app.models.codes.CodeSaveOutcome(code, status, "bad code" if status == "failed" else None))
+            return outcomes
+        return patch.object(app.models.codes.Code, "save_many", side_effect=save_many)
+
+    def test_failed_code_rolls_back_inserted_codes(self):
+        with self.save_many(["inserted", "failed", "inserted"]):
+            with raises(app.errors.BadRequestWithCode) as e:
+                self.terminology.load_new_codes_to_terminology(self.codes, on_conflict_do_nothing=True)
+        assert e.value.code == "Terminology.load_new_codes.failed_codes"
+        # The inner savepoint released the inserted codes, and the outer one rolls them back
+        outer_savepoint, inner_savepoint = self.savepoints
+        inner_savepoint.commit.assert_called_once()
+        outer_savepoint.rollback.assert_called_once()
+        outer_savepoint.commit.assert_not_called()
+        assert [code._saved_to_db for code in self.codes] == [False, False, False]
+
+    def test_codes_are_committed_to_the_savepoint(self):
+        with self.save_many(["inserted", "inserted", "inserted"]):
+            assert self.terminology.load_new_codes_to_terminology(self.codes) == 3
+        for savepoint in self.savepoints:
+            savepoint.commit.assert_called_once()
+            savepoint.rollback.assert_not_called()
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,235 @@
+import unittest
+import uuid
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from sqlalchemy import text
+
+import app.value_sets.models
+from app.app import create_app
+from app.database import get_db
+from app.value_sets.expansion_job_models import ExpansionJob
+
+
+class ExpansionJobTests(unittest.TestCase):
+    """
+    ExpansionJob.submit commits, so that a worker can see the job: each test deletes the jobs it created.
+    """
+    # 'Automated Testing Value Set' version, expected status is in progress: see test_value_sets.py
+    safe_value_set_uuid_auto_tool_version = "58e792d9-1264-4f18-b16e-6292cb7ca597"
+
+    def setUp(self) -> None:
+        self.conn = get_db()
+        self.app = create_app()
+        self.app.config.update(
+            {
+                "TESTING": True,
+            }
+        )
+        self.client = self.app.test_client()
+
+    def tearDown(self) -> None:
+        self.conn.rollback()
+        self.conn.execute(
+            text(
+                """
+                delete from value_sets.expansion_job
+                where vs_version_uuid = :vs_version_uuid
+                """
+            ),
+            {"vs_version_uuid": self.safe_value_set_uuid_auto_tool_version},
+        )
+        self.conn.commit()
+        self.conn.close()
+
+    def test_duplicate_submissions_coalesce(self):
+        with patch("app.tasks.expand_value_set_version.delay") as mock_delay:
+            first_job = ExpansionJob.submit(self.safe_value_set_uuid_auto_tool_version)
+            second_job = ExpansionJob.submit(self.safe_value_set_uuid_auto_tool_version)
+
+        mock_delay.assert_called_once_with(str(first_job.uuid))
+        self.assertFalse(first_job.coalesced)
+        self.assertTrue(second_job.coalesced)
+        self.assertEqual(first_job.uuid, second_job.uuid)
+        self.assertEqual("queued", second_job.status)
+
+    def test_run_reports_phases_and_completes(self):
+        with patch("app.tasks.expand_value_set_version.delay"):
+            job = ExpansionJob.submit(
+                self.safe_value_set_uuid_auto_tool_version, force_new=True
+            )
+
+        reported_phases = []
+        update_progress = job.update_progress
+
+        def record_progress(phase, completed, total):
+            reported_phases.append(phase)
+            update_progress(phase, completed, total)
+
+        job.update_progress = record_progress
+        job.run()
+
+        loaded_job = ExpansionJob.load(job.uuid)
+        self.assertEqual("complete", loaded_job.status)
+        self.assertIsNotNone(loaded_job.expansion_uuid)
+        self.assertEqual("save", loaded_job.phase)
+        self.assertEqual(loaded_job.phase_total, loaded_job.phase_completed)
+        self.assertEqual(
+            app.value_sets.models.EXPANSION_PHASES,
+            list(dict.fromkeys(reported_phases)),
+        )
+
+    def test_poll_job(self):
+        with patch("app.tasks.expand_value_set_version.delay"):
+            response = self.client.post(
+                f"/ValueSets/{self.safe_value_set_uuid_auto_tool_version}/expansion_jobs"
+            )
+        self.assertEqual(202, response.status_code)
+
+        poll_response = self.client.get(response.headers["Location"])
+        self.assertEqual(200, poll_response.status_code)
+        self.assertEqual("queued", poll_response.json["status"])
+
+
+def make_job_row(status="queued", force_new=False, vs_version_uuid=None, after_job_uuid=None):
+    """
+    A value_sets.expansion_job row
+    """
+    return SimpleNamespace(
+        uuid=uuid.uuid4(),
+        vs_version_uuid=vs_version_uuid or uuid.uuid4(),
+        force_new=force_new,
+        status=status,
+        phase=None,
+        phase_completed=None,
+        phase_total=None,
+        expansion_uuid=None,
+        error=None,
+        created_date=None,
+        updated_date=None,
+        after_job_uuid=after_job_uuid,
+    )
+
+
+class ExpansionJobMockTests(unittest.TestCase):
+    """
+    Races and edge cases that are hard to arrange in the database: the connection and the value set version are
+    replaced by mocks.
+    """
+
+    def setUp(self) -> None:
+        self.patches = [
+            patch("app.value_sets.expansion_job_models.get_db"),
+            patch("app.value_sets.models.ValueSetVersion.load"),
+            patch("app.tasks.expand_value_set_version.delay"),
+        ]
+        self.conn = self.patches[0].start().return_value
+        self.load_version = self.patches[1].start()
+        self.delay = self.patches[2].start()
+
+    def tearDown(self) -> None:
+        for p in self.patches:
+            p.stop()
+
+    def test_submit_retries_when_active_job_finishes(self):
+        new_job = make_job_row()
+        # abandon stale jobs, insert (conflict), select (the active job has just finished), insert
+        self.conn.execute.return_value.first.side_effect = [None, None, new_job]
+        job = ExpansionJob.submit(new_job.vs_version_uuid)
+
+        self.assertEqual(new_job.uuid, job.uuid)
+        self.assertFalse(job.coalesced)
+        self.delay.assert_called_once_with(str(new_job.uuid))
+
+    def test_submit_coalesces_onto_active_job(self):
+        active_job = make_job_row(status="running")
+        self.conn.execute.return_value.first.side_effect = [None, active_job]
+        job = ExpansionJob.submit(active_job.vs_version_uuid)
+
+        self.assertEqual(active_job.uuid, job.uuid)
+        self.assertTrue(job.coalesced)
+        self.delay.assert_not_called()
+
+    def test_extensional_value_set_is_skipped(self):
+        vs_version = MagicMock()
+        vs_version.value_set.type = "extensional"
+        self.load_version.return_value = vs_version
+        job = ExpansionJob.from_row(make_job_row())
+        job.run()
+
+        self.assertEqual("skipped", job.status)
+        self.assertIsNotNone(job.error)
+        self.assertIsNone(job.expansion_uuid)
+        vs_version.create_expansion.assert_not_called()
+        saved_states = [
+            call.args[1]["status"] for call in self.conn.execute.call_args_list if "status" in call.args[1]
+        ]
+        self.assertEqual(["running", "skipped"], saved_states)
+
+    def test_forced_submit_coalesces_onto_forced_active_job(self):
+        active_job = make_job_row(status="running", force_new=True)
+        self.conn.execute.return_value.first.side_effect = [None, active_job]
+        job = ExpansionJob.submit(active_job.vs_version_uuid, force_new=True)
+
+        self.assertEqual(active_job.uuid, job.uuid)
+        self.assertTrue(job.coalesced)
+        self.delay.assert_not_called()
+
+    def test_forced_submit_waits_for_active_job(self):
+        active_job = make_job_row(status="running")
+        waiting_job = make_job_row(
+            status="waiting", force_new=True, vs_version_uuid=active_job.vs_version_uuid, after_job_uuid=active_job.uuid
+        )
+        # abandon stale jobs, insert (conflict), select the active job, insert the waiting job
+        self.conn.execute.return_value.first.side_effect = [None, active_job, waiting_job]
+        job = ExpansionJob.submit(active_job.vs_version_uuid, force_new=True)
+
+        self.assertEqual(waiting_job.uuid, job.uuid)
+        self.assertEqual("waiting", job.status)
+        self.assertFalse(job.coalesced)
+        self.assertEqual(str(active_job.uuid), self.conn.execute.call_args.args[1]["after_job_uuid"])
+        self.delay.assert_not_called()
+
+    def test_forced_submit_coalesces_onto_waiting_job(self):
+        active_job = make_job_row(status="queued")
+        waiting_job = make_job_row(
+            status="waiting", force_new=True, vs_version_uuid=active_job.vs_version_uuid, after_job_uuid=active_job.uuid
+        )
+        self.conn.execute.return_value.first.side_effect = [None, active_job, None, waiting_job]
+        job = ExpansionJob.submit(active_job.vs_version_uuid, force_new=True)
+
+        self.assertEqual(waiting_job.uuid, job.uuid)
+        self.assertTrue(job.coalesced)
+        self.delay.assert_not_called()
+
+    def test_finished_job_queues_waiting_job(self):
+        vs_version = MagicMock()
+        vs_version.value_set.type = "extensional"
+        self.load_version.return_value = vs_version
+        job = ExpansionJob.from_row(make_job_row())
+        waiting_job = make_job_row(
+            status="queued", force_new=True, vs_version_uuid=job.vs_version_uuid, after_job_uuid=job.uuid
+        )
+        self.conn.execute.return_value.__iter__.return_value = [waiting_job]
+        job.run()
+
+        self.assertEqual([str(job.uuid)], self.conn.execute.call_args.args[1]["after_job_uuids"])
+        self.delay.assert_called_once_with(str(waiting_job.uuid))
+
+    def test_submit_fails_job_that_cannot_be_queued(self):
+        new_job = make_job_row()
+        self.conn.execute.return_value.first.side_effect = [new_job]
+        self.delay.side_effect = ConnectionError("broker unavailable")
+        job = ExpansionJob.submit(new_job.vs_version_uuid)
+
+        self.assertEqual("failed", job.status)
+        self.assertEqual("ConnectionError", job.error)
+        saved_states = [
+            call.args[1]["status"] for call in self.conn.execute.call_args_list if "status" in call.args[1]
+        ]
+        self.assertEqual(["failed"], saved_states)
+        self.conn.commit.assert_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
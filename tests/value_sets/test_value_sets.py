@@ -1,6 +1,10 @@
+import csv
+import gzip
 import hashlib
+import io
 import json
 import unittest
+from collections import namedtuple
 from unittest.mock import patch, Mock
 
 from pytest import raises
@@ -126,6 +130,70 @@ class ValueSetTests(unittest.TestCase):
 
         self.assertEqual(11509, len(value_set_version.expansion))
 
+    def test_value_set_expand_paged(self):
+        """
+        Page through the stored expansion of the 'Automated Testing Value Set' via $expand offset and count,
+        and verify the pages are stable, do not overlap, and report the full total
+        """
+        first_page = self.client.get(
+            f"/ValueSet/{self.safe_value_set_uuid_auto_tool_version}/$expand?offset=0&count=10"
+        ).json["expansion"]
+        second_page = self.client.get(
+            f"/ValueSet/{self.safe_value_set_uuid_auto_tool_version}/$expand?offset=10&count=10"
+        ).json["expansion"]
+        first_page_again = self.client.get(
+            f"/ValueSet/{self.safe_value_set_uuid_auto_tool_version}/$expand?offset=0&count=10"
+        ).json["expansion"]
+
+        self.assertEqual(10, len(first_page["contains"]))
+        self.assertEqual(10, len(second_page["contains"]))
+        self.assertEqual(first_page["total"], second_page["total"])
+        self.assertEqual(0, first_page["offset"])
+        self.assertEqual(10, second_page["offset"])
+        self.assertEqual(first_page["contains"], first_page_again["contains"])
+        for member in second_page["contains"]:
+            self.assertNotIn(member, first_page["contains"])
+
+    def test_value_set_expand_filtered(self):
+        """
+        A $expand filter is matched case-insensitively against the display of each member
+        """
+        response = self.client.get(
+            f"/ValueSet/{self.safe_value_set_uuid_auto_tool_version}/$expand?filter=BLOOD&count=5"
+        )
+        expansion = response.json["expansion"]
+        self.assertLessEqual(len(expansion["contains"]), 5)
+        self.assertGreaterEqual(expansion["total"], len(expansion["contains"]))
+        for member in expansion["contains"]:
+            self.assertIn("blood", (member["display"] + member["code"]).lower())
+
+    def test_value_set_expand_filter_ignores_json_keys(self):
+        """
+        A $expand filter matches the codes, displays and text of CodeableConcept members, not their JSON keys or
+        system URIs, so a filter such as "coding" or "system" does not match every CodeableConcept member
+        """
+        for filter_text in ("coding", "system"):
+            response = self.client.get(
+                f"/ValueSet/{self.safe_value_set_uuid_auto_tool_version}/$expand?filter={filter_text}&count=50"
+            )
+            for member in response.json["expansion"]["contains"]:
+                searched = [member["display"]]
+                code = member["code"]
+                if isinstance(code, dict):
+                    searched.append(code.get("text") or "")
+                    for coding in code.get("coding") or []:
+                        searched.extend([coding.get("code") or "", coding.get("display") or ""])
+                else:
+                    searched.append(code)
+                self.assertIn(filter_text, " ".join(searched).lower())
+
+    def test_value_set_expand_bad_paging_parameter(self):
+        response = self.client.get(
+            f"/ValueSet/{self.safe_value_set_uuid_auto_tool_version}/$expand?count=-1"
+        )
+        self.assertEqual(400, response.status_code)
+        self.assertEqual("ValueSet.expand.parameter", response.json["code"])
+
     def test_custom_terminology_code_schema_value_set(self):
         """
         Tests making a new expansion and loading the expansion for custom terminology value set.
@@ -655,6 +723,101 @@ class ValueSetTests(unittest.TestCase):
             == f"No Value Set Version found with UUID: {self.safe_term_uuid_dupl}"
         )
 
+    def test_diff_version_against_itself(self):
+        """
+        A value set version compared to itself has no removed, added or display-changed codes
+        """
+        diff = app.value_sets.models.ValueSetVersion.diff_for_removed_and_added_codes(
+            self.safe_value_set_uuid_auto_tool_version,
+            self.safe_value_set_uuid_auto_tool_version,
+        )
+        self.assertEqual([], diff["removed_codes"])
+        self.assertEqual([], diff["added_codes"])
+        self.assertEqual([], diff["display_changed_codes"])
+        self.assertEqual(
+            {"removed": 0, "added": 0, "display_changed": 0}, diff["counts"]
+        )
+
+    def test_diff_counts_only(self):
+        """
+        The counts_only diff returns the same counts as the full diff, without the lists of codes
+        """
+        full_diff = app.value_sets.models.ValueSetVersion.diff_for_removed_and_added_codes(
+            self.custom_terminology_value_set_version,
+            self.safe_value_set_uuid_auto_tool_version,
+        )
+        counts_diff = app.value_sets.models.ValueSetVersion.diff_for_removed_and_added_codes(
+            self.custom_terminology_value_set_version,
+            self.safe_value_set_uuid_auto_tool_version,
+            counts_only=True,
+        )
+        self.assertEqual({"counts": full_diff["counts"]}, counts_diff)
+        self.assertEqual(len(full_diff["removed_codes"]), full_diff["counts"]["removed"])
+        self.assertEqual(len(full_diff["added_codes"]), full_diff["counts"]["added"])
+
+    def test_export_expansion_ndjson_and_csv(self):
+        """
+        The NDJSON and CSV exports of an expansion have one line per member (plus a header row for CSV),
+        and the gzip option returns the same content compressed
+        """
+        value_set_version = app.value_sets.models.ValueSetVersion.load(
+            self.safe_value_set_uuid_auto_tool_version
+        )
+        value_set_version.expand()
+        member_count = len(value_set_version.expansion)
+
+        ndjson_response = self.client.get(
+            f"/ValueSets/{self.safe_value_set_uuid_auto_tool_version}/expansion/export"
+        )
+        lines = ndjson_response.get_data(as_text=True).splitlines()
+        self.assertEqual("application/x-ndjson", ndjson_response.mimetype)
+        self.assertEqual(member_count, len(lines))
+        self.assertEqual(
+            {"code_schema", "code", "display", "system", "version"},
+            set(json.loads(lines[0]).keys()),
+        )
+
+        csv_response = self.client.get(
+            f"/ValueSets/{self.safe_value_set_uuid_auto_tool_version}/expansion/export?format=csv"
+        )
+        csv_rows = list(csv.reader(io.StringIO(csv_response.get_data(as_text=True))))
+        self.assertEqual(["code_schema", "code", "display", "system", "version"], csv_rows[0])
+        self.assertEqual(member_count, len(csv_rows) - 1)
+
+        gzip_response = self.client.get(
+            f"/ValueSets/{self.safe_value_set_uuid_auto_tool_version}/expansion/export?gzip=true"
+        )
+        self.assertEqual("gzip", gzip_response.headers["Content-Encoding"])
+        self.assertEqual(
+            ndjson_response.get_data(), gzip.decompress(gzip_response.get_data())
+        )
+
+    def test_export_expansion_unsupported_format(self):
+        response = self.client.get(
+            f"/ValueSets/{self.safe_value_set_uuid_auto_tool_version}/expansion/export?format=xml"
+        )
+        self.assertEqual(400, response.status_code)
+        self.assertEqual("ValueSetVersion.export.format", response.json["code"])
+
+    def test_expand_streams_stored_expansion(self):
+        """
+        $expand streams the members of the stored expansion from the database: they are the members that
+        expand() loads as Codes
+        """
+        value_set_version = app.value_sets.models.ValueSetVersion.load(
+            self.safe_value_set_uuid_auto_tool_version
+        )
+        value_set_version.expand()
+        response = self.client.get(
+            f"/ValueSet/{self.safe_value_set_uuid_auto_tool_version}/$expand"
+        )
+        contains = response.json["expansion"]["contains"]
+        self.assertEqual(len(value_set_version.expansion), len(contains))
+        self.assertEqual(
+            sorted(json.dumps(code.serialize(), sort_keys=True) for code in value_set_version.expansion),
+            sorted(json.dumps(member, sort_keys=True) for member in contains),
+        )
+
     def test_expansion_report(self):
         response = self.client.get(
             f"/ValueSets/expansions/{self.safe_value_set_uuid_auto_tool_expansion}/report"
@@ -664,5 +827,64 @@ class ValueSetTests(unittest.TestCase):
         )
 
 
+
+ExpansionMemberRow = namedtuple(
+    "ExpansionMemberRow", ["code_schema", "code_simple", "code_jsonb", "display", "system", "version"]
+)
+
+
+class StoredExpansionContainsTests(unittest.TestCase):
+    """
+    iter_stored_expansion_contains serializes expansion members from their rows, with the database connection
+    replaced by a mock
+    """
+
+    def test_members_serialized_from_rows(self):
+        value_set_version = app.value_sets.models.ValueSetVersion.__new__(
+            app.value_sets.models.ValueSetVersion
+        )
+        value_set_version.expansion_uuid = "6e3a8c1e-0b5e-11ee-8f4a-0242ac120002"
+        codeable_concept = {
+            "coding": [{"system": "http://loinc.org", "code": "1-8", "display": "Acyclovir"}],
+            "text": "Acyclovir",
+        }
+        rows = [
+            ExpansionMemberRow("code", "1-8", None, "Acyclovir", "http://loinc.org", "2.74"),
+            ExpansionMemberRow(
+                "http://projectronin.io/fhir/StructureDefinition/ronin-conceptMapSourceCodeableConcept",
+                None,
+                codeable_concept,
+                "Acyclovir",
+                "http://projectronin.io/fhir/CodeSystem/test",
+                "1",
+            ),
+        ]
+        conn = Mock()
+        conn.execute.return_value.partitions.return_value = iter([rows[:1], rows[1:]])
+        with patch("app.value_sets.models.get_db", return_value=conn), patch.object(
+            app.models.codes.Code, "from_rows", side_effect=AssertionError("no Codes are built")
+        ):
+            contains = list(value_set_version.iter_stored_expansion_contains(batch_size=1))
+
+        self.assertEqual(
+            [
+                {"system": "http://loinc.org", "version": "2.74", "code": "1-8", "display": "Acyclovir"},
+                {
+                    "system": "http://projectronin.io/fhir/CodeSystem/test",
+                    "version": "1",
+                    "code": {
+                        "text": "Acyclovir",
+                        "coding": [{"code": "1-8", "display": "Acyclovir", "system": "http://loinc.org"}],
+                    },
+                    "display": "Acyclovir",
+                },
+            ],
+            contains,
+        )
+        self.assertEqual(
+            {"expansion_uuid": value_set_version.expansion_uuid}, conn.execute.call_args.args[1]
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,332 @@
+import datetime
+import timeit
+import tracemalloc
+import uuid
+from collections import namedtuple
+from types import SimpleNamespace
+from unittest import skip
+from unittest.mock import patch
+
+import app.concept_maps.models
+import app.helpers.data_helper
+import app.helpers.format_helper
+import app.helpers.id_helper
+import app.models.codes
+import app.terminologies.models
+
+
+def make_benchmark_terminology():
+    """
+    An in-memory Terminology, so that benchmarks of model classes need no database connection.
+    """
+    return app.terminologies.models.Terminology(
+        uuid=uuid.uuid4(),
+        terminology="benchmark_terminology",
+        version="1",
+        effective_start=datetime.date(2024, 1, 1),
+        effective_end=datetime.date(2024, 12, 31),
+        fhir_uri="http://benchmark_url",
+        fhir_terminology=False,
+        is_standard=False,
+    )
+
+
+def make_benchmark_codes(terminology, count: int):
+    return [
+        app.models.codes.Code(
+            system=None,
+            version=None,
+            code=f"code-{i}",
+            display=f"Display for code {i}",
+            terminology_version=terminology,
+            from_custom_terminology=False,
+            from_fhir_terminology=False,
+        )
+        for i in range(count)
+    ]
+
+
+@skip("This is a utility, not a test. Use only to measure model performance on a local dev machine.")
+def test_benchmark_code_sets():
+    """
+    Not a test. Prints the memory used by Code instances and the time taken by the set operations
+    that expansions and concept maps perform on them. Adjust code_count as needed.
+    """
+    code_count = 200000
+    terminology = make_benchmark_terminology()
+
+    tracemalloc.start()
+    codes = make_benchmark_codes(terminology, code_count)
+    memory_used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{code_count} Codes: {memory_used / code_count:.0f} bytes per Code")
+
+    duplicates = make_benchmark_codes(terminology, code_count)
+    build_seconds = timeit.timeit(lambda: set(codes), number=5) / 5
+    code_set = set(codes)
+    lookup_seconds = timeit.timeit(lambda: sum(1 for code in duplicates if code in code_set), number=5) / 5
+    difference_seconds = timeit.timeit(lambda: code_set.difference(duplicates), number=5) / 5
+    print(f"Build a set: {build_seconds:.3f}s")
+    print(f"Look up equal Codes in the set: {lookup_seconds:.3f}s")
+    print(f"Set difference with equal Codes: {difference_seconds:.3f}s")
+
+
+@skip("This is a utility, not a test. Use only to measure model performance on a local dev machine.")
+def test_benchmark_codeable_concept_serialization():
+    """
+    Not a test. Prints the time taken to normalize and serialize source CodeableConcepts for hashing, as code_id
+    generation does, in two steps and in the single pass of normalized_source_codeable_concept_string().
+    """
+    concept_count = 100000
+    concepts = [
+        {
+            "coding": [
+                {"code": f"{i}-{j}", "display": f"Display {i} {j}", "system": "urn:oid:2.16.840.1.113883.6.96"}
+                for j in range(4, 0, -1)
+            ],
+            "text": f"Concept {i}",
+        }
+        for i in range(concept_count)
+    ]
+    two_step_seconds = timeit.timeit(
+        lambda: [
+            app.helpers.data_helper.serialize_json_object(
+                app.helpers.data_helper.normalized_source_codeable_concept(concept)
+            )
+            for concept in concepts
+        ],
+        number=3,
+    ) / 3
+    one_pass_seconds = timeit.timeit(
+        lambda: [app.helpers.data_helper.normalized_source_codeable_concept_string(concept) for concept in concepts],
+        number=3,
+    ) / 3
+    print(f"{concept_count} CodeableConcepts in two steps: {two_step_seconds:.3f}s")
+    print(f"{concept_count} CodeableConcepts in one pass: {one_pass_seconds:.3f}s")
+
+
+@skip("This is a utility, not a test. Use only to measure model performance on a local dev machine.")
+def test_benchmark_spark_export_conversion():
+    """
+    Not a test. Prints the time taken to convert spark export source concepts, as the v5 migrations do for each row.
+    Compare against an earlier commit to measure a change. Adjust concept_count as needed.
+    """
+    concept_count = 100000
+    spark_export_strings = [
+        f"{{[{{{i}, Display {i}, http://snomed.info/sct}}, {{R{i}.9, Display, with commas {i}, urn:oid:2.16.840.1.113883.6.90}}"
+        f", {{{i}-2, null, http://loinc.org}}], Text {i}}}"
+        for i in range(concept_count)
+    ]
+    unordered_seconds = timeit.timeit(
+        lambda: [
+            app.helpers.format_helper.convert_source_concept_spark_export_string_to_json_string_unordered(value)
+            for value in spark_export_strings
+        ],
+        number=3,
+    ) / 3
+    ordered_seconds = timeit.timeit(
+        lambda: [
+            app.helpers.format_helper.convert_source_concept_spark_export_string_to_json_string_normalized_ordered(value)
+            for value in spark_export_strings
+        ],
+        number=3,
+    ) / 3
+    print(f"{concept_count} spark export strings to unordered JSON: {unordered_seconds:.3f}s")
+    print(f"{concept_count} spark export strings to normalized, ordered JSON: {ordered_seconds:.3f}s")
+
+
+@skip("This is a utility, not a test. Use only to measure model performance on a local dev machine.")
+def test_benchmark_source_concept_columns():
+    """
+    Not a test. Prints the time taken to prepare one page of v5 migration rows, row by row and as columns.
+    Each source concept appears with distinct_depends_on_count depends_on values, as in concept map data.
+    """
+    row_count = 50000
+    distinct_depends_on_count = 5
+    codes = [
+        f'{{"coding":[{{"code":"{i // distinct_depends_on_count}","system":"urn:oid:2.16.840.1.113883.6.96"}}],'
+        f'"text":"Concept {i // distinct_depends_on_count}"}}'
+        for i in range(row_count)
+    ]
+    displays = [f"Concept {i // distinct_depends_on_count}" for i in range(row_count)]
+    depends_on_values = [
+        f'{{"text":"Route {i % distinct_depends_on_count}"}}' for i in range(row_count)
+    ]
+    depends_on_properties = ["Medication.route"] * row_count
+
+    def prepare_rows():
+        for code, display, depends_on_value, depends_on_property in zip(
+            codes, displays, depends_on_values, depends_on_properties
+        ):
+            code_result = app.helpers.format_helper.prepare_code_and_display_for_storage_migration(code, display)
+            (value, rejected_value) = app.helpers.format_helper.filter_unsafe_depends_on_value(depends_on_value)
+            depends_on_result = app.helpers.format_helper.prepare_depends_on_value_for_storage(
+                value, depends_on_property
+            )
+            app.helpers.id_helper.generate_code_id(
+                code_string=code_result[3],
+                display_string=code_result[4],
+                depends_on_value_string=app.helpers.format_helper.prepare_depends_on_attributes_for_code_id_migration(
+                    depends_on_result[3], depends_on_result[4]
+                ),
+            )
+
+    row_seconds = timeit.timeit(prepare_rows, number=1)
+    column_seconds = timeit.timeit(
+        lambda: app.helpers.format_helper.prepare_source_concept_columns_for_storage_migration(
+            codes, displays, depends_on_values, depends_on_properties
+        ),
+        number=1,
+    )
+    print(f"{row_count} rows, row by row: {row_seconds:.3f}s")
+    print(f"{row_count} rows as columns: {column_seconds:.3f}s")
+
+
+@skip("This is a utility, not a test. Use only to measure model performance on a local dev machine.")
+def test_benchmark_serialize_mappings():
+    """
+    Not a test. Prints the time taken by ConceptMapVersion.serialize_mappings for a synthetic concept map whose
+    sources are mapped to several target terminologies. Compare against an earlier commit to measure a change.
+    Adjust source_count and target_terminology_count as needed.
+    """
+    source_count = 20000
+    target_terminology_count = 6
+    source_terminology = make_benchmark_terminology()
+    target_terminologies = [make_benchmark_terminology() for _ in range(target_terminology_count)]
+    for i, terminology in enumerate(target_terminologies):
+        terminology.fhir_uri = f"http://benchmark_target_url/{i}"
+    relationship = app.concept_maps.models.MappingRelationship(uuid.uuid4(), "equivalent", "Equivalent")
+    mapper = app.concept_maps.models.ContentCreator(uuid.uuid4(), "Benchmark Mapper")
+    mapped_date_time = datetime.datetime(2024, 1, 1)
+
+    concept_map_version = app.concept_maps.models.ConceptMapVersion.__new__(app.concept_maps.models.ConceptMapVersion)
+    concept_map_version.concept_map = SimpleNamespace(uuid=uuid.uuid4())  # in place of a ConceptMap from the database
+    concept_map_version.version = 1
+    concept_map_version.mappings = {}
+    with patch("app.concept_maps.models.get_db"):  # Mapping looks up a connection it does not use here
+        for i in range(source_count):
+            source_concept = app.concept_maps.models.SourceConcept(
+                uuid=uuid.uuid4(),
+                code=app.models.codes.Code(
+                    system=None,
+                    version=None,
+                    code=f"source-{i}",
+                    display=f"Source {i}",
+                    terminology_version=source_terminology,
+                    custom_terminology_code_uuid=uuid.uuid4(),
+                    custom_terminology_code_id=f"{i:032x}",
+                    from_custom_terminology=True,
+                    from_fhir_terminology=False,
+                ),
+                concept_map_version_uuid=None,
+            )
+            concept_map_version.mappings[source_concept] = [
+                app.concept_maps.models.Mapping(
+                    source=source_concept,
+                    relationship=relationship,
+                    target=app.models.codes.Code(
+                        system=None,
+                        version=None,
+                        code=f"target-{i}-{j}",
+                        display=f"Target {i} {j}",
+                        terminology_version=target_terminologies[(i + j) % target_terminology_count],
+                        from_custom_terminology=False,
+                        from_fhir_terminology=False,
+                    ),
+                    saved_to_db=True,
+                    mapping_id=f"{i:016x}{j:016x}",
+                    _stored_deduplication_hash=f"{i:016x}{j:016x}",
+                    mapped_by=mapper,
+                    mapped_date_time=mapped_date_time,
+                )
+                for j in range(2)
+            ]
+
+    seconds = timeit.timeit(concept_map_version.serialize_mappings, number=1)
+    print(f"{source_count} sources in {target_terminology_count} target terminologies: {seconds:.3f}s")
+
+
+@skip("This is a utility, not a test. Use only to measure model performance on a local dev machine.")
+def test_benchmark_serialize_mappings_from_rows():
+    """
+    Not a test. Prints the time taken to serialize the groups of a synthetic concept map from its mapping rows, through
+    load_reviewed_mappings and serialize_mappings, and directly with serialize_mappings_from_rows.
+    Adjust source_count as needed.
+    """
+    source_count = 20000
+    source_terminology = make_benchmark_terminology()
+    target_terminology = make_benchmark_terminology()
+    target_terminology.fhir_uri = "http://benchmark_target_url"
+    terminologies = {str(source_terminology.uuid): source_terminology, str(target_terminology.uuid): target_terminology}
+    relationship = app.concept_maps.models.MappingRelationship(uuid.uuid4(), "equivalent", "Equivalent")
+    mapper = app.concept_maps.models.ContentCreator(uuid.uuid4(), "Benchmark Mapper")
+    mapped_date_time = datetime.datetime(2024, 1, 1)
+
+    row_values = {
+        "mapping_uuid": None, "mapped_by": mapper.uuid, "reviewed_by": None,
+        "review_status": "reviewed", "mapping_comments": None, "mapped_date_time": mapped_date_time,
+        "review_comments": None, "reviewed_date_time": None, "map_program_date_time": None,
+        "map_program_version": None, "map_program_prediction_id": None, "map_program_confidence_score": None,
+        "deleted_date_time": None, "deleted_by": None,
+        "source_code_schema": app.models.codes.RoninCodeSchemas.codeable_concept.value, "source_code_simple": None,
+        "source_display": None, "source_system": str(source_terminology.uuid),
+        "source_version": source_terminology.version, "source_fhir_uri": source_terminology.fhir_uri,
+        "source_comments": None, "source_map_status": "completed", "source_assigned_mapper": None,
+        "source_assigned_reviewer": None, "no_map": None, "reason_for_no_map": None, "source_mapping_group": None,
+        "source_previous_version_context": None, "relationship_code": relationship.code, "map_status": "completed",
+        "target_concept_terminology_version_uuid": str(target_terminology.uuid),
+        "target_version": target_terminology.version, "target_fhir_uri": target_terminology.fhir_uri,
+        "depends_on_property": None, "depends_on_system": None, "depends_on_value_schema": None,
+        "depends_on_value_simple": None, "depends_on_value_jsonb": None, "depends_on_display": None,
+        "source_deduplication_hash": None,
+    }
+    per_row_columns = [
+        "mapping_id", "mapping_deduplication_hash", "source_concept_uuid", "source_code_jsonb", "custom_terminology_code_uuid",
+        "target_concept_code", "target_concept_display", "source_code_id",
+    ]
+    MappingRow = namedtuple("MappingRow", list(row_values) + per_row_columns)
+    rows = []
+    for i in range(source_count):
+        source_concept_uuid = uuid.uuid4()
+        source_code_jsonb = {
+            "coding": [{"code": f"source-{i}", "display": f"Source {i}", "system": "http://benchmark_source_codes"}],
+            "text": f"Source {i}",
+        }
+        custom_terminology_code_uuid = uuid.uuid4()
+        for j in range(2):
+            rows.append(
+                MappingRow(
+                    **row_values,
+                    mapping_id=f"{i:016x}{j:016x}",
+                    mapping_deduplication_hash=f"{i:016x}{j:016x}",
+                    source_concept_uuid=source_concept_uuid,
+                    source_code_jsonb=source_code_jsonb,
+                    custom_terminology_code_uuid=custom_terminology_code_uuid,
+                    target_concept_code=f"target-{i}-{j}",
+                    target_concept_display=f"Target {i} {j}",
+                    source_code_id=f"{i:032x}",
+                )
+            )
+
+    concept_map_version = app.concept_maps.models.ConceptMapVersion.__new__(app.concept_maps.models.ConceptMapVersion)
+    concept_map_version.uuid = uuid.uuid4()
+    concept_map_version.concept_map = SimpleNamespace(uuid=uuid.uuid4())  # in place of a ConceptMap from the database
+    concept_map_version.version = 1
+
+    def through_objects():
+        concept_map_version.mappings = {}
+        concept_map_version.load_reviewed_mappings(rows)
+        return concept_map_version.serialize_mappings()
+
+    # The lookups would otherwise go to the database; here they return the objects made above
+    with patch("app.concept_maps.models.get_db"), patch.object(
+        app.terminologies.models.Terminology, "load_from_cache", side_effect=lambda key: terminologies[str(key)]
+    ), patch.object(
+        app.concept_maps.models.ContentCreator, "load_by_uuid_from_cache", side_effect={mapper.uuid: mapper}.get
+    ), patch.object(
+        app.concept_maps.models.MappingRelationship, "load_by_code_from_cache", return_value=relationship
+    ):
+        object_seconds = timeit.timeit(through_objects, number=1)
+        row_seconds = timeit.timeit(lambda: concept_map_version.serialize_mappings_from_rows(rows), number=1)
+    print(f"{len(rows)} rows through load_reviewed_mappings and serialize_mappings: {object_seconds:.3f}s")
+    print(f"{len(rows)} rows with serialize_mappings_from_rows: {row_seconds:.3f}s")